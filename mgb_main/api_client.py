@@ -0,0 +1,426 @@
+# mgb_main/api_client.py
+"""
+Общий клиент внешних API (TMDb, IGDB, Google Books, YouTube).
+
+- пул соединений: requests.Session для синхронных вызовов, aiohttp-сессия для загрузчиков на asyncio;
+- дисковый кэш ответов (SQLite, settings.API_CACHE_PATH) с TTL; устаревшая запись
+  перепроверяется условным запросом (If-None-Match / If-Modified-Since), 304 продлевает её;
+- повторы с экспоненциальной паузой на 429 и 5xx (Retry-After учитывается);
+- дневная квота (YouTube Data API): единицы списываются только за запросы, ушедшие в сеть;
+- settings.API_CLIENT_MODE: live - сеть и кэш, record - то же плюс запись всех ответов
+  в settings.API_FIXTURES_PATH, replay - только из записанных ответов, без сети.
+
+Ключи API в ключ кэша и в записанные ответы не попадают.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import aiohttp
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from users.models import ApiQuotaUsage
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MODE_LIVE = 'live'
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 4          # повторов после первой попытки
+BACKOFF_BASE = 1         # секунды: 1, 2, 4, 8 ... плюс случайная добавка
+BACKOFF_MAX = 30
+REQUEST_TIMEOUT = 30
+
+HOUR = 60 * 60
+
+
+class ReplayMissError(LookupError):
+    """В режиме replay запрошен ответ, которого нет среди записанных."""
+
+
+class QuotaExceededError(RuntimeError):
+    """Дневная квота API израсходована, а в кэше ответа нет."""
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты для asyncio: токены пополняются со скоростью rate в секунду,
+    запрос ждёт, пока не появится целый токен. capacity=1 - запросы идут равномерно, без всплесков.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class DailyQuota:
+    """
+    Дневной бюджет единиц API в строке ApiQuotaUsage (один счётчик на все процессы).
+    Сутки считаются в часовом поясе провайдера: квота YouTube сбрасывается в полночь по тихоокеанскому времени.
+    """
+
+    def __init__(self, name, limit, timezone='America/Los_Angeles'):
+        self.name = name
+        self.limit = limit
+        self.timezone = ZoneInfo(timezone)
+
+    def today(self):
+        return datetime.now(self.timezone).date()
+
+    def used(self):
+        usage = ApiQuotaUsage.objects.filter(name=self.name, day=self.today()).values_list('used', flat=True).first()
+        return usage or 0
+
+    def remaining(self):
+        return max(0, self.limit - self.used())
+
+    def spend(self, units):
+        """
+        Списывает units, если они есть в остатке. False - квота на сегодня кончилась.
+        Проверка остатка и списание - один UPDATE ... WHERE used <= limit - units, без гонки между процессами.
+        """
+        day = self.today()
+        ApiQuotaUsage.objects.bulk_create([ApiQuotaUsage(name=self.name, day=day)], ignore_conflicts=True)
+        spent = ApiQuotaUsage.objects.filter(
+            name=self.name, day=day, used__lte=self.limit - units,
+        ).update(used=F('used') + units)
+        return spent == 1
+
+
+# ХРАНИЛИЩЕ ОТВЕТОВ
+# ---------------------------------------------------------------------------------
+class ResponseStore:
+    """Ответы в SQLite: ключ запроса -> статус, тело, ETag / Last-Modified, время получения."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, client TEXT, method TEXT, url TEXT, status INTEGER, body TEXT, '
+                'etag TEXT, last_modified TEXT, stored_at REAL)'
+            )
+            self._conn = conn
+        return self._conn
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT status, body, etag, last_modified, stored_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('status', 'body', 'etag', 'last_modified', 'stored_at'), row))
+
+    def put(self, key, client, method, url, entry):
+        with self._lock:
+            self._connection().execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, client, method, url, entry['status'], entry['body'], entry.get('etag'),
+                 entry.get('last_modified'), entry.get('stored_at') or time.time()),
+            )
+
+    def touch(self, key):
+        with self._lock:
+            self._connection().execute('UPDATE responses SET stored_at = ? WHERE key = ?', (time.time(), key))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path):
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ResponseStore(path)
+        return _stores[path]
+
+
+def get_mode():
+    return getattr(settings, 'API_CLIENT_MODE', MODE_LIVE)
+
+
+def retry_delay(attempt, retry_after=None):
+    if retry_after:
+        try:
+            return min(BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) + random.uniform(0, 0.5)
+
+
+# КЛИЕНТ
+# ---------------------------------------------------------------------------------
+class ApiClient:
+    """
+    Клиент одного API. Синхронно: client.get(path, params) / client.post(path, data).
+    На asyncio: async with client.async_session() as api: await api.get(...).
+    Возвращает разобранный JSON или None, если ответ не 200 (или сеть недоступна и в кэше ничего нет).
+    ttl=0 в вызове - не доверять свежести кэша, но перепроверить запись условным запросом.
+    cost - стоимость запроса в единицах квоты (если у клиента есть quota); без квоты -
+    QuotaExceededError, если нет даже устаревшей записи в кэше.
+    """
+
+    def __init__(self, name, base_url, params=None, headers=None, ttl=12 * HOUR, rate=None, max_open_requests=8, quota=None):
+        self.name = name
+        self.base_url = base_url
+        self.params = params or {}  # параметры каждого запроса (ключ API); в ключ кэша не входят
+        self.headers = headers or {}
+        self.ttl = ttl
+        self.rate = rate
+        self.max_open_requests = max_open_requests
+        self.quota = quota
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def url(self, path):
+        return path if path.startswith('http') else f"{self.base_url}/{path.lstrip('/')}"
+
+    def query_params(self, params):
+        """Параметры запроса без пустых значений (aiohttp не принимает None)."""
+        return {key: value for key, value in {**self.params, **(params or {})}.items() if value is not None}
+
+    def request_key(self, method, url, params, data):
+        public_params = sorted((key, str(value)) for key, value in (params or {}).items() if key not in self.params)
+        raw = json.dumps([self.name, method, url, public_params, data], ensure_ascii=False, default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_open_requests)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update(self.headers)
+                self._session = session
+            return self._session
+
+    # Общая часть синхронного и асинхронного пути
+    def _cache(self):
+        return get_store(settings.API_CACHE_PATH)
+
+    def _fixtures(self):
+        return get_store(settings.API_FIXTURES_PATH)
+
+    def _before_request(self, key, method, url, ttl):
+        """(готовый ответ без сети или None, устаревшая запись кэша для условного запроса)."""
+        mode = get_mode()
+        if mode == MODE_REPLAY:
+            entry = self._fixtures().get(key)
+            if entry is None:
+                raise ReplayMissError(f"{self.name}: нет записанного ответа для {method} {url}")
+            return entry, None
+
+        entry = self._cache().get(key)
+        if entry is not None and ttl and time.time() - entry['stored_at'] < ttl:
+            self._record(key, method, url, entry)
+            return entry, None
+        return None, entry
+
+    def _conditional_headers(self, stale):
+        headers = {}
+        if stale is not None:
+            if stale.get('etag'):
+                headers['If-None-Match'] = stale['etag']
+            if stale.get('last_modified'):
+                headers['If-Modified-Since'] = stale['last_modified']
+        return headers
+
+    def _after_response(self, key, method, url, status, body, headers, stale):
+        if status == 304 and stale is not None:
+            self._cache().touch(key)
+            entry = stale
+        else:
+            entry = {
+                'status': status, 'body': body, 'stored_at': time.time(),
+                'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified'),
+            }
+            if status == 200:
+                self._cache().put(key, self.name, method, url, entry)
+            else:
+                logger.warning("%s: %s %s -> %s", self.name, method, url, status)
+        self._record(key, method, url, entry)
+        return entry
+
+    def _quota_denied(self, key, method, url, stale):
+        """Квоты нет: устаревший кэш, если он есть, иначе QuotaExceededError."""
+        logger.warning("%s: дневная квота израсходована, %s %s не отправлен", self.name, method, url)
+        if stale is not None:
+            self._record(key, method, url, stale)
+            return self._result(stale)
+        raise QuotaExceededError(f"{self.name}: дневная квота израсходована")
+
+    def _give_up(self, key, method, url, stale):
+        """Повторы кончились: отдаём устаревший кэш, если он есть."""
+        logger.warning("%s: %s %s не удался после %s повторов", self.name, method, url, MAX_RETRIES)
+        if stale is not None:
+            self._record(key, method, url, stale)
+            return self._result(stale)
+        return None
+
+    def _record(self, key, method, url, entry):
+        if get_mode() == MODE_RECORD:
+            self._fixtures().put(key, self.name, method, url, entry)
+
+    def _result(self, entry):
+        return json.loads(entry['body']) if entry['status'] == 200 else None
+
+    # Синхронные запросы
+    def get(self, path, params=None, ttl=None, cost=1):
+        return self.request('GET', path, params=params, ttl=ttl, cost=cost)
+
+    def post(self, path, data=None, ttl=None, cost=1):
+        return self.request('POST', path, data=data, ttl=ttl, cost=cost)
+
+    def request(self, method, path, params=None, data=None, ttl=None, cost=1):
+        url = self.url(path)
+        key = self.request_key(method, url, params, data)
+        ready, stale = self._before_request(key, method, url, self.ttl if ttl is None else ttl)
+        if ready is not None:
+            return self._result(ready)
+        if self.quota and not self.quota.spend(cost):
+            return self._quota_denied(key, method, url, stale)
+
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = self.session().request(
+                    method, url, params=self.query_params(params), data=data,
+                    headers=self._conditional_headers(stale), timeout=REQUEST_TIMEOUT,
+                )
+            except requests.RequestException as e:
+                logger.warning("%s: сетевая ошибка (%s/%s): %s", self.name, attempt + 1, MAX_RETRIES + 1, e)
+                delay = retry_delay(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    return self._result(self._after_response(
+                        key, method, url, response.status_code, response.text, response.headers, stale
+                    ))
+                delay = retry_delay(attempt, response.headers.get('Retry-After'))
+            if attempt < MAX_RETRIES:
+                time.sleep(delay)
+        return self._give_up(key, method, url, stale)
+
+    @asynccontextmanager
+    async def async_session(self):
+        """aiohttp-сессия с лимитами клиента (rate, max_open_requests) на время одного asyncio.run."""
+        async with aiohttp.ClientSession(headers=self.headers) as session:
+            yield AsyncApiSession(self, session)
+
+
+class AsyncApiSession:
+    """Асинхронные запросы клиента: тот же кэш, повторы и запись, плюс ограничение частоты и числа соединений."""
+
+    def __init__(self, client, session):
+        self.client = client
+        self.session = session
+        self.bucket = TokenBucket(client.rate) if client.rate else None
+        self.open_requests = asyncio.Semaphore(client.max_open_requests)
+
+    async def get(self, path, params=None, ttl=None, cost=1):
+        return await self.request('GET', path, params=params, ttl=ttl, cost=cost)
+
+    async def post(self, path, data=None, ttl=None, cost=1):
+        return await self.request('POST', path, data=data, ttl=ttl, cost=cost)
+
+    async def request(self, method, path, params=None, data=None, ttl=None, cost=1):
+        client = self.client
+        url = client.url(path)
+        key = client.request_key(method, url, params, data)
+        # Кэш и записанные ответы - в SQLite: блокирующие вызовы уходят в поток, чтобы не стоял цикл событий
+        ready, stale = await asyncio.to_thread(client._before_request, key, method, url, client.ttl if ttl is None else ttl)
+        if ready is not None:
+            return client._result(ready)
+        # Счётчик квоты - в базе (ApiQuotaUsage), из корутины к ORM только через sync_to_async
+        if client.quota and not await sync_to_async(client.quota.spend)(cost):
+            return await asyncio.to_thread(client._quota_denied, key, method, url, stale)
+
+        for attempt in range(MAX_RETRIES + 1):
+            if self.bucket:
+                await self.bucket.acquire()
+            try:
+                async with self.open_requests:
+                    async with self.session.request(
+                        method, url, params=client.query_params(params), data=data,
+                        headers=client._conditional_headers(stale),
+                        timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+                    ) as response:
+                        status, body, headers = response.status, await response.text(), response.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("%s: сетевая ошибка (%s/%s): %s", client.name, attempt + 1, MAX_RETRIES + 1, e)
+                delay = retry_delay(attempt)
+            else:
+                if status not in RETRY_STATUSES:
+                    entry = await asyncio.to_thread(client._after_response, key, method, url, status, body, headers, stale)
+                    return client._result(entry)
+                delay = retry_delay(attempt, headers.get('Retry-After'))
+            if attempt < MAX_RETRIES:
+                await asyncio.sleep(delay)
+        return await asyncio.to_thread(client._give_up, key, method, url, stale)
+
+
+# КЛИЕНТЫ ПРОЕКТА
+# ---------------------------------------------------------------------------------
+TMDB_CLIENT = ApiClient(
+    'tmdb', "https://api.themoviedb.org/3",
+    params={'api_key': os.getenv("TMDB_API_KEY")},
+    ttl=12 * HOUR, rate=40, max_open_requests=20,  # TMDb: около 50 запросов в секунду, до 20 соединений
+)
+IGDB_CLIENT = ApiClient(
+    'igdb', "https://api.igdb.com/v4",
+    headers={"Client-ID": f"{os.getenv('CLIENT_ID')}", "Authorization": f"Bearer {os.getenv('AUTHORIZATION_GAMES_TOKEN')}"},
+    ttl=12 * HOUR, rate=4, max_open_requests=8,  # IGDB: 4 запроса в секунду, до 8 открытых
+)
+GOOGLE_BOOKS_CLIENT = ApiClient(
+    'google_books', "https://www.googleapis.com/books/v1",
+    params={'key': os.getenv("GOOGLE_API_KEY")},
+    ttl=24 * HOUR,
+)
+YOUTUBE_CLIENT = ApiClient(
+    'youtube', "https://www.googleapis.com/youtube/v3",
+    params={'key': os.getenv("GOOGLE_API_KEY")},
+    ttl=7 * 24 * HOUR,  # поиск дорог по квоте, трейлеры меняются редко
+    rate=5, max_open_requests=8,
+    quota=DailyQuota('youtube', int(os.getenv("YOUTUBE_DAILY_QUOTA", 10000))),  # 10 000 единиц в сутки по умолчанию
+)
@@ -0,0 +1,258 @@
+import heapq
+import json
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import connection
+
+from users.models import Game, Movie, Book
+from .search import get_query_variants
+from .utils import format_date
+
+# Ключ в общем кэше: версия индекса. Команды загрузки увеличивают её,
+# и каждый воркер пересобирает свой индекс при следующей проверке.
+INDEX_VERSION_CACHE_KEY = 'autocomplete:index_version'
+
+INDEX_MAX_AGE = 15 * 60         # индекс пересобирается не реже, чем раз в 15 минут
+VERSION_CHECK_INTERVAL = 30     # как часто (сек) сверяться с версией в кэше
+LRU_SIZE = 1024                 # сколько последних ответов держать в памяти
+MAX_WORD_STARTS = 4             # по скольким первым словам названия искать префикс
+MIN_PREFIX_LENGTH = 2           # совпадает с MIN_QUERY_LENGTH в search_handler.js
+RESULTS_PER_TYPE = 5
+
+CONTENT_KEYS = ('games', 'movies', 'books')
+
+BOOK_THUMBNAIL_PLACEHOLDER = '/static/imgs/placeholder_thumbnail.png'
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_title(text):
+    """Нижний регистр, ё -> е, только буквы/цифры через одиночные пробелы."""
+    text = (text or '').lower().replace('ё', 'е')
+    return ' '.join(re.findall(r'\w+', text))
+
+
+def _to_json(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+
+# ФРАГМЕНТЫ ОТВЕТА
+# Поля те же, что отдаёт search_view, чтобы search_handler.js рисовал их одинаково.
+# ---------------------------------------------------------------------------------
+def load_game_entries():
+    rows = Game.objects.values(
+        'id', 'name', 'cover_url', 'first_release_date', 'total_rating', 'rating_color', 'genres', 'total_rating_count'
+    )
+    for row in rows.iterator(chunk_size=2000):
+        popularity = row.pop('total_rating_count') or 0
+        row['first_release_date'] = format_date(row['first_release_date'])
+        yield row['name'], popularity, _to_json(row)
+
+
+def load_movie_entries():
+    genres_by_movie = {}
+    for movie_id, genre_name in Movie.genres.through.objects.values_list('movie_id', 'genre__name'):
+        genres_by_movie.setdefault(movie_id, []).append(genre_name)
+
+    rows = Movie.objects.values(
+        'id', 'tmdb_id', 'title', 'original_title', 'poster_path', 'release_date', 'vote_average', 'rating_color',
+        'popularity',
+    )
+    for row in rows.iterator(chunk_size=2000):
+        original_title = row.pop('original_title')
+        popularity = row.pop('popularity') or 0
+        row['release_date'] = row['release_date'].isoformat() if row['release_date'] else None
+        row['genres'] = genres_by_movie.get(row['id'], [])
+        fragment = _to_json(row)
+        yield row['title'], popularity, fragment
+        if original_title and normalize_title(original_title) != normalize_title(row['title']):
+            yield original_title, popularity, fragment
+
+
+def load_book_entries():
+    rows = Book.objects.values(
+        'id', 'google_id', 'title', 'thumbnail', 'published_date', 'published_year', 'mgb_average_rating', 'authors',
+        'categories', 'ratings_count',
+    )
+    for row in rows.iterator(chunk_size=2000):
+        popularity = row.pop('ratings_count') or 0
+        row['thumbnail'] = row['thumbnail'] or BOOK_THUMBNAIL_PLACEHOLDER
+        row['authors'] = row['authors'] if isinstance(row['authors'], list) else []
+        row['categories'] = row['categories'] if isinstance(row['categories'], list) else []
+        yield row['title'], popularity, _to_json(row)
+
+
+AUTOCOMPLETE_LOADERS = {
+    'games': load_game_entries,
+    'movies': load_movie_entries,
+    'books': load_book_entries,
+}
+
+
+class PrefixIndex:
+    """
+    Отсортированный массив ключей "название, начиная с i-го слова" -> номер элемента.
+    Поиск префикса - два bisect, без обращения к базе.
+    """
+
+    def __init__(self, entries):
+        self._popularity = []
+        self._fragments = []
+        fragment_ids = {}
+        pairs = []
+
+        for title, popularity, fragment in entries:
+            item_id = fragment_ids.get(fragment)
+            if item_id is None:
+                item_id = fragment_ids[fragment] = len(self._fragments)
+                self._fragments.append(fragment)
+                self._popularity.append(popularity)
+
+            words = normalize_title(title).split()
+            for i in range(min(len(words), MAX_WORD_STARTS)):
+                pairs.append((' '.join(words[i:]), item_id))
+
+        pairs.sort()
+        self._keys = [key for key, _ in pairs]
+        self._item_ids = [item_id for _, item_id in pairs]
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def search(self, prefixes, limit):
+        """Возвращает JSON-фрагменты самых популярных элементов, совпавших хотя бы с одним префиксом."""
+        matched = set()
+        for prefix in prefixes:
+            lo = bisect_left(self._keys, prefix)
+            hi = bisect_left(self._keys, prefix + '\uffff', lo)
+            matched.update(self._item_ids[lo:hi])
+
+        best = heapq.nlargest(limit, matched, key=lambda item_id: (self._popularity[item_id], -item_id))
+        return [self._fragments[item_id] for item_id in best]
+
+
+class AutocompleteIndex:
+    """Индексы по играм, фильмам и книгам плюс LRU готовых ответов. Один экземпляр на процесс."""
+
+    def __init__(self, indexes, version):
+        self.indexes = indexes
+        self.version = version
+        self.built_at = time.monotonic()
+        self.checked_at = self.built_at
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, version):
+        indexes = {key: PrefixIndex(loader()) for key, loader in AUTOCOMPLETE_LOADERS.items()}
+        return cls(indexes, version)
+
+    def lookup(self, query, category='all', limit=RESULTS_PER_TYPE):
+        """Возвращает готовое JSON-тело ответа вида {"games": [...], "movies": [...], "books": [...]}."""
+        normalized = normalize_title(query)
+        cache_key = (normalized, category, limit)
+
+        with self._lock:
+            body = self._responses.get(cache_key)
+            if body is not None:
+                self._responses.move_to_end(cache_key)
+                return body
+
+        prefixes = []
+        if len(normalized) >= MIN_PREFIX_LENGTH:
+            prefixes = [normalize_title(variant) for variant in get_query_variants(normalized)]
+
+        sections = []
+        for key in CONTENT_KEYS:
+            fragments = []
+            if prefixes and category in ('all', key):
+                fragments = self.indexes[key].search(prefixes, limit)
+            sections.append(f'"{key}":[{",".join(fragments)}]')
+        body = '{' + ','.join(sections) + '}'
+
+        with self._lock:
+            self._responses[cache_key] = body
+            if len(self._responses) > LRU_SIZE:
+                self._responses.popitem(last=False)
+        return body
+
+
+_index = None
+_build_lock = threading.Lock()
+_rebuilding = False     # идёт фоновая пересборка; меняется под _build_lock
+
+
+def _rebuild_in_background(version):
+    global _index, _rebuilding
+    try:
+        _index = AutocompleteIndex.build(version)
+    except Exception:
+        logger.exception("Не удалось пересобрать индекс автодополнения, остаётся прежний")
+    finally:
+        _rebuilding = False
+        connection.close()  # у потока своё соединение с базой
+
+
+def _start_rebuild(version):
+    """Запускает пересборку в фоновом потоке, если она ещё не идёт."""
+    global _rebuilding
+    with _build_lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+    threading.Thread(target=_rebuild_in_background, args=(version,), name='autocomplete-rebuild', daemon=True).start()
+
+
+def get_autocomplete_index():
+    """
+    Возвращает индекс текущего процесса. Если он устарел или команды загрузки сменили
+    версию в кэше, запускает пересборку в фоне и пока отвечает по прежнему индексу;
+    ждать приходится только первую сборку в процессе.
+    """
+    global _index
+    now = time.monotonic()
+    index = _index
+    if index is not None and now - index.checked_at < VERSION_CHECK_INTERVAL:
+        return index
+
+    version = cache.get(INDEX_VERSION_CACHE_KEY, 0)
+    if index is None:
+        with _build_lock:
+            if _index is None:
+                _index = AutocompleteIndex.build(version)
+            return _index
+
+    index.checked_at = now
+    if index.version != version or now - index.built_at >= INDEX_MAX_AGE:
+        _start_rebuild(version)
+    return index
+
+
+def invalidate_autocomplete_index():
+    """Вызывается после загрузки новых данных: все процессы пересоберут индекс."""
+    try:
+        cache.incr(INDEX_VERSION_CACHE_KEY)
+    except ValueError:
+        cache.set(INDEX_VERSION_CACHE_KEY, 1, None)
+
+
+# Поля, из которых собираются записи индекса; изменения остальных полей на подсказки не влияют
+INDEXED_FIELDS = {
+    'games': {'name', 'cover_url', 'first_release_date', 'total_rating', 'rating_color', 'genres', 'total_rating_count'},
+    'movies': {'title', 'original_title', 'poster_path', 'release_date', 'vote_average', 'rating_color', 'popularity'},
+    'books': {'title', 'thumbnail', 'published_date', 'published_year', 'mgb_average_rating', 'authors', 'categories', 'ratings_count'},
+}
+
+
+def invalidate_autocomplete_for_changes(content_key, changed_fields):
+    """Пересборка индекса после точечного обновления - только если изменились поля, которые в нём есть."""
+    if not INDEXED_FIELDS[content_key] & set(changed_fields):
+        return False
+    invalidate_autocomplete_index()
+    return True
@@ -0,0 +1,172 @@
+# mgb_main/backfill.py
+"""
+Заполнение производных полей по уже загруженным данным (release_date из first_release_date и т.п.).
+
+Таблица обходится диапазонами pk по batch_size строк, каждый диапазон - своя транзакция
+с отметкой в IngestionRun (источник backfill), поэтому прерванный запуск продолжается с --resume.
+Пишутся только строки, где значение действительно меняется.
+
+Два вида задач в BACKFILLS:
+- 'expression' - выражение Django, значение считает сама база: один UPDATE на диапазон;
+- 'compute' - метод модели, выставляющий поля 'fields' (то же, что делает save()), для того,
+  что в SQL не выражается: объекты читаются через iterator() только с нужными полями,
+  изменившиеся пишутся bulk_update.
+"""
+import time
+from contextlib import nullcontext
+
+from django.db import transaction
+from django.db.models import DateField, DateTimeField, F, Func, Max, Min, Q
+from django.db.models.functions import Cast
+
+from users.comments import comment_counter_expressions
+from users.models import Book, Comment, Game, Movie, IngestionRun
+from .ingest import IngestionCheckpoint
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def unix_to_date(field):
+    """Unix-время (секунды) -> дата в UTC: to_timestamp(field)::date (соединение Django работает в UTC)."""
+    return Cast(Func(F(field), function='to_timestamp', output_field=DateTimeField()), DateField())
+
+
+BACKFILLS = {
+    'game_release_date': {
+        'model': Game,
+        'field': 'release_date',
+        'expression': unix_to_date('first_release_date'),
+        'help': "Game.release_date из first_release_date (unix-время IGDB)",
+    },
+    'game_rating_color': {
+        'model': Game,
+        'fields': ['rating_color'],
+        'compute': Game.assign_rating_color,
+        'source_fields': ['total_rating'],
+        'help': "Game.rating_color по total_rating",
+    },
+    'movie_rating_color': {
+        'model': Movie,
+        'fields': ['rating_color'],
+        'compute': Movie.assign_rating_color,
+        'source_fields': ['vote_average'],
+        'help': "Movie.rating_color по vote_average",
+    },
+    'game_display_fields': {
+        'model': Game,
+        'fields': Game.DISPLAY_FIELDS,
+        'compute': Game.assign_display_fields,
+        'source_fields': ['first_release_date', 'platforms', 'summary'],
+        'help': "Game.release_date / platform_icons / short_summary (поля для отображения)",
+    },
+    'movie_display_fields': {
+        'model': Movie,
+        'fields': Movie.DISPLAY_FIELDS,
+        'compute': Movie.assign_display_fields,
+        'source_fields': ['poster_path', 'backdrop_path', 'country', 'runtime', 'overview'],
+        'help': "Movie.full_poster_path / full_backdrop_path / country_code / formatted_runtime / short_overview",
+    },
+    'book_published_on': {
+        'model': Book,
+        'fields': ['published_on', 'published_year', 'published_precision'],
+        'compute': Book.assign_published_fields,
+        'source_fields': ['published_date'],
+        'help': "Book.published_on / published_year / published_precision из строки published_date",
+    },
+    'comment_like_count': {
+        'model': Comment,
+        'field': 'like_count',
+        'expression': comment_counter_expressions()['like_count'],
+        'help': "Сверка Comment.like_count с таблицей лайков",
+    },
+    'comment_reply_count': {
+        'model': Comment,
+        'field': 'reply_count',
+        'expression': comment_counter_expressions()['reply_count'],
+        'help': "Сверка Comment.reply_count с ответами",
+    },
+}
+
+
+def changed_rows(queryset, field, expression):
+    """Строки, где field отличается от expression (IS DISTINCT FROM: NULL с обеих сторон - не изменение)."""
+    queryset = queryset.annotate(backfill_value=expression)
+    return queryset.filter(
+        Q(**{f'{field}__isnull': True}, backfill_value__isnull=False)
+        | Q(**{f'{field}__isnull': False}, backfill_value__isnull=True)
+        | (Q(**{f'{field}__isnull': False}, backfill_value__isnull=False) & ~Q(**{field: F('backfill_value')}))
+    )
+
+
+def backfill_range(config, start, stop, dry_run):
+    """
+    Один диапазон pk [start, stop). Возвращает (строк в диапазоне, изменённых строк);
+    при dry_run изменённые только считаются.
+    """
+    model = config['model']
+    queryset = model.objects.filter(pk__gte=start, pk__lt=stop)
+
+    if 'expression' in config:
+        field = config['field']
+        rows = queryset.count()
+        changed = changed_rows(queryset, field, config['expression'])
+        if dry_run:
+            return rows, changed.count()
+        return rows, model.objects.filter(pk__in=changed.values('pk')).update(**{field: config['expression']})
+
+    fields = config['fields']
+    rows = 0
+    changed = []
+    for obj in queryset.only('pk', *fields, *config['source_fields']).iterator(chunk_size=2000):
+        rows += 1
+        stored = [getattr(obj, name) for name in fields]
+        config['compute'](obj)
+        if [getattr(obj, name) for name in fields] != stored:
+            changed.append(obj)
+    if changed and not dry_run:
+        model.objects.bulk_update(changed, fields, batch_size=1000)
+    return rows, len(changed)
+
+
+def run_backfill(name, batch_size=DEFAULT_BATCH_SIZE, dry_run=False, resume=False, stdout=None):
+    """
+    Выполняет задачу BACKFILLS[name]. dry_run - только посчитать, сколько строк изменилось бы
+    (без записи и без IngestionRun). Возвращает (просмотрено строк, изменено строк).
+    """
+    config = BACKFILLS[name]
+    bounds = config['model'].objects.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return 0, 0
+
+    if dry_run:
+        checkpoint = None
+    else:
+        checkpoint = IngestionCheckpoint(
+            IngestionRun.SOURCE_BACKFILL, {'backfill': name, 'batch_size': batch_size},
+            resume=resume, stdout=stdout, resume_match={'backfill': name},
+        )
+        batch_size = checkpoint.params['batch_size']
+
+    # Диапазоны выровнены по batch_size, чтобы ключи страниц совпадали между запуском и --resume
+    first = bounds['first'] - bounds['first'] % batch_size
+    ranges = list(range(first, bounds['last'] + 1, batch_size))
+    scanned = updated = 0
+    started_at = time.monotonic()
+
+    with checkpoint or nullcontext():
+        for number, start in enumerate(ranges, start=1):
+            if checkpoint and checkpoint.is_done(start):
+                continue
+            with transaction.atomic():
+                rows, changed = backfill_range(config, start, start + batch_size, dry_run)
+                if checkpoint:
+                    checkpoint.mark_done(start, changed)
+            scanned += rows
+            updated += changed
+            if stdout:
+                elapsed = time.monotonic() - started_at
+                stdout.write(
+                    f"{name}: диапазон {number}/{len(ranges)} (pk {start}-{start + batch_size - 1}), "
+                    f"{'к изменению' if dry_run else 'изменено'} {updated}, {scanned / elapsed if elapsed else 0:.0f} строк/с"
+                )
+    return scanned, updated
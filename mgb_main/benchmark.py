@@ -0,0 +1,554 @@
+# mgb_main/benchmark.py
+"""
+Нагрузочный стенд: синтетические данные в масштабе продакшена и замеры ключевых view.
+
+generate_dataset() наполняет базу каталогом, пользователями, библиотеками и ветками отзывов.
+Популярность элементов - по закону Ципфа, размер библиотеки - логнормальный (много маленьких
+и немного огромных), оценки коррелируют с "качеством" элемента. Производные таблицы
+(UserItemState, MGB-рейтинги, журнал активности, поиск, полки, соседи, рекомендации)
+строятся теми же командами, что и в проде. При одном seed данные совпадают от запуска к запуску.
+Запускать на отдельной базе (DATABASE_URL): синтетика в рабочей базе не нужна.
+
+run_benchmark() прогоняет сценарии через django.test.Client - весь стек middleware, view
+и шаблонов: p50/p95 времени ответа, число SQL-запросов и пик памяти Python (tracemalloc,
+отдельным прогоном, чтобы не искажать время). Результат пишется в JSON для сравнения прогонов.
+"""
+import json
+import math
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone as dt_timezone
+from urllib.parse import quote
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import DurationField, ExpressionWrapper, F, Value
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users.comments import CommentLike, comment_counter_expressions
+from users.library_state import LIBRARY_STATE_CONFIG
+from users.models import Actor, Book, Comment, CrewMember, Game, Genre, Movie, User
+from .query_budget import QueryProfile
+
+BENCH_USERNAME_PREFIX = 'bench_'
+BENCH_POWER_USER = 'bench_power'       # пользователь с огромной библиотекой - от его имени идут замеры
+BENCH_ID_BASE = 2_000_000_000          # game_id / tmdb_id синтетики, вне диапазонов IGDB и TMDb
+BENCH_GOOGLE_ID_PREFIX = 'bench-'
+BENCH_PASSWORD = 'bench'
+
+BENCH_SCALES = {
+    # Проверка самого стенда и быстрые локальные сравнения
+    'small': {
+        'items': 2_000, 'users': 2_000, 'library_mean': 20, 'power_library': 300,
+        'comments_per_user': 1.0, 'hot_threads': 300, 'hot_replies': 300,
+    },
+    # Целевой масштаб: 30k игр/фильмов/книг, 100k пользователей, ~10M строк оценок, статусов и избранного
+    'full': {
+        'items': 30_000, 'users': 100_000, 'library_mean': 20, 'power_library': 2_000,
+        'comments_per_user': 1.0, 'hot_threads': 3_000, 'hot_replies': 2_000,
+    },
+}
+
+USER_CHUNK = 1_000        # пользователей на транзакцию при генерации библиотек
+BULK_BATCH = 5_000
+HISTORY_SECONDS = 3 * 365 * 24 * 60 * 60
+
+ZIPF_EXPONENT = 0.9
+STATUS_SHARES = (0.6, 0.2, 0.1)  # завершено / в процессе / брошено, остальное - без статуса
+RATED_SHARE = 0.6
+FAVORITE_SHARE = 0.15
+REPLIED_SHARE = 0.3
+
+WORDS = (
+    'star', 'dark', 'kingdom', 'legend', 'shadow', 'fire', 'iron', 'silent', 'lost', 'city', 'night',
+    'dragon', 'ocean', 'empire', 'ghost', 'winter', 'blood', 'crown', 'storm', 'echo', 'last', 'hidden',
+    'golden', 'broken', 'wild', 'north', 'river', 'machine', 'dream', 'garden', 'secret', 'world', 'light',
+    'journey', 'tower', 'forest', 'stone', 'sky', 'heart', 'song', 'war', 'house', 'road', 'time', 'moon',
+)
+GAME_GENRES = ('Adventure', 'RPG', 'Shooter', 'Strategy', 'Platform', 'Puzzle', 'Racing', 'Sport', 'Indie', 'Simulator')
+PLATFORMS = ('PC (Microsoft Windows)', 'PlayStation 5', 'PlayStation 4', 'Xbox Series X|S', 'Nintendo Switch', 'Mac', 'Linux')
+GAME_MODES = ('Single player', 'Multiplayer', 'Co-operative')
+MOVIE_GENRES = ('Drama', 'Comedy', 'Thriller', 'Action', 'Horror', 'Romance', 'Science Fiction', 'Fantasy', 'Animation', 'Crime')
+BOOK_CATEGORIES = ('Fiction', 'Fantasy', 'Science Fiction', 'History', 'Biography', 'Mystery', 'Romance', 'Poetry', 'Philosophy')
+COUNTRIES = ('United States of America', 'United Kingdom', 'France', 'Japan', 'South Korea', 'Germany')
+
+
+# ГЕНЕРАЦИЯ
+# ---------------------------------------------------------------------------------
+def popularity_cdf(count):
+    """Накопленные вероятности по закону Ципфа: элемент 0 самый популярный."""
+    weights = 1.0 / np.arange(1, count + 1) ** ZIPF_EXPONENT
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def sample_items(rng, cdf, size):
+    """size разных номеров элементов с учётом популярности (searchsorted по cdf вместо choice(p=...) на каждый вызов)."""
+    size = min(size, len(cdf))
+    picked = np.unique(np.searchsorted(cdf, rng.random(size * 2)))
+    if len(picked) < size:
+        extra = np.setdiff1d(np.arange(len(cdf)), picked)
+        picked = np.concatenate([picked, rng.choice(extra, size - len(picked), replace=False)])
+    return rng.permutation(picked)[:size]
+
+
+def library_sizes(rng, mean, count):
+    """Логнормальные размеры библиотек со средним mean."""
+    return np.maximum(rng.lognormal(math.log(mean) - 0.5, 1.0, count).astype(int), 0)
+
+
+def random_moments(rng, now, count):
+    return [now - timedelta(seconds=int(seconds)) for seconds in rng.integers(0, HISTORY_SECONDS, count)]
+
+
+def title(rng, number):
+    return f"{' '.join(rng.choice(WORDS, rng.integers(2, 4))).title()} {number}"
+
+
+def text(rng, words):
+    return ' '.join(rng.choice(WORDS, words))
+
+
+def pick(rng, values, low, high):
+    return [str(value) for value in rng.choice(values, rng.integers(low, high + 1), replace=False)]
+
+
+def spread_timestamps(queryset, field):
+    """
+    auto_now / auto_now_add перезаписывают время при bulk_create - раскидываем его по истории
+    одним UPDATE: сдвиг назад - детерминированная функция id.
+    """
+    offset = ExpressionWrapper(
+        Value(timedelta(seconds=1)) * ((F('id') * 104_729) % HISTORY_SECONDS), output_field=DurationField()
+    )
+    return queryset.update(**{field: F(field) - offset})
+
+
+def generate_games(rng, count, now):
+    release_low = int((now - timedelta(days=30 * 365)).timestamp())
+    release_high = int((now + timedelta(days=365)).timestamp())
+    games = []
+    for number in range(count):
+        released = int(rng.integers(release_low, release_high))
+        game = Game(
+            game_id=BENCH_ID_BASE + number,
+            name=title(rng, number),
+            summary=text(rng, 60),
+            first_release_date=released,
+            release_date=datetime.fromtimestamp(released, tz=dt_timezone.utc).date(),
+            company=f"Studio {int(rng.integers(0, 500))}",
+            cover_url=f"https://images.igdb.com/igdb/image/upload/t_cover_big/bench{number % 100}.jpg",
+            genres=pick(rng, GAME_GENRES, 1, 3),
+            platforms=pick(rng, PLATFORMS, 1, 4),
+            game_modes=pick(rng, GAME_MODES, 1, 2),
+            screenshots=[], videos=[],
+            total_rating=round(float(np.clip(rng.normal(7.2, 1.2), 1, 9.9)), 1),  # как в fetch_games: шкала IGDB / 10
+            # Популярность в IGDB следует той же кривой, что и у пользователей MGB
+            total_rating_count=int(20_000 / (number + 1) ** ZIPF_EXPONENT),
+            is_main_game=number < 5,
+            is_recently_trending_small=5 <= number < 25,
+            is_recently_trending_big=25 <= number < 35,
+        )
+        game.assign_rating_color()
+        game.assign_display_fields()
+        games.append(game)
+    Game.objects.bulk_create(games, batch_size=BULK_BATCH)
+    return list(Game.objects.filter(game_id__gte=BENCH_ID_BASE).order_by('game_id').values_list('pk', flat=True))
+
+
+def generate_movies(rng, count, now):
+    genres = Genre.objects.bulk_create(
+        [Genre(tmdb_id=BENCH_ID_BASE + i, name=f"{name} (bench)") for i, name in enumerate(MOVIE_GENRES)]
+    )
+    actors = Actor.objects.bulk_create(
+        [Actor(tmdb_id=BENCH_ID_BASE + i, name=title(rng, i)) for i in range(max(count // 6, 50))], batch_size=BULK_BATCH,
+    )
+    jobs = [job for job, _ in CrewMember.ROLE_CHOICES]
+    crew = CrewMember.objects.bulk_create(
+        [CrewMember(tmdb_id=BENCH_ID_BASE + i, name=title(rng, i), job=jobs[i % len(jobs)]) for i in range(max(count // 30, 30))],
+        batch_size=BULK_BATCH,
+    )
+
+    movies = []
+    for number in range(count):
+        movie = Movie(
+            tmdb_id=BENCH_ID_BASE + number,
+            title=title(rng, number),
+            original_title=title(rng, number),
+            overview=text(rng, 50),
+            country=str(rng.choice(COUNTRIES)),
+            runtime=int(rng.integers(80, 180)),
+            release_date=(now - timedelta(days=int(rng.integers(-180, 40 * 365)))).date(),
+            popularity=float(1000 / (number + 1) ** ZIPF_EXPONENT),
+            original_language='en',
+            poster_path=f"/bench{number % 100}.jpg",
+            backdrop_path=f"/bench_backdrop{number % 100}.jpg",
+            vote_average=float(np.clip(rng.normal(6.5, 1.2), 1, 10)),
+            vote_count=int(50_000 / (number + 1) ** ZIPF_EXPONENT),
+            content_type=Movie.CONTENT_TYPE_TV if number % 5 == 0 else Movie.CONTENT_TYPE_MOVIE,
+            is_main_movie=number < 5,
+            is_recently_trending_small=5 <= number < 25,
+            is_recently_trending_big=25 <= number < 35,
+        )
+        movie.assign_rating_color()
+        movie.assign_display_fields()
+        movies.append(movie)
+    movies = Movie.objects.bulk_create(movies, batch_size=BULK_BATCH)
+
+    relations = ((Movie.genres, genres, 1, 3), (Movie.actors, actors, 6, 12), (Movie.crew, crew, 2, 4))
+    for relation, targets, low, high in relations:
+        field = relation.field
+        source, target = field.m2m_field_name() + '_id', field.m2m_reverse_field_name() + '_id'
+        relation.through.objects.bulk_create(
+            [
+                relation.through(**{source: movie.pk, target: targets[index].pk})
+                for movie in movies
+                for index in rng.choice(len(targets), rng.integers(low, high + 1), replace=False)
+            ],
+            batch_size=BULK_BATCH,
+        )
+    return [movie.pk for movie in movies]
+
+
+def generate_books(rng, count, now):
+    books = []
+    for number in range(count):
+        published = now - timedelta(days=int(rng.integers(0, 80 * 365)))
+        # Google Books отдаёт дату с разной точностью: год, год-месяц или полную
+        published_date = (published.strftime('%Y'), published.strftime('%Y-%m'), published.strftime('%Y-%m-%d'))[number % 3]
+        book = Book(
+            google_id=f"{BENCH_GOOGLE_ID_PREFIX}{number}",
+            title=title(rng, number),
+            authors=[f"Author {int(author)}" for author in rng.integers(0, count // 4 + 1, rng.integers(1, 3))],
+            language='en',
+            published_date=published_date,
+            description=text(rng, 80),
+            categories=pick(rng, BOOK_CATEGORIES, 1, 2),
+            thumbnail=f"https://books.google.com/books/content?id=bench{number % 100}",
+            average_rating=float(np.clip(rng.normal(3.8, 0.6), 1, 5)),
+            ratings_count=int(5_000 / (number + 1) ** ZIPF_EXPONENT),
+            is_main_book=number < 5,
+            is_recently_trending_small=5 <= number < 25,
+        )
+        book.assign_published_fields()
+        books.append(book)
+    Book.objects.bulk_create(books, batch_size=BULK_BATCH)
+    return list(Book.objects.filter(google_id__startswith=BENCH_GOOGLE_ID_PREFIX).order_by('pk').values_list('pk', flat=True))
+
+
+def generate_users(count):
+    password = make_password(BENCH_PASSWORD)
+    users = [User(username=BENCH_POWER_USER, password=password, email=f"{BENCH_POWER_USER}@example.com")]
+    users += [
+        User(username=f"{BENCH_USERNAME_PREFIX}{number:06d}", password=password, email=f"bench{number}@example.com")
+        for number in range(count - 1)
+    ]
+    User.objects.bulk_create(users, batch_size=BULK_BATCH)
+    return list(User.objects.filter(username__startswith=BENCH_USERNAME_PREFIX).order_by('pk').values_list('pk', flat=True))
+
+
+def library_rows(rng, user_pk, content_type, item_pks, cdf, quality, size, now):
+    """Строки избранного, статусов и оценок одного пользователя для одного типа контента."""
+    config = LIBRARY_STATE_CONFIG[content_type]
+    field = f"{config['field']}_id"
+    picked = sample_items(rng, cdf, size)
+    rolls = rng.random((len(picked), 3))
+    added = random_moments(rng, now, len(picked))
+    rows = []
+    for index, item, (status_roll, rating_roll, favorite_roll), added_at in zip(picked, item_pks[picked], rolls, added):
+        relation = {'user_id': user_pk, field: int(item)}
+        bound = 0.0
+        for share, (_, model) in zip(STATUS_SHARES, config['statuses']):
+            bound += share
+            if status_roll < bound:
+                rows.append(model(added_at=added_at, **relation))
+                break
+        if rating_roll < RATED_SHARE:
+            rating = int(np.clip(round(quality[index] + rng.normal(0, 1.5)), 1, 10))
+            rows.append(config['rating_model'](rating=rating, **relation))
+        if favorite_roll < FAVORITE_SHARE:
+            rows.append(config['favorite_model'](added_at=added_at, **relation))
+    return rows
+
+
+def generate_libraries(rng, user_pks, items, scale, now, stdout=None):
+    """Библиотеки всех пользователей пачками по USER_CHUNK, каждая пачка - своя транзакция."""
+    cdfs = {content_type: popularity_cdf(len(pks)) for content_type, pks in items.items()}
+    quality = {content_type: rng.normal(6.5, 1.5, len(pks)) for content_type, pks in items.items()}
+    written = 0
+    started_at = time.monotonic()
+    for start in range(0, len(user_pks), USER_CHUNK):
+        chunk = user_pks[start:start + USER_CHUNK]
+        by_model = {}
+        for content_type, pks in items.items():
+            sizes = library_sizes(rng, scale['library_mean'], len(chunk))
+            if start == 0:
+                sizes[0] = scale['power_library']  # user_pks[0] - BENCH_POWER_USER
+            for user_pk, size in zip(chunk, sizes):
+                for row in library_rows(rng, user_pk, content_type, pks, cdfs[content_type], quality[content_type], int(size), now):
+                    by_model.setdefault(type(row), []).append(row)
+        with transaction.atomic():
+            for model, rows in by_model.items():
+                model.objects.bulk_create(rows, batch_size=BULK_BATCH)
+                written += len(rows)
+        if stdout:
+            elapsed = time.monotonic() - started_at
+            stdout.write(f"библиотеки: {start + len(chunk)}/{len(user_pks)} пользователей, {written} строк, {written / elapsed:.0f} строк/с")
+
+    for config in LIBRARY_STATE_CONFIG.values():
+        spread_timestamps(config['rating_model'].objects.filter(user__username__startswith=BENCH_USERNAME_PREFIX), 'updated_at')
+    return written
+
+
+def generate_comments(rng, user_pks, items, scale, stdout=None):
+    """
+    Отзывы: обычные - на популярные элементы, часть с ответами; плюс у самого популярного
+    элемента каждого типа глубокая лента (hot_threads отзывов, у первого hot_replies ответов и сотни лайков).
+    """
+    users = np.asarray(user_pks)
+    cdfs = {content_type: popularity_cdf(len(pks)) for content_type, pks in items.items()}
+    content_types = list(items)
+    top_level = []
+    for user_pk, count in zip(user_pks, rng.poisson(scale['comments_per_user'], len(user_pks))):
+        for _ in range(count):
+            content_type = content_types[int(rng.integers(len(content_types)))]
+            item = items[content_type][np.searchsorted(cdfs[content_type], rng.random())]
+            top_level.append(Comment(user_id=user_pk, title=text(rng, 3), content=text(rng, 40), **{f'{content_type}_id': int(item)}))
+    for content_type, pks in items.items():
+        top_level += [
+            Comment(user_id=int(user_pk), title=text(rng, 3), content=text(rng, 40), **{f'{content_type}_id': int(pks[0])})
+            for user_pk in rng.choice(users, scale['hot_threads'])
+        ]
+    top_level = Comment.objects.bulk_create(top_level, batch_size=BULK_BATCH)
+
+    replies = []
+    for comment in top_level:
+        if rng.random() < REPLIED_SHARE:
+            replies += [
+                Comment(user_id=int(user_pk), parent_id=comment.pk, title=text(rng, 2), content=text(rng, 20),
+                        game_id=comment.game_id, movie_id=comment.movie_id, book_id=comment.book_id)
+                for user_pk in rng.choice(users, rng.poisson(2) + 1)
+            ]
+    hot = top_level[-scale['hot_threads'] * len(items):]
+    for comment in hot[::scale['hot_threads']]:
+        replies += [
+            Comment(user_id=int(user_pk), parent_id=comment.pk, title=text(rng, 2), content=text(rng, 20),
+                    game_id=comment.game_id, movie_id=comment.movie_id, book_id=comment.book_id)
+            for user_pk in rng.choice(users, scale['hot_replies'])
+        ]
+    Comment.objects.bulk_create(replies, batch_size=BULK_BATCH)
+
+    likes = []
+    for index, comment in enumerate(hot):
+        likers = min(len(users), 500 if index % scale['hot_threads'] == 0 else int(rng.poisson(3)))
+        likes += [CommentLike(comment_id=comment.pk, user_id=int(user_pk)) for user_pk in rng.choice(users, likers, replace=False)]
+    CommentLike.objects.bulk_create(likes, batch_size=BULK_BATCH)
+
+    bench_comments = Comment.objects.filter(user__username__startswith=BENCH_USERNAME_PREFIX)
+    spread_timestamps(bench_comments, 'created_at')
+    bench_comments.update(**comment_counter_expressions())
+    if stdout:
+        stdout.write(f"отзывы: {len(top_level)} верхнего уровня, {len(replies)} ответов, {len(likes)} лайков")
+    return len(top_level) + len(replies)
+
+
+# Производные таблицы - теми же командами, что и в проде (bulk_create сигналы не вызывает)
+DERIVED_COMMANDS = (
+    ('rebuild_user_item_states',),
+    ('reconcile_mgb_ratings',),
+    ('rebuild_activity_log',),
+    ('rebuild_search_index',),
+    ('refresh_shelves',),
+    ('refresh_browse_facets',),
+    ('build_similar_items',),
+    ('build_recommendations',),
+)
+
+
+def benchmark_data_exists():
+    return User.objects.filter(username=BENCH_POWER_USER).exists()
+
+
+def generate_dataset(scale_name='small', seed=42, derived=True, stdout=None):
+    """Наполняет базу синтетикой масштаба BENCH_SCALES[scale_name]. Возвращает счётчики набора."""
+    scale = BENCH_SCALES[scale_name]
+    rng = np.random.default_rng(seed)
+    now = timezone.now()
+
+    def report(message):
+        if stdout:
+            stdout.write(message)
+
+    with transaction.atomic():
+        items = {
+            'game': np.asarray(generate_games(rng, scale['items'], now)),
+            'movie': np.asarray(generate_movies(rng, scale['items'], now)),
+            'book': np.asarray(generate_books(rng, scale['items'], now)),
+        }
+        user_pks = generate_users(scale['users'])
+    report(f"каталог: по {scale['items']} игр, фильмов и книг; пользователей: {len(user_pks)}")
+
+    generate_libraries(rng, user_pks, items, scale, now, stdout)
+    with transaction.atomic():
+        generate_comments(rng, user_pks, items, scale, stdout)
+
+    if derived:
+        for command in DERIVED_COMMANDS:
+            started_at = time.monotonic()
+            call_command(*command, stdout=stdout)
+            report(f"{command[0]}: {time.monotonic() - started_at:.1f} c")
+    return dataset_counts()
+
+
+def dataset_counts():
+    counts = {
+        'users': User.objects.count(),
+        'games': Game.objects.count(),
+        'movies': Movie.objects.count(),
+        'books': Book.objects.count(),
+        'comments': Comment.objects.count(),
+        'ratings': 0, 'statuses': 0, 'favorites': 0,
+    }
+    for config in LIBRARY_STATE_CONFIG.values():
+        counts['ratings'] += config['rating_model'].objects.count()
+        counts['favorites'] += config['favorite_model'].objects.count()
+        counts['statuses'] += sum(model.objects.count() for _, model in config['statuses'])
+    return counts
+
+
+# ЗАМЕРЫ
+# ---------------------------------------------------------------------------------
+BENCH_VIEWS = (
+    'games', 'movies', 'books', 'search_view', 'game_detail', 'movie_detail',
+    'profile', 'profile_history', 'favorite_games_list', 'favorite_movies_list', 'favorite_books_list', 'browse',
+)
+BENCH_VIEW_MODES = ('view-grid', 'view-list', 'view-tierlist')
+SEARCH_QUERIES = ('star', 'dark kingdom', 'legend of the lost')
+
+
+def benchmark_scenarios():
+    """{view: [(имя сценария, url), ...]} - детальные страницы берут самые популярные синтетические элементы."""
+    game = Game.objects.get(game_id=BENCH_ID_BASE)
+    movie = Movie.objects.get(tmdb_id=BENCH_ID_BASE)
+    scenarios = {
+        'games': [('games', reverse('games'))],
+        'movies': [('movies', reverse('movies'))],
+        'books': [('books', reverse('books'))],
+        'search_view': [(f"search_view:{query}", f"{reverse('search')}?q={quote(query)}") for query in SEARCH_QUERIES],
+        'game_detail': [('game_detail', reverse('game_detail', args=[game.pk]))],
+        'movie_detail': [('movie_detail', reverse('movie_detail', args=[movie.pk]))],
+        'profile': [('profile', reverse('users:profile'))],
+        'profile_history': [('profile_history', reverse('users:profile_history'))],
+        'browse': [
+            (f"browse:{key}{':' + query if query else ''}", f"{reverse('browse', args=[key])}?{query}")
+            for key in ('games', 'movies', 'books') for query in ('', 'rating=7&rating=8&sort=new')
+        ],
+    }
+    for slug in ('games', 'movies', 'books'):
+        view = f"favorite_{slug}_list"
+        scenarios[view] = [(f"{view}:{mode}", f"{reverse(f'users:{view}')}?view_mode={mode}") for mode in BENCH_VIEW_MODES]
+    return scenarios
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+def measure(client, url, iterations, warmup):
+    for _ in range(warmup):
+        client.get(url)
+
+    timings = []
+    queries = status = None
+    for _ in range(iterations):
+        with QueryProfile(capture_origin=False) as profile:
+            started_at = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - started_at)
+        queries = max(queries or 0, profile.count)
+        status = response.status_code
+
+    tracemalloc.start()
+    try:
+        client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'url': url,
+        'status': status,
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 2),
+        'queries': queries,
+        'peak_memory_kb': round(peak / 1024),
+    }
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def run_benchmark(views=None, iterations=20, warmup=3, stdout=None):
+    """Замеры сценариев от имени BENCH_POWER_USER. Возвращает словарь для JSON."""
+    user = User.objects.get(username=BENCH_POWER_USER)
+    scenarios = benchmark_scenarios()
+    results = {}
+
+    # Профилировщик запросов со стеком на каждый SQL исказил бы время - на замерах он выключен
+    with override_settings(QUERY_PROFILE=False):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        for view in views or BENCH_VIEWS:
+            for name, url in scenarios[view]:
+                results[name] = measure(client, url, iterations, warmup)
+                if stdout:
+                    result = results[name]
+                    stdout.write(
+                        f"{name}: p50 {result['p50_ms']} мс, p95 {result['p95_ms']} мс, "
+                        f"{result['queries']} запросов, пик {result['peak_memory_kb']} КБ (HTTP {result['status']})"
+                    )
+
+    return {
+        'started_at': timezone.now().isoformat(),
+        'commit': git_commit(),
+        'debug': settings.DEBUG,
+        'iterations': iterations,
+        'warmup': warmup,
+        'dataset': dataset_counts(),
+        'scenarios': results,
+    }
+
+
+def compare_results(previous, current):
+    """Строки отчёта: изменение p50/p95 (%) и числа запросов по сценариям, которые есть в обоих прогонах."""
+    lines = [f"сравнение с прогоном {previous.get('started_at')} ({previous.get('commit') or '?'})"]
+    for name, result in current['scenarios'].items():
+        before = previous.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms'):
+            if before[key]:
+                changes.append(f"{key[:3]} {result[key] - before[key]:+.1f} мс ({(result[key] / before[key] - 1) * 100:+.0f}%)")
+        changes.append(f"запросов {before['queries']} -> {result['queries']}")
+        lines.append(f"  {name}: {', '.join(changes)}")
+    return lines
+
+
+def write_results(results, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, ensure_ascii=False, indent=2))
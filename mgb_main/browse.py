@@ -0,0 +1,508 @@
+# mgb_main/browse.py
+"""
+Просмотр каталога с фильтрами: жанр, платформа, год, язык, тип (фильм/сериал) и диапазон рейтинга,
+keyset-пагинация и число элементов у каждого значения фасета для боковой панели.
+
+Счётчики не считаются GROUP BY на каждый запрос. После загрузки данных (и командой
+refresh_browse_facets) для каждого значения фасета строится битовая маска по позициям всех
+элементов типа - CatalogFacetIndex. Процесс держит маски в памяти, и счётчик значения при
+выбранных фильтрах - popcount(маска значения & маска остальных выбранных фасетов): доли
+миллисекунды на 100k элементов. Внутри фасета выбранные значения объединяются (ИЛИ),
+между фасетами - пересекаются (И).
+
+Сама страница элементов - запрос с теми же фильтрами и keyset по (ключ сортировки, pk),
+поэтому она всегда актуальна, а счётчики - на момент последней пересборки масок.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from functools import reduce
+from operator import or_
+
+import numpy as np
+from django.core import signing
+from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import (
+    BOOK_BROWSE_SORTS, GAME_BROWSE_SORTS, MOVIE_BROWSE_SORTS, Book, CatalogFacetIndex, Game, Genre, Movie, browse_sort_key,
+)
+
+BROWSE_PAGE_SIZE = 24
+BROWSE_CURSOR_SALT = 'catalog-browse'
+FACET_VALUES_LIMIT = 50          # сколько значений фасета отдавать в панель (выбранные - всегда)
+VERSION_CHECK_INTERVAL = 30      # как часто (сек) сверять маски в памяти с CatalogFacetIndex.built_at
+
+# (значение, подпись, от, до) на шкале 0-10: total_rating игр, vote_average фильмов, MGB-рейтинг книг
+RATING_BANDS = (
+    ('9', '9+', 9, None),
+    ('8', '8-9', 8, 9),
+    ('7', '7-8', 7, 8),
+    ('6', '6-7', 6, 7),
+    ('5', '5-6', 5, 6),
+    ('0', '<5', None, 5),
+)
+
+
+def any_of(queries):
+    return reduce(or_, queries)
+
+
+def rating_band(rating):
+    if rating is None:
+        return []
+    for value, _, low, high in RATING_BANDS:
+        if (low is None or rating >= low) and (high is None or rating < high):
+            return [value]
+    return []
+
+
+def first_year(*dates):
+    for value in dates:
+        if value:
+            return [str(value.year)]
+    return []
+
+
+# ФИЛЬТРЫ
+# Выбранные значения фасета -> Q; значения уже сверены с индексом фасетов.
+# ---------------------------------------------------------------------------------
+def overlap_filter(field):
+    """Поле-массив (genres, platforms игр): && по GIN-индексу."""
+    return lambda values: Q(**{f'{field}__overlap': values})
+
+
+def json_list_filter(field):
+    """JSON-список строк (categories книг): @> по GIN-индексу для каждого значения."""
+    return lambda values: any_of(Q(**{f'{field}__contains': [value]}) for value in values)
+
+
+def in_filter(field):
+    return lambda values: Q(**{f'{field}__in': values})
+
+
+def year_filter(*date_fields):
+    """Год первой заполненной даты: диапазоны по каждому полю (BETWEEN, индекс по дате работает)."""
+    def build(values):
+        queries = []
+        for year in map(int, values):
+            for number, field in enumerate(date_fields):
+                earlier_empty = {f'{earlier}__isnull': True for earlier in date_fields[:number]}
+                queries.append(Q(**earlier_empty, **{f'{field}__year': year}))
+        return any_of(queries)
+    return build
+
+
+def rating_filter(field, unrated=None):
+    """unrated - значение поля "оценок нет" (vote_average = 0): как и в фасете, не попадает ни в одну полосу."""
+    def build(values):
+        bands = {value: (low, high) for value, _, low, high in RATING_BANDS}
+        queries = []
+        for value in values:
+            low, high = bands[value]
+            bounds = {}
+            if low is not None:
+                bounds[f'{field}__gte'] = low
+            elif unrated is not None:
+                bounds[f'{field}__gt'] = unrated
+            if high is not None:
+                bounds[f'{field}__lt'] = high
+            queries.append(Q(**bounds))
+        return any_of(queries)
+    return build
+
+
+def movie_genre_filter(values):
+    genre_movies = Movie.genres.through.objects.filter(genre_id__in=[int(value) for value in values])
+    return Q(pk__in=genre_movies.values('movie_id'))
+
+
+# ЗНАЧЕНИЯ ФАСЕТОВ
+# Генераторы (pk, {фасет: [значения]}) по всем элементам - для сборки масок.
+# ---------------------------------------------------------------------------------
+def game_facet_values():
+    rows = Game.objects.values_list('pk', 'genres', 'platforms', 'release_date', 'total_rating')
+    for pk, genres, platforms, release_date, total_rating in rows.iterator(chunk_size=5000):
+        yield pk, {
+            'genre': genres or [],
+            'platform': platforms or [],
+            'year': first_year(release_date),
+            'rating': rating_band(total_rating),
+        }
+
+
+def movie_facet_values():
+    genres = defaultdict(list)
+    for movie_id, genre_id in Movie.genres.through.objects.values_list('movie_id', 'genre_id').iterator(chunk_size=5000):
+        genres[movie_id].append(str(genre_id))
+    rows = Movie.objects.values_list('pk', 'release_date', 'first_air_date', 'original_language', 'content_type', 'vote_average')
+    for pk, release_date, first_air_date, language, content_type, vote_average in rows.iterator(chunk_size=5000):
+        yield pk, {
+            'genre': genres[pk],
+            'year': first_year(release_date, first_air_date),
+            'language': [language] if language else [],
+            'content_type': [content_type],
+            # vote_average по умолчанию 0.0 - у фильма ещё нет оценок TMDb
+            'rating': rating_band(vote_average or None),
+        }
+
+
+def book_facet_values():
+    rows = Book.objects.values_list('pk', 'categories', 'published_year', 'language', 'mgb_average_rating')
+    for pk, categories, published_year, language, rating in rows.iterator(chunk_size=5000):
+        yield pk, {
+            'genre': [str(category) for category in categories] if isinstance(categories, list) else [],
+            'year': [str(published_year)] if published_year else [],
+            'language': [language] if language else [],
+            'rating': rating_band(rating),
+        }
+
+
+def movie_genre_labels():
+    return {str(pk): name for pk, name in Genre.objects.values_list('pk', 'name')}
+
+
+def rating_labels():
+    return {value: label for value, label, _, _ in RATING_BANDS}
+
+
+# КАРТОЧКИ
+# ---------------------------------------------------------------------------------
+def game_card(game):
+    return {
+        'id': game.pk,
+        'title': game.name,
+        'url': reverse('game_detail', args=[game.pk]),
+        'image': game.cover_url,
+        'year': game.release_date.year if game.release_date else None,
+        'rating': game.total_rating,
+        'rating_color': game.rating_color,
+        'platforms': game.platforms[:3],
+    }
+
+
+def movie_card(movie):
+    released = movie.release_date or movie.first_air_date
+    return {
+        'id': movie.pk,
+        'title': movie.title,
+        'url': reverse('movie_detail', args=[movie.pk]),
+        'image': movie.full_poster_path,
+        'year': released.year if released else None,
+        'rating': movie.vote_average,
+        'rating_color': movie.rating_color,
+        'content_type': movie.content_type,
+    }
+
+
+def book_card(book):
+    return {
+        'id': book.pk,
+        'title': book.title,
+        'url': reverse('book_detail', args=[book.google_id]) if book.google_id else None,
+        'image': book.thumbnail or book.custom_photo,
+        'year': book.published_year,
+        'rating': book.mgb_average_rating,
+        'rating_color': book.rating_color,
+        'authors': [str(author) for author in book.authors] if isinstance(book.authors, list) else [],
+    }
+
+
+# Фасеты каждого типа: фильтр, подписи значений (по умолчанию - само значение) и порядок в панели:
+# 'count' - по числу элементов, 'value' - по убыванию значения (годы), 'labels' - как в подписях.
+# sorts - ключ сортировки и значение вместо NULL (такие элементы идут в конце), по нему же keyset.
+# source_fields - поля, от которых зависят маски (sync_catalog_changes пересобирает их только при изменении этих полей).
+BROWSE_CONFIG = {
+    'games': {
+        'model': Game,
+        'content_type': 'game',
+        'facet_values': game_facet_values,
+        'facets': {
+            'genre': {'filter': overlap_filter('genres'), 'order': 'count'},
+            'platform': {'filter': overlap_filter('platforms'), 'order': 'count'},
+            'year': {'filter': year_filter('release_date'), 'order': 'value'},
+            'rating': {'filter': rating_filter('total_rating'), 'labels': rating_labels, 'order': 'labels'},
+        },
+        'sorts': GAME_BROWSE_SORTS,
+        'card': game_card,
+        'card_fields': ['name', 'cover_url', 'release_date', 'total_rating', 'rating_color', 'platforms'],
+        'source_fields': {'genres', 'platforms', 'release_date', 'first_release_date', 'total_rating'},
+    },
+    'movies': {
+        'model': Movie,
+        'content_type': 'movie',
+        'facet_values': movie_facet_values,
+        'facets': {
+            'genre': {'filter': movie_genre_filter, 'labels': movie_genre_labels, 'order': 'count'},
+            'year': {'filter': year_filter('release_date', 'first_air_date'), 'order': 'value'},
+            'language': {'filter': in_filter('original_language'), 'order': 'count'},
+            'content_type': {'filter': in_filter('content_type'), 'labels': lambda: dict(Movie.CONTENT_TYPE_CHOICES), 'order': 'labels'},
+            'rating': {'filter': rating_filter('vote_average', unrated=0), 'labels': rating_labels, 'order': 'labels'},
+        },
+        'sorts': MOVIE_BROWSE_SORTS,
+        'card': movie_card,
+        'card_fields': ['title', 'full_poster_path', 'release_date', 'first_air_date', 'vote_average', 'rating_color', 'content_type'],
+        'source_fields': {'genres', 'release_date', 'first_air_date', 'original_language', 'content_type', 'vote_average'},
+    },
+    'books': {
+        'model': Book,
+        'content_type': 'book',
+        'facet_values': book_facet_values,
+        'facets': {
+            'genre': {'filter': json_list_filter('categories'), 'order': 'count'},
+            'year': {'filter': in_filter('published_year'), 'order': 'value'},
+            'language': {'filter': in_filter('language'), 'order': 'count'},
+            'rating': {'filter': rating_filter('mgb_average_rating'), 'labels': rating_labels, 'order': 'labels'},
+        },
+        'sorts': BOOK_BROWSE_SORTS,
+        'card': book_card,
+        'card_fields': ['google_id', 'title', 'thumbnail', 'custom_photo', 'published_year', 'mgb_average_rating', 'rating_color', 'authors'],
+        'source_fields': {'categories', 'published_date', 'published_year', 'language', 'mgb_average_rating'},
+    },
+}
+
+DEFAULT_SORT = 'popular'
+
+
+# СБОРКА МАСОК
+# ---------------------------------------------------------------------------------
+def ordered_facet_values(facet_config, positions):
+    """[[значение, подпись, элементов], ...] в порядке панели."""
+    labels = facet_config['labels']() if 'labels' in facet_config else {}
+    order = facet_config['order']
+    if order == 'labels':
+        values = [value for value in labels if value in positions]
+    elif order == 'value':
+        values = sorted(positions, reverse=True)
+    else:
+        values = sorted(positions, key=lambda value: (-len(positions[value]), value))
+    return [[value, labels.get(value, value), len(positions[value])] for value in values]
+
+
+def build_facet_index(content_key):
+    """
+    Маски всех значений фасетов типа: позиции элементов - порядок pk, строка масок на значение.
+    Сохраняется в CatalogFacetIndex одной строкой. Возвращает (элементов, значений фасетов).
+    """
+    config = BROWSE_CONFIG[content_key]
+    built_at = timezone.now()
+    item_ids = []
+    positions = {facet: defaultdict(list) for facet in config['facets']}
+    for position, (pk, values) in enumerate(sorted(config['facet_values'](), key=lambda row: row[0])):
+        item_ids.append(pk)
+        for facet, facet_values in values.items():
+            for value in set(facet_values):
+                positions[facet][value].append(position)
+
+    facets = []
+    bitmaps = []
+    for facet, facet_config in config['facets'].items():
+        values = ordered_facet_values(facet_config, positions[facet])
+        facets.append([facet, values])
+        for value, _, _ in values:
+            mask = np.zeros(len(item_ids), dtype=bool)
+            mask[positions[facet][value]] = True
+            bitmaps.append(np.packbits(mask))
+
+    row_bytes = (len(item_ids) + 7) // 8
+    matrix = np.vstack(bitmaps) if bitmaps else np.zeros((0, row_bytes), dtype=np.uint8)
+    with transaction.atomic():
+        CatalogFacetIndex.objects.update_or_create(content_type=config['content_type'], defaults={
+            'item_ids': np.asarray(item_ids, dtype=np.int32).tobytes(),
+            'facets': facets,
+            'bitmaps': matrix.tobytes(),
+            'built_at': built_at,
+        })
+    return len(item_ids), len(bitmaps)
+
+
+def refresh_facet_indexes(*content_keys):
+    """Пересобирает маски указанных типов (по умолчанию - всех). Вызывается после загрузки данных."""
+    for content_key in content_keys or BROWSE_CONFIG:
+        build_facet_index(content_key)
+
+
+def refresh_facet_index_for_changes(content_key, changed_fields):
+    """Пересборка после точечного обновления - только если изменились поля, из которых строятся фасеты."""
+    if not BROWSE_CONFIG[content_key]['source_fields'] & set(changed_fields):
+        return False
+    build_facet_index(content_key)
+    return True
+
+
+# МАСКИ В ПАМЯТИ
+# ---------------------------------------------------------------------------------
+class FacetIndex:
+    """Маски одного типа контента в памяти процесса; счётчики при выбранных фильтрах - побитовые И и popcount."""
+
+    def __init__(self, row):
+        self.built_at = row.built_at
+        self.checked_at = time.monotonic()
+        self.item_count = len(row.item_ids) // 4
+        self.facets = dict(row.facets)
+        self.rows = {}
+        for facet, values in self.facets.items():
+            for value, _, _ in values:
+                self.rows[(facet, value)] = len(self.rows)
+        row_bytes = (self.item_count + 7) // 8
+        self.bitmaps = np.frombuffer(bytes(row.bitmaps), dtype=np.uint8).reshape(len(self.rows), row_bytes)
+
+    def clean_selection(self, selected):
+        """Только известные индексу значения: остальное - опечатки или значения, появившиеся после сборки."""
+        cleaned = {}
+        for facet, values in selected.items():
+            known = [value for value in dict.fromkeys(values) if (facet, value) in self.rows]
+            if known:
+                cleaned[facet] = known
+        return cleaned
+
+    def selection_mask(self, selected, skip=None):
+        """Маска элементов, подходящих под все выбранные фасеты, кроме skip; None - фильтров нет."""
+        mask = None
+        for facet, values in selected.items():
+            if facet == skip or not values:
+                continue
+            facet_mask = np.bitwise_or.reduce(self.bitmaps[[self.rows[(facet, value)] for value in values]], axis=0)
+            mask = facet_mask if mask is None else mask & facet_mask
+        return mask
+
+    def total(self, selected):
+        mask = self.selection_mask(selected)
+        return self.item_count if mask is None else int(np.bitwise_count(mask).sum())
+
+    def counts(self, selected, limit=FACET_VALUES_LIMIT):
+        """
+        {фасет: [{value, label, count, selected}, ...]}. Счётчик значения - сколько элементов с этим
+        значением подходит под выбранное в остальных фасетах (свой фасет не сужает свои же счётчики).
+        """
+        result = {}
+        for facet, values in self.facets.items():
+            chosen = set(selected.get(facet, ()))
+            mask = self.selection_mask(selected, skip=facet)
+            if mask is None:
+                counts = [count for _, _, count in values]
+            else:
+                start = self.rows[(facet, values[0][0])] if values else 0
+                counts = np.bitwise_count(self.bitmaps[start:start + len(values)] & mask).sum(axis=1).tolist()
+
+            entries = []
+            for (value, label, _), count in zip(values, counts):
+                if value in chosen or (count and len(entries) < limit):
+                    entries.append({'value': value, 'label': label, 'count': int(count), 'selected': value in chosen})
+            result[facet] = entries
+        return result
+
+
+_indexes = {}
+_load_lock = threading.Lock()
+
+
+def get_facet_index(content_key):
+    """
+    Маски типа для текущего процесса: загружаются один раз и перечитываются, когда
+    CatalogFacetIndex.built_at меняется (сверка не чаще раза в VERSION_CHECK_INTERVAL).
+    Если масок ещё нет (первый запуск), они собираются на месте.
+    """
+    content_type = BROWSE_CONFIG[content_key]['content_type']
+    index = _indexes.get(content_key)
+    now = time.monotonic()
+    if index is not None and now - index.checked_at < VERSION_CHECK_INTERVAL:
+        return index
+
+    built_at = CatalogFacetIndex.objects.filter(content_type=content_type).values_list('built_at', flat=True).first()
+    if index is not None and index.built_at == built_at:
+        index.checked_at = now
+        return index
+
+    with _load_lock:
+        if _indexes.get(content_key) is index:
+            if built_at is None:
+                build_facet_index(content_key)
+            _indexes[content_key] = FacetIndex(CatalogFacetIndex.objects.get(content_type=content_type))
+        return _indexes[content_key]
+
+
+# СТРАНИЦА ЭЛЕМЕНТОВ (keyset)
+# ---------------------------------------------------------------------------------
+def encode_browse_cursor(scope, value, pk):
+    if isinstance(value, date):
+        value = value.isoformat()
+    return signing.dumps([scope, value, pk], salt=BROWSE_CURSOR_SALT, compress=True)
+
+
+def decode_browse_cursor(cursor, scope, empty):
+    """(значение ключа сортировки, pk) или None, если курсор битый или выдан для другой сортировки."""
+    try:
+        cursor_scope, value, pk = signing.loads(cursor, salt=BROWSE_CURSOR_SALT)
+        if isinstance(empty, date):
+            value = date.fromisoformat(value)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    if cursor_scope != scope:
+        return None
+    return value, pk
+
+
+def filtered_queryset(content_key, selected):
+    config = BROWSE_CONFIG[content_key]
+    queryset = config['model'].objects.all()
+    for facet, values in selected.items():
+        if values:
+            queryset = queryset.filter(config['facets'][facet]['filter'](values))
+    return queryset
+
+
+def browse_items(content_key, selected, sort=DEFAULT_SORT, cursor=None, page_size=BROWSE_PAGE_SIZE):
+    """
+    Страница элементов под выбранные фасеты: keyset по (ключ сортировки, pk) по убыванию, без OFFSET.
+    Возвращает (список объектов, курсор следующей страницы или None).
+    """
+    config = BROWSE_CONFIG[content_key]
+    if sort not in config['sorts']:
+        sort = DEFAULT_SORT
+    fields, empty = config['sorts'][sort]
+    queryset = filtered_queryset(content_key, selected).annotate(
+        browse_sort=browse_sort_key(fields, empty),
+    ).only('pk', *config['card_fields']).order_by('-browse_sort', '-pk')
+
+    scope = f'{content_key}:{sort}'
+    position = decode_browse_cursor(cursor, scope, empty) if cursor else None
+    if position is not None:
+        value, pk = position
+        # Нестрогое условие - граница диапазона для индекса (ключ, id), точное - фильтром поверх
+        queryset = queryset.filter(browse_sort__lte=value).filter(Q(browse_sort__lt=value) | Q(pk__lt=pk))
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_browse_cursor(scope, items[-1].browse_sort, items[-1].pk)
+    return items, next_cursor
+
+
+def parse_selection(content_key, params):
+    """{фасет: [значения]} из GET-параметров (?genre=...&genre=...&year=2020)."""
+    return {facet: params.getlist(facet) for facet in BROWSE_CONFIG[content_key]['facets'] if params.getlist(facet)}
+
+
+def browse_catalog(content_key, params, page_size=BROWSE_PAGE_SIZE):
+    """Ответ API просмотра: выбранные фильтры, счётчики фасетов, всего под фильтры и страница карточек."""
+    config = BROWSE_CONFIG[content_key]
+    index = get_facet_index(content_key)
+    selected = index.clean_selection(parse_selection(content_key, params))
+    sort = params.get('sort') if params.get('sort') in config['sorts'] else DEFAULT_SORT
+    items, next_cursor = browse_items(content_key, selected, sort, params.get('cursor'), page_size)
+    return {
+        'content_type': content_key,
+        'sort': sort,
+        'sorts': list(config['sorts']),
+        'selected': selected,
+        'total': index.total(selected),
+        'facets': index.counts(selected),
+        'facets_built_at': index.built_at.isoformat(),
+        'results': [config['card'](item) for item in items],
+        'next_cursor': next_cursor,
+    }
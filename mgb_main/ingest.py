@@ -0,0 +1,220 @@
+# mgb_main/ingest.py
+import hashlib
+import json
+
+from django.utils import timezone
+
+from users.models import IngestionRun
+
+
+def bulk_link(relation, pairs, batch_size=1000):
+    """
+    Связи M2M пачкой: один INSERT в through-таблицу вместо .add() на каждую пару.
+    relation - дескриптор поля (Movie.genres), pairs - [(pk источника, pk цели), ...].
+    Существующие связи не трогаются (ON CONFLICT DO NOTHING), как и при .add().
+    """
+    through = relation.through
+    field = relation.field
+    source_column = field.m2m_field_name() + '_id'
+    target_column = field.m2m_reverse_field_name() + '_id'
+    links = [through(**{source_column: source, target_column: target}) for source, target in set(pairs)]
+    through.objects.bulk_create(links, batch_size=batch_size, ignore_conflicts=True)
+    return len(links)
+
+
+def pick_tmdb_trailer(videos):
+    """
+    Трейлер из videos TMDb (append_to_response=videos): YouTube, тип Trailer, ru или en.
+    Приоритет официальным, русский официальный - сразу. Возвращает (key, name) или (None, None).
+    """
+    trailer_key = None
+    trailer_name = None
+    for video in (videos or {}).get("results", []):
+        is_trailer = video.get("type") == "Trailer"
+        is_official = video.get("official") is True
+        site_is_youtube = video.get("site") == "YouTube"
+        lang_ru = video.get("iso_639_1") == "ru"
+        lang_en = video.get("iso_639_1") == "en"
+
+        if site_is_youtube and is_trailer:
+            if is_official and (lang_ru or lang_en):
+                trailer_key = video.get("key")
+                trailer_name = video.get("name")
+                if lang_ru:
+                    break
+            elif trailer_key is None and (lang_ru or lang_en):
+                trailer_key = video.get("key")
+                trailer_name = video.get("name")
+    return trailer_key, trailer_name
+
+
+def igdb_names(values, key='name'):
+    """
+    Список IGDB -> список строк для ArrayField: словари {"id": ..., "name": ...} дают name,
+    строки остаются как есть. Старые записи хранили список JSON-строкой - она тоже разбирается.
+    """
+    if isinstance(values, str):
+        try:
+            values = json.loads(values)
+        except ValueError:
+            return []
+    if not isinstance(values, list):
+        return []
+    names = (value.get(key) if isinstance(value, dict) else value for value in values)
+    return [str(name) for name in names if name]
+
+
+def igdb_ids(values):
+    """Список id IGDB (числа или словари с "id") -> список int."""
+    if isinstance(values, str):
+        try:
+            values = json.loads(values)
+        except ValueError:
+            return []
+    if not isinstance(values, list):
+        return []
+    ids = (value.get('id') if isinstance(value, dict) else value for value in values)
+    return [int(game_id) for game_id in ids if isinstance(game_id, int) or (isinstance(game_id, str) and game_id.isdigit())]
+
+
+def payload_hash(payload):
+    """md5 от полей записи в том виде, в каком их пишет загрузчик. Совпал с source_hash - строку не трогаем."""
+    return hashlib.md5(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def with_display_fields(model, defaults):
+    """
+    defaults для update_or_create плюс поля для отображения (model.DISPLAY_FIELDS), посчитанные по ним:
+    update_or_create сохраняет только поля defaults, а assign_display_fields вызывается в save().
+    """
+    obj = model(**defaults)
+    obj.assign_display_fields()
+    return {**defaults, **{name: getattr(obj, name) for name in model.DISPLAY_FIELDS}}
+
+
+def apply_changed_payloads(model, key_field, payloads, batch_size=500):
+    """
+    Обновляет уже загруженные записи по свежим данным источника {ключ: поля записи}.
+    Сначала один запрос за source_hash: строки с тем же хэшем пропускаются. Остальные
+    читаются целиком и сравниваются по полям; записываются только изменившиеся поля
+    (один bulk_update). Возвращает {pk: множество изменившихся полей}.
+    """
+    hashes = {key: payload_hash(payload) for key, payload in payloads.items()}
+    stored = model.objects.filter(**{f'{key_field}__in': hashes}).values_list(key_field, 'source_hash')
+    stale = [key for key, source_hash in stored if source_hash != hashes[key]]
+
+    changed = {}
+    objects = []
+    update_fields = {'source_hash'}
+    for obj in model.objects.filter(**{f'{key_field}__in': stale}):
+        key = getattr(obj, key_field)
+        row_changes = set()
+        for name, value in payloads[key].items():
+            value = model._meta.get_field(name).to_python(value)
+            if getattr(obj, name) != value:
+                setattr(obj, name, value)
+                row_changes.add(name)
+        # Производные поля (save() здесь не вызывается): цвет рейтинга и поля для отображения
+        derived = []
+        if hasattr(obj, 'assign_rating_color'):
+            derived.append((obj.assign_rating_color, ['rating_color']))
+        if hasattr(obj, 'assign_display_fields'):
+            derived.append((obj.assign_display_fields, model.DISPLAY_FIELDS))
+        for assign, fields in derived:
+            stored = [getattr(obj, name) for name in fields]
+            assign()
+            row_changes.update(name for name, value in zip(fields, stored) if getattr(obj, name) != value)
+        obj.source_hash = hashes[key]
+        objects.append(obj)
+        update_fields |= row_changes
+        if row_changes:
+            changed[obj.pk] = row_changes
+
+    # Строки, где изменился только хэш (например, первая синхронизация), тоже пишем - чтобы в следующий раз пропустить
+    model.objects.bulk_update(objects, sorted(update_fields), batch_size=batch_size)
+    return changed
+
+
+class IngestionCheckpoint:
+    """
+    Прогресс запуска загрузки по страницам (IngestionRun). Используется как контекстный менеджер:
+
+        with IngestionCheckpoint(IngestionRun.SOURCE_GAMES, {...}, resume=True, stdout=self.stdout) as checkpoint:
+            if not checkpoint.is_done(offset): ...
+            with transaction.atomic():
+                ...запись страницы...
+                checkpoint.mark_done(offset, saved)
+
+    При resume продолжается последний незавершённый запуск источника с его параметрами:
+    записанные страницы пропускаются. resume_match - параметры, которые должны совпасть
+    (у одного источника бывают разные задачи, например backfill с разными именами). Запуск, упавший с исключением или с незагруженными
+    страницами, остаётся незавершённым (failed) - его и подхватит следующий --resume.
+    """
+
+    def __init__(self, source, params, resume=False, stdout=None, resume_match=None):
+        self.run = None
+        if resume:
+            runs = IngestionRun.objects.filter(source=source).exclude(status=IngestionRun.STATUS_COMPLETED)
+            if resume_match:
+                runs = runs.filter(params__contains=resume_match)
+            self.run = runs.order_by('-started_at').first()
+        if self.run is None:
+            self.run = IngestionRun.objects.create(source=source, params=params)
+            if resume and stdout:
+                stdout.write(f"Незавершённых запусков {source} нет, начинаем новый #{self.run.pk}")
+        else:
+            self.run.status = IngestionRun.STATUS_RUNNING
+            self.run.error = ''
+            self.run.save(update_fields=['status', 'error', 'updated_at'])
+            if stdout:
+                stdout.write(
+                    f"Продолжаем запуск {source} #{self.run.pk}: уже записано {len(self.run.completed_pages)} страниц, "
+                    f"{self.run.items_saved} записей"
+                )
+        self.done = set(self.run.completed_pages)
+        self.failed = []
+
+    @property
+    def params(self):
+        return self.run.params
+
+    @property
+    def items_saved(self):
+        return self.run.items_saved
+
+    def set_param(self, name, value):
+        """Параметр, вычисленный уже после старта (например, список категорий) - сохраняется для --resume."""
+        self.run.params[name] = value
+        self.run.save(update_fields=['params', 'updated_at'])
+
+    def is_done(self, page_key):
+        return page_key in self.done
+
+    def mark_done(self, page_key, saved):
+        """Отмечает страницу записанной. Вызывать в той же транзакции, что и запись самой страницы."""
+        if page_key in self.done:
+            return
+        self.run.completed_pages.append(page_key)
+        self.run.items_saved += saved
+        self.run.save(update_fields=['completed_pages', 'items_saved', 'updated_at'])
+        self.done.add(page_key)
+
+    def mark_failed(self, page_key):
+        """Страница не загрузилась (ошибка API) - запуск не будет считаться завершённым."""
+        self.failed.append(page_key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.run.status = IngestionRun.STATUS_FAILED
+            self.run.error = f"{exc_type.__name__}: {exc}"
+        elif self.failed:
+            self.run.status = IngestionRun.STATUS_FAILED
+            self.run.error = f"Не загружено страниц: {len(self.failed)} ({', '.join(map(str, self.failed[:20]))})"
+        else:
+            self.run.status = IngestionRun.STATUS_COMPLETED
+        self.run.finished_at = timezone.now()
+        self.run.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+        return False
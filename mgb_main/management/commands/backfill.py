@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from mgb_main.backfill import BACKFILLS, DEFAULT_BATCH_SIZE, run_backfill
+
+
+class Command(BaseCommand):
+    help = "Заполняет производные поля по уже загруженным данным: " + "; ".join(
+        f"{name} - {config['help']}" for name, config in BACKFILLS.items()
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=list(BACKFILLS), action='append', help="Выполнить только эту задачу")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Строк (диапазон pk) в одной транзакции")
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать, сколько строк изменится")
+        parser.add_argument('--resume', action='store_true', help="Продолжить последний прерванный запуск задачи")
+
+    def handle(self, *args, **options):
+        for name in options['only'] or BACKFILLS:
+            scanned, updated = run_backfill(
+                name, batch_size=options['batch_size'], dry_run=options['dry_run'],
+                resume=options['resume'], stdout=self.stdout,
+            )
+            verb = "изменилось бы" if options['dry_run'] else "изменено"
+            self.stdout.write(self.style.SUCCESS(f"{name}: просмотрено {scanned} строк, {verb} {updated}"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from mgb_main.recommendations import (
+    FACTORS, RECOMMENDATIONS_CONFIG, TOP_N, build_recommendations, refresh_changed_recommendations,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает персональные рекомендации \"Для вас\" по оценкам, статусам и избранному пользователей; "
+        "с --changed - только для пользователей, у которых библиотека изменилась после прошлого расчёта"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=list(RECOMMENDATIONS_CONFIG), action='append', help="Пересчитать только этот тип контента")
+        parser.add_argument('--changed', action='store_true', help="Только изменившиеся пользователи, по факторам прошлого полного пересчёта")
+        parser.add_argument('--factors', type=int, default=FACTORS, help="Число факторов SVD (при полном пересчёте)")
+        parser.add_argument('--top-n', type=int, default=TOP_N, help="Рекомендаций на пользователя")
+
+    def handle(self, *args, **options):
+        for content_key in options['only'] or RECOMMENDATIONS_CONFIG:
+            if options['changed']:
+                users = refresh_changed_recommendations(content_key, top_n=options['top_n'], stdout=self.stdout)
+                self.stdout.write(self.style.SUCCESS(f"{content_key}: пересчитано пользователей: {users}"))
+            else:
+                saved = build_recommendations(content_key, factors=options['factors'], top_n=options['top_n'], stdout=self.stdout)
+                self.stdout.write(self.style.SUCCESS(f"{content_key}: записано {saved} рекомендаций"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from mgb_main.similar_items import SIMILAR_ITEMS_CONFIG, TOP_K, build_similar_items
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает индекс похожих игр, фильмов и книг (ItemNeighbor) по жанрам, авторам, описаниям и т.п."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=list(SIMILAR_ITEMS_CONFIG), action='append', help="Пересчитать только этот тип контента")
+        parser.add_argument('--top-k', type=int, default=TOP_K, help="Соседей на элемент")
+
+    def handle(self, *args, **options):
+        for content_key in options['only'] or SIMILAR_ITEMS_CONFIG:
+            saved = build_similar_items(content_key, top_k=options['top_k'], stdout=self.stdout)
+            self.stdout.write(self.style.SUCCESS(f"{content_key}: записано {saved} соседей"))
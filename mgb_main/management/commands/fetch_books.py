@@ -1,13 +1,11 @@
-import requests
-import os
-from dotenv import load_dotenv
 from django.core.management.base import BaseCommand
-from users.models import Book  # Убедись, что модель Book существует и подключена
-
-load_dotenv()
-
-GOOGLE_BOOKS_API_URL = "https://www.googleapis.com/books/v1/volumes"
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+from django.db import transaction
+from users.models import Book, IngestionRun, parse_published_date  # Убедись, что модель Book существует и подключена
+from mgb_main.api_client import GOOGLE_BOOKS_CLIENT
+from mgb_main.ingest import IngestionCheckpoint
+from mgb_main.autocomplete import invalidate_autocomplete_index
+from mgb_main.browse import refresh_facet_indexes
+from mgb_main.shelves import refresh_shelf_snapshots
 
 # Количество книг, которое нужно скачать
 TOTAL_BOOKS = 10000
@@ -26,20 +24,18 @@ def get_unique_categories():
     for genre in genres:
         params = {
             "q": f"subject:{genre}",
-            "key": GOOGLE_API_KEY,
             "maxResults": 40
         }
-        response = requests.get(GOOGLE_BOOKS_API_URL, params=params)
+        data = GOOGLE_BOOKS_CLIENT.get("volumes", params)
 
-        if response.status_code == 200:
-            data = response.json()
+        if data is not None:
             items = data.get("items", [])
             for item in items:
                 volume_info = item.get("volumeInfo", {})
                 book_categories = volume_info.get("categories", [])
                 categories.update(book_categories)
         else:
-            print(f"Ошибка при загрузке категории {genre}: {response.status_code}")
+            print(f"Ошибка при загрузке категории {genre}")
 
     return list(categories)
 
@@ -47,74 +43,87 @@ def get_unique_categories():
 class Command(BaseCommand):
     help = "Fetch and store books from Google Books API"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--resume', action='store_true', help="Продолжить последний прерванный запуск с его параметрами")
+
     def handle(self, *args, **kwargs):
-        total_books = 0
         max_requests = TOTAL_BOOKS // MAX_RESULTS
         if TOTAL_BOOKS % MAX_RESULTS != 0:
             max_requests += 1
 
-        # Получаем список уникальных категорий
-        all_categories = get_unique_categories()
-
-        # Перебираем все категории
-        for category in all_categories:
-            if category in ["Beard", "Children", "Literature"]:  # Пример исключения неправильных категорий
-                continue
-
-            print(f"Загружаем книги для категории: {category}")  # Логирование категории
-
-            for start_index in range(0, max_requests * MAX_RESULTS, MAX_RESULTS):
-                if total_books >= TOTAL_BOOKS:
-                    break
-
-                params = {
-                    "q": f"subject:{category}",
-                    "startIndex": start_index,
-                    "maxResults": MAX_RESULTS,
-                    "key": GOOGLE_API_KEY,
-                }
-
-                response = requests.get(GOOGLE_BOOKS_API_URL, params=params)
-
-                if response.status_code == 200:
-                    data = response.json()
-                    books = data.get("items", [])
-
-                    for item in books:
-                        volume_info = item.get("volumeInfo", {})
-                        identifiers = volume_info.get("industryIdentifiers", [])
-                        isbn_13 = next((i["identifier"] for i in identifiers if i["type"] == "ISBN_13"), None)
-
-                        # Сохраняем или обновляем книгу
-                        Book.objects.update_or_create(
-                            google_id=item["id"],
-                            defaults={
-                                "title": volume_info.get("title"),
-                                "authors": volume_info.get("authors", []),
-                                "published_date": volume_info.get("publishedDate"),
-                                "description": self.get_short_description(volume_info.get("description")),
-                                "categories": volume_info.get("categories", []),
-                                "average_rating": volume_info.get("averageRating"),
-                                "ratings_count": volume_info.get("ratingsCount"),
-                                "thumbnail": volume_info.get("imageLinks", {}).get("thumbnail"),
-                                "language": volume_info.get("language"),
-                                "isbn_13": isbn_13,
-                            }
-                        )
-
-                        total_books += 1
-                        if total_books >= TOTAL_BOOKS:
-                            break
-
-                    self.stdout.write(self.style.SUCCESS(f"{len(books)} книг загружено по категории '{category}' (начиная с {start_index})"))
-                else:
-                    self.stderr.write(f"Ошибка API: {response.status_code}")
+        with IngestionCheckpoint(IngestionRun.SOURCE_BOOKS, {'total_books': TOTAL_BOOKS}, resume=kwargs['resume'], stdout=self.stdout) as checkpoint:
+            # Список категорий запоминаем в запуске: при --resume страницы должны совпасть с прерванным
+            if 'categories' not in checkpoint.params:
+                checkpoint.set_param('categories', sorted(get_unique_categories()))
+            total_limit = checkpoint.params['total_books']
+
+            # Перебираем все категории
+            for category in checkpoint.params['categories']:
+                if category in ["Beard", "Children", "Literature"]:  # Пример исключения неправильных категорий
+                    continue
+
+                print(f"Загружаем книги для категории: {category}")  # Логирование категории
+
+                for start_index in range(0, max_requests * MAX_RESULTS, MAX_RESULTS):
+                    if checkpoint.items_saved >= total_limit:
+                        break
+                    page_key = f"{category}:{start_index}"
+                    if checkpoint.is_done(page_key):
+                        continue
+
+                    params = {
+                        "q": f"subject:{category}",
+                        "startIndex": start_index,
+                        "maxResults": MAX_RESULTS,
+                    }
+
+                    data = GOOGLE_BOOKS_CLIENT.get("volumes", params)
+
+                    if data is not None:
+                        books = data.get("items", [])[:total_limit - checkpoint.items_saved]
+                        self.save_page(checkpoint, page_key, books)
+
+                        self.stdout.write(self.style.SUCCESS(f"{len(books)} книг загружено по категории '{category}' (начиная с {start_index})"))
+                    else:
+                        self.stderr.write(f"Ошибка API: категория '{category}', startIndex {start_index}")
+                        checkpoint.mark_failed(page_key)
+                        break
+
+                if checkpoint.items_saved >= total_limit:
                     break
 
-            if total_books >= TOTAL_BOOKS:
-                break
+        self.stdout.write(self.style.SUCCESS(f"Всего загружено книг: {checkpoint.items_saved}"))
+        invalidate_autocomplete_index()
+        refresh_shelf_snapshots('books')
+        refresh_facet_indexes('books')
 
-        self.stdout.write(self.style.SUCCESS(f"Всего загружено книг: {total_books}"))
+    def save_page(self, checkpoint, page_key, books):
+        """Книги страницы и отметка страницы в IngestionRun - в одной транзакции."""
+        with transaction.atomic():
+            for item in books:
+                volume_info = item.get("volumeInfo", {})
+                identifiers = volume_info.get("industryIdentifiers", [])
+                isbn_13 = next((i["identifier"] for i in identifiers if i["type"] == "ISBN_13"), None)
+
+                # Сохраняем или обновляем книгу
+                Book.objects.update_or_create(
+                    google_id=item["id"],
+                    defaults={
+                        "title": volume_info.get("title"),
+                        "authors": volume_info.get("authors", []),
+                        "published_date": volume_info.get("publishedDate"),
+                        # update_or_create сохраняет только поля defaults, поэтому разобранная дата - явно
+                        **parse_published_date(volume_info.get("publishedDate")),
+                        "description": self.get_short_description(volume_info.get("description")),
+                        "categories": volume_info.get("categories", []),
+                        "average_rating": volume_info.get("averageRating"),
+                        "ratings_count": volume_info.get("ratingsCount"),
+                        "thumbnail": volume_info.get("imageLinks", {}).get("thumbnail"),
+                        "language": volume_info.get("language"),
+                        "isbn_13": isbn_13,
+                    }
+                )
+            checkpoint.mark_done(page_key, len(books))
 
     def get_short_description(self, description):
         if not description:
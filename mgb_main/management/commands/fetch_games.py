@@ -1,96 +1,179 @@
+import asyncio
 import re
-import requests
-import os
-from dotenv import load_dotenv
-from django.core.management.base import BaseCommand
-from users.models import Game
-
-load_dotenv()
+import time
 
-client_id_games = os.getenv("CLIENT_ID")
-auth_games_token = os.getenv("AUTHORIZATION_GAMES_TOKEN")
-
-API_URL = "https://api.igdb.com/v4/games"
-COMPANY_API_URL = "https://api.igdb.com/v4/involved_companies"
-HEADERS = {
-    "Client-ID": f"{client_id_games}",
-    "Authorization": f"Bearer {auth_games_token}"
-}
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from users.models import Game, IngestionRun
+from mgb_main.api_client import IGDB_CLIENT
+from mgb_main.autocomplete import invalidate_autocomplete_index
+from mgb_main.browse import refresh_facet_indexes
+from mgb_main.ingest import IngestionCheckpoint, igdb_ids, igdb_names, payload_hash
+from mgb_main.search import refresh_search_vectors
+from mgb_main.shelves import refresh_shelf_snapshots
+
+GAME_FIELDS = """
+    fields name, id, total_rating, total_rating_count, cover.url, platforms.name, summary, videos,
+           first_release_date, involved_companies, genres.name, game_modes.name, screenshots.url,
+           similar_games, status, websites.url, multiplayer_modes.*;
+"""
+
+IGDB_MAX_LIMIT = 500    # максимальный limit в одном запросе IGDB
+
+# Поля, которые обновляются у уже существующих игр (game_id - ключ конфликта)
+UPSERT_FIELDS = [
+    "name", "total_rating", "total_rating_count", "cover_url", "platforms", "summary", "videos",
+    "first_release_date", "company", "genres", "game_modes", "screenshots", "similar_games", "status",
+    "websites", "multiplayer_modes", "rating_color", "source_hash", *Game.DISPLAY_FIELDS,
+]
 
 
 class Command(BaseCommand):
     help = "Fetch and store games from IGDB API"
 
-    def handle(self, *args, **kwargs):
-        total_games = []  # Список для всех загруженных игр
-        batch_size = 500   # Максимальное количество игр за раз
-        max_games = 10000  # Сколько всего игр нужно загрузить
-
-        for offset in range(0, max_games, batch_size):
-            query = f"""
-            fields name, id, total_rating, total_rating_count, cover.url, platforms.name, summary, videos, 
-                   first_release_date, involved_companies, genres.name, game_modes.name, screenshots.url, 
-                   similar_games, status, websites.url, multiplayer_modes.*;
-            limit {batch_size};
-            offset {offset};
-            """
-            response = requests.post(API_URL, headers=HEADERS, data=query)
-
-            if response.status_code == 200:
-                games = response.json()
-                total_games.extend(games)
-
-                for game in games:
-                    company_name = self.get_company_name(game.get("involved_companies"))
-
-                    Game.objects.update_or_create(
-                        game_id=game["id"],
-                        defaults={
-                            "name": game["name"],
-                            "total_rating": round(game["total_rating"] / 10, 1) if game.get("total_rating") else None,
-                            "total_rating_count": game.get("total_rating_count"),
-                            "cover_url": self.get_high_quality_cover(game["cover"]["url"]) if "cover" in game else None,
-                            "platforms": game.get("platforms"),
-                            "summary": self.get_short_summary(game.get("summary")),
-                            "videos": game.get("videos"),
-                            "first_release_date": game.get("first_release_date"),
-                            "company": company_name,
-                            "genres": [
-                                re.search(r"\((.*?)\)", genre["name"]).group(1) if "(" in genre["name"] else genre["name"]
-                                for genre in game.get("genres", [])
-                            ] if "genres" in game else [],
-                            "game_modes": [mode["name"] for mode in game.get("game_modes", [])] if "game_modes" in game else [],
-                            "screenshots": [self.get_high_quality_screenshot(screenshot["url"]) for screenshot in game.get("screenshots", [])] if "screenshots" in game else [],
-                            "similar_games": game.get("similar_games"),
-                            "status": game.get("status"),
-                            "websites": [website["url"] for website in game.get("websites", [])] if "websites" in game else [],
-                            "multiplayer_modes": game.get("multiplayer_modes", [])
-                        }
-                    )
-
-                self.stdout.write(self.style.SUCCESS(f"Загружено {len(games)} игр (offset {offset})"))
-            else:
-                self.stderr.write(f"Ошибка загрузки: {response.status_code}")
-                break
-
-        self.stdout.write(self.style.SUCCESS(f"Всего загружено {len(total_games)} игр"))
-
-    def get_company_name(self, involved_companies):
-        """ Получает название компании-разработчика """
-        if not involved_companies:
-            return None
-
-        company_query = f"""
-        fields company.name;
-        where id = ({', '.join(map(str, involved_companies))});
-        limit 1;
+    def add_arguments(self, parser):
+        parser.add_argument('--max-games', type=int, default=10000, help="Сколько всего игр нужно загрузить")
+        parser.add_argument('--batch-size', type=int, default=IGDB_MAX_LIMIT, help="Игр в одном запросе (не больше 500)")
+        parser.add_argument('--resume', action='store_true', help="Продолжить последний прерванный запуск с его параметрами")
+
+    def handle(self, *args, **options):
+        params = {'max_games': options['max_games'], 'batch_size': min(options['batch_size'], IGDB_MAX_LIMIT)}
+
+        started_at = time.monotonic()
+        with IngestionCheckpoint(IngestionRun.SOURCE_GAMES, params, resume=options['resume'], stdout=self.stdout) as checkpoint:
+            self.checkpoint = checkpoint
+            total_saved = asyncio.run(self.fetch_all(checkpoint.params['max_games'], checkpoint.params['batch_size']))
+        elapsed = time.monotonic() - started_at
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Всего загружено {total_saved} игр за {elapsed:.1f} c ({total_saved / elapsed if elapsed else 0:.1f} игр/с)"
+        ))
+        invalidate_autocomplete_index()
+        refresh_shelf_snapshots('games')
+        refresh_facet_indexes('games')
+
+    # ЗАГРУЗКА
+    # ---------------------------------------------------------------------------------
+    async def fetch_all(self, max_games, batch_size):
+        """
+        Страницы запрашиваются параллельно (лимиты IGDB - в IGDB_CLIENT); каждая готовая страница
+        сразу записывается в базу одним upsert, пока остальные ещё загружаются.
+        Страницы, записанные в прерванном запуске (--resume), не запрашиваются повторно.
         """
-        response = requests.post(COMPANY_API_URL, headers=HEADERS, data=company_query)
+        total_saved = 0
+        started_at = time.monotonic()
+
+        async with IGDB_CLIENT.async_session() as api:
+            tasks = [
+                asyncio.create_task(self.fetch_page(api, offset, batch_size))
+                for offset in range(0, max_games, batch_size)
+                if not self.checkpoint.is_done(offset)
+            ]
+            for task in asyncio.as_completed(tasks):
+                offset, games, companies = await task
+                if games is None:
+                    self.checkpoint.mark_failed(offset)
+                    continue
+                saved = await sync_to_async(self.save_page)(offset, games, companies)
+                total_saved += saved
+
+                elapsed = time.monotonic() - started_at
+                self.stdout.write(self.style.SUCCESS(
+                    f"Загружено {saved} игр (offset {offset}), всего {total_saved}, {total_saved / elapsed:.1f} игр/с"
+                ))
+        return total_saved
+
+    async def fetch_page(self, api, offset, batch_size):
+        query = f"""
+        {GAME_FIELDS}
+        limit {batch_size};
+        offset {offset};
+        """
+        games = await api.post("games", data=query)
+        if not games:
+            return offset, games, {}
+        companies = await self.fetch_companies(api, games)
+        return offset, games, companies
 
-        if response.status_code == 200:
-            companies = response.json()
-            if companies:
-                return companies[0].get("company", {}).get("name")
+    async def fetch_companies(self, api, games):
+        """
+        Названия компаний для всей страницы: involved_companies всех игр одним запросом
+        where id = (...) (пачками по 500). Возвращает {involved_company_id: название}.
+        """
+        involved_ids = sorted({company_id for game in games for company_id in game.get("involved_companies") or []})
+        companies = {}
+        for start in range(0, len(involved_ids), IGDB_MAX_LIMIT):
+            chunk = involved_ids[start:start + IGDB_MAX_LIMIT]
+            company_query = f"""
+            fields id, company.name;
+            where id = ({', '.join(map(str, chunk))});
+            limit {IGDB_MAX_LIMIT};
+            """
+            for involved in await api.post("involved_companies", data=company_query) or []:
+                name = (involved.get("company") or {}).get("name")
+                if name:
+                    companies[involved["id"]] = name
+        return companies
+
+    # ЗАПИСЬ
+    # ---------------------------------------------------------------------------------
+    def save_page(self, offset, games, companies):
+        """
+        Одна страница - один INSERT ... ON CONFLICT (game_id) DO UPDATE и один пересчёт search_vector,
+        в одной транзакции с отметкой страницы в IngestionRun.
+        """
+        objects = {}
+        for game in games:
+            defaults = self.game_defaults(game, self.get_company_name(game, companies))
+            obj = Game(game_id=game["id"], source_hash=payload_hash(defaults), **defaults)
+            obj.assign_rating_color()
+            obj.assign_display_fields()
+            objects[game["id"]] = obj  # IGDB может вернуть игру дважды - в одном INSERT ключ должен быть уникален
+
+        with transaction.atomic():
+            saved = Game.objects.bulk_create(
+                list(objects.values()),
+                update_conflicts=True,
+                unique_fields=["game_id"],
+                update_fields=UPSERT_FIELDS,
+            )
+            # bulk_create не отправляет post_save, поэтому поисковый вектор обновляем явно
+            refresh_search_vectors(Game, [obj.pk for obj in saved if obj.pk])
+            self.checkpoint.mark_done(offset, len(saved))
+        return len(saved)
+
+    def game_defaults(self, game, company_name):
+        return {
+            "name": game["name"],
+            "total_rating": round(game["total_rating"] / 10, 1) if game.get("total_rating") else None,
+            "total_rating_count": game.get("total_rating_count"),
+            "cover_url": self.get_high_quality_cover(game["cover"]["url"]) if "cover" in game else None,
+            "platforms": igdb_names(game.get("platforms")),
+            "summary": self.get_short_summary(game.get("summary")),
+            "videos": game.get("videos"),
+            "first_release_date": game.get("first_release_date"),
+            "company": company_name,
+            "genres": [
+                re.search(r"\((.*?)\)", genre).group(1) if "(" in genre else genre
+                for genre in igdb_names(game.get("genres"))
+            ],
+            "game_modes": igdb_names(game.get("game_modes")),
+            "screenshots": [self.get_high_quality_screenshot(screenshot["url"]) for screenshot in game.get("screenshots", [])] if "screenshots" in game else [],
+            "similar_games": igdb_ids(game.get("similar_games")),
+            "status": game.get("status"),
+            "websites": igdb_names(game.get("websites"), key="url"),
+            "multiplayer_modes": game.get("multiplayer_modes", [])
+        }
+
+    def get_company_name(self, game, companies):
+        """
+        Название компании-разработчика из уже загруженных для страницы.
+        Как и раньше (where id = (...); limit 1), берём запись с наименьшим id.
+        """
+        for company_id in sorted(game.get("involved_companies") or []):
+            if company_id in companies:
+                return companies[company_id]
         return None
 
     def get_high_quality_cover(self, cover_url):
@@ -1,17 +1,49 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
 from django.core.management.base import BaseCommand
-from users.models import Movie, Genre, Actor, CrewMember
+from django.db import transaction
+from django.db.models import Case, Value, When
+from users.models import Movie, Genre, Actor, CrewMember, IngestionRun
+from mgb_main.api_client import TMDB_CLIENT
 from mgb_main.utils import get_tmdb_data
-import time
+from mgb_main.autocomplete import invalidate_autocomplete_index
+from mgb_main.browse import refresh_facet_indexes
+from mgb_main.ingest import IngestionCheckpoint, bulk_link, payload_hash, pick_tmdb_trailer
+from mgb_main.search import refresh_search_vectors
+from mgb_main.shelves import refresh_shelf_snapshots
+
+BASE_IMAGE_URL = "https://image.tmdb.org/t/p/original"
+
+TMDB_PAGE_SIZE = 20      # фильмов на странице movie/popular
+TMDB_MAX_PAGE = 500      # дальше 500-й страницы TMDb не отдаёт
+
+CAST_LIMIT = 10
+CREW_JOBS = ["Director", "Screenplay", "Producer"]
+SIMILAR_LIMIT = 5
+
+# Поля, которые обновляются у уже загруженных фильмов (tmdb_id - ключ конфликта)
+UPSERT_FIELDS = [
+    "title", "original_title", "overview", "release_date", "poster_path", "backdrop_path",
+    "vote_average", "vote_count", "popularity", "original_language", "adult", "rating_color", "source_hash",
+    "full_poster_path", "full_backdrop_path", "short_overview",
+]
+DETAIL_FIELDS = ["country", "runtime", "country_code", "formatted_runtime"]
+
+
+def image_url(path):
+    return f"{BASE_IMAGE_URL}{path}" if path else None
 
 
 class Command(BaseCommand):
     help = "Загружает до 10 000 популярных фильмов из TMDb"
 
-    def handle(self, *args, **kwargs):
-        total_pages = 500
-        movies_loaded = 0
+    def add_arguments(self, parser):
+        parser.add_argument('--max-movies', type=int, default=10000, help="Сколько всего фильмов нужно загрузить")
+        parser.add_argument('--resume', action='store_true', help="Продолжить последний прерванный запуск с его параметрами")
 
-        BASE_IMAGE_URL = "https://image.tmdb.org/t/p/original"
+    def handle(self, *args, **options):
 
         genres_data = get_tmdb_data("genre/movie/list", {"language": "ru-RU"})
         if genres_data and "genres" in genres_data:
@@ -20,122 +52,195 @@ class Command(BaseCommand):
                     tmdb_id=g["id"],
                     defaults={"name": g["name"]}
                 )
-
-        for page in range(1, total_pages + 1):
-            data = get_tmdb_data("movie/popular", {"language": "ru-RU", "page": page})
-            if not data:
-                self.stdout.write(self.style.ERROR(f"Ошибка загрузки данных для страницы {page}"))
-                break
-
-            for item in data["results"]:
-                release_date = item.get("release_date", None)
-
-                if not release_date:
-                    self.stdout.write(self.style.WARNING(f"❗ Пропущен фильм {item['title']} (ID: {item['id']}) из-за отсутствия даты выпуска"))
+        self.genre_ids = dict(Genre.objects.exclude(tmdb_id=None).values_list("tmdb_id", "pk"))
+
+        started_at = time.monotonic()
+        with IngestionCheckpoint(IngestionRun.SOURCE_MOVIES, {'max_movies': options['max_movies']}, resume=options['resume'], stdout=self.stdout) as checkpoint:
+            self.checkpoint = checkpoint
+            max_movies = checkpoint.params['max_movies']
+            pages = min(TMDB_MAX_PAGE, -(-max_movies // TMDB_PAGE_SIZE))
+            movies_loaded = asyncio.run(self.fetch_all(pages, max_movies))
+        elapsed = time.monotonic() - started_at
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🎬 Всего загружено {movies_loaded} фильмов за {elapsed:.1f} c ({movies_loaded / elapsed if elapsed else 0:.1f} фильмов/с)"
+        ))
+        invalidate_autocomplete_index()
+        refresh_shelf_snapshots('movies')
+        refresh_facet_indexes('movies')
+
+    # ЗАГРУЗКА
+    # ---------------------------------------------------------------------------------
+    async def fetch_all(self, pages, max_movies):
+        """
+        Страницы movie/popular и детали фильмов запрашиваются параллельно (лимиты TMDb - в TMDB_CLIENT).
+        Детали - один запрос на фильм: append_to_response=credits,similar,videos вместо
+        четырёх отдельных. Готовая страница сразу записывается в базу пачкой.
+        Страницы, записанные в прерванном запуске (--resume), не запрашиваются повторно;
+        лимит max_movies считается вместе с ними.
+        """
+        movies_loaded = 0
+        started_at = time.monotonic()
+
+        async with TMDB_CLIENT.async_session() as api:
+            tasks = [
+                asyncio.create_task(self.fetch_page(api, page))
+                for page in range(1, pages + 1)
+                if not self.checkpoint.is_done(page)
+            ]
+            for task in asyncio.as_completed(tasks):
+                page, movies = await task
+                if movies is None:
+                    self.stdout.write(self.style.ERROR(f"Ошибка загрузки данных для страницы {page}"))
+                    self.checkpoint.mark_failed(page)
                     continue
-
-                poster_path = item.get("poster_path")
-                backdrop_path = item.get("backdrop_path")
-
-                movie, created = Movie.objects.update_or_create(
-                    tmdb_id=item["id"],
-                    defaults={
-                        "title": item["title"],
-                        "original_title": item.get("original_title", ""),
-                        "overview": item.get("overview", ""),
-                        "release_date": release_date,
-                        "poster_path": f"{BASE_IMAGE_URL}{poster_path}" if poster_path else None,
-                        "backdrop_path": f"{BASE_IMAGE_URL}{backdrop_path}" if backdrop_path else None,
-                        "vote_average": item.get("vote_average", 0),
-                        "vote_count": item.get("vote_count", 0),
-                        "popularity": item.get("popularity", 0),
-                        "original_language": item.get("original_language", ""),
-                        "adult": item.get("adult", False),
-                        "video": item.get("video", False),
-                    },
-                )
-
-                movies_loaded += 1
-                action = "Добавлен" if created else "Обновлен"
-                self.stdout.write(self.style.SUCCESS(f"{action} фильм: {movie.title} (ID: {movie.tmdb_id})"))
-
-                # Обновление жанров
-                if "genre_ids" in item:
-                    for genre_id in item["genre_ids"]:
-                        genre = Genre.objects.filter(tmdb_id=genre_id).first()
-                        if genre:
-                            movie.genres.add(genre)
-
-                # Загрузка актеров и съемочной группы
-                credits = get_tmdb_data(f"movie/{movie.tmdb_id}/credits")
-                if credits:
-                    if "cast" in credits:
-                        for actor in credits["cast"][:10]:
-                            actor_obj, _ = Actor.objects.get_or_create(
-                                tmdb_id=actor["id"],
-                                defaults={
-                                    "name": actor["name"],
-                                    "profile_path": actor.get("profile_path"),
-                                },
-                            )
-                            movie.actors.add(actor_obj)
-
-                    if "crew" in credits:
-                        for crew_member in credits["crew"]:
-                            if crew_member["job"] in ["Director", "Screenplay", "Producer"]:
-                                member_obj, _ = CrewMember.objects.get_or_create(
-                                    tmdb_id=crew_member["id"],
-                                    defaults={
-                                        "name": crew_member["name"],
-                                        "job": crew_member["job"],
-                                    },
-                                )
-                                movie.crew.add(member_obj)
-
-                # Загрузка детальной информации (страна и продолжительность)
-                details = get_tmdb_data(f"movie/{movie.tmdb_id}", {"language": "ru-RU"})
-                if details:
-                    countries = ", ".join([c["name"] for c in details.get("production_countries", [])])
-                    runtime = details.get("runtime", 0)
-
-                    movie.country = countries
-                    movie.runtime = runtime
-                    movie.save()
-
-                # Загрузка похожих фильмов
-                similar_movies_data = get_tmdb_data(f"movie/{movie.tmdb_id}/similar", {"language": "ru-RU"})
-
-                if similar_movies_data and "results" in similar_movies_data:
-                    for similar in similar_movies_data["results"][:5]:  # Ограничение на 5 похожих фильмов
-                        release_date = similar.get("release_date")
-                        if not release_date:  # Пропускаем фильмы без даты
-                            continue
-
-                        similar_movie, _ = Movie.objects.get_or_create(
-                            tmdb_id=similar["id"],
-                            defaults={
-                                "title": similar["title"],
-                                "original_title": similar.get("original_title", ""),
-                                "overview": similar.get("overview", ""),
-                                "release_date": release_date,
-                                "content_type": Movie.CONTENT_TYPE_MOVIE,
-                                "poster_path": f"{BASE_IMAGE_URL}{similar.get('poster_path')}" if similar.get("poster_path") else None,
-                                "backdrop_path": f"{BASE_IMAGE_URL}{similar.get('backdrop_path')}" if similar.get("backdrop_path") else None,
-                                "vote_average": similar.get("vote_average", 0),
-                                "vote_count": similar.get("vote_count", 0),
-                                "popularity": similar.get("popularity", 0),
-                                "original_language": similar.get("original_language", ""),
-                                "adult": similar.get("adult", False),
-                                "video": similar.get("video", False),
-                            },
-                        )
-
-                        movie.similar_movies.add(similar_movie)  # Добавляем связь
-
-            self.stdout.write(self.style.NOTICE(f"✅ Загружено фильмов: {movies_loaded} / 10 000"))
-            time.sleep(1)
-
-            if movies_loaded >= 10_000:
-                break
-
-        self.stdout.write(self.style.SUCCESS(f"🎬 Всего загружено {movies_loaded} фильмов!"))
+                movies = movies[:max(0, max_movies - self.checkpoint.items_saved)]
+                saved = await sync_to_async(self.save_page)(page, movies)
+                movies_loaded += saved
+
+                elapsed = time.monotonic() - started_at
+                self.stdout.write(self.style.NOTICE(
+                    f"✅ Страница {page}: {saved} фильмов, всего {movies_loaded} / {max_movies}, {movies_loaded / elapsed:.1f} фильмов/с"
+                ))
+        return movies_loaded
+
+    async def fetch_page(self, api, page):
+        """Страница популярных фильмов и детали всех её фильмов. Возвращает (page, [(item, details), ...])."""
+        data = await api.get("movie/popular", {"language": "ru-RU", "page": page})
+        if not data or "results" not in data:
+            return page, None
+
+        items = []
+        for item in data["results"]:
+            if not item.get("release_date"):
+                self.stdout.write(self.style.WARNING(f"❗ Пропущен фильм {item['title']} (ID: {item['id']}) из-за отсутствия даты выпуска"))
+                continue
+            items.append(item)
+
+        details = await asyncio.gather(*[
+            api.get(f"movie/{item['id']}", {"language": "ru-RU", "append_to_response": "credits,similar,videos"})
+            for item in items
+        ])
+        return page, list(zip(items, details))
+
+    # ЗАПИСЬ
+    # ---------------------------------------------------------------------------------
+    def save_page(self, page, movies):
+        """
+        Страница целиком в одной транзакции: upsert фильмов, заглушки похожих фильмов,
+        актёры и съёмочная группа, все связи M2M - по одному INSERT на таблицу - и отметка
+        страницы в IngestionRun. Упавшая посередине страница не остаётся записанной наполовину.
+        """
+        page_movies = {}
+        detailed_ids = set()
+        similar_stubs = {}
+        actors = {}
+        crew = {}
+        genre_links, actor_links, crew_links, similar_links = [], [], [], []
+        trailers = {}
+
+        for item, details in movies:
+            tmdb_id = item["id"]
+            if details:
+                detailed_ids.add(tmdb_id)
+            defaults = self.movie_defaults(item, details)
+            movie = Movie(tmdb_id=tmdb_id, source_hash=payload_hash(defaults), **defaults)
+            details = details or {}
+            movie.assign_rating_color()
+            movie.assign_display_fields()
+            page_movies[tmdb_id] = movie  # TMDb может вернуть фильм дважды - в одном INSERT ключ должен быть уникален
+
+            for genre_id in item.get("genre_ids", []):
+                if genre_id in self.genre_ids:
+                    genre_links.append((tmdb_id, self.genre_ids[genre_id]))
+
+            credits = details.get("credits") or {}
+            for actor in credits.get("cast", [])[:CAST_LIMIT]:
+                actors.setdefault(actor["id"], Actor(
+                    tmdb_id=actor["id"], name=actor["name"], profile_path=actor.get("profile_path"),
+                ))
+                actor_links.append((tmdb_id, actor["id"]))
+            for crew_member in credits.get("crew", []):
+                if crew_member["job"] in CREW_JOBS:
+                    crew.setdefault(crew_member["id"], CrewMember(
+                        tmdb_id=crew_member["id"], name=crew_member["name"], job=crew_member["job"],
+                    ))
+                    crew_links.append((tmdb_id, crew_member["id"]))
+
+            similar_results = [s for s in (details.get("similar") or {}).get("results", [])[:SIMILAR_LIMIT] if s.get("release_date")]
+            for similar in similar_results:
+                stub = Movie(tmdb_id=similar["id"], content_type=Movie.CONTENT_TYPE_MOVIE, **self.movie_defaults(similar))
+                stub.assign_rating_color()
+                stub.assign_display_fields()
+                similar_stubs.setdefault(similar["id"], stub)
+                similar_links.append((tmdb_id, similar["id"]))
+
+            trailer_key, trailer_name = pick_tmdb_trailer(details.get("videos"))
+            if trailer_key:
+                trailers[tmdb_id] = (trailer_key, trailer_name)
+
+        with transaction.atomic():
+            # Если детали не загрузились, страну и продолжительность у фильма не затираем
+            for with_details in (True, False):
+                batch = [movie for tmdb_id, movie in page_movies.items() if (tmdb_id in detailed_ids) == with_details]
+                if batch:
+                    Movie.objects.bulk_create(
+                        batch,
+                        update_conflicts=True,
+                        unique_fields=["tmdb_id"],
+                        update_fields=UPSERT_FIELDS + (DETAIL_FIELDS if with_details else []),
+                    )
+            # Похожие фильмы - только заглушки: уже загруженные не перезаписываем (как get_or_create раньше)
+            Movie.objects.bulk_create(
+                [stub for stub_id, stub in similar_stubs.items() if stub_id not in page_movies],
+                ignore_conflicts=True,
+            )
+            Actor.objects.bulk_create(list(actors.values()), ignore_conflicts=True)
+            CrewMember.objects.bulk_create(list(crew.values()), ignore_conflicts=True)
+
+            # ignore_conflicts не возвращает pk, поэтому id из TMDb переводим в pk отдельными запросами
+            movie_pks = dict(Movie.objects.filter(tmdb_id__in=set(page_movies) | set(similar_stubs)).values_list("tmdb_id", "pk"))
+            actor_pks = dict(Actor.objects.filter(tmdb_id__in=actors).values_list("tmdb_id", "pk"))
+            crew_pks = dict(CrewMember.objects.filter(tmdb_id__in=crew).values_list("tmdb_id", "pk"))
+
+            bulk_link(Movie.genres, [(movie_pks[m], genre_pk) for m, genre_pk in genre_links])
+            bulk_link(Movie.actors, [(movie_pks[m], actor_pks[a]) for m, a in actor_links if a in actor_pks])
+            bulk_link(Movie.crew, [(movie_pks[m], crew_pks[c]) for m, c in crew_links if c in crew_pks])
+            bulk_link(Movie.similar_movies, [(movie_pks[m], movie_pks[s]) for m, s in similar_links if s in movie_pks])
+
+            self.save_trailers(movie_pks, trailers)
+
+            # bulk_create не отправляет post_save и m2m_changed, поэтому поисковый вектор обновляем явно
+            refresh_search_vectors(Movie, list(movie_pks.values()))
+            self.checkpoint.mark_done(page, len(page_movies))
+        return len(page_movies)
+
+    def save_trailers(self, movie_pks, trailers):
+        """Трейлеры из videos одним UPDATE; уже выбранные (в том числе через YouTube API) не трогаем."""
+        if not trailers:
+            return
+        whens = {tmdb_id: movie_pks[tmdb_id] for tmdb_id in trailers}
+        Movie.objects.filter(pk__in=whens.values(), youtube_trailer__isnull=True).update(
+            youtube_trailer=Case(*[When(pk=pk, then=Value(trailers[tmdb_id][0])) for tmdb_id, pk in whens.items()]),
+            youtube_trailer_name=Case(*[When(pk=pk, then=Value(trailers[tmdb_id][1])) for tmdb_id, pk in whens.items()]),
+        )
+
+    def movie_defaults(self, item, details=None):
+        """Поля фильма из результата списка; страна и продолжительность - из деталей."""
+        defaults = {
+            "title": item["title"],
+            "original_title": item.get("original_title", ""),
+            "overview": item.get("overview", ""),
+            "release_date": item["release_date"],
+            "poster_path": image_url(item.get("poster_path")),
+            "backdrop_path": image_url(item.get("backdrop_path")),
+            "vote_average": item.get("vote_average", 0),
+            "vote_count": item.get("vote_count", 0),
+            "popularity": item.get("popularity", 0),
+            "original_language": item.get("original_language", ""),
+            "adult": item.get("adult", False),
+        }
+        if details:
+            defaults["country"] = ", ".join(c["name"] for c in details.get("production_countries", []))
+            defaults["runtime"] = details.get("runtime") or 0
+        return defaults
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from mgb_main.benchmark import BENCH_SCALES, benchmark_data_exists, generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Наполняет базу синтетическими данными для run_benchmark: каталог, пользователи, библиотеки, отзывы "
+        "и производные таблицы. Запускать на отдельной базе (DATABASE_URL)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(BENCH_SCALES), default='small', help="Размер набора (full - 30k элементов, 100k пользователей)")
+        parser.add_argument('--seed', type=int, default=42, help="Seed генератора: при одном seed данные совпадают")
+        parser.add_argument('--skip-derived', action='store_true', help="Не пересобирать производные таблицы (UserItemState, поиск, полки, рекомендации)")
+        parser.add_argument('--force', action='store_true', help="Разрешить запуск при DEBUG=False")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError("DEBUG=False: похоже на рабочую базу. Для запуска на ней нужен --force")
+        if benchmark_data_exists():
+            raise CommandError("Синтетические данные уже есть в этой базе - создайте чистую базу для нового набора")
+
+        counts = generate_dataset(options['scale'], seed=options['seed'], derived=not options['skip_derived'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(", ".join(f"{name}: {count}" for name, count in counts.items())))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from users.activity import rebuild_activity_log
+
+
+class Command(BaseCommand):
+    help = "Пересобирает журнал активности и дневные счётчики тепловой карты по оценкам, избранному, статусам и отзывам"
+
+    def handle(self, *args, **options):
+        count = rebuild_activity_log()
+        self.stdout.write(self.style.SUCCESS(f"Записано {count} событий"))
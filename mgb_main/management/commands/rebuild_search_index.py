@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from mgb_main.search import SEARCH_CONFIG, is_search_backend_available, refresh_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает search_vector для игр, фильмов и книг (полнотекстовый поиск)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            choices=list(SEARCH_CONFIG.keys()),
+            help='Пересчитать только один тип контента (games, movies, books)',
+        )
+
+    def handle(self, *args, **options):
+        if not is_search_backend_available():
+            self.stderr.write(self.style.ERROR("Полнотекстовый поиск поддерживается только на PostgreSQL."))
+            return
+
+        content_keys = [options['only']] if options['only'] else list(SEARCH_CONFIG.keys())
+        for content_key in content_keys:
+            updated = refresh_search_vectors(SEARCH_CONFIG[content_key]['model'])
+            self.stdout.write(self.style.SUCCESS(f"{content_key}: обновлено {updated} поисковых векторов"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from users.library_state import LIBRARY_STATE_CONFIG, rebuild_user_item_states
+
+
+class Command(BaseCommand):
+    help = "Пересобирает сводную таблицу UserItemState по избранному, статусам и оценкам"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            choices=list(LIBRARY_STATE_CONFIG),
+            help="Пересобрать только один тип контента",
+        )
+
+    def handle(self, *args, **options):
+        content_types = [options['only']] if options['only'] else list(LIBRARY_STATE_CONFIG)
+
+        for content_type in content_types:
+            count = rebuild_user_item_states(content_type)
+            self.stdout.write(self.style.SUCCESS(f"{content_type}: записано {count} строк"))
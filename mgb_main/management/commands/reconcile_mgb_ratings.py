@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from users.ratings import MGB_RATING_CONFIG, recount_mgb_ratings
+
+
+class Command(BaseCommand):
+    help = "Сверяет сумму/количество MGB оценок с таблицами оценок и исправляет расхождения"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            choices=list(MGB_RATING_CONFIG),
+            help="Сверить только один тип контента",
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help="Пересчитать все строки, а не только разошедшиеся (например, чтобы обновить округление)",
+        )
+
+    def handle(self, *args, **options):
+        content_keys = [options['only']] if options['only'] else list(MGB_RATING_CONFIG)
+
+        for content_key in content_keys:
+            config = MGB_RATING_CONFIG[content_key]
+            fixed = recount_mgb_ratings(
+                config['content_model'], config['rating_model'], config['field'], only_drifted=not options['all']
+            )
+            self.stdout.write(self.style.SUCCESS(f"{content_key}: исправлено {fixed} записей"))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from mgb_main.browse import BROWSE_CONFIG, build_facet_index
+
+
+class Command(BaseCommand):
+    help = "Пересобирает маски фасетов каталога (CatalogFacetIndex) для просмотра с фильтрами - после загрузки данных или по расписанию"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=list(BROWSE_CONFIG), action='append', help="Пересобрать только этот тип контента")
+
+    def handle(self, *args, **options):
+        for content_key in options['only'] or BROWSE_CONFIG:
+            started_at = time.monotonic()
+            items, values = build_facet_index(content_key)
+            self.stdout.write(self.style.SUCCESS(
+                f"{content_key}: {items} элементов, {values} значений фасетов за {time.monotonic() - started_at:.1f} c"
+            ))
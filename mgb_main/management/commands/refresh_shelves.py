@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from mgb_main.shelves import SHELF_PAGES, refresh_shelf_snapshot
+
+
+class Command(BaseCommand):
+    help = "Пересобирает снимки полок для страниц games / movies / books (запускать по расписанию)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            choices=list(SHELF_PAGES),
+            help="Обновить только одну страницу",
+        )
+
+    def handle(self, *args, **options):
+        pages = [options['only']] if options['only'] else list(SHELF_PAGES)
+
+        for page in pages:
+            snapshot = refresh_shelf_snapshot(page)
+            self.stdout.write(self.style.SUCCESS(
+                f"{page}: {len(snapshot['shelves'])} полок, {len(snapshot['cards'])} карточек"
+            ))
@@ -0,0 +1,35 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from mgb_main.benchmark import BENCH_VIEWS, benchmark_data_exists, compare_results, run_benchmark, write_results
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет p50/p95 времени ответа, число SQL-запросов и пик памяти ключевых страниц на данных "
+        "generate_benchmark_data и сохраняет результат в JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=BENCH_VIEWS, action='append', help="Замерить только эту view")
+        parser.add_argument('--iterations', type=int, default=20, help="Замеров на сценарий")
+        parser.add_argument('--warmup', type=int, default=3, help="Прогревочных запросов на сценарий (не учитываются)")
+        parser.add_argument('--output', help="Файл результата (по умолчанию .benchmarks/<время>.json)")
+        parser.add_argument('--compare', help="JSON прошлого прогона - вывести изменения")
+
+    def handle(self, *args, **options):
+        if not benchmark_data_exists():
+            raise CommandError("Нет синтетических данных - сначала generate_benchmark_data")
+        previous = json.loads(Path(options['compare']).read_text()) if options['compare'] else None
+
+        results = run_benchmark(options['only'], iterations=options['iterations'], warmup=options['warmup'], stdout=self.stdout)
+
+        output = Path(options['output'] or Path(settings.BASE_DIR) / '.benchmarks' / f"{timezone.now():%Y%m%d-%H%M%S}.json")
+        write_results(results, output)
+        if previous:
+            for line in compare_results(previous, results):
+                self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Результат: {output}"))
@@ -0,0 +1,184 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from users.models import Game, Movie, IngestionRun
+from mgb_main.autocomplete import invalidate_autocomplete_for_changes
+from mgb_main.browse import refresh_facet_index_for_changes
+from mgb_main.api_client import IGDB_CLIENT, TMDB_CLIENT
+from mgb_main.ingest import IngestionCheckpoint, apply_changed_payloads
+from mgb_main.search import refresh_search_vectors
+from mgb_main.shelves import refresh_shelf_snapshots_for_items
+from mgb_main.management.commands import fetch_games, fetch_movies, populate_tv_shows
+
+TMDB_CHANGES_WINDOW = timedelta(days=14)  # TMDb отдаёт изменения не больше чем за 14 дней в одном запросе
+
+# Что синхронизируется: модель и ключ источника, запуски (свои и полной загрузки) для отсчёта "с какого момента",
+# страница полок и ключ индекса подсказок (и фасетов) для точечной инвалидации
+SYNC_SOURCES = {
+    'games': {
+        'model': Game,
+        'key_field': 'game_id',
+        'run_source': IngestionRun.SOURCE_GAMES_CHANGES,
+        'full_source': IngestionRun.SOURCE_GAMES,
+        'content_key': 'games',
+    },
+    'movies': {
+        'model': Movie,
+        'key_field': 'tmdb_id',
+        'run_source': IngestionRun.SOURCE_MOVIES_CHANGES,
+        'full_source': IngestionRun.SOURCE_MOVIES,
+        'content_key': 'movies',
+    },
+    'tv': {
+        'model': Movie,
+        'key_field': 'tmdb_id',
+        'run_source': IngestionRun.SOURCE_TV_CHANGES,
+        'full_source': IngestionRun.SOURCE_TV_SHOWS,
+        'content_key': 'movies',
+    },
+}
+
+
+class Command(BaseCommand):
+    help = "Обновляет уже загруженные игры, фильмы и сериалы, изменившиеся с прошлой синхронизации (TMDb changes, IGDB updated_at)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=list(SYNC_SOURCES), action='append', help="Синхронизировать только этот источник")
+        parser.add_argument('--since', help="Начало периода (YYYY-MM-DD) вместо времени прошлого запуска")
+
+    def handle(self, *args, **options):
+        for source in options['only'] or SYNC_SOURCES:
+            config = SYNC_SOURCES[source]
+            since = self.get_since(config, options['since'])
+            self.stdout.write(f"Синхронизация {source} с {since:%Y-%m-%d %H:%M}")
+
+            with IngestionCheckpoint(config['run_source'], {'since': since.isoformat()}, stdout=self.stdout) as checkpoint:
+                payloads = asyncio.run(getattr(self, f"fetch_{source}_changes")(since, checkpoint))
+                changed = apply_changed_payloads(config['model'], config['key_field'], payloads)
+                checkpoint.mark_done('apply', len(changed))
+
+            self.invalidate(config, changed)
+            self.stdout.write(self.style.SUCCESS(
+                f"{source}: получено {len(payloads)} изменённых записей, обновлено {len(changed)}"
+            ))
+
+    def get_since(self, config, since_option):
+        """Явный --since, иначе начало прошлой успешной синхронизации источника (до первой - полной загрузки)."""
+        if since_option:
+            try:
+                return timezone.make_aware(datetime.strptime(since_option, "%Y-%m-%d"))
+            except ValueError:
+                raise CommandError("--since должен быть в формате YYYY-MM-DD")
+
+        # Полная загрузка обновляет только топ, поэтому она - точка отсчёта лишь до первой синхронизации
+        completed = IngestionRun.objects.filter(status=IngestionRun.STATUS_COMPLETED).order_by('-started_at')
+        last_run = completed.filter(source=config['run_source']).first() or completed.filter(source=config['full_source']).first()
+        if last_run is None:
+            raise CommandError(f"Нет завершённых запусков для {config['run_source']}, укажите --since")
+        return last_run.started_at
+
+    def invalidate(self, config, changed):
+        """Поисковый вектор, полки, подсказки и фасеты - только для изменённых записей."""
+        if not changed:
+            return
+        pks = list(changed)
+        changed_fields = set().union(*changed.values())
+        refresh_search_vectors(config['model'], pks)
+        if refresh_shelf_snapshots_for_items(config['content_key'], pks):
+            self.stdout.write(f"Пересобраны полки {config['content_key']}")
+        if invalidate_autocomplete_for_changes(config['content_key'], changed_fields):
+            self.stdout.write("Индекс подсказок будет пересобран")
+        if refresh_facet_index_for_changes(config['content_key'], changed_fields):
+            self.stdout.write(f"Пересобраны фасеты {config['content_key']}")
+
+    # IGDB
+    # ---------------------------------------------------------------------------------
+    async def fetch_games_changes(self, since, checkpoint):
+        """
+        Игры каталога с updated_at позже since: id уже загруженных игр уходят в where пачками по 500,
+        поэтому IGDB возвращает только наши изменённые игры. Разбор полей - как в fetch_games.
+        ttl=0: кэш ответов не считается свежим, запрос всегда уходит в API.
+        """
+        loader = fetch_games.Command(stdout=self.stdout, stderr=self.stderr)
+        game_ids = await sync_to_async(list)(Game.objects.exclude(game_id=None).order_by('game_id').values_list('game_id', flat=True))
+        updated_after = int(since.timestamp())
+
+        async def fetch_chunk(api, chunk):
+            query = f"""
+            {fetch_games.GAME_FIELDS}
+            where id = ({', '.join(map(str, chunk))}) & updated_at > {updated_after};
+            limit {fetch_games.IGDB_MAX_LIMIT};
+            """
+            return chunk[0], await api.post("games", data=query, ttl=0)
+
+        async with IGDB_CLIENT.async_session() as api:
+            chunks = [game_ids[start:start + fetch_games.IGDB_MAX_LIMIT] for start in range(0, len(game_ids), fetch_games.IGDB_MAX_LIMIT)]
+            games = []
+            for first_id, chunk_games in await asyncio.gather(*[fetch_chunk(api, chunk) for chunk in chunks]):
+                if chunk_games is None:
+                    checkpoint.mark_failed(first_id)
+                    continue
+                games.extend(chunk_games)
+            companies = await loader.fetch_companies(api, games)
+
+        return {game["id"]: loader.game_defaults(game, loader.get_company_name(game, companies)) for game in games}
+
+    # TMDb
+    # ---------------------------------------------------------------------------------
+    async def fetch_tmdb_changed_ids(self, api, kind, since, checkpoint):
+        """id из {kind}/changes за период с since по сейчас: окнами по 14 дней, страницы окна - параллельно."""
+        changed_ids = set()
+        window_start = since
+        now = timezone.now()
+        while window_start < now:
+            window_end = min(window_start + TMDB_CHANGES_WINDOW, now)
+            params = {"start_date": window_start.date().isoformat(), "end_date": window_end.date().isoformat()}
+            first = await api.get(f"{kind}/changes", {**params, "page": 1}, ttl=0)
+            if first is None:
+                raise CommandError(f"Не удалось получить {kind}/changes за {params['start_date']} - {params['end_date']}")
+            pages = [first] + list(await asyncio.gather(*[
+                api.get(f"{kind}/changes", {**params, "page": page}, ttl=0)
+                for page in range(2, first.get("total_pages", 1) + 1)
+            ]))
+            for page, data in enumerate(pages, start=1):
+                if data is None:
+                    checkpoint.mark_failed(f"{kind}/changes {params['start_date']}:{page}")
+                    continue
+                changed_ids.update(result["id"] for result in data.get("results", []))
+            window_start = window_end
+        return changed_ids
+
+    async def fetch_tmdb_details(self, kind, content_type, since, checkpoint):
+        """
+        Детали только тех изменённых в TMDb записей, что есть в каталоге. Возвращает {tmdb_id: детали}.
+        Детали запрашиваются с ttl=0: запись в кэше перепроверяется по ETag, неизменённые приходят как 304.
+        """
+        async with TMDB_CLIENT.async_session() as api:
+            changed_ids = await self.fetch_tmdb_changed_ids(api, kind, since, checkpoint)
+            known_ids = await sync_to_async(list)(
+                Movie.objects.filter(tmdb_id__in=changed_ids, content_type=content_type).values_list('tmdb_id', flat=True)
+            )
+            details = await asyncio.gather(*[
+                api.get(f"{kind}/{tmdb_id}", {"language": "ru-RU"}, ttl=0) for tmdb_id in known_ids
+            ])
+        result = {}
+        for tmdb_id, item in zip(known_ids, details):
+            if item is None:
+                checkpoint.mark_failed(tmdb_id)
+            else:
+                result[tmdb_id] = item
+        return result
+
+    async def fetch_movies_changes(self, since, checkpoint):
+        loader = fetch_movies.Command(stdout=self.stdout, stderr=self.stderr)
+        details = await self.fetch_tmdb_details("movie", Movie.CONTENT_TYPE_MOVIE, since, checkpoint)
+        # Как и в fetch_movies: фильмы без даты выхода не пишем
+        return {tmdb_id: loader.movie_defaults(item, item) for tmdb_id, item in details.items() if item.get("release_date")}
+
+    async def fetch_tv_changes(self, since, checkpoint):
+        tv_loader = populate_tv_shows.Command(stdout=self.stdout, stderr=self.stderr)
+        details = await self.fetch_tmdb_details("tv", Movie.CONTENT_TYPE_TV, since, checkpoint)
+        return {tmdb_id: tv_loader.tv_defaults(item) for tmdb_id, item in details.items()}
@@ -1,48 +1,193 @@
+import asyncio
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
 from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.utils import timezone
 from users.models import Game, Movie
-from mgb_main.utils import get_youtube_trailer_with_name
+from mgb_main.api_client import IGDB_CLIENT, TMDB_CLIENT, YOUTUBE_CLIENT, QuotaExceededError
+from mgb_main.ingest import pick_tmdb_trailer
+from mgb_main.utils import YOUTUBE_SEARCH_COST, parse_youtube_trailer, youtube_trailer_search_params
+from mgb_main.management.commands.fetch_games import IGDB_MAX_LIMIT
 
+NOT_FOUND_RETRY = timedelta(days=30)  # YouTube ничего не нашёл - следующая попытка через месяц
+ERROR_RETRY = timedelta(days=1)       # ошибка API - попробуем завтра
 
-class Command(BaseCommand):
-    help = "Обновляет YouTube трейлеры для всех игр и фильмов"
+# Что обновляется: модель, поле названия для поиска на YouTube, порядок поиска (сначала популярные)
+# и поле для названия ролика, если оно есть у модели
+TRAILER_TARGETS = {
+    'games': {
+        'model': Game,
+        'title_field': 'name',
+        'search_order': F('total_rating_count').desc(nulls_last=True),
+        'name_field': None,
+        'label': 'игр',
+    },
+    'movies': {
+        'model': Movie,
+        'title_field': 'title',
+        'search_order': F('popularity').desc(),
+        'name_field': 'youtube_trailer_name',
+        'label': 'фильмов и сериалов',
+    },
+}
 
-    def handle(self, *args, **kwargs):
-        self.update_game_trailers()
-        self.update_movie_trailers()
 
-    def update_game_trailers(self):
-        games = Game.objects.filter(youtube_trailer__isnull=True)
+class Command(BaseCommand):
+    help = (
+        "Обновляет YouTube трейлеры для игр и фильмов: сначала из видео IGDB и TMDb, "
+        "для остальных - поиск на YouTube в пределах дневной квоты"
+    )
 
-        if not games.exists():
-            self.stdout.write(self.style.WARNING("⚠️ Все трейлеры для игр уже обновлены."))
-        else:
-            self.stdout.write(self.style.SUCCESS("🎮 Обновление трейлеров для игр:"))
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=list(TRAILER_TARGETS), action='append', help="Обновить только игры или только фильмы")
+        parser.add_argument('--skip-search', action='store_true', help="Только видео из IGDB и TMDb, без поиска на YouTube")
+        parser.add_argument('--max-searches', type=int, help="Не больше стольких поисков на YouTube за запуск")
 
-        for game in games:
-            video_id = get_youtube_trailer_with_name(game.name)
-            if not video_id:
-                self.stdout.write(self.style.WARNING(f'❌ Трейлер не найден для игры {game.name}'))
+    def handle(self, *args, **options):
+        for target in options['only'] or TRAILER_TARGETS:
+            config = TRAILER_TARGETS[target]
+            due = self.due_queryset(config)
+            if not due.exists():
+                self.stdout.write(self.style.WARNING(f"⚠️ Все трейлеры для {config['label']} уже обновлены."))
                 continue
 
-            game.youtube_trailer = video_id['id']
-            game.save()
-            self.stdout.write(self.style.SUCCESS(f'✅ Обновлён трейлер для игры {game.name}: {video_id["id"]}'))
+            trailers = asyncio.run(getattr(self, f"harvest_{target}")(due))
+            self.save_results(config, trailers, {})
+            self.stdout.write(self.style.SUCCESS(f"✅ Трейлеры из видео источника: {len(trailers)} {config['label']}"))
 
-    def update_movie_trailers(self):
-        movies = Movie.objects.filter(youtube_trailer__isnull=True)
+            if not options['skip_search']:
+                self.search_youtube(config, options['max_searches'])
 
-        if not movies.exists():
-            self.stdout.write(self.style.WARNING("⚠️ Все трейлеры для фильмов уже обновлены."))
-        else:
-            self.stdout.write(self.style.SUCCESS("🎬 Обновление трейлеров для фильмов:"))
+    def due_queryset(self, config):
+        """Без трейлера и без отложенной после неудачного поиска попытки."""
+        return config['model'].objects.filter(youtube_trailer__isnull=True).filter(
+            Q(trailer_retry_after__isnull=True) | Q(trailer_retry_after__lte=timezone.now())
+        )
 
-        for movie in movies:
-            video_data = get_youtube_trailer_with_name(movie.title)
-            if not video_data:
-                self.stdout.write(self.style.WARNING(f'❌ Трейлер не найден для фильма {movie.title}'))
-                continue
+    # ВИДЕО ИСТОЧНИКОВ
+    # ---------------------------------------------------------------------------------
+    async def harvest_games(self, due):
+        """
+        Game.videos - id записей game_videos IGDB. Сами ролики (video_id - ключ YouTube) запрашиваются
+        пачками по 500 id; у игры берётся первый ролик с "trailer" в названии, иначе первый.
+        """
+        game_videos = await sync_to_async(list)(due.exclude(videos=None).values_list('pk', 'videos'))
+        video_ids = sorted({video for _, videos in game_videos for video in videos or [] if isinstance(video, int)})
+        chunks = [video_ids[start:start + IGDB_MAX_LIMIT] for start in range(0, len(video_ids), IGDB_MAX_LIMIT)]
+
+        async with IGDB_CLIENT.async_session() as api:
+            responses = await asyncio.gather(*[
+                api.post("game_videos", data=f"fields id, name, video_id; where id = ({', '.join(map(str, chunk))}); limit {IGDB_MAX_LIMIT};")
+                for chunk in chunks
+            ])
+        videos_by_id = {video["id"]: video for response in responses for video in response or [] if video.get("video_id")}
+
+        trailers = {}
+        for pk, videos in game_videos:
+            candidates = [videos_by_id[video] for video in videos or [] if video in videos_by_id]
+            trailer = next((video for video in candidates if "trailer" in (video.get("name") or "").lower()), None)
+            trailer = trailer or (candidates[0] if candidates else None)
+            if trailer:
+                trailers[pk] = (trailer["video_id"], trailer.get("name"))
+        return trailers
+
+    async def harvest_movies(self, due):
+        """videos из TMDb для фильмов и сериалов без трейлера (в том числе заглушек похожих фильмов) - параллельно."""
+        movies = await sync_to_async(list)(due.exclude(tmdb_id=None).values_list('pk', 'tmdb_id', 'content_type'))
+
+        async with TMDB_CLIENT.async_session() as api:
+            responses = await asyncio.gather(*[
+                api.get(
+                    f"{'tv' if content_type == Movie.CONTENT_TYPE_TV else 'movie'}/{tmdb_id}/videos",
+                    {"include_video_language": "ru,en"},
+                )
+                for _, tmdb_id, content_type in movies
+            ])
+
+        trailers = {}
+        for (pk, _, _), videos in zip(movies, responses):
+            trailer_key, trailer_name = pick_tmdb_trailer(videos)
+            if trailer_key:
+                trailers[pk] = (trailer_key, trailer_name)
+        return trailers
+
+    # ПОИСК НА YOUTUBE
+    # ---------------------------------------------------------------------------------
+    def search_youtube(self, config, max_searches):
+        """
+        Поиск для оставшихся - сколько позволяет остаток дневной квоты (search.list - 100 единиц),
+        популярные первыми. Не нашли - следующая попытка через NOT_FOUND_RETRY, ошибка API - через ERROR_RETRY.
+        """
+        budget = YOUTUBE_CLIENT.quota.remaining() // YOUTUBE_SEARCH_COST
+        if max_searches is not None:
+            budget = min(budget, max_searches)
+        if budget <= 0:
+            self.stdout.write(self.style.WARNING("⚠️ Квота YouTube API на сегодня израсходована, поиск трейлеров отложен."))
+            return
+
+        title_field = config['title_field']
+        candidates = list(
+            self.due_queryset(config).order_by(config['search_order'], 'pk').values_list('pk', title_field)[:budget]
+        )
+        if not candidates:
+            return
+        self.stdout.write(self.style.SUCCESS(f"🔎 Поиск трейлеров на YouTube: {len(candidates)} {config['label']}"))
+
+        results = asyncio.run(self.search_all(candidates))
+        now = timezone.now()
+        trailers, retry_after = {}, {}
+        quota_left = True
+        for (pk, title), result in zip(candidates, results):
+            if result is QuotaExceededError:
+                quota_left = False
+            elif result is None:
+                retry_after[pk] = now + ERROR_RETRY
+            elif not result:
+                self.stdout.write(self.style.WARNING(f"❌ Трейлер не найден для {title}"))
+                retry_after[pk] = now + NOT_FOUND_RETRY
+            else:
+                trailers[pk] = (result["id"], result["title"])
+        self.save_results(config, trailers, retry_after)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Найдено на YouTube: {len(trailers)}, не найдено или ошибка: {len(retry_after)}"
+        ))
+        if not quota_left:
+            self.stdout.write(self.style.WARNING("⚠️ Квота YouTube API кончилась во время поиска, остальные - в следующий запуск."))
+
+    async def search_all(self, candidates):
+        """Результат на каждого кандидата: трейлер, {} - не найден, None - ошибка API, QuotaExceededError - квоты нет."""
+        async with YOUTUBE_CLIENT.async_session() as api:
+            async def search(title):
+                try:
+                    data = await api.get("search", youtube_trailer_search_params(title), cost=YOUTUBE_SEARCH_COST)
+                except QuotaExceededError:
+                    return QuotaExceededError
+                if data is None:
+                    return None
+                return parse_youtube_trailer(data) or {}
+
+            return await asyncio.gather(*[search(title) for _, title in candidates])
+
+    # ЗАПИСЬ
+    # ---------------------------------------------------------------------------------
+    def save_results(self, config, trailers, retry_after):
+        """Найденные трейлеры - одним bulk_update, отложенные попытки - по UPDATE на каждый срок."""
+        model = config['model']
+        name_field = config['name_field']
+        objects = []
+        for pk, (trailer_key, trailer_name) in trailers.items():
+            obj = model(pk=pk, youtube_trailer=trailer_key, trailer_retry_after=None)
+            if name_field:
+                setattr(obj, name_field, trailer_name)
+            objects.append(obj)
+        fields = ['youtube_trailer', 'trailer_retry_after'] + ([name_field] if name_field else [])
+        model.objects.bulk_update(objects, fields, batch_size=500)
 
-            movie.youtube_trailer = video_data['id']
-            movie.youtube_trailer_name = video_data['title']
-            movie.save()
-            self.stdout.write(self.style.SUCCESS(f'✅ Обновлён трейлер для фильма {movie.title}: {video_data["id"]} | {video_data["title"]}'))
+        by_time = {}
+        for pk, retry_at in retry_after.items():
+            by_time.setdefault(retry_at, []).append(pk)
+        for retry_at, pks in by_time.items():
+            model.objects.filter(pk__in=pks).update(trailer_retry_after=retry_at)
@@ -0,0 +1,232 @@
+# mgb_main/query_budget.py
+"""
+Учёт SQL в пределах одного HTTP-запроса: число запросов, время в базе, повторяющиеся
+запросы (признак N+1), строки, которые вернул каждый запрос (признак выборки всей таблицы),
+и место, откуда они пришли - файл проекта и тег шаблона.
+
+- QueryProfile - контекстный менеджер поверх connection.execute_wrapper всех соединений;
+- @query_budget(n, max_rows=...) - сколько запросов допустимо для view и сколько строк
+  может вернуть один запрос; читают middleware и тесты;
+- QueryProfileMiddleware (включается settings.QUERY_PROFILE, на staging) - заголовки X-Query-*
+  и Server-Timing в ответе, предупреждение в лог при выходе за бюджет;
+- QueryBudgetTestMixin.assertWithinQueryBudget - проваливает тест, если view вышла за бюджет,
+  и печатает, какие запросы повторялись и откуда.
+"""
+import logging
+import re
+import sys
+import time
+from collections import Counter, defaultdict, namedtuple
+from contextlib import ExitStack
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Node
+from django.urls import resolve
+
+logger = logging.getLogger(__name__)
+
+QueryRecord = namedtuple('QueryRecord', 'sql fingerprint duration origin rows')
+
+PROJECT_ROOT = str(Path(settings.BASE_DIR).resolve())
+THIS_FILE = str(Path(__file__).resolve())
+
+IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)')
+NUMBER_RE = re.compile(r'\b\d+\b')
+SPACES_RE = re.compile(r'\s+')
+
+MAX_ROWS_PER_QUERY = 1000  # больше строк за запрос на странице - почти наверняка выборка всей таблицы
+
+
+def fingerprint(sql):
+    """SQL без значений: запросы, отличающиеся только параметрами и длиной IN (...), совпадают."""
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    return SPACES_RE.sub(' ', sql).strip()
+
+
+def query_origin():
+    """
+    'файл.py:строка в функции' - ближайший к запросу кадр кода проекта (view, тег шаблона, модель),
+    плюс 'шаблон:строка' ближайшего узла шаблона, если запрос выполнен при рендеринге.
+    """
+    code_place = template_place = None
+    frame = sys._getframe(2)
+    while frame is not None and not (code_place and template_place):
+        filename = frame.f_code.co_filename
+        if code_place is None and filename.startswith(PROJECT_ROOT) and filename != THIS_FILE \
+                and 'site-packages' not in filename:
+            code_place = f"{Path(filename).relative_to(PROJECT_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        if template_place is None and frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            if isinstance(node, Node) and node.origin is not None:
+                template_place = f"{node.origin.template_name}:{node.token.lineno}"
+        frame = frame.f_back
+    if template_place:
+        return f"{code_place or '?'} ({template_place})"
+    return code_place or '?'
+
+
+class QueryProfile:
+    """Записывает все запросы ко всем базам внутри блока with."""
+
+    def __init__(self, capture_origin=True):
+        self.capture_origin = capture_origin
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        origin = query_origin() if self.capture_origin else None
+        started_at = time.perf_counter()
+        rows = None
+        try:
+            result = execute(sql, params, many, context)
+            # Строки результата известны сразу после execute (клиентский курсор); у серверного (iterator) - -1
+            if sql.lstrip()[:6].upper() == 'SELECT' and context['cursor'].rowcount >= 0:
+                rows = context['cursor'].rowcount
+            return result
+        finally:
+            self.queries.append(QueryRecord(sql, fingerprint(sql), time.perf_counter() - started_at, origin, rows))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(query.duration for query in self.queries)
+
+    @property
+    def total_rows(self):
+        return sum(query.rows or 0 for query in self.queries)
+
+    def wide(self, max_rows):
+        """Запросы, вернувшие больше max_rows строк, от самого широкого."""
+        return sorted((query for query in self.queries if (query.rows or 0) > max_rows), key=lambda query: -query.rows)
+
+    def repeated(self):
+        """[(fingerprint, сколько раз, Counter мест вызова), ...] для запросов, выполненных больше одного раза."""
+        groups = defaultdict(list)
+        for query in self.queries:
+            groups[query.fingerprint].append(query)
+        return sorted(
+            (
+                (sql, len(queries), Counter(query.origin for query in queries))
+                for sql, queries in groups.items() if len(queries) > 1
+            ),
+            key=lambda group: -group[1],
+        )
+
+    def report(self, limit=10, max_rows=MAX_ROWS_PER_QUERY):
+        lines = [f"{self.count} запросов, {self.total_rows} строк, {self.total_time * 1000:.1f} мс в базе"]
+        for sql, times, origins in self.repeated()[:limit]:
+            lines.append(f"  {times}x {sql[:200]}")
+            lines.extend(f"      {count}x {origin}" for origin, count in origins.most_common(3))
+        for query in self.wide(max_rows)[:limit]:
+            lines.append(f"  {query.rows} строк: {query.fingerprint[:200]}")
+            lines.append(f"      {query.origin}")
+        return '\n'.join(lines)
+
+
+# БЮДЖЕТ ЗАПРОСОВ VIEW
+# ---------------------------------------------------------------------------------
+def query_budget(max_queries, max_rows=MAX_ROWS_PER_QUERY):
+    """
+    Объявляет, сколько SQL-запросов допустимо для view (вместе с сессией, пользователем и шаблоном)
+    и сколько строк может вернуть один запрос.
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        view.query_row_budget = max_rows
+        return view
+    return decorator
+
+
+def get_query_budget(view):
+    return getattr(view, 'query_budget', None)
+
+
+def get_query_row_budget(view):
+    return getattr(view, 'query_row_budget', MAX_ROWS_PER_QUERY)
+
+
+class QueryProfileMiddleware:
+    """
+    Профиль SQL каждого запроса в заголовках ответа: X-Query-Count, X-Query-Time-Ms,
+    X-Query-Budget, X-Query-Repeated (сколько разных запросов повторялось),
+    X-Query-Top-Repeated (самый частый повтор и его место), X-Query-Rows (строк всего) и
+    X-Query-Max-Rows (самый широкий запрос), плюс Server-Timing для DevTools.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_PROFILE', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryProfile() as profile:
+            response = self.get_response(request)
+
+        budget = getattr(request, 'query_budget', None)
+        row_budget = getattr(request, 'query_row_budget', MAX_ROWS_PER_QUERY)
+        repeated = profile.repeated()
+        wide = profile.wide(row_budget)
+        response['X-Query-Count'] = str(profile.count)
+        response['X-Query-Time-Ms'] = f"{profile.total_time * 1000:.1f}"
+        response['X-Query-Repeated'] = str(len(repeated))
+        response['X-Query-Rows'] = str(profile.total_rows)
+        response['X-Query-Max-Rows'] = str(max((query.rows or 0 for query in profile.queries), default=0))
+        if repeated:
+            _, times, origins = repeated[0]
+            response['X-Query-Top-Repeated'] = f"{times}x {origins.most_common(1)[0][0]}"
+        if budget is not None:
+            response['X-Query-Budget'] = str(budget)
+        response['Server-Timing'] = f'db;dur={profile.total_time * 1000:.1f};desc="{profile.count} queries"'
+
+        if budget is not None and profile.count > budget:
+            logger.warning("%s %s: бюджет %s запросов превышен\n%s", request.method, request.path, budget, profile.report())
+        elif wide:
+            logger.warning(
+                "%s %s: %s запросов вернули больше %s строк\n%s",
+                request.method, request.path, len(wide), row_budget, profile.report(max_rows=row_budget),
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(view_func)
+        request.query_row_budget = get_query_row_budget(view_func)
+
+
+# ТЕСТЫ
+# ---------------------------------------------------------------------------------
+class QueryBudgetTestMixin:
+    """Для django.test.TestCase: запрос через self.client с проверкой бюджета запросов и строк view."""
+
+    def assertWithinQueryBudget(self, path, method='get', budget=None, max_rows=None, **kwargs):
+        view = resolve(urlsplit(path).path).func
+        if budget is None:
+            budget = get_query_budget(view)
+        if max_rows is None:
+            max_rows = get_query_row_budget(view)
+        if budget is None:
+            self.fail(f"{path}: у view {view.__module__}.{view.__name__} не объявлен @query_budget")
+
+        with QueryProfile() as profile:
+            response = getattr(self.client, method)(path, **kwargs)
+        if profile.count > budget:
+            self.fail(f"{method.upper()} {path}: бюджет {budget} запросов превышен\n{profile.report(max_rows=max_rows)}")
+        if profile.wide(max_rows):
+            self.fail(f"{method.upper()} {path}: запросы вернули больше {max_rows} строк\n{profile.report(max_rows=max_rows)}")
+        return response
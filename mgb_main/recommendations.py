@@ -0,0 +1,268 @@
+# mgb_main/recommendations.py
+"""
+Персональные рекомендации "Для вас" (UserRecommendation), строятся офлайн командой build_recommendations.
+
+Матрица пользователь x элемент собирается из UserItemState - там уже сведены оценки (User*Rating),
+статусы и избранное. Вес взаимодействия: оценка относительно середины шкалы, статус, избранное;
+брошенное и низко оценённое - отрицательный вес. Строки нормируются, чтобы активные пользователи
+не перевешивали остальных.
+
+Усечённое SVD (scipy.sparse.linalg.svds) даёт факторы элементов V; оценка элементов для пользователя
+с вектором взаимодействий a - (a V) V^T. Для пользователей из обучающей матрицы это ровно то же,
+что U S V^T, поэтому пользователя, у которого изменилась библиотека, можно пересчитать
+по сохранённым V (RecommenderModel) без новой факторизации (build_recommendations --changed).
+Полка на лендинге читает готовые id одним запросом по индексу.
+"""
+import time
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+from scipy import sparse
+from scipy.sparse.linalg import svds
+
+from users.models import (
+    Book, Game, Movie,
+    RecommenderModel, UserItemState, UserRecommendation, UserRecommendationState,
+)
+
+FACTORS = 48
+ROWS_PER_FACTOR = 8            # факторов не больше min(пользователей, элементов) / 8, см. fit_item_factors
+TOP_N = 24
+MIN_INTERACTIONS = 3           # у кого меньше - рекомендаций не считаем, полка не показывается
+MIN_SCORE = 1e-4
+SCORE_CELLS_PER_BATCH = 20_000_000  # плотная матрица оценок пачки: пользователей * элементов (float32, ~80 МБ)
+
+# Вклад статуса; завершённое весит больше начатого, брошенное - против
+STATUS_WEIGHTS = {
+    'played': 1.0, 'watched': 1.0, 'read': 1.0,
+    'playing': 0.6, 'watching': 0.6, 'reading': 0.6,
+    'dropped': -1.0,
+}
+FAVORITE_WEIGHT = 1.5
+RATING_WEIGHT = 2.0            # оценка 10 -> +2, 1 -> -2
+
+RECOMMENDATIONS_CONFIG = {
+    'games': {'model': Game, 'content_type': 'game'},
+    'movies': {'model': Movie, 'content_type': 'movie'},
+    'books': {'model': Book, 'content_type': 'book'},
+}
+
+
+def interaction_weight(is_favorite, status, rating):
+    weight = STATUS_WEIGHTS.get(status, 0.0)
+    if rating is not None:
+        weight += RATING_WEIGHT * (rating - 5.5) / 4.5
+    if is_favorite:
+        weight += FAVORITE_WEIGHT
+    return weight
+
+
+# МАТРИЦА ВЗАИМОДЕЙСТВИЙ
+# ---------------------------------------------------------------------------------
+def load_interactions(content_type, user_ids=None):
+    """{user_id: {item_id: вес}} по UserItemState; user_ids=None - все пользователи."""
+    field = f'{content_type}_id'
+    rows = UserItemState.objects.filter(content_type=content_type)
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+    interactions = {}
+    values = rows.values_list('user_id', field, 'is_favorite', 'status', 'rating')
+    for user_id, item_id, is_favorite, status, rating in values.iterator(chunk_size=5000):
+        interactions.setdefault(user_id, {})[item_id] = interaction_weight(is_favorite, status, rating)
+    return interactions
+
+
+def interaction_matrix(user_items, item_index):
+    """
+    Строка на пользователя: веса по столбцам item_index (элементы вне индекса пропускаются), L2-норма 1.
+    Второй результат - матрица из единиц: всё, что уже есть в библиотеке, не рекомендуется.
+    """
+    indices, indptr, data = [], [0], []
+    for items in user_items:
+        for item_id, weight in items.items():
+            column = item_index.get(item_id)
+            if column is not None:
+                indices.append(column)
+                data.append(weight)
+        indptr.append(len(indices))
+    shape = (len(user_items), len(item_index))
+    indices = np.asarray(indices, dtype=np.int32)
+    indptr = np.asarray(indptr, dtype=np.int64)
+    matrix = sparse.csr_matrix((np.asarray(data, dtype=np.float32), indices, indptr), shape=shape)
+    seen = sparse.csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr), shape=shape)
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return (sparse.diags(inverse.astype(np.float32)) @ matrix).tocsr(), seen
+
+
+def fit_item_factors(matrix, factors=FACTORS):
+    """
+    Факторы элементов V (элементов x k) усечённого SVD; None, если данных на факторизацию не хватает.
+    При k, близком к рангу матрицы, SVD просто восстанавливает известные взаимодействия, и всем
+    неизвестным элементам достаётся оценка около нуля, поэтому на маленьких данных k урезается.
+    """
+    k = min(factors, min(matrix.shape) // ROWS_PER_FACTOR, min(matrix.shape) - 1)
+    if k < 1:
+        return None
+    _, _, vt = svds(matrix, k=k, random_state=0)
+    return np.ascontiguousarray(vt.T, dtype=np.float32)
+
+
+def top_items(matrix, seen, item_factors, top_n=TOP_N, min_score=MIN_SCORE):
+    """Для каждой строки: [(номер столбца, оценка), ...] по убыванию, без уже известных пользователю."""
+    rows, items = matrix.shape
+    k = min(top_n, items)
+    if k <= 0:
+        return
+    batch_size = max(1, SCORE_CELLS_PER_BATCH // items)
+
+    for start in range(0, rows, batch_size):
+        stop = min(start + batch_size, rows)
+        scores = (matrix[start:stop] @ item_factors) @ item_factors.T
+        known = seen[start:stop].tocoo()
+        scores[known.row, known.col] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        for offset in range(stop - start):
+            yield start + offset, [
+                (int(column), float(score))
+                for column, score in zip(top[offset], top_scores[offset])
+                if score >= min_score
+            ]
+
+
+def recommendation_rows(content_type, user_ids, user_items, item_ids, item_factors, top_n):
+    item_index = {item_id: column for column, item_id in enumerate(item_ids)}
+    matrix, seen = interaction_matrix(user_items, item_index)
+    return [
+        UserRecommendation(
+            user_id=user_ids[row], content_type=content_type, rank=rank,
+            item_id=int(item_ids[column]), score=score,
+        )
+        for row, recommended in top_items(matrix, seen, item_factors, top_n)
+        for rank, (column, score) in enumerate(recommended)
+    ]
+
+
+# ПОСТРОЕНИЕ
+# ---------------------------------------------------------------------------------
+def build_recommendations(content_key, factors=FACTORS, top_n=TOP_N, stdout=None):
+    """
+    Полный пересчёт типа контента: факторизация по всем активным пользователям (не меньше
+    MIN_INTERACTIONS элементов), факторы - в RecommenderModel, рекомендации всех пользователей
+    заменяются в одной транзакции. Возвращает число строк UserRecommendation.
+    """
+    config = RECOMMENDATIONS_CONFIG[content_key]
+    content_type = config['content_type']
+    started_at = time.monotonic()
+    built_at = timezone.now()  # изменения после чтения матрицы останутся "устаревшими" для --changed
+
+    interactions = {
+        user_id: items for user_id, items in load_interactions(content_type).items()
+        if len(items) >= MIN_INTERACTIONS
+    }
+    user_ids = list(interactions)
+    item_ids = np.asarray(sorted({item_id for items in interactions.values() for item_id in items}), dtype=np.int32)
+    matrix, _ = interaction_matrix(
+        [interactions[user_id] for user_id in user_ids],
+        {item_id: column for column, item_id in enumerate(item_ids.tolist())},
+    )
+    item_factors = fit_item_factors(matrix, factors)
+    if item_factors is None:
+        if stdout:
+            stdout.write(f"{content_key}: мало данных ({len(user_ids)} пользователей, {len(item_ids)} элементов)")
+        item_factors = np.zeros((len(item_ids), 0), dtype=np.float32)
+    if stdout:
+        stdout.write(
+            f"{content_key}: {len(user_ids)} пользователей, {len(item_ids)} элементов, {matrix.nnz} взаимодействий, "
+            f"{item_factors.shape[1]} факторов ({time.monotonic() - started_at:.1f} c)"
+        )
+
+    rows = recommendation_rows(
+        content_type, user_ids, [interactions[user_id] for user_id in user_ids],
+        item_ids.tolist(), item_factors, top_n,
+    ) if item_factors.shape[1] else []
+
+    with transaction.atomic():
+        RecommenderModel.objects.update_or_create(content_type=content_type, defaults={
+            'factor_count': item_factors.shape[1],
+            'item_ids': item_ids.tobytes(),
+            'factors': item_factors.tobytes(),
+            'users_count': len(user_ids),
+            'built_at': built_at,
+        })
+        UserRecommendation.objects.filter(content_type=content_type).delete()
+        UserRecommendation.objects.bulk_create(rows, batch_size=5000)
+        UserRecommendationState.objects.filter(content_type=content_type).update(built_at=built_at)
+
+    if stdout:
+        elapsed = time.monotonic() - started_at
+        stdout.write(f"{content_key}: {len(rows)} рекомендаций за {elapsed:.1f} c ({len(user_ids) / elapsed if elapsed else 0:.0f} пользователей/с)")
+    return len(rows)
+
+
+def refresh_changed_recommendations(content_key, top_n=TOP_N, stdout=None):
+    """
+    Пересчитывает рекомендации только пользователям, у которых библиотека менялась после
+    последнего расчёта (UserRecommendationState.changed_at > built_at), по факторам последнего
+    полного пересчёта. Новые элементы каталога попадут в рекомендации после следующего полного.
+    Без сохранённых факторов выполняется полный пересчёт. Возвращает число пересчитанных пользователей.
+    """
+    config = RECOMMENDATIONS_CONFIG[content_key]
+    content_type = config['content_type']
+    model = RecommenderModel.objects.filter(content_type=content_type).first()
+    if model is None:
+        build_recommendations(content_key, top_n=top_n, stdout=stdout)
+        return RecommenderModel.objects.get(content_type=content_type).users_count
+
+    built_at = timezone.now()
+    stale = UserRecommendationState.objects.filter(content_type=content_type, changed_at__isnull=False).filter(
+        Q(built_at__isnull=True) | Q(changed_at__gt=F('built_at'))
+    )
+    stale_user_ids = list(stale.values_list('user_id', flat=True))
+    if not stale_user_ids:
+        return 0
+
+    item_ids = np.frombuffer(bytes(model.item_ids), dtype=np.int32).tolist()
+    item_factors = np.frombuffer(bytes(model.factors), dtype=np.float32).reshape(len(item_ids), model.factor_count)
+    interactions = {
+        user_id: items for user_id, items in load_interactions(content_type, stale_user_ids).items()
+        if len(items) >= MIN_INTERACTIONS
+    }
+    user_ids = list(interactions)
+    rows = recommendation_rows(
+        content_type, user_ids, [interactions[user_id] for user_id in user_ids], item_ids, item_factors, top_n,
+    ) if model.factor_count else []
+
+    with transaction.atomic():
+        UserRecommendation.objects.filter(content_type=content_type, user_id__in=stale_user_ids).delete()
+        UserRecommendation.objects.bulk_create(rows, batch_size=5000)
+        UserRecommendationState.objects.filter(
+            content_type=content_type, user_id__in=stale_user_ids, changed_at__lte=built_at,
+        ).update(built_at=built_at)
+
+    if stdout:
+        stdout.write(f"{content_key}: пересчитано {len(stale_user_ids)} пользователей, {len(rows)} рекомендаций")
+    return len(stale_user_ids)
+
+
+# ЧТЕНИЕ
+# ---------------------------------------------------------------------------------
+def get_recommendations(content_key, user, limit=TOP_N):
+    """
+    Рекомендации пользователя по порядку одним запросом: pk IN (id из индекса
+    user+content_type+rank) с порядком из того же индекса. Анонимному - пусто.
+    """
+    config = RECOMMENDATIONS_CONFIG[content_key]
+    if not (user and user.is_authenticated):
+        return config['model'].objects.none()
+    recommended = UserRecommendation.objects.filter(user=user, content_type=config['content_type'])
+    return config['model'].objects.filter(pk__in=recommended.values('item_id')).annotate(
+        recommendation_rank=Subquery(recommended.filter(item_id=OuterRef('pk')).values('rank')[:1])
+    ).order_by('recommendation_rank')[:limit]
@@ -0,0 +1,215 @@
+import re
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, FloatField, Func, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, Ln
+
+from users.models import Game, Movie, Book, Genre
+
+# Конфигурация 'simple': названия бывают и на русском, и на английском,
+# поэтому не используем стемминг конкретного языка.
+SEARCH_CONFIG_NAME = 'simple'
+
+# Веса в итоговой формуле ранжирования
+RANK_WEIGHT = 1.0         # релевантность по tsvector
+SIMILARITY_WEIGHT = 0.6   # триграммное сходство (опечатки)
+POPULARITY_WEIGHT = 0.05  # ln(1 + популярность)
+
+RU_TO_LAT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+}
+
+# Сначала многобуквенные сочетания, потом одиночные буквы
+LAT_TO_RU = [
+    ('shch', 'щ'), ('zh', 'ж'), ('kh', 'х'), ('ts', 'ц'), ('ch', 'ч'), ('sh', 'ш'),
+    ('yu', 'ю'), ('ya', 'я'), ('yo', 'ё'),
+    ('a', 'а'), ('b', 'б'), ('c', 'к'), ('d', 'д'), ('e', 'е'), ('f', 'ф'), ('g', 'г'),
+    ('h', 'х'), ('i', 'и'), ('j', 'дж'), ('k', 'к'), ('l', 'л'), ('m', 'м'), ('n', 'н'),
+    ('o', 'о'), ('p', 'п'), ('q', 'к'), ('r', 'р'), ('s', 'с'), ('t', 'т'), ('u', 'у'),
+    ('v', 'в'), ('w', 'в'), ('x', 'кс'), ('y', 'й'), ('z', 'з'),
+]
+
+
+def transliterate(text):
+    """Переводит строку в другую раскладку: кириллицу в латиницу и наоборот."""
+    text = text.lower()
+    if re.search('[а-яё]', text):
+        return ''.join(RU_TO_LAT.get(char, char) for char in text)
+
+    result = []
+    i = 0
+    while i < len(text):
+        for lat, ru in LAT_TO_RU:
+            if text.startswith(lat, i):
+                result.append(ru)
+                i += len(lat)
+                break
+        else:
+            result.append(text[i])
+            i += 1
+    return ''.join(result)
+
+
+def get_query_variants(query):
+    """Исходный запрос и его транслитерация (если она отличается)."""
+    normalized = ' '.join(query.lower().split())
+    variants = [normalized]
+    transliterated = transliterate(normalized)
+    if transliterated and transliterated != normalized:
+        variants.append(transliterated)
+    return variants
+
+
+def build_prefix_search_query(variants):
+    """
+    Собирает tsquery вида 'word1:* & word2:*' для каждого варианта и объединяет их через OR.
+    Префиксы нужны, потому что поиск вызывается на каждое нажатие клавиши.
+    """
+    search_query = None
+    for variant in variants:
+        tokens = re.findall(r'\w+', variant)
+        if not tokens:
+            continue
+        raw = ' & '.join(f"{token}:*" for token in tokens)
+        variant_query = SearchQuery(raw, search_type='raw', config=SEARCH_CONFIG_NAME)
+        search_query = variant_query if search_query is None else search_query | variant_query
+    return search_query
+
+
+# ВЕКТОРЫ ПОИСКА (tsvector)
+# ---------------------------------------------------------------------------------
+def game_search_vector():
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG_NAME)
+        + SearchVector('company', weight='B', config=SEARCH_CONFIG_NAME)
+        + SearchVector(Func(F('genres'), Value(' '), function='array_to_string', output_field=TextField()), weight='C', config=SEARCH_CONFIG_NAME)
+    )
+
+
+def movie_search_vector():
+    genre_names = Genre.objects.filter(
+        tv_shows=OuterRef('pk')
+    ).order_by().values('tv_shows').annotate(
+        names=StringAgg('name', delimiter=' ')
+    ).values('names')
+
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG_NAME)
+        + SearchVector('original_title', weight='A', config=SEARCH_CONFIG_NAME)
+        + SearchVector(Subquery(genre_names, output_field=TextField()), weight='C', config=SEARCH_CONFIG_NAME)
+    )
+
+
+def book_search_vector():
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG_NAME)
+        + SearchVector(Cast('authors', TextField()), weight='B', config=SEARCH_CONFIG_NAME)
+        + SearchVector(Cast('categories', TextField()), weight='C', config=SEARCH_CONFIG_NAME)
+    )
+
+
+SEARCH_CONFIG = {
+    'games': {
+        'model': Game,
+        'vector': game_search_vector,
+        'trigram_fields': ['name'],
+        'popularity_field': 'total_rating_count',
+        # Поля, изменение которых требует пересчёта search_vector
+        'source_fields': {'name', 'company', 'genres'},
+    },
+    'movies': {
+        'model': Movie,
+        'vector': movie_search_vector,
+        'trigram_fields': ['title', 'original_title'],
+        'popularity_field': 'popularity',
+        'source_fields': {'title', 'original_title'},
+    },
+    'books': {
+        'model': Book,
+        'vector': book_search_vector,
+        'trigram_fields': ['title'],
+        'popularity_field': 'ratings_count',
+        'source_fields': {'title', 'authors', 'categories'},
+    },
+}
+
+
+def get_search_config_for_model(model):
+    for config in SEARCH_CONFIG.values():
+        if config['model'] is model:
+            return config
+    return None
+
+
+def is_search_backend_available():
+    """Полнотекстовый и триграммный поиск работают только на PostgreSQL."""
+    return connection.vendor == 'postgresql'
+
+
+def refresh_search_vectors(model, pks=None):
+    """
+    Пересчитывает search_vector одним UPDATE для указанных объектов (или для всей таблицы).
+    Возвращает количество обновлённых строк.
+    """
+    config = get_search_config_for_model(model)
+    if config is None or not is_search_backend_available():
+        return 0
+
+    queryset = model.objects.all() if pks is None else model.objects.filter(pk__in=pks)
+    return queryset.update(search_vector=config['vector']())
+
+
+# ПОИСК
+# ---------------------------------------------------------------------------------
+def search_catalog(content_key, query, limit=5):
+    """
+    Ищет по каталогу ('games', 'movies', 'books').
+    Совпадения по tsvector (с префиксами) или по триграммам (опечатки), по исходному
+    запросу и по его транслитерации. Сортировка: релевантность + сходство + популярность.
+    """
+    config = SEARCH_CONFIG[content_key]
+    model = config['model']
+    variants = get_query_variants(query)
+
+    if not is_search_backend_available():
+        # Запасной вариант для не-PostgreSQL баз (например, локальная SQLite)
+        lookup = Q()
+        for variant in variants:
+            for field in config['trigram_fields']:
+                lookup |= Q(**{f'{field}__icontains': variant})
+        return model.objects.filter(lookup)[:limit]
+
+    search_query = build_prefix_search_query(variants)
+
+    similarities = [
+        TrigramSimilarity(field, variant)
+        for field in config['trigram_fields']
+        for variant in variants
+    ]
+    similarity = Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+
+    match = Q()
+    for field in config['trigram_fields']:
+        for variant in variants:
+            match |= Q(**{f'{field}__trigram_similar': variant})
+
+    rank = Value(0.0, output_field=FloatField())
+    if search_query is not None:
+        match |= Q(search_vector=search_query)
+        rank = SearchRank(F('search_vector'), search_query)
+
+    popularity = Ln(Value(1.0) + Coalesce(Cast(config['popularity_field'], FloatField()), Value(0.0)))
+
+    return model.objects.filter(match).annotate(
+        search_score=(
+            Value(RANK_WEIGHT) * Coalesce(rank, Value(0.0))
+            + Value(SIMILARITY_WEIGHT) * similarity
+            + Value(POPULARITY_WEIGHT) * popularity
+        )
+    ).order_by('-search_score', 'pk')[:limit]
@@ -0,0 +1,255 @@
+import time
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import Game, Movie, Book
+from .recommendations import get_recommendations
+
+SHELF_CACHE_KEY = 'shelves:v2:{page}'  # v2: поля игр и фильмов больше не кладутся в снимок
+SHELF_SNAPSHOT_TTL = 30 * 60  # если снимок никто не обновил, он пересоберётся сам
+SHELF_LIMIT = 60              # потолок для полок, которые раньше были без ограничения
+
+
+# ПОЛЯ ДЛЯ ОТОБРАЖЕНИЯ
+# Иконки платформ, URL постеров, короткие описания и т.п. у игр и фильмов хранятся в самих строках
+# (Game/Movie.assign_display_fields при загрузке и save()); здесь - только витрина книг.
+# ---------------------------------------------------------------------------------
+def book_display_fields(book):
+    """Данные для JS-витрины главных книг (без actions_html - он зависит от пользователя)."""
+    authors_list = []
+    if book.authors and isinstance(book.authors, list):
+        authors_list = [str(author) for author in book.authors]
+
+    published_year_val = str(book.published_year) if book.published_year else '----'
+
+    cover_url_val = static('imgs/placeholder_book_cover_large.png')
+    if book.thumbnail:
+        cover_url_val = book.thumbnail
+    elif book.custom_photo:
+        cover_url_val = book.custom_photo
+
+    return {
+        'showcase_data': {
+            'id': book.id,
+            'google_id': book.google_id,
+            'title': book.title[:20] + '...' if len(book.title) > 23 else book.title,
+            'authors': authors_list,
+            'rating': str(book.mgb_average_rating) if book.mgb_average_rating is not None else '',
+            'rating_color': getattr(book, 'rating_color', '#777'),
+            'year': str(published_year_val),
+            'pages': getattr(book, 'page_count', 0) or 0,
+            'description': book.description or "",
+            'cover_url': cover_url_val,
+            'learn_more_url': reverse('book_detail', args=[book.google_id]) if book.google_id else '#',
+        },
+    }
+
+
+def apply_display_fields(obj, fields):
+    for name, value in fields.items():
+        setattr(obj, name, value)
+    return obj
+
+
+# ПОЛКИ
+# ---------------------------------------------------------------------------------
+def top_popular_games_shelf():
+    return Game.objects.filter(
+        total_rating_count__gt=1000
+    ).exclude(
+        name__icontains="Mario"
+    ).exclude(
+        name__icontains="Zelda"
+    ).order_by('-total_rating')[:50]
+
+
+def new_games_shelf():
+    now_ts = int(timezone.now().timestamp())
+    timestamp_threshold = int((timezone.now() - timedelta(days=120)).timestamp())
+    return Game.objects.filter(
+        first_release_date__isnull=False,
+        first_release_date__gt=0,
+        first_release_date__gte=timestamp_threshold,
+        first_release_date__lte=now_ts,
+        total_rating_count__gte=1,
+    ).order_by('-total_rating_count', '-first_release_date')[:9]
+
+
+def upcoming_games_shelf():
+    return Game.objects.filter(
+        first_release_date__gt=int(time.time()),
+        total_rating_count__gt=500
+    ).order_by('-total_rating_count')[:10]
+
+
+def new_movies_shelf():
+    today = date.today()
+    return Movie.objects.filter(
+        release_date__gte=today - timedelta(days=60), release_date__lte=today
+    ).exclude(release_date__isnull=True).order_by('-release_date')
+
+
+def upcoming_movies_shelf():
+    return Movie.objects.filter(release_date__gt=date.today()).exclude(release_date__isnull=True).order_by('release_date')
+
+
+def anime_series_shelf():
+    return Movie.objects.filter(
+        content_type=Movie.CONTENT_TYPE_TV,
+        genres__tmdb_id="16",
+        country__icontains="JP"
+    )
+
+
+def new_books_shelf():
+    """
+    Книги за последние полгода - диапазон по индексу published_on. Книги, у которых известны только
+    год или месяц (published_on - первый день периода), попадают, если период заходит в эти полгода.
+    """
+    today = timezone.localdate()
+    half_year_ago = today - timedelta(days=180)
+    return Book.objects.filter(
+        published_on__gte=date(half_year_ago.year, 1, 1),
+        published_on__lte=today,
+    ).filter(
+        Q(published_on__gte=half_year_ago)
+        | Q(published_precision=Book.PRECISION_MONTH, published_on__gte=half_year_ago.replace(day=1))
+        | Q(published_precision=Book.PRECISION_YEAR)
+    ).order_by('-published_on', '-pk')
+
+
+def popular_books_shelf():
+    return Book.objects.filter(
+        ratings_count__gte=5,
+        average_rating__isnull=False
+    ).order_by('-ratings_count')
+
+
+# Конфигурация лендингов: имя полки совпадает с именем переменной в шаблоне.
+# display_fields - поля карточки, которые считаются при сборке снимка (None - всё уже в строке).
+SHELF_PAGES = {
+    'games': {
+        'model': Game,
+        'display_fields': None,
+        'prefetch': [],
+        'shelves': {
+            'main_games': lambda: Game.objects.filter(is_main_game=True),
+            'recently_trending_small_games': lambda: Game.objects.filter(is_recently_trending_small=True),
+            'recently_trending_big_games': lambda: Game.objects.filter(is_recently_trending_big=True),
+            'new_games': new_games_shelf,
+            'top_popular_games': top_popular_games_shelf,
+            'upcoming_games': upcoming_games_shelf,
+        },
+    },
+    'movies': {
+        'model': Movie,
+        'display_fields': None,
+        'prefetch': ['genres'],
+        'shelves': {
+            'main_movies': lambda: Movie.objects.filter(is_main_movie=True),
+            'recently_trending_small_movies': lambda: Movie.objects.filter(is_recently_trending_small=True),
+            'recently_trending_big_movies': lambda: Movie.objects.filter(is_recently_trending_big=True),
+            'new_movies': new_movies_shelf,
+            'upcoming_movies': upcoming_movies_shelf,
+            'top_popular_movies': lambda: Movie.objects.filter(vote_count__gt=1000).order_by('-vote_average')[:60],
+            'best_movies': lambda: Movie.objects.filter(vote_average__gt=8, vote_count__gt=1000).order_by('-vote_average')[:50],
+            'anime_series_list': anime_series_shelf,
+        },
+    },
+    'books': {
+        'model': Book,
+        'display_fields': book_display_fields,
+        'prefetch': [],
+        'shelves': {
+            'main_books_for_django': lambda: Book.objects.filter(is_main_book=True),
+            'recently_trending_small_books': lambda: Book.objects.filter(is_recently_trending_small=True),
+            'new_books': new_books_shelf,
+            'popular_books': popular_books_shelf,
+        },
+    },
+}
+
+
+def build_shelf_snapshot(page):
+    """
+    Считает все полки страницы: упорядоченные id по каждой полке и готовые поля карточек.
+    Каждая полка - один запрос, каждый объект обрабатывается один раз.
+    """
+    config = SHELF_PAGES[page]
+    display_fields = config['display_fields']
+    shelves = {}
+    cards = {}
+
+    for name, get_queryset in config['shelves'].items():
+        pks = []
+        for obj in get_queryset()[:SHELF_LIMIT]:
+            pks.append(obj.pk)
+            if obj.pk not in cards:
+                cards[obj.pk] = {'fields': display_fields(obj) if display_fields else {}}
+        shelves[name] = pks
+
+    return {'built_at': timezone.now(), 'shelves': shelves, 'cards': cards}
+
+
+def refresh_shelf_snapshot(page):
+    snapshot = build_shelf_snapshot(page)
+    cache.set(SHELF_CACHE_KEY.format(page=page), snapshot, SHELF_SNAPSHOT_TTL)
+    return snapshot
+
+
+def refresh_shelf_snapshots(*pages):
+    """Пересобирает снимки указанных страниц (по умолчанию - всех). Вызывается после загрузки данных."""
+    for page in pages or SHELF_PAGES:
+        refresh_shelf_snapshot(page)
+
+
+def refresh_shelf_snapshots_for_items(page, pks):
+    """
+    Пересобирает снимок страницы, только если изменённые объекты сейчас на её полках.
+    Объекты, которые после изменения должны попасть на полку, появятся там
+    при плановой пересборке (SHELF_SNAPSHOT_TTL).
+    """
+    snapshot = cache.get(SHELF_CACHE_KEY.format(page=page))
+    if snapshot is None or not set(pks) & set(snapshot['cards']):
+        return False
+    refresh_shelf_snapshot(page)
+    return True
+
+
+def load_shelves(page):
+    """
+    Полки страницы из снимка: одно чтение из кэша и один запрос за объектами.
+    Возвращает {имя полки: список объектов с уже проставленными полями для отображения}.
+    """
+    config = SHELF_PAGES[page]
+    snapshot = cache.get(SHELF_CACHE_KEY.format(page=page))
+    if snapshot is None:
+        snapshot = refresh_shelf_snapshot(page)
+
+    all_pks = {pk for pks in snapshot['shelves'].values() for pk in pks}
+    objects = config['model'].objects.prefetch_related(*config['prefetch']).in_bulk(all_pks)
+    for pk, obj in objects.items():
+        apply_display_fields(obj, snapshot['cards'][pk]['fields'])
+
+    # pk, удалённые после сборки снимка, пропускаются
+    return {
+        name: [objects[pk] for pk in snapshot['shelves'].get(name, []) if pk in objects]
+        for name in config['shelves']
+    }
+
+
+def load_for_you_shelf(page, user):
+    """
+    Персональная полка "Для вас": готовые рекомендации пользователя (UserRecommendation) одним запросом;
+    витрина книг считается на месте - элементов немного и снимок страницы общий для всех.
+    """
+    display_fields = SHELF_PAGES[page]['display_fields']
+    items = get_recommendations(page, user)
+    if display_fields:
+        items = [apply_display_fields(obj, display_fields(obj)) for obj in items]
+    return items
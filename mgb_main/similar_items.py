@@ -0,0 +1,236 @@
+# mgb_main/similar_items.py
+"""
+Индекс похожих игр, фильмов и книг (ItemNeighbor), строится офлайн командой build_similar_items.
+
+Каждый элемент - разреженный вектор из блоков признаков (жанры, платформы, авторы, люди,
+TF-IDF по описанию и названию). Каждый блок взвешен по IDF и нормирован отдельно, затем
+умножен на sqrt(вес блока): косинус итогового вектора - взвешенная сумма косинусов блоков.
+Соседи считаются пачками строк: (пачка x все элементы) одним умножением разреженных матриц,
+top-K через argpartition. Детальная страница читает готовых соседей одним запросом по индексу.
+"""
+import re
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from scipy import sparse
+
+from users.models import Book, Game, ItemNeighbor, Movie
+
+TOP_K = 12
+MIN_SCORE = 0.05
+SCORE_CELLS_PER_BATCH = 20_000_000  # плотная матрица близостей пачки: строк * элементов (float32, ~80 МБ)
+
+WORD_RE = re.compile(r'[^\W\d_]{3,}')
+TEXT_MIN_DF = 2      # слово из одного описания ничего ни с чем не связывает
+TEXT_MAX_DF = 0.3    # слова из трети описаний и чаще - почти стоп-слова
+
+
+def words(*texts):
+    return [word for text in texts if text for word in WORD_RE.findall(text.lower())]
+
+
+def names(values, key='name'):
+    """Список из JSONField: строки или словари IGDB вида {"id": ..., "name": ...}."""
+    if not isinstance(values, list):
+        return []
+    return [str(value.get(key, '')) if isinstance(value, dict) else str(value) for value in values if value]
+
+
+def m2m_tokens(relation, prefix):
+    """{pk: ['prefix:id связанного', ...]} одним запросом к through-таблице."""
+    field = relation.field
+    source_column = field.m2m_field_name() + '_id'
+    target_column = field.m2m_reverse_field_name() + '_id'
+    tokens = defaultdict(list)
+    for source, target in relation.through.objects.values_list(source_column, target_column).iterator(chunk_size=5000):
+        tokens[source].append(f"{prefix}:{target}")
+    return tokens
+
+
+# ПРИЗНАКИ
+# ---------------------------------------------------------------------------------
+def game_features():
+    rows = Game.objects.values_list('pk', 'name', 'summary', 'genres', 'platforms', 'game_modes', 'company')
+    for pk, name, summary, genres, platforms, game_modes, company in rows.iterator(chunk_size=2000):
+        yield pk, {
+            'genres': names(genres),
+            'platforms': names(platforms),
+            'modes': names(game_modes),
+            'company': [company] if company else [],
+            'text': words(name, summary),
+        }
+
+
+def movie_features():
+    genres = m2m_tokens(Movie.genres, 'genre')
+    actors = m2m_tokens(Movie.actors, 'actor')
+    crew = m2m_tokens(Movie.crew, 'crew')
+    rows = Movie.objects.values_list('pk', 'title', 'original_title', 'overview', 'content_type', 'original_language')
+    for pk, title, original_title, overview, content_type, original_language in rows.iterator(chunk_size=2000):
+        yield pk, {
+            'genres': genres[pk],
+            'people': actors[pk] + crew[pk],
+            'kind': [content_type],
+            'language': [original_language] if original_language else [],
+            'text': words(title, original_title, overview),
+        }
+
+
+def book_features():
+    rows = Book.objects.values_list('pk', 'title', 'description', 'authors', 'categories', 'language')
+    for pk, title, description, authors, categories, language in rows.iterator(chunk_size=2000):
+        yield pk, {
+            'authors': names(authors),
+            'categories': names(categories),
+            'language': [language] if language else [],
+            'text': words(title, description),
+        }
+
+
+# Блоки признаков и их веса; 'text' - TF-IDF по словам, остальные - категориальные признаки с IDF
+SIMILAR_ITEMS_CONFIG = {
+    'games': {
+        'model': Game,
+        'content_type': 'game',
+        'features': game_features,
+        'weights': {'genres': 1.0, 'platforms': 0.4, 'modes': 0.4, 'company': 0.6, 'text': 1.0},
+    },
+    'movies': {
+        'model': Movie,
+        'content_type': 'movie',
+        'features': movie_features,
+        'weights': {'genres': 1.0, 'people': 0.8, 'kind': 0.6, 'language': 0.3, 'text': 1.0},
+    },
+    'books': {
+        'model': Book,
+        'content_type': 'book',
+        'features': book_features,
+        'weights': {'authors': 1.2, 'categories': 1.0, 'language': 0.4, 'text': 1.0},
+    },
+}
+
+
+# МАТРИЦЫ
+# ---------------------------------------------------------------------------------
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return (sparse.diags(inverse.astype(np.float32)) @ matrix).tocsr()
+
+
+def block_matrix(token_lists, text=False):
+    """
+    Строки токенов -> разреженная матрица TF-IDF (строки нормированы).
+    Для текста - сублинейный tf и отсечение слишком редких и слишком частых слов.
+    """
+    vocabulary = {}
+    indices, indptr, data = [], [0], []
+    for tokens in token_lists:
+        for token, count in Counter(tokens).items():
+            indices.append(vocabulary.setdefault(token, len(vocabulary)))
+            data.append(count)
+        indptr.append(len(indices))
+    rows = len(token_lists)
+    matrix = sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=(rows, len(vocabulary)),
+    )
+
+    df = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    if text:
+        keep = np.flatnonzero((df >= TEXT_MIN_DF) & (df <= TEXT_MAX_DF * rows))
+        matrix, df = matrix[:, keep], df[keep]
+        matrix.data = 1 + np.log(matrix.data)
+    idf = (np.log((1 + rows) / (1 + df)) + 1).astype(np.float32)
+    return normalize_rows(matrix @ sparse.diags(idf))
+
+
+def feature_matrix(config):
+    """(pk элементов, матрица признаков: строка на элемент, L2-норма 1 или 0)."""
+    pks = []
+    blocks = defaultdict(list)
+    for pk, features in config['features']():
+        pks.append(pk)
+        for block in config['weights']:
+            blocks[block].append(features.get(block, []))
+
+    matrices = [
+        block_matrix(blocks[block], text=block == 'text') * np.float32(np.sqrt(weight))
+        for block, weight in config['weights'].items()
+    ]
+    return pks, normalize_rows(sparse.hstack(matrices, format='csr'))
+
+
+def top_neighbors(matrix, top_k=TOP_K, min_score=MIN_SCORE):
+    """Для каждой строки: [(номер строки соседа, близость), ...] по убыванию, без самой строки."""
+    rows = matrix.shape[0]
+    k = min(top_k, rows - 1)
+    if k <= 0:
+        return
+    transposed = matrix.T.tocsc()
+    batch_size = max(1, SCORE_CELLS_PER_BATCH // rows)
+
+    for start in range(0, rows, batch_size):
+        stop = min(start + batch_size, rows)
+        scores = (matrix[start:stop] @ transposed).toarray()
+        scores[np.arange(stop - start), np.arange(start, stop)] = -1  # сам элемент
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        for offset in range(stop - start):
+            yield start + offset, [
+                (int(neighbor), float(score))
+                for neighbor, score in zip(top[offset], top_scores[offset])
+                if score >= min_score
+            ]
+
+
+# ПОСТРОЕНИЕ И ЧТЕНИЕ
+# ---------------------------------------------------------------------------------
+def build_similar_items(content_key, top_k=TOP_K, stdout=None):
+    """
+    Пересобирает соседей одного типа контента. Старые строки заменяются новыми в одной
+    транзакции, так что детальные страницы не видят полупустой индекс. Возвращает число строк.
+    """
+    config = SIMILAR_ITEMS_CONFIG[content_key]
+    started_at = time.monotonic()
+    pks, matrix = feature_matrix(config)
+    if stdout:
+        stdout.write(
+            f"{content_key}: {len(pks)} элементов, {matrix.shape[1]} признаков, {matrix.nnz} ненулевых "
+            f"({time.monotonic() - started_at:.1f} c)"
+        )
+
+    neighbors = [
+        ItemNeighbor(
+            content_type=config['content_type'], item_id=pks[row], rank=rank,
+            neighbor_id=pks[neighbor], score=score,
+        )
+        for row, row_neighbors in top_neighbors(matrix, top_k)
+        for rank, (neighbor, score) in enumerate(row_neighbors)
+    ]
+    with transaction.atomic():
+        ItemNeighbor.objects.filter(content_type=config['content_type']).delete()
+        ItemNeighbor.objects.bulk_create(neighbors, batch_size=5000)
+
+    if stdout:
+        elapsed = time.monotonic() - started_at
+        stdout.write(f"{content_key}: {len(neighbors)} соседей за {elapsed:.1f} c ({len(pks) / elapsed if elapsed else 0:.0f} элементов/с)")
+    return len(neighbors)
+
+
+def get_similar_items(content_key, obj, limit=TOP_K):
+    """
+    Соседи элемента из индекса, по убыванию близости, одним запросом:
+    pk IN (соседи по индексу content_type+item_id) с порядком из того же индекса.
+    """
+    config = SIMILAR_ITEMS_CONFIG[content_key]
+    neighbors = ItemNeighbor.objects.filter(content_type=config['content_type'], item_id=obj.pk)
+    return config['model'].objects.filter(pk__in=neighbors.values('neighbor_id')).annotate(
+        similar_rank=Subquery(neighbors.filter(neighbor_id=OuterRef('pk')).values('rank')[:1])
+    ).order_by('similar_rank')[:limit]
@@ -1,3 +1,143 @@
+# mgb_main/tests.py
+from io import StringIO
+
+import numpy as np
+from django.core.cache import caches
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import Book, Game, Movie, User
+from . import browse
+from .api_client import DailyQuota
+from .benchmark import (
+    BENCH_POWER_USER, DERIVED_COMMANDS, generate_books, generate_games, generate_libraries, generate_movies,
+    generate_users,
+)
+from .query_budget import QueryBudgetTestMixin
+
+TEST_ITEMS = 40
+TEST_USERS = 20
+TEST_SCALE = {'library_mean': 5, 'power_library': 30}
+
+
+def populate_test_catalog(seed=7):
+    """
+    Небольшой каталог и библиотеки генераторами нагрузочного стенда, производные таблицы -
+    теми же командами. Возвращает пользователя с заполненной библиотекой.
+    """
+    rng = np.random.default_rng(seed)
+    now = timezone.now()
+    items = {
+        'game': np.asarray(generate_games(rng, TEST_ITEMS, now)),
+        'movie': np.asarray(generate_movies(rng, TEST_ITEMS, now)),
+        'book': np.asarray(generate_books(rng, TEST_ITEMS, now)),
+    }
+    user_pks = generate_users(TEST_USERS)
+    generate_libraries(rng, user_pks, items, TEST_SCALE, now)
+    for command in DERIVED_COMMANDS:
+        call_command(*command, stdout=StringIO())
+    return User.objects.get(username=BENCH_POWER_USER)
+
+
+class CatalogQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Страницы каталога укладываются в @query_budget и для гостя, и для пользователя с библиотекой."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = populate_test_catalog()
+        cls.game = Game.objects.order_by('-total_rating_count').first()
+        cls.movie = Movie.objects.order_by('-popularity').first()
+        cls.book = Book.objects.order_by('-ratings_count').first()
+
+    def setUp(self):
+        # Снимки полок строит refresh_shelves в setUpTestData, а кэш карточек - холодный: худший случай
+        caches['fragments'].clear()
+
+    def catalog_paths(self):
+        return [
+            reverse('games'),
+            reverse('movies'),
+            reverse('books'),
+            reverse('game_detail', args=[self.game.pk]),
+            reverse('movie_detail', args=[self.movie.pk]),
+            reverse('book_detail', args=[self.book.google_id]),
+        ]
+
+    def test_anonymous(self):
+        for path in self.catalog_paths():
+            with self.subTest(path=path):
+                response = self.assertWithinQueryBudget(path)
+                self.assertEqual(response.status_code, 200)
+
+    def test_logged_in(self):
+        self.client.force_login(self.user)
+        for path in self.catalog_paths():
+            with self.subTest(path=path):
+                response = self.assertWithinQueryBudget(path)
+                self.assertEqual(response.status_code, 200)
+
+    def test_budget_exceeded_fails(self):
+        with self.assertRaises(self.failureException):
+            self.assertWithinQueryBudget(reverse('games'), budget=0)
+
+    def test_row_budget_exceeded_fails(self):
+        # Фасеты жанров на странице фильмов - больше трёх строк одним запросом
+        with self.assertRaises(self.failureException):
+            self.assertWithinQueryBudget(reverse('movies'), max_rows=3)
+
+
+class BrowseFacetTests(TestCase):
+    """Счётчики фасетов из масок совпадают с фильтрами, которыми browse_items отбирает элементы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        populate_test_catalog()
+        # У фильмов без оценок TMDb vote_average = 0 - такие не входят ни в одну полосу рейтинга
+        unrated = Movie.objects.order_by('pk').values_list('pk', flat=True)[:3]
+        Movie.objects.filter(pk__in=list(unrated)).update(vote_average=0)
+        browse.refresh_facet_indexes()
+
+    def setUp(self):
+        browse._indexes.clear()
+
+    def test_counts_match_filters(self):
+        for content_key in browse.BROWSE_CONFIG:
+            index = browse.get_facet_index(content_key)
+            for facet, entries in index.counts({}).items():
+                for entry in entries:
+                    with self.subTest(content_key=content_key, facet=facet, value=entry['value']):
+                        selected = {facet: [entry['value']]}
+                        self.assertEqual(browse.filtered_queryset(content_key, selected).count(), entry['count'])
+                        self.assertEqual(index.total(selected), entry['count'])
+
+    def test_pagination_covers_all_items_once(self):
+        for content_key, config in browse.BROWSE_CONFIG.items():
+            for sort in config['sorts']:
+                with self.subTest(content_key=content_key, sort=sort):
+                    pks, cursor = [], None
+                    while True:
+                        items, cursor = browse.browse_items(content_key, {}, sort, cursor, page_size=7)
+                        pks += [item.pk for item in items]
+                        if cursor is None:
+                            break
+                    self.assertEqual(len(pks), len(set(pks)))
+                    self.assertEqual(set(pks), set(config['model'].objects.values_list('pk', flat=True)))
+
+
+class DailyQuotaTests(TestCase):
+    def test_spend_stops_at_limit(self):
+        quota = DailyQuota('test', 10)
+        self.assertTrue(quota.spend(4))
+        self.assertTrue(quota.spend(6))
+        self.assertFalse(quota.spend(1))
+        self.assertEqual(quota.used(), 10)
+        self.assertEqual(quota.remaining(), 0)
 
-# Create your tests here.
+    def test_refused_spend_is_not_counted(self):
+        quota = DailyQuota('test', 10)
+        self.assertTrue(quota.spend(7))
+        self.assertFalse(quota.spend(5))
+        self.assertTrue(quota.spend(3))
+        self.assertEqual(quota.used(), 10)
@@ -1,13 +1,7 @@
-import requests
-import os
-from dotenv import load_dotenv
+import re
+from datetime import datetime
 
-load_dotenv()
-
-YOUTUBE_API_KEY = os.getenv("GOOGLE_API_KEY")
-
-TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-TMDB_BASE_URL = "https://api.themoviedb.org/3"
+from .api_client import TMDB_CLIENT, YOUTUBE_CLIENT, QuotaExceededError
 
 COUNTRY_ABBREVIATIONS = {
     "United States of America": "USA",
@@ -29,70 +23,112 @@ def format_runtime(minutes):
     return f"{hours}h {mins}min" if hours else f"{mins}min"
 
 
-def get_youtube_trailer_with_name(query):
-    """Ищет трейлер на YouTube и возвращает словарь с videoId и названием."""
-    search_query = f"{query} official trailer"
-    url = "https://www.googleapis.com/youtube/v3/search"
+YOUTUBE_SEARCH_COST = 100  # search.list стоит 100 единиц дневной квоты YouTube Data API
 
-    params = {
+
+def youtube_trailer_search_params(query):
+    return {
         "part": "snippet",
-        "q": search_query,
-        "key": YOUTUBE_API_KEY,
+        "q": f"{query} official trailer",
         "maxResults": 1,
         "type": "video",
         "videoEmbeddable": "true"
     }
 
-    response = requests.get(url, params=params)
-    data = response.json()
-
-    if "error" in data:
-        print(f"❌ Ошибка API: {data['error']['message']}")
-        return None
 
-    if "items" in data and data["items"]:
+def parse_youtube_trailer(data):
+    """Первый ролик из ответа search.list: {"id": videoId, "title": название} или None."""
+    if data and data.get("items"):
         video = data["items"][0]
         return {
             "id": video["id"]["videoId"],
             "title": video["snippet"]["title"]
         }
-
-    print(f"❌ Трейлер не найден для {query}")
     return None
 
 
+def get_youtube_trailer_with_name(query):
+    """Ищет трейлер на YouTube и возвращает словарь с videoId и названием."""
+    try:
+        data = YOUTUBE_CLIENT.get("search", youtube_trailer_search_params(query), cost=YOUTUBE_SEARCH_COST)
+    except QuotaExceededError:
+        print(f"❌ Квота YouTube API на сегодня израсходована, трейлер для {query} не искали")
+        return None
+
+    if data is None:
+        print(f"❌ Ошибка API при поиске трейлера для {query}")
+        return None
+
+    trailer = parse_youtube_trailer(data)
+    if trailer is None:
+        print(f"❌ Трейлер не найден для {query}")
+    return trailer
+
+
 def get_tmdb_data(endpoint, params=None):
-    """Функция для выполнения GET-запросов к TMDb API."""
-    url = f"{TMDB_BASE_URL}/{endpoint}"
-    params = params or {}
-    params["api_key"] = TMDB_API_KEY
-
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json()
-    return None
+    """GET-запрос к TMDb API (через общий клиент: кэш, повторы, запись/воспроизведение)."""
+    return TMDB_CLIENT.get(endpoint, params)
+
+
+# Платформа IGDB -> иконка; всё, чего здесь нет, показывается иконкой PC
+PLATFORM_ICON_GROUPS = {
+    "imgs/platforms/xbox_icon.svg": ["Xbox Series X|S", "Xbox One", "Xbox 360"],
+    "imgs/platforms/ps_icon.svg": ["PlayStation 5", "PlayStation 4", "PlayStation 3", "PlayStation 2", "PlayStation", "PlayStation Portable"],
+    "imgs/platforms/mobile_icon.svg": ["Android", "iOS", "Google Stadia"],
+    "imgs/platforms/pc_icon.svg": ["PC (Microsoft Windows)", "Mac", "Linux", "DOS", "Family Computer"],
+    "imgs/platforms/nintendo_switch_icon.svg": [
+        "Nintendo Switch", "Nintendo 64", "Wii", "Nintendo GameCube", "Nintendo Entertainment System", "Wii U",
+        "Super Nintendo Entertainment System",
+    ],
+}
+PLATFORM_ICONS = {platform: icon for icon, platforms in PLATFORM_ICON_GROUPS.items() for platform in platforms}
+DEFAULT_PLATFORM_ICON = "imgs/platforms/pc_icon.svg"
 
 
 def get_platform_icon_path(platform_name):
     """
     Возвращает путь к иконке платформы.
     """
+    return PLATFORM_ICONS.get(platform_name, DEFAULT_PLATFORM_ICON)
+
+
+def get_platform_icons(platforms):
+    """Иконки платформ игры без повторов, в порядке первого появления."""
+    return list(dict.fromkeys(get_platform_icon_path(platform) for platform in platforms or []))
+
+
+TMDB_IMAGE_BASE_URL = "https://image.tmdb.org/t/p/"
+
+
+def tmdb_image_url(path, size='w500'):
+    """
+    URL картинки TMDb нужного размера. path - относительный путь из API (/abc.jpg) или уже полный URL
+    (fetch_movies и populate_tv_shows сохраняют .../t/p/original/abc.jpg); чужие URL возвращаются как есть.
+    """
+    if not path:
+        return None
+    if path.startswith(TMDB_IMAGE_BASE_URL):
+        path = '/' + path[len(TMDB_IMAGE_BASE_URL):].partition('/')[2]
+    elif not path.startswith('/'):
+        return path
+    return f"{TMDB_IMAGE_BASE_URL}{size}{path}"
+
+
+def format_date(timestamp):
+    """Возвращает только год из timestamp (игры) или строки (фильмы)"""
+    if isinstance(timestamp, int):
+        return datetime.fromtimestamp(timestamp).strftime('%Y')
+    elif isinstance(timestamp, str) and timestamp:
+        try:
+            return datetime.strptime(timestamp, '%Y-%m-%d').strftime('%Y')
+        except ValueError:
+            return timestamp
+    return None
+
 
-    xbox = ["Xbox Series X|S", "Xbox One", "Xbox 360"]
-    playstation = ["PlayStation 5", "PlayStation 4", "PlayStation 3", "PlayStation 2", "PlayStation", "PlayStation Portable"]
-    mobile = ["Android", "iOS", "Google Stadia"]
-    pc = ["PC (Microsoft Windows)", "Mac", "Linux", "DOS", "Family Computer"]
-
-    nintendo_switch = ["Nintendo Switch", "Nintendo 64", "Wii", "Nintendo GameCube", "Nintendo Entertainment System", "Wii U", "Super Nintendo Entertainment System"]
-
-    if platform_name in xbox:
-        return "imgs/platforms/xbox_icon.svg"
-    elif platform_name in playstation:
-        return "imgs/platforms/ps_icon.svg"
-    elif platform_name in mobile:
-        return "imgs/platforms/mobile_icon.svg"
-    elif platform_name in pc:
-        return "imgs/platforms/pc_icon.svg"
-    elif platform_name in nintendo_switch:
-        return "imgs/platforms/nintendo_switch_icon.svg"
-    return "imgs/platforms/pc_icon.svg"
+def get_first_sentence(text):
+    if not text:
+        return ""
+    # Разбиваем текст на предложения по точке, восклицательному и вопросительному знаку
+    sentences = re.split(r'(?<=[.!?])\s+', text.strip())
+    return sentences[0] if sentences else text
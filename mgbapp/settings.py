@@ -38,7 +38,7 @@ AUTH_USER_MODEL = 'users.User'
 
 LOGIN_REDIRECT_URL = "index"
 LOGOUT_REDIRECT_URL = "home"
-LOGIN_URL = "login"
+LOGIN_URL = "users:login"
 # Application definition
 
 INSTALLED_APPS = [
@@ -49,6 +49,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.humanize',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'mgb_main',
     'users',
 ]
@@ -64,6 +65,7 @@ SILENCED_SYSTEM_CHECKS = ["django_recaptcha.recaptcha_test_key_error"]
 
 
 MIDDLEWARE = [
+    'mgb_main.query_budget.QueryProfileMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -74,6 +76,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Профиль SQL каждого запроса в заголовках X-Query-* (mgb_main/query_budget.py): локально и на staging.
+# Стоит первым в MIDDLEWARE, чтобы учитывались и запросы сессии и пользователя.
+QUERY_PROFILE = os.environ.get('QUERY_PROFILE', str(DEBUG)) == 'True'
+
 ROOT_URLCONF = 'mgbapp.urls'
 
 TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
@@ -121,6 +127,30 @@ if DATABASE_URL:
     DATABASES['default'].update(db_config)
 
 
+# Кэш общий для всех процессов (gunicorn-воркеров): версия индекса автодополнения и т.п.
+# Таблица создаётся командой createcachetable (см. Procfile).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'mgb_cache',
+    },
+    # HTML карточек каталога без пользовательских кнопок ({% cache ... using="fragments" %}).
+    # Ключ включает хэш содержимого, поэтому общий кэш между процессами не нужен.
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'card-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+# Ответы внешних API (mgb_main/api_client.py): дисковый кэш и записанные ответы для офлайн-прогонов.
+# API_CLIENT_MODE: live - сеть + кэш, record - то же с записью всех ответов в API_FIXTURES_PATH,
+# replay - только записанные ответы, без сети (повтор и бенчмарк загрузки).
+API_CLIENT_MODE = os.environ.get('API_CLIENT_MODE', 'live')
+API_CACHE_PATH = os.environ.get('API_CACHE_PATH', str(BASE_DIR / '.api_cache' / 'responses.sqlite3'))
+API_FIXTURES_PATH = os.environ.get('API_FIXTURES_PATH', str(BASE_DIR / '.api_cache' / 'fixtures.sqlite3'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -23,7 +23,9 @@ from django.conf.urls.static import static
 urlpatterns = [
     path("", views.home_view, name="home"),
     path('search/', views.search_view, name='search'),
+    path('search/autocomplete/', views.autocomplete_view, name='search_autocomplete'),
     path("index/", views.index_view, name="index"),
+    path('browse/<str:content_key>/', views.browse_view, name='browse'),
 
     path("movies/", views.movies, name="movies"),
     path("movies/<int:tmdb_id>/", views.movie_detail, name="movie_detail"),
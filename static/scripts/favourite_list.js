@@ -154,6 +154,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     initializeTierListDragAndDrop(); // <--- ВАЖНО
                 }
                 updateSortUI(activeSortKeyForUI); // Update arrows after new content is rendered
+                observeScrollSentinel(); // Новая первая страница - новый курсор
             } else {
                 libraryContentArea.innerHTML = "<p class='error-message'>Error: No items HTML received.</p>";
             }
@@ -509,9 +510,90 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }   
 
+    //--------------------------------------------------------------------------
+    // SECTION: Infinite Scroll (keyset pages)
+    //--------------------------------------------------------------------------
+    let isLoadingNextPage = false;
+    const scrollObserver = ('IntersectionObserver' in window) ? new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) loadNextPage(entry.target);
+        });
+    }, { rootMargin: '600px 0px' }) : null;
+
+    function observeScrollSentinel() {
+        if (!scrollObserver || !libraryContentArea) return;
+        scrollObserver.disconnect();
+        const sentinel = libraryContentArea.querySelector('.library-scroll-sentinel');
+        if (sentinel) scrollObserver.observe(sentinel);
+    }
+
+    // Элементы следующей страницы дописываются в уже существующие секции (по data-section-key),
+    // новые секции вставляются на своё место по data-section-order
+    function mergeLibrarySections(fragment) {
+        const container = libraryContentArea.querySelector('.grid-view-sections-container, .list-view-container');
+        if (!container) return;
+
+        fragment.querySelectorAll('[data-section-key]').forEach(newSection => {
+            const key = newSection.dataset.sectionKey;
+            const existingSection = container.querySelector(`[data-section-key="${key}"]`);
+            if (existingSection) {
+                const target = existingSection.querySelector('tbody') || existingSection.querySelector(`#section-content-${key}`);
+                const source = newSection.querySelector('tbody') || newSection.querySelector(`#section-content-${key}`);
+                if (target && source) {
+                    while (source.firstElementChild) target.appendChild(source.firstElementChild);
+                    target.querySelectorAll('.item-number').forEach((cell, index) => { cell.textContent = index + 1; });
+                }
+                return;
+            }
+            const order = parseInt(newSection.dataset.sectionOrder, 10);
+            const nextSection = Array.from(container.querySelectorAll('[data-section-key]'))
+                .find(section => parseInt(section.dataset.sectionOrder, 10) > order);
+            container.insertBefore(newSection, nextSection || null);
+        });
+    }
+
+    function loadNextPage(sentinel) {
+        if (isLoadingNextPage || !sentinel.dataset.nextCursor) return;
+        isLoadingNextPage = true;
+
+        const pageUrl = `${window.location.pathname.replace(/\/?$/, '/')}page/`;
+        const queryParams = new URLSearchParams({
+            status_filter: currentFilter,
+            sort_by: currentSortParam,
+            view_mode: currentView,
+            cursor: sentinel.dataset.nextCursor
+        });
+
+        fetch(`${pageUrl}?${queryParams.toString()}`, {
+            method: 'GET',
+            headers: { 'X-Requested-With': 'XMLHttpRequest' }
+        })
+        .then(response => {
+            if (!response.ok) throw new Error(`HTTP error! status: ${response.status} ${response.statusText}`);
+            return response.json();
+        })
+        .then(data => {
+            const pageTemplate = document.createElement('template');
+            pageTemplate.innerHTML = data.html_items || '';
+            mergeLibrarySections(pageTemplate.content);
+
+            sentinel.remove();
+            const nextSentinel = pageTemplate.content.querySelector('.library-scroll-sentinel');
+            if (nextSentinel) libraryContentArea.appendChild(nextSentinel);
+            observeScrollSentinel();
+        })
+        .catch(error => {
+            console.error('Error loading next page:', error);
+        })
+        .finally(() => {
+            isLoadingNextPage = false;
+        });
+    }
+
     //--------------------------------------------------------------------------
     // SECTION: Initial Call (if any needed beyond Django render)
     //--------------------------------------------------------------------------
     initializeState();
+    observeScrollSentinel();
     console.log('Initial state:', { currentView, currentFilter, currentSortParam, currentSortState });
 });
\ No newline at end of file
@@ -29,19 +29,22 @@ document.addEventListener("DOMContentLoaded", function () {
             pagination: false,
         });
 
-        const swiper3 = new Swiper(".top-rated-swiper", {
-            loop: true,
-            speed: 800,
-            slidesPerView: 6,
-            slidesPerGroup: 6,
-            spaceBetween: 20,
-            grabCursor: true,
-            loopAdditionalSlides: 6,
-            navigation: {
-                nextEl: ".top-rated-container .swiper-button-next",
-                prevEl: ".top-rated-container .swiper-button-prev",
-            },
-            pagination: false,
+        // Top Rated и For You - одинаковые полки, у каждой свои кнопки навигации
+        document.querySelectorAll(".top-rated-container").forEach((container) => {
+            new Swiper(container.querySelector(".top-rated-swiper"), {
+                loop: true,
+                speed: 800,
+                slidesPerView: 6,
+                slidesPerGroup: 6,
+                spaceBetween: 20,
+                grabCursor: true,
+                loopAdditionalSlides: 6,
+                navigation: {
+                    nextEl: container.querySelector(".swiper-button-next"),
+                    prevEl: container.querySelector(".swiper-button-prev"),
+                },
+                pagination: false,
+            });
         });
 
         const swiper4 = new Swiper(".upcoming-games-swiper", {
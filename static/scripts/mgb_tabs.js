@@ -86,8 +86,8 @@ document.addEventListener("DOMContentLoaded", function () {
             .then(response => response.json())
             .then(data => {
                 if (data.success) {
-                    // Добавляем новый комментарий в DOM
-                    addCommentToDOM(data.comment); // Передаем новый комментарий в функцию
+                    // Добавляем новый комментарий в DOM - карточку сервер присылает готовой
+                    addCommentToDOM(data.html);
                     // Сбрасываем поля ввода
                     document.getElementById("comment-title").value = "";
                     document.getElementById("comment-text").value = "";
@@ -101,55 +101,112 @@ document.addEventListener("DOMContentLoaded", function () {
         });
     }
 
-    function addCommentToDOM(comment) {
+    function addCommentToDOM(commentHtml) {
         const commentsList = document.getElementById("commentsList");
-        const commentDiv = document.createElement("div");
-        commentDiv.className = "comment";
-        commentDiv.id = `comment-${comment.id}`;
-        
-        const likeIcon = comment.liked ? "/static/imgs/icons/red_like_comment.svg" : "/static/imgs/icons/like_comment.svg"; // Устанавливаем иконку в зависимости от состояния лайка
-    
-        commentDiv.innerHTML = `
-            <img src="${comment.user.avatar}" alt="avatar">
-            <div class="comment-content">
-                <div class="comment-info">
-                    <div class="comment-meta">
-                        <div class="username-date">
-                            <h2>${comment.user.username}</h2>
-                            <span class="comment-date">${comment.created_at}</span>
-                        </div>
-                        <h3>${comment.title}</h3>
-                    </div>
-                    <span class="user-rating">
-                        <img src="/static/imgs/icons/btn-star-small.svg" alt="Star btn">
-                        10
-                    </span>
-                </div>
-                <span class="comment-text">${comment.content}</span>
-                <div class="reactions-to-comment">
-                    <div class="likes">
-                        <button class="like-btn" data-id="${comment.id}">
-                            <img src="${likeIcon}" alt="Like Button">
-                        </button>
-                        <span class="like-count">${comment.like_count}</span> <!-- Элемент для количества лайков -->
-                    </div>
-                    <button class="reply-comment">
-                        <img src="/static/imgs/icons/reply.svg" alt="Reply btn">
-                        Reply
-                    </button>
-                </div>
-                <button class="show-replies">0 replies</button>
-                <div class="reply-form" style="display: none;">
-                    <input type="text" class="reply-title" placeholder="Title" required>
-                    <textarea class="reply-text" placeholder="Text" required></textarea>
-                    <button class="publish-reply">Publish</button>
-                </div>
-            </div>
-        `;
-        
-        commentsList.prepend(commentDiv);
+        const emptyMessage = commentsList.querySelector(":scope > p");
+        if (emptyMessage) {
+            emptyMessage.remove();
+        }
+        commentsList.insertAdjacentHTML("afterbegin", commentHtml);
+    }
+
+    // Следующая страница отзывов или ответов: курсор приходит в ответе вместе с готовым HTML
+    function loadCommentPage(url, cursor) {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+        return fetch(url + query, { headers: { "X-Requested-With": "XMLHttpRequest" } })
+            .then(response => response.json());
     }
 
+    document.addEventListener("click", function (event) {
+        // "Show more reviews" под лентой
+        const moreButton = event.target.closest(".load-more-comments");
+        if (moreButton) {
+            moreButton.disabled = true;
+            loadCommentPage(moreButton.dataset.url, moreButton.dataset.cursor)
+                .then(data => {
+                    document.getElementById("commentsList").insertAdjacentHTML("beforeend", data.html);
+                    if (data.next_cursor) {
+                        moreButton.dataset.cursor = data.next_cursor;
+                        moreButton.disabled = false;
+                    } else {
+                        moreButton.remove();
+                    }
+                })
+                .catch(error => {
+                    console.error("Ошибка:", error);
+                    moreButton.disabled = false;
+                });
+            return;
+        }
+
+        // Ответы грузятся при первом раскрытии ветки, дальше кнопка их прячет и показывает
+        const repliesButton = event.target.closest(".show-replies");
+        if (repliesButton) {
+            const repliesList = repliesButton.nextElementSibling;
+            if (repliesButton.dataset.loaded && !repliesButton.dataset.cursor) {
+                repliesList.style.display = repliesList.style.display === "none" ? "" : "none";
+                return;
+            }
+            loadCommentPage(repliesButton.dataset.url, repliesButton.dataset.cursor)
+                .then(data => {
+                    repliesList.insertAdjacentHTML("beforeend", data.html);
+                    repliesList.style.display = "";
+                    repliesButton.dataset.loaded = "1";
+                    repliesButton.dataset.cursor = data.next_cursor || "";
+                    if (data.next_cursor) {
+                        repliesButton.innerText = "Show more replies";
+                    }
+                })
+                .catch(error => {
+                    console.error("Ошибка:", error);
+                });
+            return;
+        }
+
+        const replyButton = event.target.closest(".reply-comment");
+        if (replyButton) {
+            const replyForm = replyButton.closest(".comment-content").querySelector(".reply-form");
+            replyForm.style.display = replyForm.style.display === "none" ? "" : "none";
+            return;
+        }
+
+        const publishReplyButton = event.target.closest(".publish-reply");
+        if (publishReplyButton) {
+            const replyForm = publishReplyButton.closest(".reply-form");
+            const title = replyForm.querySelector(".reply-title").value;
+            const content = replyForm.querySelector(".reply-text").value;
+            if (!title || !content) {
+                alert("Заполните все поля!");
+                return;
+            }
+
+            fetch(publishReplyButton.dataset.url, {
+                method: "POST",
+                headers: {
+                    "X-CSRFToken": getCookie("csrftoken"),
+                    "Content-Type": "application/json",
+                },
+                body: JSON.stringify({ title: title, content: content }),
+            })
+            .then(response => response.json())
+            .then(data => {
+                if (data.success) {
+                    const repliesList = replyForm.parentElement.querySelector(".replies-list");
+                    repliesList.insertAdjacentHTML("beforeend", data.html);
+                    repliesList.style.display = "";
+                    replyForm.querySelector(".reply-title").value = "";
+                    replyForm.querySelector(".reply-text").value = "";
+                    replyForm.style.display = "none";
+                } else {
+                    alert("Ошибка: " + data.error);
+                }
+            })
+            .catch(error => {
+                console.error("Ошибка:", error);
+            });
+        }
+    });
+
     // Обработка нажатия на кнопку "Like"
     document.addEventListener("click", function (event) {
         if (event.target.closest(".like-btn")) { // Используем closest для обработки клика на изображении
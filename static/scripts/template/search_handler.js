@@ -37,8 +37,14 @@ document.addEventListener("DOMContentLoaded", function () {
         showSearchResults(); 
 
         try {
-            const response = await fetch(`/search/?q=${encodeURIComponent(query)}&category=${currentCategory}`);
-            const data = await response.json();
+            const params = `q=${encodeURIComponent(query)}&category=${currentCategory}`;
+            // Сначала быстрые подсказки по префиксу; если пусто - полный поиск (опечатки, жанры, авторы)
+            let response = await fetch(`/search/autocomplete/?${params}`);
+            let data = await response.json();
+            if (!data.games.length && !data.movies.length && !data.books.length) {
+                response = await fetch(`/search/?${params}`);
+                data = await response.json();
+            }
 
             resultsDisplayContainer.innerHTML = '';
             let contentRendered = false;
@@ -0,0 +1,234 @@
+# users/activity.py
+from itertools import islice
+
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.urls import reverse
+from django.utils import timezone
+
+from .library_state import LIBRARY_STATE_CONFIG
+from .models import ActivityEvent, ActivityDailyCount, Comment
+
+HISTORY_PAGE_SIZE = 20
+HISTORY_CURSOR_SALT = 'activity-history'
+
+# Что считается в тепловой карте (как и раньше: оценки, избранное, отзывы; статусы - только в истории)
+HEATMAP_EVENT_TYPES = {ActivityEvent.EVENT_RATED, ActivityEvent.EVENT_FAVORITED, ActivityEvent.EVENT_COMMENTED}
+
+STATUS_VERBS = {
+    ('game', 'played'): 'Finished playing',
+    ('game', 'playing'): 'Started playing',
+    ('game', 'dropped'): 'Dropped playing',
+    ('movie', 'watched'): 'Finished watching',
+    ('movie', 'watching'): 'Started watching',
+    ('movie', 'dropped'): 'Dropped watching',
+    ('book', 'read'): 'Finished reading',
+    ('book', 'reading'): 'Started reading',
+    ('book', 'dropped'): 'Dropped reading',
+}
+
+# Как показывать элемент в истории: (поле названия, поле картинки, имя url, поле для url)
+HISTORY_ITEM_DISPLAY = {
+    'game': ('name', 'cover_url', 'game_detail', 'id'),
+    'movie': ('title', 'poster_path', 'movie_detail', 'tmdb_id'),
+    'book': ('title', 'thumbnail', 'book_detail', 'google_id'),
+}
+
+
+def _build_activity_sources():
+    """Модель-источник -> (тип события, тип контента, слаг статуса, поле времени)."""
+    sources = {}
+    for content_type, config in LIBRARY_STATE_CONFIG.items():
+        sources[config['favorite_model']] = (ActivityEvent.EVENT_FAVORITED, content_type, None, 'added_at')
+        sources[config['rating_model']] = (ActivityEvent.EVENT_RATED, content_type, None, 'updated_at')
+        for slug, StatusModel in config['statuses']:
+            sources[StatusModel] = (ActivityEvent.EVENT_STATUS, content_type, slug, 'added_at')
+    return sources
+
+
+ACTIVITY_SOURCES = _build_activity_sources()
+
+
+def _comment_content_type(comment):
+    for content_type in LIBRARY_STATE_CONFIG:
+        if getattr(comment, f'{content_type}_id', None):
+            return content_type
+    return None
+
+
+def _event_verb(event_type, content_type, status_slug, rating=None, comment_title=None):
+    if event_type == ActivityEvent.EVENT_RATED:
+        return f'Rated {rating}'
+    if event_type == ActivityEvent.EVENT_FAVORITED:
+        return 'Added to favorites'
+    if event_type == ActivityEvent.EVENT_STATUS:
+        return STATUS_VERBS[(content_type, status_slug)]
+    return f'Commented on "{comment_title}"'[:150]
+
+
+# ЗАПИСЬ
+# ---------------------------------------------------------------------------------
+def bump_activity_day(user_id, day, delta=1):
+    """Сдвигает дневной счётчик одним UPDATE; строка дня создаётся при первом событии."""
+    updated = ActivityDailyCount.objects.filter(user_id=user_id, day=day).update(count=F('count') + delta)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            ActivityDailyCount.objects.create(user_id=user_id, day=day, count=delta)
+    except IntegrityError:
+        # Строку дня успел создать параллельный запрос
+        ActivityDailyCount.objects.filter(user_id=user_id, day=day).update(count=F('count') + delta)
+
+
+def record_activity_event(sender, instance, created):
+    """
+    Пишет событие для сохранённого избранного/статуса/оценки/отзыва.
+    Повторное сохранение без изменений не пишется; для оценки событие - только если она изменилась.
+    """
+    if sender is Comment:
+        if not created:
+            return None
+        event_type, content_type, status_slug, time_field = ActivityEvent.EVENT_COMMENTED, _comment_content_type(instance), None, 'created_at'
+    else:
+        event_type, content_type, status_slug, time_field = ACTIVITY_SOURCES[sender]
+        if event_type == ActivityEvent.EVENT_RATED:
+            previous = getattr(instance, '_previous_rating', None)
+            if not created and previous is not None and previous == instance.rating:
+                return None
+        elif not created:
+            return None
+
+    if content_type is None:
+        return None
+    item_key = f'{content_type}_id'
+    item_id = getattr(instance, item_key, None)
+    if item_id is None:
+        return None
+
+    created_at = getattr(instance, time_field, None) or timezone.now()
+    event = ActivityEvent.objects.create(
+        user_id=instance.user_id,
+        event_type=event_type,
+        content_type=content_type,
+        verb=_event_verb(
+            event_type, content_type, status_slug,
+            rating=getattr(instance, 'rating', None), comment_title=getattr(instance, 'title', None),
+        ),
+        created_at=created_at,
+        **{item_key: item_id},
+    )
+    if event_type in HEATMAP_EVENT_TYPES:
+        bump_activity_day(instance.user_id, timezone.localtime(created_at).date())
+    return event
+
+
+# ЧТЕНИЕ
+# ---------------------------------------------------------------------------------
+def get_activity_heatmap(user, year):
+    """{ 'YYYY-MM-DD': count, ... } за год - один запрос к дневным счётчикам."""
+    days = ActivityDailyCount.objects.filter(user=user, day__year=year).values_list('day', 'count')
+    return {day.isoformat(): count for day, count in days}
+
+
+def _history_entry(event):
+    item = getattr(event, event.content_type)
+    title_attr, image_attr, url_name, url_attr = HISTORY_ITEM_DISPLAY[event.content_type]
+    return {
+        'timestamp': event.created_at,
+        'type': event.event_type,
+        'verb': event.verb,
+        'content_object': item,
+        'content_type_str': event.content_type,
+        'title': getattr(item, title_attr),
+        'image_url': getattr(item, image_attr),
+        'detail_url': reverse(url_name, args=[getattr(item, url_attr)]) if getattr(item, url_attr) else '#',
+    }
+
+
+def get_activity_history_page(user, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    Страница истории из журнала: keyset по (created_at, id) в обратном порядке.
+    Возвращает (записи для шаблона, курсор следующей страницы или None).
+    """
+    events = ActivityEvent.objects.filter(user=user).select_related('game', 'movie', 'book').order_by('-created_at', '-id')
+
+    if cursor:
+        try:
+            created_at, event_id = signing.loads(cursor, salt=HISTORY_CURSOR_SALT)
+        except (signing.BadSignature, ValueError, TypeError):
+            created_at = None
+        if created_at is not None:
+            events = events.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=event_id))
+
+    page = list(events[:page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = signing.dumps([page[-1].created_at.isoformat(), page[-1].id], salt=HISTORY_CURSOR_SALT)
+    return [_history_entry(event) for event in page], next_cursor
+
+
+def get_latest_activity(user):
+    """Последнее действие пользователя для карточки профиля или None."""
+    event = ActivityEvent.objects.filter(user=user).select_related('game', 'movie', 'book').order_by('-created_at').first()
+    return _history_entry(event) if event else None
+
+
+# ПЕРЕСБОРКА
+# ---------------------------------------------------------------------------------
+def _source_events(batch_size):
+    """События журнала по текущим оценкам, избранному, статусам и отзывам - потоком, без списка в памяти."""
+    for SourceModel, (event_type, content_type, status_slug, time_field) in ACTIVITY_SOURCES.items():
+        item_key = f'{content_type}_id'
+        fields = ['user_id', item_key, time_field] + (['rating'] if event_type == ActivityEvent.EVENT_RATED else [])
+        for row in SourceModel.objects.exclude(**{item_key: None}).values(*fields).iterator(chunk_size=batch_size):
+            yield ActivityEvent(
+                user_id=row['user_id'], event_type=event_type, content_type=content_type,
+                verb=_event_verb(event_type, content_type, status_slug, rating=row.get('rating')),
+                created_at=row[time_field], **{item_key: row[item_key]},
+            )
+
+    for row in Comment.objects.values('user_id', 'game_id', 'movie_id', 'book_id', 'title', 'created_at').iterator(chunk_size=batch_size):
+        content_type = next((ct for ct in LIBRARY_STATE_CONFIG if row[f'{ct}_id']), None)
+        if content_type is None:
+            continue
+        yield ActivityEvent(
+            user_id=row['user_id'], event_type=ActivityEvent.EVENT_COMMENTED, content_type=content_type,
+            verb=_event_verb(ActivityEvent.EVENT_COMMENTED, content_type, None, comment_title=row['title']),
+            created_at=row['created_at'], **{f'{content_type}_id': row[f'{content_type}_id']},
+        )
+
+
+def _bulk_create_stream(model, objects, batch_size):
+    """bulk_create пачками по batch_size из итератора: в памяти не больше одной пачки. Возвращает число строк."""
+    objects = iter(objects)
+    written = 0
+    while batch := list(islice(objects, batch_size)):
+        model.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def rebuild_activity_log(batch_size=2000):
+    """
+    Заполняет журнал и дневные счётчики заново по текущим оценкам, избранному, статусам и отзывам
+    (команда rebuild_activity_log). Источники читаются потоком и пишутся пачками по batch_size,
+    поэтому память не растёт с размером таблиц. Возвращает количество событий.
+    """
+    with transaction.atomic():
+        ActivityEvent.objects.all().delete()
+        ActivityDailyCount.objects.all().delete()
+        written = _bulk_create_stream(ActivityEvent, _source_events(batch_size), batch_size)
+
+        days = ActivityEvent.objects.filter(event_type__in=HEATMAP_EVENT_TYPES).annotate(
+            day=TruncDate('created_at')
+        ).values('user_id', 'day').annotate(total=Count('id')).order_by()
+        _bulk_create_stream(
+            ActivityDailyCount,
+            (ActivityDailyCount(user_id=row['user_id'], day=row['day'], count=row['total']) for row in days.iterator(chunk_size=batch_size)),
+            batch_size,
+        )
+    return written
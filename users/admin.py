@@ -1,6 +1,7 @@
 from django.contrib import admin
 from users.models import (
-    User, Game, FavoriteGame, PlayedGame, PlayingGame, DroppedGame, Comment, Movie, Genre, Actor, Book
+    User, Game, FavoriteGame, PlayedGame, PlayingGame, DroppedGame, Comment, Movie, Genre, Actor, Book,
+    IngestionRun,
 )
 
 
@@ -114,3 +115,14 @@ class BookAdmin(admin.ModelAdmin):
     list_filter = ('published_date', 'average_rating', 'categories')
     search_fields = ('title', 'google_id')
     readonly_fields = ('google_id',)
+
+
+# INGESTION
+# --------------------------------------------------------------
+
+
+@admin.register(IngestionRun)
+class IngestionRunAdmin(admin.ModelAdmin):
+    list_display = ('source', 'status', 'items_saved', 'started_at', 'finished_at')
+    list_filter = ('source', 'status')
+    readonly_fields = ('completed_pages', 'started_at', 'updated_at', 'finished_at')
@@ -0,0 +1,149 @@
+# users/comments.py
+from django.core import signing
+from django.db import transaction
+from django.db.models import BooleanField, Count, Exists, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_datetime
+
+from .models import Comment
+
+COMMENTS_PAGE_SIZE = 20
+REPLIES_PAGE_SIZE = 20
+COMMENT_CURSOR_SALT = 'comment-thread'
+
+# Типы контента, к которым пишутся отзывы: имя FK в Comment
+COMMENT_CONTENT_TYPES = ('game', 'movie', 'book')
+
+CommentLike = Comment.likes.through
+
+
+def liked_by_user_expression(user):
+    """Лайкнул ли user комментарий - EXISTS по уникальному индексу (comment_id, user_id) таблицы лайков."""
+    if user and user.is_authenticated:
+        return Exists(CommentLike.objects.filter(comment_id=OuterRef('pk'), user_id=user.pk))
+    return Value(False, output_field=BooleanField())
+
+
+def comment_queryset(user):
+    """Комментарии с автором (select_related) и признаком liked_by_user вместо загрузки всех лайков в Python."""
+    return Comment.objects.select_related('user').annotate(liked_by_user=liked_by_user_expression(user))
+
+
+# ПОСТРАНИЧНАЯ ВЫДАЧА (keyset)
+# ---------------------------------------------------------------------------------
+def encode_comment_cursor(scope, comment):
+    """Курсор - подписанная позиция последнего комментария страницы: (created_at, pk) в пределах scope."""
+    return signing.dumps([scope, comment.created_at.isoformat(), comment.pk], salt=COMMENT_CURSOR_SALT, compress=True)
+
+
+def decode_comment_cursor(cursor, scope):
+    """(created_at, pk) или None, если курсор битый или выдан для другой ленты."""
+    try:
+        cursor_scope, created_at, pk = signing.loads(cursor, salt=COMMENT_CURSOR_SALT)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    created_at = parse_datetime(created_at) if isinstance(created_at, str) else None
+    if cursor_scope != scope or created_at is None:
+        return None
+    return created_at, pk
+
+
+def paginate_comments(queryset, scope, descending, cursor=None, page_size=COMMENTS_PAGE_SIZE):
+    """
+    Keyset-пагинация по (created_at, id): следующая страница - фильтр "строго после курсора"
+    и короткий проход по индексу, без OFFSET. Возвращает (список комментариев, курсор или None).
+    """
+    if descending:
+        queryset = queryset.order_by('-created_at', '-id')
+    else:
+        queryset = queryset.order_by('created_at', 'id')
+
+    position = decode_comment_cursor(cursor, scope) if cursor else None
+    if position is not None:
+        created_at, pk = position
+        after = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'created_at__{after}': created_at}) | Q(created_at=created_at, **{f'id__{after}': pk})
+        )
+
+    comments = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(comments) > page_size:
+        comments = comments[:page_size]
+        next_cursor = encode_comment_cursor(scope, comments[-1])
+    return comments, next_cursor
+
+
+def get_comment_thread(content_type, item_pk, user, cursor=None, page_size=COMMENTS_PAGE_SIZE):
+    """Отзывы верхнего уровня к элементу, новые первыми (частичный индекс comment_<тип>_thread)."""
+    queryset = comment_queryset(user).filter(**{f'{content_type}_id': item_pk, 'parent__isnull': True})
+    return paginate_comments(queryset, f'{content_type}:{item_pk}', True, cursor, page_size)
+
+
+def get_comment_replies(comment_pk, user, cursor=None, page_size=REPLIES_PAGE_SIZE):
+    """Ответы на отзыв по порядку написания (индекс comment_replies); грузятся по требованию."""
+    queryset = comment_queryset(user).filter(parent_id=comment_pk)
+    return paginate_comments(queryset, f'replies:{comment_pk}', False, cursor, page_size)
+
+
+def count_thread_comments(content_type, item_pk):
+    """Число отзывов верхнего уровня - по тому же частичному индексу."""
+    return Comment.objects.filter(**{f'{content_type}_id': item_pk, 'parent__isnull': True}).count()
+
+
+def serialize_comment(comment):
+    return {
+        "id": comment.id,
+        "title": comment.title,
+        "content": comment.content,
+        "created_at": comment.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "user": {
+            "username": comment.user.username,
+            "avatar_url": comment.user.avatar.url if comment.user.avatar else None,
+        },
+        "like_count": comment.like_count,
+        "reply_count": comment.reply_count,
+        "liked": bool(getattr(comment, 'liked_by_user', False)),
+        "parent_id": comment.parent_id,
+    }
+
+
+# СЧЁТЧИКИ
+# ---------------------------------------------------------------------------------
+def toggle_comment_like(comment_pk, user):
+    """
+    Ставит или снимает лайк; like_count меняется атомарным UPDATE в той же транзакции.
+    Возвращает (liked, like_count).
+    """
+    with transaction.atomic():
+        removed, _ = CommentLike.objects.filter(comment_id=comment_pk, user_id=user.pk).delete()
+        if removed:
+            liked, delta = False, -1
+        else:
+            # get_or_create - при двойном клике второй запрос упрётся в уникальный индекс и не посчитает лайк дважды
+            _, created = CommentLike.objects.get_or_create(comment_id=comment_pk, user_id=user.pk)
+            liked, delta = True, 1 if created else 0
+        if delta:
+            Comment.objects.filter(pk=comment_pk).update(like_count=F('like_count') + delta)
+        like_count = Comment.objects.filter(pk=comment_pk).values_list('like_count', flat=True).first()
+    return liked, like_count or 0
+
+
+def apply_reply_count_delta(parent_pk, delta):
+    """reply_count родителя += delta одним UPDATE (из сигналов post_save / post_delete Comment)."""
+    Comment.objects.filter(pk=parent_pk).update(reply_count=F('reply_count') + delta)
+
+
+def comment_counter_expressions(comment_model=Comment, like_model=CommentLike):
+    """
+    Настоящие значения счётчиков подзапросами - для сверки (backfill comment_like_count /
+    comment_reply_count) и стенда. Миграция 0055 держит свою копию на исторических моделях.
+    """
+    def count_of(queryset, field):
+        counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(total=Count('*')).values('total')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+    return {
+        'like_count': count_of(like_model.objects.all(), 'comment_id'),
+        'reply_count': count_of(comment_model.objects.all(), 'parent_id'),
+    }
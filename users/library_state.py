@@ -0,0 +1,363 @@
+# users/library_state.py
+from itertools import islice
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core import signing
+from django.db import transaction
+from django.db.models import BooleanField, Count, ExpressionWrapper, F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import (
+    User, UserItemState,
+    Game, Movie, Book,
+    FavoriteGame, FavoriteMovie, FavoriteBook,
+    PlayedGame, PlayingGame, DroppedGame,
+    WatchedMovie, WatchingMovie, DroppedMovie,
+    ReadBook, ReadingBook, DroppedBook,
+    UserGameRating, UserMovieRating, UserBookRating,
+    UserRecommendationState,
+)
+
+# Имя атрибута, под которым состояние хранится на объекте request
+REQUEST_ATTR = '_user_library_state'
+
+LIBRARY_PAGE_SIZE = 48              # элементов на страницу списка библиотеки
+LIBRARY_CURSOR_SALT = 'library-cursor'
+
+# Конфигурация по типам контента.
+# Порядок статусов важен: первый найденный статус считается текущим (как в *_actions тегах).
+LIBRARY_STATE_CONFIG = {
+    'game': {
+        'content_model': Game,
+        'field': 'game',
+        'favorite_model': FavoriteGame,
+        'rating_model': UserGameRating,
+        'statuses': [('played', PlayedGame), ('playing', PlayingGame), ('dropped', DroppedGame)],
+    },
+    'movie': {
+        'content_model': Movie,
+        'field': 'movie',
+        'favorite_model': FavoriteMovie,
+        'rating_model': UserMovieRating,
+        'statuses': [('watched', WatchedMovie), ('watching', WatchingMovie), ('dropped', DroppedMovie)],
+    },
+    'book': {
+        'content_model': Book,
+        'field': 'book',
+        'favorite_model': FavoriteBook,
+        'rating_model': UserBookRating,
+        'statuses': [('read', ReadBook), ('reading', ReadingBook), ('dropped', DroppedBook)],
+    },
+}
+
+
+class UserLibraryState:
+    """
+    Состояние библиотеки пользователя (избранное, статусы, оценки) для элементов страницы.
+    Живёт в рамках одного запроса: view вызывает preload() для всех карточек,
+    а теги game_actions / movie_actions / book_actions читают готовые данные через get().
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._states = {content_type: {} for content_type in LIBRARY_STATE_CONFIG}
+
+    def preload(self, content_type, *item_groups):
+        """
+        Загружает состояние для всех переданных элементов одним запросом к UserItemState.
+        item_groups - любые итерируемые (QuerySet, списки) с объектами Game/Movie/Book.
+        """
+        config = LIBRARY_STATE_CONFIG[content_type]
+        loaded = self._states[content_type]
+
+        pks = set()
+        for items in item_groups:
+            for item in items or []:
+                if isinstance(item, config['content_model']) and item.pk not in loaded:
+                    pks.add(item.pk)
+
+        if not pks or not (self.user and self.user.is_authenticated):
+            return
+
+        field = config['field']
+        rows = UserItemState.objects.filter(
+            user=self.user, **{f'{field}_id__in': pks}
+        ).values(f'{field}_id', 'is_favorite', 'rating', 'status')
+        found = {row[f'{field}_id']: row for row in rows}
+
+        for pk in pks:
+            row = found.get(pk, {'is_favorite': False, 'rating': None, 'status': ''})
+            loaded[pk] = {
+                'is_favorite': row['is_favorite'],
+                'rating': row['rating'],
+                'statuses': {slug: row['status'] == slug for slug, _ in config['statuses']},
+            }
+
+    def get(self, content_type, item):
+        """Возвращает состояние элемента или None, если он не был предзагружен."""
+        return self._states[content_type].get(getattr(item, 'pk', None))
+
+
+def get_user_library_state(request):
+    """Возвращает (создавая при необходимости) состояние библиотеки для текущего запроса."""
+    state = getattr(request, REQUEST_ATTR, None)
+    if state is None:
+        state = UserLibraryState(request.user)
+        setattr(request, REQUEST_ATTR, state)
+    return state
+
+
+def get_item_library_state(context, content_type, item):
+    """
+    Для template-тегов: ищет предзагруженное состояние элемента через request из контекста.
+    Возвращает None, если состояние не было предзагружено - тогда тег идёт по старому пути.
+    """
+    request = context.get('request')
+    state = getattr(request, REQUEST_ATTR, None) if request is not None else None
+    if state is None:
+        return None
+    return state.get(content_type, item)
+
+
+# СИНХРОНИЗАЦИЯ UserItemState
+# ---------------------------------------------------------------------------------
+# Модель-источник (избранное, статус, оценка) -> тип контента
+LIBRARY_STATE_SOURCES = {}
+for _content_type, _config in LIBRARY_STATE_CONFIG.items():
+    LIBRARY_STATE_SOURCES[_config['favorite_model']] = _content_type
+    LIBRARY_STATE_SOURCES[_config['rating_model']] = _content_type
+    for _slug, _StatusModel in _config['statuses']:
+        LIBRARY_STATE_SOURCES[_StatusModel] = _content_type
+
+
+def _pick_state(config, favorite_at, rating, status_dates):
+    """Собирает поля UserItemState из дат избранного/статусов и оценки."""
+    status = next((slug for slug, _ in config['statuses'] if status_dates.get(slug)), '')
+    dates = [date for date in [favorite_at, *status_dates.values()] if date]
+    return {
+        'is_favorite': favorite_at is not None,
+        'status': status,
+        'rating': rating,
+        'last_interaction_at': max(dates) if dates else None,
+    }
+
+
+def sync_user_item_state(content_type, user_id, item_id):
+    """
+    Пересчитывает строку UserItemState для одной пары (пользователь, элемент)
+    по моделям-источникам одним запросом. Пустое состояние удаляется.
+    """
+    config = LIBRARY_STATE_CONFIG[content_type]
+    field = config['field']
+    lookup = {'user_id': user_id, field: OuterRef('pk')}
+
+    annotations = {
+        'favorite_at': Subquery(config['favorite_model'].objects.filter(**lookup).values('added_at')[:1]),
+        'user_rating': Subquery(config['rating_model'].objects.filter(**lookup).values('rating')[:1]),
+    }
+    for slug, StatusModel in config['statuses']:
+        annotations[f'{slug}_at'] = Subquery(StatusModel.objects.filter(**lookup).values('added_at')[:1])
+
+    row = config['content_model'].objects.filter(pk=item_id).annotate(**annotations).values(*annotations).first()
+    key = {'user_id': user_id, f'{field}_id': item_id}
+    if row is None:
+        UserItemState.objects.filter(**key).delete()
+        return None
+
+    state = _pick_state(
+        config, row['favorite_at'], row['user_rating'],
+        {slug: row[f'{slug}_at'] for slug, _ in config['statuses']},
+    )
+    if not state['last_interaction_at'] and state['rating'] is None:
+        UserItemState.objects.filter(**key).delete()
+        return None
+
+    obj, _ = UserItemState.objects.update_or_create(**key, defaults={'content_type': content_type, **state})
+    return obj
+
+
+def mark_recommendations_stale(content_type, user_id):
+    """
+    Отмечает, что у пользователя изменилась библиотека этого типа контента:
+    build_recommendations --changed пересчитает ему рекомендации. Один INSERT ... ON CONFLICT.
+    """
+    UserRecommendationState.objects.bulk_create(
+        [UserRecommendationState(user_id=user_id, content_type=content_type, changed_at=timezone.now())],
+        update_conflicts=True,
+        unique_fields=['user', 'content_type'],
+        update_fields=['changed_at'],
+    )
+
+
+def _collect_user_item_states(content_type, first_user_id, last_user_id):
+    """Состояния UserItemState пользователей с id в [first_user_id, last_user_id] по моделям-источникам."""
+    config = LIBRARY_STATE_CONFIG[content_type]
+    item_key = f"{config['field']}_id"
+    users = {'user_id__gte': first_user_id, 'user_id__lte': last_user_id}
+    collected = {}
+
+    def entry(user_id, item_id):
+        return collected.setdefault((user_id, item_id), {'favorite_at': None, 'rating': None, 'statuses': {}})
+
+    favorite_rows = config['favorite_model'].objects.filter(**users).exclude(**{item_key: None})
+    for user_id, item_id, added_at in favorite_rows.values_list('user_id', item_key, 'added_at'):
+        entry(user_id, item_id)['favorite_at'] = added_at
+    for user_id, item_id, rating in config['rating_model'].objects.filter(**users).values_list('user_id', item_key, 'rating'):
+        entry(user_id, item_id)['rating'] = rating
+    for slug, StatusModel in config['statuses']:
+        status_rows = StatusModel.objects.filter(**users).exclude(**{item_key: None})
+        for user_id, item_id, added_at in status_rows.values_list('user_id', item_key, 'added_at'):
+            entry(user_id, item_id)['statuses'][slug] = added_at
+
+    return [
+        UserItemState(
+            user_id=user_id, content_type=content_type, **{item_key: item_id},
+            **_pick_state(config, data['favorite_at'], data['rating'], data['statuses']),
+        )
+        for (user_id, item_id), data in collected.items()
+    ]
+
+
+def rebuild_user_item_states(content_type, batch_size=2000, users_per_chunk=500):
+    """
+    Полностью пересобирает UserItemState для типа контента по моделям-источникам.
+    Используется для сверки (команда rebuild_user_item_states). Пользователи обрабатываются
+    диапазонами id по users_per_chunk: в памяти только состояния одного диапазона.
+    Возвращает количество строк.
+    """
+    user_ids = User.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=users_per_chunk)
+    written = 0
+    with transaction.atomic():
+        UserItemState.objects.filter(content_type=content_type).delete()
+        while chunk := list(islice(user_ids, users_per_chunk)):
+            states = _collect_user_item_states(content_type, chunk[0], chunk[-1])
+            UserItemState.objects.bulk_create(states, batch_size=batch_size)
+            written += len(states)
+    return written
+
+
+# ЗАПРОСЫ БИБЛИОТЕКИ
+# ---------------------------------------------------------------------------------
+def get_library_queryset(user, content_type):
+    """
+    Элементы библиотеки пользователя (избранное или любой статус) одним JOIN с UserItemState
+    по индексу (user, content_type, last_interaction_at), с аннотациями для шаблонов:
+    latest_interaction_date, user_rating, is_favorite_for_user, is_<status>_for_user.
+    """
+    config = LIBRARY_STATE_CONFIG[content_type]
+    annotations = {
+        'latest_interaction_date': F('library_states__last_interaction_at'),
+        'user_rating': F('library_states__rating'),
+        'is_favorite_for_user': F('library_states__is_favorite'),
+    }
+    for slug, _ in config['statuses']:
+        annotations[f'is_{slug}_for_user'] = ExpressionWrapper(
+            Q(library_states__status=slug), output_field=BooleanField()
+        )
+
+    return config['content_model'].objects.filter(
+        library_states__user=user,
+        library_states__content_type=content_type,
+        library_states__last_interaction_at__isnull=False,
+    ).annotate(**annotations).order_by(F('latest_interaction_date').desc(nulls_last=True), '-pk')
+
+
+def get_library_counts(user, content_type):
+    """Счётчики для панели статистики библиотеки одним агрегатом: total, favorite и по каждому статусу."""
+    config = LIBRARY_STATE_CONFIG[content_type]
+    aggregates = {
+        'total': Count('pk'),
+        'favorite': Count('pk', filter=Q(is_favorite=True)),
+    }
+    for slug, _ in config['statuses']:
+        aggregates[slug] = Count('pk', filter=Q(status=slug))
+
+    return UserItemState.objects.filter(
+        user=user, content_type=content_type, last_interaction_at__isnull=False
+    ).aggregate(**aggregates)
+
+
+# ПОСТРАНИЧНАЯ ВЫДАЧА (keyset)
+# ---------------------------------------------------------------------------------
+def encode_library_cursor(sort_field, descending, value, pk):
+    """Курсор - подписанная позиция последнего элемента страницы: (значение сортировки, pk)."""
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return signing.dumps([sort_field, descending, value, pk], salt=LIBRARY_CURSOR_SALT, compress=True)
+
+
+def decode_library_cursor(cursor, sort_field, descending):
+    """Возвращает (значение, pk) или None, если курсор битый или выдан для другой сортировки."""
+    try:
+        cursor_field, cursor_descending, value, pk = signing.loads(cursor, salt=LIBRARY_CURSOR_SALT)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    if cursor_field != sort_field or cursor_descending != descending:
+        return None
+    return value, pk
+
+
+def order_library_queryset(queryset, sort_field, descending):
+    """Порядок (поле сортировки NULLS LAST, pk) - pk добавляется для однозначной позиции курсора."""
+    if descending:
+        return queryset.order_by(F(sort_field).desc(nulls_last=True), '-pk')
+    return queryset.order_by(F(sort_field).asc(nulls_last=True), 'pk')
+
+
+def paginate_library(queryset, sort_field, descending, cursor=None, page_size=LIBRARY_PAGE_SIZE):
+    """
+    Keyset-пагинация: вместо OFFSET фильтр "строго после позиции курсора",
+    поэтому каждая следующая страница - такой же короткий проход по индексу.
+    Возвращает (список элементов, курсор следующей страницы или None).
+    """
+    queryset = order_library_queryset(queryset, sort_field, descending)
+    position = decode_library_cursor(cursor, sort_field, descending) if cursor else None
+
+    if position is not None:
+        value, pk = position
+        after = 'lt' if descending else 'gt'
+        if value is None:
+            # Уже в хвосте из NULL - идём только по pk
+            queryset = queryset.filter(**{f'{sort_field}__isnull': True, f'pk__{after}': pk})
+        else:
+            queryset = queryset.filter(
+                Q(**{f'{sort_field}__{after}': value})
+                | Q(**{sort_field: value, f'pk__{after}': pk})
+                | Q(**{f'{sort_field}__isnull': True})
+            )
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_library_cursor(sort_field, descending, getattr(last, sort_field), last.pk)
+    return items, next_cursor
+
+
+def get_library_tiers(user, content_type):
+    """
+    Данные для тирлиста: один сгруппированный по оценке запрос к UserItemState
+    (id элементов каждой оценки в порядке последнего взаимодействия) и один запрос за объектами.
+    Возвращает ({1..10: [элементы]}, [элементы без оценки]).
+    """
+    item_key = f"{LIBRARY_STATE_CONFIG[content_type]['field']}_id"
+    groups = UserItemState.objects.filter(
+        user=user, content_type=content_type, last_interaction_at__isnull=False
+    ).values('rating').annotate(
+        item_ids=ArrayAgg(item_key, order_by=(F('last_interaction_at').desc(), F(item_key).desc()))
+    ).order_by()
+
+    groups = list(groups)
+    all_ids = [item_id for group in groups for item_id in group['item_ids']]
+    objects = get_library_queryset(user, content_type).in_bulk(all_ids) if all_ids else {}
+
+    rated_items_by_tier = {rating: [] for rating in range(1, 11)}
+    unrated_items = []
+    for group in groups:
+        items = [objects[item_id] for item_id in group['item_ids'] if item_id in objects]
+        if group['rating'] is not None and 1 <= group['rating'] <= 10:
+            rated_items_by_tier[group['rating']] = items
+        else:
+            unrated_items.extend(items)
+    return rated_items_by_tier, unrated_items
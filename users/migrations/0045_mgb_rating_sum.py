@@ -0,0 +1,61 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:42
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def fill_mgb_rating_sums(apps, schema_editor):
+    """
+    Заполняет новые счётчики по существующим оценкам (в том числе для фильмов, где рейтинг не считался).
+    Один UPDATE с подзапросами на тип контента; среднее округляется до одного знака через numeric(4, 1).
+    """
+    for content_name, rating_name, field in [
+        ('Game', 'UserGameRating', 'game'),
+        ('Movie', 'UserMovieRating', 'movie'),
+        ('Book', 'UserBookRating', 'book'),
+    ]:
+        content_model = apps.get_model('users', content_name)
+        rating_model = apps.get_model('users', rating_name)
+
+        stats = rating_model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+        rating_sum = Coalesce(
+            Subquery(stats.annotate(total=Sum('rating')).values('total'), output_field=IntegerField()), Value(0)
+        )
+        rating_count = Coalesce(
+            Subquery(stats.annotate(total=Count('pk')).values('total'), output_field=IntegerField()), Value(0)
+        )
+        content_model.objects.update(
+            mgb_rating_sum=rating_sum,
+            mgb_rating_count=rating_count,
+            mgb_average_rating=Cast(
+                Cast(rating_sum, FloatField()) / NullIf(rating_count, Value(0)),
+                DecimalField(max_digits=4, decimal_places=1),
+            ),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0044_search_vectors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='mgb_rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='mgb_rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='mgb_rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_mgb_rating_sums, migrations.RunPython.noop),
+    ]
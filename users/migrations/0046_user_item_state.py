@@ -0,0 +1,94 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:45
+
+from itertools import islice
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Источники библиотеки на момент миграции: тип -> (FK, избранное, оценки, статусы по приоритету)
+LIBRARY_SOURCES = {
+    'game': ('game', 'FavoriteGame', 'UserGameRating', [('played', 'PlayedGame'), ('playing', 'PlayingGame'), ('dropped', 'DroppedGame')]),
+    'movie': ('movie', 'FavoriteMovie', 'UserMovieRating', [('watched', 'WatchedMovie'), ('watching', 'WatchingMovie'), ('dropped', 'DroppedMovie')]),
+    'book': ('book', 'FavoriteBook', 'UserBookRating', [('read', 'ReadBook'), ('reading', 'ReadingBook'), ('dropped', 'DroppedBook')]),
+}
+
+USERS_PER_CHUNK = 500  # пользователей за проход: в памяти только их состояния
+
+
+def collect_states(apps, content_type, users):
+    """Состояния пользователей из диапазона users (фильтр по user_id) для одного типа контента."""
+    UserItemState = apps.get_model('users', 'UserItemState')
+    field, favorite_name, rating_name, statuses = LIBRARY_SOURCES[content_type]
+    item_key = f"{field}_id"
+    collected = {}
+
+    def entry(user_id, item_id):
+        return collected.setdefault((user_id, item_id), {'favorite_at': None, 'rating': None, 'statuses': {}})
+
+    favorite_rows = apps.get_model('users', favorite_name).objects.filter(**users).exclude(**{item_key: None})
+    for user_id, item_id, added_at in favorite_rows.values_list('user_id', item_key, 'added_at'):
+        entry(user_id, item_id)['favorite_at'] = added_at
+    for user_id, item_id, rating in apps.get_model('users', rating_name).objects.filter(**users).values_list('user_id', item_key, 'rating'):
+        entry(user_id, item_id)['rating'] = rating
+    for slug, status_name in statuses:
+        status_rows = apps.get_model('users', status_name).objects.filter(**users).exclude(**{item_key: None})
+        for user_id, item_id, added_at in status_rows.values_list('user_id', item_key, 'added_at'):
+            entry(user_id, item_id)['statuses'][slug] = added_at
+
+    states = []
+    for (user_id, item_id), data in collected.items():
+        dates = [date for date in [data['favorite_at'], *data['statuses'].values()] if date]
+        states.append(UserItemState(
+            user_id=user_id, content_type=content_type, **{item_key: item_id},
+            is_favorite=data['favorite_at'] is not None,
+            status=next((slug for slug, _ in statuses if data['statuses'].get(slug)), ''),
+            rating=data['rating'],
+            last_interaction_at=max(dates) if dates else None,
+        ))
+    return states
+
+
+def fill_user_item_states(apps, schema_editor):
+    """Переносит текущие избранное, статусы и оценки в сводную таблицу диапазонами пользователей."""
+    UserItemState = apps.get_model('users', 'UserItemState')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+
+    user_ids = User.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=USERS_PER_CHUNK)
+    while chunk := list(islice(user_ids, USERS_PER_CHUNK)):
+        users = {'user_id__gte': chunk[0], 'user_id__lte': chunk[-1]}
+        for content_type in LIBRARY_SOURCES:
+            UserItemState.objects.bulk_create(collect_states(apps, content_type, users), batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0045_mgb_rating_sum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserItemState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(choices=[('game', 'Игра'), ('movie', 'Фильм/Сериал'), ('book', 'Книга')], max_length=10)),
+                ('is_favorite', models.BooleanField(default=False)),
+                ('status', models.CharField(blank=True, default='', max_length=10)),
+                ('rating', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('last_interaction_at', models.DateTimeField(blank=True, null=True)),
+                ('book', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='library_states', to='users.book')),
+                ('game', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='library_states', to='users.game')),
+                ('movie', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='library_states', to='users.movie')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'User Item State',
+                'verbose_name_plural': 'User Item States',
+                'indexes': [models.Index(fields=['user', 'content_type', '-last_interaction_at'], name='user_item_state_library')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'game'), name='unique_user_game_state'), models.UniqueConstraint(fields=('user', 'movie'), name='unique_user_movie_state'), models.UniqueConstraint(fields=('user', 'book'), name='unique_user_book_state')],
+            },
+        ),
+        migrations.RunPython(fill_user_item_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:51
+
+from itertools import islice
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+# Источники журнала на момент миграции: (модель, тип события, тип контента, поле времени, подпись статуса)
+ACTIVITY_SOURCES = [
+    ('FavoriteGame', 'favorited', 'game', 'added_at', None),
+    ('UserGameRating', 'rated', 'game', 'updated_at', None),
+    ('PlayedGame', 'status_changed', 'game', 'added_at', 'Finished playing'),
+    ('PlayingGame', 'status_changed', 'game', 'added_at', 'Started playing'),
+    ('DroppedGame', 'status_changed', 'game', 'added_at', 'Dropped playing'),
+    ('FavoriteMovie', 'favorited', 'movie', 'added_at', None),
+    ('UserMovieRating', 'rated', 'movie', 'updated_at', None),
+    ('WatchedMovie', 'status_changed', 'movie', 'added_at', 'Finished watching'),
+    ('WatchingMovie', 'status_changed', 'movie', 'added_at', 'Started watching'),
+    ('DroppedMovie', 'status_changed', 'movie', 'added_at', 'Dropped watching'),
+    ('FavoriteBook', 'favorited', 'book', 'added_at', None),
+    ('UserBookRating', 'rated', 'book', 'updated_at', None),
+    ('ReadBook', 'status_changed', 'book', 'added_at', 'Finished reading'),
+    ('ReadingBook', 'status_changed', 'book', 'added_at', 'Started reading'),
+    ('DroppedBook', 'status_changed', 'book', 'added_at', 'Dropped reading'),
+]
+HEATMAP_EVENT_TYPES = ['rated', 'favorited', 'commented']
+
+
+BATCH_SIZE = 2000
+
+
+def bulk_create_stream(model, objects):
+    """bulk_create пачками из итератора: в памяти не больше одной пачки."""
+    objects = iter(objects)
+    while batch := list(islice(objects, BATCH_SIZE)):
+        model.objects.bulk_create(batch)
+
+
+def source_events(apps):
+    """События по существующим оценкам, избранному, статусам и отзывам - потоком."""
+    ActivityEvent = apps.get_model('users', 'ActivityEvent')
+
+    for model_name, event_type, content_type, time_field, status_verb in ACTIVITY_SOURCES:
+        item_key = f'{content_type}_id'
+        fields = ['user_id', item_key, time_field] + (['rating'] if event_type == 'rated' else [])
+        rows = apps.get_model('users', model_name).objects.exclude(**{item_key: None}).values(*fields)
+        for row in rows.iterator(chunk_size=BATCH_SIZE):
+            verb = {'rated': f"Rated {row.get('rating')}", 'favorited': 'Added to favorites'}.get(event_type, status_verb)
+            yield ActivityEvent(
+                user_id=row['user_id'], event_type=event_type, content_type=content_type, verb=verb,
+                created_at=row[time_field], **{item_key: row[item_key]},
+            )
+
+    comments = apps.get_model('users', 'Comment').objects.values('user_id', 'game_id', 'movie_id', 'book_id', 'title', 'created_at')
+    for row in comments.iterator(chunk_size=BATCH_SIZE):
+        content_type = next((ct for ct in ('game', 'movie', 'book') if row[f'{ct}_id']), None)
+        if content_type is None:
+            continue
+        yield ActivityEvent(
+            user_id=row['user_id'], event_type='commented', content_type=content_type,
+            verb=f'Commented on "{row["title"]}"'[:150],
+            created_at=row['created_at'], **{f'{content_type}_id': row[f'{content_type}_id']},
+        )
+
+
+def fill_activity_log(apps, schema_editor):
+    """Переносит существующие оценки, избранное, статусы и отзывы в журнал и дневные счётчики."""
+    ActivityEvent = apps.get_model('users', 'ActivityEvent')
+    ActivityDailyCount = apps.get_model('users', 'ActivityDailyCount')
+
+    bulk_create_stream(ActivityEvent, source_events(apps))
+    days = ActivityEvent.objects.filter(event_type__in=HEATMAP_EVENT_TYPES).annotate(
+        day=TruncDate('created_at')
+    ).values('user_id', 'day').annotate(total=Count('id')).order_by()
+    bulk_create_stream(ActivityDailyCount, (
+        ActivityDailyCount(user_id=row['user_id'], day=row['day'], count=row['total'])
+        for row in days.iterator(chunk_size=BATCH_SIZE)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0046_user_item_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityDailyCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_days', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Activity Daily Count',
+                'verbose_name_plural': 'Activity Daily Counts',
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='unique_user_activity_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('rated', 'Оценка'), ('favorited', 'Избранное'), ('status_changed', 'Статус'), ('commented', 'Отзыв')], max_length=20)),
+                ('content_type', models.CharField(choices=[('game', 'Игра'), ('movie', 'Фильм/Сериал'), ('book', 'Книга')], max_length=10)),
+                ('verb', models.CharField(max_length=150)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('book', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='activity_events', to='users.book')),
+                ('game', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='activity_events', to='users.game')),
+                ('movie', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='activity_events', to='users.movie')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Activity Event',
+                'verbose_name_plural': 'Activity Events',
+                'indexes': [models.Index(fields=['user', '-created_at', '-id'], name='activity_event_user_recent')],
+            },
+        ),
+        migrations.RunPython(fill_activity_log, migrations.RunPython.noop),
+    ]
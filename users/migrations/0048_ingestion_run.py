@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0047_activity_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('games', 'Игры (IGDB)'), ('movies', 'Фильмы (TMDb)'), ('books', 'Книги (Google Books)'), ('tv_shows', 'Сериалы (TMDb)')], max_length=20)),
+                ('status', models.CharField(choices=[('running', 'Выполняется'), ('completed', 'Завершён'), ('failed', 'Прерван')], default='running', max_length=20)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('completed_pages', models.JSONField(blank=True, default=list)),
+                ('items_saved', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Ingestion Run',
+                'verbose_name_plural': 'Ingestion Runs',
+                'indexes': [models.Index(fields=['source', '-started_at'], name='ingestion_run_source_recent')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0048_ingestion_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='ingestionrun',
+            name='source',
+            field=models.CharField(choices=[('games', 'Игры (IGDB)'), ('movies', 'Фильмы (TMDb)'), ('books', 'Книги (Google Books)'), ('tv_shows', 'Сериалы (TMDb)'), ('games_changes', 'Изменения игр (IGDB updated_at)'), ('movies_changes', 'Изменения фильмов (TMDb changes)'), ('tv_changes', 'Изменения сериалов (TMDb changes)')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0049_source_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='trailer_retry_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='trailer_retry_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0050_trailer_retry_after'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingestionrun',
+            name='source',
+            field=models.CharField(choices=[('games', 'Игры (IGDB)'), ('movies', 'Фильмы (TMDb)'), ('books', 'Книги (Google Books)'), ('tv_shows', 'Сериалы (TMDb)'), ('games_changes', 'Изменения игр (IGDB updated_at)'), ('movies_changes', 'Изменения фильмов (TMDb changes)'), ('tv_changes', 'Изменения сериалов (TMDb changes)'), ('backfill', 'Заполнение производных полей')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0051_ingestion_run_backfill'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='published_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='published_precision',
+            field=models.CharField(blank=True, choices=[('day', 'Дата'), ('month', 'Месяц'), ('year', 'Год')], default='', max_length=5),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='published_year',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['published_on'], name='book_published_on'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['published_year'], name='book_published_year'),
+        ),
+    ]
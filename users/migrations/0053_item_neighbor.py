@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0052_book_published_on'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(choices=[('game', 'Игра'), ('movie', 'Фильм/Сериал'), ('book', 'Книга')], max_length=10)),
+                ('item_id', models.PositiveIntegerField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('neighbor_id', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+            ],
+            options={
+                'verbose_name': 'Item Neighbor',
+                'verbose_name_plural': 'Item Neighbors',
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'item_id', 'rank'), name='unique_item_neighbor_rank')],
+            },
+        ),
+    ]
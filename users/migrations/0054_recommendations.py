@@ -0,0 +1,62 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0053_item_neighbor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommenderModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(choices=[('game', 'Игра'), ('movie', 'Фильм/Сериал'), ('book', 'Книга')], max_length=10, unique=True)),
+                ('factor_count', models.PositiveSmallIntegerField()),
+                ('item_ids', models.BinaryField()),
+                ('factors', models.BinaryField()),
+                ('users_count', models.PositiveIntegerField(default=0)),
+                ('built_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Recommender Model',
+                'verbose_name_plural': 'Recommender Models',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(choices=[('game', 'Игра'), ('movie', 'Фильм/Сериал'), ('book', 'Книга')], max_length=10)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('item_id', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'User Recommendation',
+                'verbose_name_plural': 'User Recommendations',
+                'constraints': [models.UniqueConstraint(fields=('user', 'content_type', 'rank'), name='unique_user_recommendation_rank')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserRecommendationState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(choices=[('game', 'Игра'), ('movie', 'Фильм/Сериал'), ('book', 'Книга')], max_length=10)),
+                ('changed_at', models.DateTimeField(blank=True, null=True)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'User Recommendation State',
+                'verbose_name_plural': 'User Recommendation States',
+                'constraints': [models.UniqueConstraint(fields=('user', 'content_type'), name='unique_user_recommendation_state')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:21
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_comment_counters(apps, schema_editor):
+    """Считает like_count / reply_count для уже написанных отзывов одним UPDATE."""
+    Comment = apps.get_model('users', 'Comment')
+
+    def count_of(queryset, field):
+        counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(total=Count('*')).values('total')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+    Comment.objects.update(
+        like_count=count_of(Comment.likes.through.objects.all(), 'comment_id'),
+        reply_count=count_of(Comment.objects.all(), 'parent_id'),
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0054_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['game', '-created_at', '-id'], name='comment_game_thread'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['movie', '-created_at', '-id'], name='comment_movie_thread'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['book', '-created_at', '-id'], name='comment_book_thread'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['parent', 'created_at', 'id'], name='comment_replies'),
+        ),
+        migrations.RunPython(fill_comment_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.1.6 on 2026-10-18 21:05
+
+import json
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+# Поле -> (базовое поле массива, ключ словаря IGDB или None для списка id)
+GAME_LIST_FIELDS = {
+    'genres': (lambda: models.CharField(max_length=100), 'name'),
+    'platforms': (lambda: models.CharField(max_length=100), 'name'),
+    'game_modes': (lambda: models.CharField(max_length=100), 'name'),
+    'similar_games': (lambda: models.IntegerField(), None),
+    'websites': (lambda: models.TextField(), 'url'),
+}
+
+
+def json_list(values):
+    """Старые записи хранили список JSON-строкой - она тоже разбирается; не список -> []."""
+    if isinstance(values, str):
+        try:
+            values = json.loads(values)
+        except ValueError:
+            return []
+    return values if isinstance(values, list) else []
+
+
+def igdb_names(values, key):
+    names = (value.get(key) if isinstance(value, dict) else value for value in json_list(values))
+    return [str(name) for name in names if name]
+
+
+def igdb_ids(values):
+    ids = (value.get('id') if isinstance(value, dict) else value for value in json_list(values))
+    return [int(game_id) for game_id in ids if isinstance(game_id, int) or (isinstance(game_id, str) and game_id.isdigit())]
+
+
+def copy_json_to_arrays(apps, schema_editor):
+    """JSON (списки строк, словари IGDB или JSON-строки) -> временные поля-массивы."""
+    Game = apps.get_model('users', 'Game')
+    array_fields = [f'{field}_array' for field in GAME_LIST_FIELDS]
+    changed = []
+    for game in Game.objects.only('pk', *GAME_LIST_FIELDS).iterator(chunk_size=2000):
+        for field, (_, key) in GAME_LIST_FIELDS.items():
+            value = getattr(game, field)
+            setattr(game, f'{field}_array', igdb_names(value, key) if key else igdb_ids(value))
+        changed.append(game)
+        if len(changed) >= 1000:
+            Game.objects.bulk_update(changed, array_fields)
+            changed = []
+    Game.objects.bulk_update(changed, array_fields)
+
+
+def copy_arrays_to_json(apps, schema_editor):
+    Game = apps.get_model('users', 'Game')
+    changed = []
+    for game in Game.objects.only('pk', *(f'{field}_array' for field in GAME_LIST_FIELDS)).iterator(chunk_size=2000):
+        for field in GAME_LIST_FIELDS:
+            setattr(game, field, getattr(game, f'{field}_array'))
+        changed.append(game)
+        if len(changed) >= 1000:
+            Game.objects.bulk_update(changed, list(GAME_LIST_FIELDS))
+            changed = []
+    Game.objects.bulk_update(changed, list(GAME_LIST_FIELDS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0055_comment_counters'),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name='game',
+                name=f'{field}_array',
+                field=django.contrib.postgres.fields.ArrayField(base_field=base_field(), blank=True, default=list, size=None),
+            )
+            for field, (base_field, _) in GAME_LIST_FIELDS.items()
+        ],
+        migrations.RunPython(copy_json_to_arrays, copy_arrays_to_json),
+        *[migrations.RemoveField(model_name='game', name=field) for field in GAME_LIST_FIELDS],
+        *[
+            migrations.RenameField(model_name='game', old_name=f'{field}_array', new_name=field)
+            for field in GAME_LIST_FIELDS
+        ],
+        migrations.AddIndex(
+            model_name='game',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['genres'], name='game_genres_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['platforms'], name='game_platforms_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['game_modes'], name='game_modes_gin'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:39
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0056_game_list_arrays'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogFacetIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(choices=[('game', 'Игра'), ('movie', 'Фильм/Сериал'), ('book', 'Книга')], max_length=10, unique=True)),
+                ('item_ids', models.BinaryField()),
+                ('facets', models.JSONField(default=list)),
+                ('bitmaps', models.BinaryField()),
+                ('built_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Catalog Facet Index',
+                'verbose_name_plural': 'Catalog Facet Indexes',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['categories'], name='book_categories_gin'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:42
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0057_catalog_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='platform_icons',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='short_summary',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='country_code',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='formatted_runtime',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='full_backdrop_path',
+            field=models.URLField(blank=True, editable=False, max_length=512, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='full_poster_path',
+            field=models.URLField(blank=True, editable=False, max_length=512, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='short_overview',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+    ]
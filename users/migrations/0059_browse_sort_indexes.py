@@ -0,0 +1,51 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:54
+
+import datetime
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0058_display_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce('ratings_count', models.Value(-1)), descending=True), models.OrderBy(models.F('id'), descending=True), name='book_browse_popular'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce('mgb_average_rating', models.Value(-1.0)), descending=True), models.OrderBy(models.F('id'), descending=True), name='book_browse_rating'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce('published_on', models.Value(datetime.date(1, 1, 1))), descending=True), models.OrderBy(models.F('id'), descending=True), name='book_browse_new'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce('total_rating_count', models.Value(-1)), descending=True), models.OrderBy(models.F('id'), descending=True), name='game_browse_popular'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce('total_rating', models.Value(-1.0)), descending=True), models.OrderBy(models.F('id'), descending=True), name='game_browse_rating'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce('release_date', models.Value(datetime.date(1, 1, 1))), descending=True), models.OrderBy(models.F('id'), descending=True), name='game_browse_new'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce('popularity', models.Value(-1.0)), descending=True), models.OrderBy(models.F('id'), descending=True), name='movie_browse_popular'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce('vote_average', models.Value(-1.0)), descending=True), models.OrderBy(models.F('id'), descending=True), name='movie_browse_rating'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce('release_date', 'first_air_date', models.Value(datetime.date(1, 1, 1))), descending=True), models.OrderBy(models.F('id'), descending=True), name='movie_browse_new'),
+        ),
+    ]
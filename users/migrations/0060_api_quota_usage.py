@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0059_browse_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiQuotaUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('day', models.DateField()),
+                ('used', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'API Quota Usage',
+                'verbose_name_plural': 'API Quota Usage',
+                'unique_together': {('name', 'day')},
+            },
+        ),
+    ]
@@ -1,7 +1,14 @@
 # users/models.py
+import calendar
+import datetime
+import re
+
 from django.contrib.auth.models import AbstractUser
-from django.db.models import Avg
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.core.validators import FileExtensionValidator, MaxValueValidator, MinValueValidator
 from django.apps import apps
@@ -152,6 +159,38 @@ class User(AbstractUser):
         return self.username
 
 
+# СОРТИРОВКИ КАТАЛОГА (mgb_main/browse.py)
+# --------------------------------------------------------------------------
+# {сортировка: (поля по приоритету, значение вместо NULL)}. Каталог листается keyset'ом по
+# (COALESCE(поля, значение) DESC, id DESC), и под каждую сортировку есть индекс ровно по этому выражению.
+GAME_BROWSE_SORTS = {
+    'popular': (('total_rating_count',), -1),
+    'rating': (('total_rating',), -1.0),
+    'new': (('release_date',), datetime.date.min),
+}
+MOVIE_BROWSE_SORTS = {
+    'popular': (('popularity',), -1.0),
+    'rating': (('vote_average',), -1.0),
+    'new': (('release_date', 'first_air_date'), datetime.date.min),
+}
+BOOK_BROWSE_SORTS = {
+    'popular': (('ratings_count',), -1),
+    'rating': (('mgb_average_rating',), -1.0),
+    'new': (('published_on',), datetime.date.min),
+}
+
+
+def browse_sort_key(fields, empty):
+    return Coalesce(*fields, models.Value(empty))
+
+
+def browse_sort_indexes(prefix, sorts):
+    return [
+        models.Index(browse_sort_key(fields, empty).desc(), models.F('id').desc(), name=f'{prefix}_browse_{sort}')
+        for sort, (fields, empty) in sorts.items()
+    ]
+
+
 # МОДЕЛЬ ИГР (Game)
 # --------------------------------------------------------------------------
 class Game(models.Model):
@@ -165,19 +204,22 @@ class Game(models.Model):
     cover_url = models.URLField(null=True, blank=True)
     videos = models.JSONField(null=True, blank=True)
 
-    genres = models.JSONField(null=True, blank=True)
-    platforms = models.JSONField(null=True, blank=True)
-    game_modes = models.JSONField(null=True, blank=True)
+    # Списки IGDB - массивы имён (mgb_main/ingest.py: igdb_names). Фильтр вида "PlayStation 5 и RPG" -
+    # platforms @> {...} AND genres @> {...} по GIN-индексам, а карточкам не нужно разбирать JSON
+    genres = ArrayField(models.CharField(max_length=100), default=list, blank=True)
+    platforms = ArrayField(models.CharField(max_length=100), default=list, blank=True)
+    game_modes = ArrayField(models.CharField(max_length=100), default=list, blank=True)
     screenshots = models.JSONField(null=True, blank=True)
-    similar_games = models.JSONField(null=True, blank=True)
+    similar_games = ArrayField(models.IntegerField(), default=list, blank=True)  # id игр в IGDB, то есть game_id
     status = models.CharField(max_length=255, null=True, blank=True)
-    websites = models.JSONField(null=True, blank=True)
+    websites = ArrayField(models.TextField(), default=list, blank=True)
     multiplayer_modes = models.JSONField(default=list, blank=True, null=True)
 
     video_custom = models.FileField(upload_to='videos_uploaded', blank=True, null=True, validators=[FileExtensionValidator(allowed_extensions=['MOV', 'avi', 'mp4', 'webm', 'mkv'])])
     custom_photo = models.URLField(null=True, blank=True)
     custom_header_photo = models.URLField(null=True, blank=True)
     youtube_trailer = models.CharField(max_length=50, blank=True, null=True)
+    trailer_retry_after = models.DateTimeField(null=True, blank=True)  # трейлер не найден - не искать до этого времени (update_trailers)
 
     is_main_game = models.BooleanField(default=False)
     is_recently_trending_small = models.BooleanField(default=False)
@@ -193,27 +235,61 @@ class Game(models.Model):
 
     mgb_average_rating = models.FloatField(null=True, blank=True, default=None) # <-- НАШЕ НОВОЕ ПОЛЕ
     mgb_rating_count = models.PositiveIntegerField(default=0)
+    mgb_rating_sum = models.PositiveIntegerField(default=0)  # сумма оценок, ведётся инкрементально (users/ratings.py)
+
+    # Поля для отображения (assign_display_fields) - считаются при загрузке и save(), а не на каждый запрос
+    platform_icons = ArrayField(models.CharField(max_length=100), default=list, blank=True, editable=False)
+    short_summary = models.TextField(blank=True, default='', editable=False)  # первое предложение summary
+
+    # Поисковый вектор (name, company, genres) - заполняется в mgb_main/search.py
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+    source_hash = models.CharField(max_length=32, blank=True, default='', editable=False)  # хэш данных источника (mgb_main/ingest.py)
+
+    DISPLAY_FIELDS = ['release_date', 'platform_icons', 'short_summary']
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='game_search_vector_gin'),
+            GinIndex(fields=['name'], name='game_name_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['genres'], name='game_genres_gin'),
+            GinIndex(fields=['platforms'], name='game_platforms_gin'),
+            GinIndex(fields=['game_modes'], name='game_modes_gin'),
+            *browse_sort_indexes('game', GAME_BROWSE_SORTS),
+        ]
 
     def update_mgb_rating(self):
-        """Пересчитывает и сохраняет средний MGB рейтинг и количество оценок."""
-        # Получаем все оценки пользователей для этой игры
-        ratings = self.user_ratings.all() # Используем related_name='user_ratings' из UserGameRating
-        count = ratings.count()
-        # Считаем среднее, если оценки есть
-        avg = ratings.aggregate(average=Avg('rating'))['average']
-
-        # Округляем среднее до одного знака после запятой, если оно не None
-        self.mgb_average_rating = round(avg, 1) if avg is not None else None
-        self.mgb_rating_count = count
-        self.save(update_fields=['mgb_average_rating', 'mgb_rating_count'])
+        """
+        Полный пересчёт MGB рейтинга по всем оценкам (сверка).
+        При голосовании счётчики сдвигаются инкрементально в users/signals.py.
+        """
+        from .ratings import recount_mgb_ratings
+        recount_mgb_ratings(Game, UserGameRating, 'game', pks=[self.pk], only_drifted=False)
+        self.refresh_from_db(fields=['mgb_average_rating', 'mgb_rating_count', 'mgb_rating_sum'])
 
-    def save(self, *args, **kwargs):
+    def assign_rating_color(self):
+        """Цвет рейтинга по total_rating. Вызывается в save() и при bulk_create, который save() не вызывает."""
         if self.total_rating is not None:
             # Упрощенная логика определения цвета
             if 8 <= self.total_rating: self.rating_color = "#15B000"
             elif 5 <= self.total_rating < 8: self.rating_color = "#FCDA17"
             elif 1 < self.total_rating < 5: self.rating_color = "#FF4949"
             else: self.rating_color = "#B7485C"  # self.total_rating <= 1
+
+    def assign_display_fields(self):
+        """
+        DISPLAY_FIELDS из данных IGDB: дата выхода из unix-времени (UTC, как backfill game_release_date),
+        иконки платформ и первое предложение описания. Вызывается в save(), при загрузке (bulk_create
+        save() не вызывает), в sync_catalog_changes и в backfill game_display_fields.
+        """
+        from mgb_main.utils import get_first_sentence, get_platform_icons
+        if self.first_release_date:
+            self.release_date = datetime.datetime.fromtimestamp(self.first_release_date, tz=datetime.timezone.utc).date()
+        self.platform_icons = get_platform_icons(self.platforms)
+        self.short_summary = get_first_sentence(self.summary)
+
+    def save(self, *args, **kwargs):
+        self.assign_rating_color()
+        self.assign_display_fields()
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -321,6 +397,7 @@ class Movie(models.Model): # Будем использовать эту моде
     custom_header_photo = models.URLField(null=True, blank=True)
     youtube_trailer = models.CharField(max_length=50, blank=True, null=True)
     youtube_trailer_name = models.CharField(max_length=255, blank=True, null=True) 
+    trailer_retry_after = models.DateTimeField(null=True, blank=True)  # трейлер не найден - не искать до этого времени (update_trailers)
 
     is_main_movie = models.BooleanField(default=False)
     is_recently_trending_small = models.BooleanField(default=False)
@@ -333,6 +410,7 @@ class Movie(models.Model): # Будем использовать эту моде
     vote_count = models.IntegerField(default=0)
     mgb_average_rating = models.FloatField(null=True, blank=True, default=None)
     mgb_rating_count = models.PositiveIntegerField(default=0)
+    mgb_rating_sum = models.PositiveIntegerField(default=0)
 
     # Важно: тип контента, чтобы различать фильмы и сериалы в одной модели
     CONTENT_TYPE_MOVIE = 'movie'
@@ -347,15 +425,45 @@ class Movie(models.Model): # Будем использовать эту моде
         default=CONTENT_TYPE_MOVIE,
     )
 
+    # Поля для отображения (assign_display_fields) - считаются при загрузке и save(), а не на каждый запрос
+    full_poster_path = models.URLField(max_length=512, null=True, blank=True, editable=False)
+    full_backdrop_path = models.URLField(max_length=512, null=True, blank=True, editable=False)
+    country_code = models.TextField(blank=True, default='', editable=False)  # country с сокращениями (USA, UK)
+    formatted_runtime = models.CharField(max_length=20, blank=True, default='', editable=False)
+    short_overview = models.TextField(blank=True, default='', editable=False)  # первое предложение overview
+
+    # Поисковый вектор (title, original_title, genres) - заполняется в mgb_main/search.py
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+    source_hash = models.CharField(max_length=32, blank=True, default='', editable=False)  # хэш данных источника (mgb_main/ingest.py)
+
+    DISPLAY_FIELDS = ['full_poster_path', 'full_backdrop_path', 'country_code', 'formatted_runtime', 'short_overview']
+
     def update_mgb_rating(self):
-        pass
+        """Полный пересчёт MGB рейтинга по всем оценкам (сверка)."""
+        from .ratings import recount_mgb_ratings
+        recount_mgb_ratings(Movie, UserMovieRating, 'movie', pks=[self.pk], only_drifted=False)
+        self.refresh_from_db(fields=['mgb_average_rating', 'mgb_rating_count', 'mgb_rating_sum'])
 
-    def save(self, *args, **kwargs):
+    def assign_rating_color(self):
+        """Цвет рейтинга по vote_average, как у Game.assign_rating_color."""
         if self.vote_average is not None:
             if 8 <= self.vote_average: self.rating_color = "#15B000"
             elif 5 <= self.vote_average < 8: self.rating_color = "#FCDA17"
             elif 1 < self.vote_average < 5: self.rating_color = "#FF4949"
             else: self.rating_color = "#B7485C"
+
+    def assign_display_fields(self):
+        """DISPLAY_FIELDS: URL картинок TMDb (w500), страны с сокращениями, продолжительность, первое предложение описания."""
+        from mgb_main.utils import format_runtime, get_country_abbreviation, get_first_sentence, tmdb_image_url
+        self.full_poster_path = tmdb_image_url(self.poster_path)
+        self.full_backdrop_path = tmdb_image_url(self.backdrop_path)
+        self.country_code = get_country_abbreviation(self.country) if self.country else ''
+        self.formatted_runtime = format_runtime(self.runtime) if self.runtime else ''
+        self.short_overview = get_first_sentence(self.overview)
+
+    def save(self, *args, **kwargs):
+        self.assign_rating_color()
+        self.assign_display_fields()
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -364,6 +472,12 @@ class Movie(models.Model): # Будем использовать эту моде
     class Meta:
         verbose_name = "Контент (Фильм/Сериал)"
         verbose_name_plural = "Контент (Фильмы/Сериалы)"
+        indexes = [
+            GinIndex(fields=['search_vector'], name='movie_search_vector_gin'),
+            GinIndex(fields=['title'], name='movie_title_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['original_title'], name='movie_original_title_trgm', opclasses=['gin_trgm_ops']),
+            *browse_sort_indexes('movie', MOVIE_BROWSE_SORTS),
+        ]
 
 
 # МОДЕЛИ, СВЯЗАННЫЕ С ФИЛЬМАМИ (Genre, Actor, CrewMember)
@@ -474,13 +588,51 @@ class MovieRating(models.Model):
 
 # МОДЕЛЬ КНИГ (Book)
 # --------------------------------------------------------------------------
+PUBLISHED_DATE_RE = re.compile(r'^\s*(\d{4})(?:-(\d{1,2})(?:-(\d{1,2}))?)?')
+
+
+def parse_published_date(value):
+    """
+    publishedDate Google Books ('2019', '2019-05', '2019-05-14', иногда с временем или мусором)
+    -> поля published_on / published_year / published_precision. Неполная дата - первый день
+    года или месяца; непарсящаяся строка - пустые поля.
+    """
+    match = PUBLISHED_DATE_RE.match(str(value or ''))
+    if not match or not 1 <= int(match.group(1)) <= 9999:
+        return {'published_on': None, 'published_year': None, 'published_precision': ''}
+
+    year = int(match.group(1))
+    month = int(match.group(2)) if match.group(2) else None
+    day = int(match.group(3)) if match.group(3) else None
+    if month is None or not 1 <= month <= 12:
+        published_on, precision = datetime.date(year, 1, 1), Book.PRECISION_YEAR
+    elif day is None or not 1 <= day <= calendar.monthrange(year, month)[1]:
+        published_on, precision = datetime.date(year, month, 1), Book.PRECISION_MONTH
+    else:
+        published_on, precision = datetime.date(year, month, day), Book.PRECISION_DAY
+    return {'published_on': published_on, 'published_year': year, 'published_precision': precision}
+
+
 class Book(models.Model):
+    PRECISION_DAY = 'day'
+    PRECISION_MONTH = 'month'
+    PRECISION_YEAR = 'year'
+    PRECISION_CHOICES = [
+        (PRECISION_DAY, 'Дата'),
+        (PRECISION_MONTH, 'Месяц'),
+        (PRECISION_YEAR, 'Год'),
+    ]
+
     google_id = models.CharField(max_length=255, unique=True, null=True) # <-- Google ID (строка)
     title = models.CharField(max_length=512)
     authors = models.JSONField(null=True, blank=True)
     language = models.CharField(max_length=10, null=True, blank=True)
 
     published_date = models.CharField(max_length=20, null=True, blank=True)
+    # Разобранный published_date (parse_published_date): для год/месяц - первый день периода
+    published_on = models.DateField(null=True, blank=True)
+    published_year = models.PositiveSmallIntegerField(null=True, blank=True)
+    published_precision = models.CharField(max_length=5, choices=PRECISION_CHOICES, blank=True, default='')
     description = models.TextField(null=True, blank=True)
 
     categories = models.JSONField(null=True, blank=True)
@@ -498,20 +650,37 @@ class Book(models.Model):
 
     mgb_average_rating = models.FloatField(null=True, blank=True, default=None)
     mgb_rating_count = models.PositiveIntegerField(default=0)
+    mgb_rating_sum = models.PositiveIntegerField(default=0)
 
     average_rating = models.FloatField(null=True, blank=True)
     ratings_count = models.IntegerField(null=True, blank=True)
 
+    # Поисковый вектор (title, authors, categories) - заполняется в mgb_main/search.py
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='book_search_vector_gin'),
+            GinIndex(fields=['title'], name='book_title_trgm', opclasses=['gin_trgm_ops']),
+            models.Index(fields=['published_on'], name='book_published_on'),
+            models.Index(fields=['published_year'], name='book_published_year'),
+            GinIndex(fields=['categories'], name='book_categories_gin'),
+            *browse_sort_indexes('book', BOOK_BROWSE_SORTS),
+        ]
+
     def update_mgb_rating(self):
-        """Пересчитывает и сохраняет средний MGB рейтинг и количество оценок."""
-        ratings = self.user_ratings.all() # Используем related_name='user_ratings' из UserBookRating
-        count = ratings.count()
-        avg = ratings.aggregate(average=Avg('rating'))['average']
-        self.mgb_average_rating = round(avg, 1) if avg is not None else None
-        self.mgb_rating_count = count
-        self.save(update_fields=['mgb_average_rating', 'mgb_rating_count'])
+        """Полный пересчёт MGB рейтинга по всем оценкам (сверка)."""
+        from .ratings import recount_mgb_ratings
+        recount_mgb_ratings(Book, UserBookRating, 'book', pks=[self.pk], only_drifted=False)
+        self.refresh_from_db(fields=['mgb_average_rating', 'mgb_rating_count', 'mgb_rating_sum'])
+
+    def assign_published_fields(self):
+        """published_on / published_year / published_precision из строки published_date."""
+        for name, value in parse_published_date(self.published_date).items():
+            setattr(self, name, value)
 
     def save(self, *args, **kwargs):
+        self.assign_published_fields()
         if self.average_rating is not None:
             if 8 <= self.average_rating: self.rating_color = "#15B000"
             elif 5 <= self.average_rating < 8: self.rating_color = "#FCDA17"
@@ -637,12 +806,22 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     parent = models.ForeignKey("self", null=True, blank=True, on_delete=models.CASCADE, related_name="replies")
     likes = models.ManyToManyField(User, related_name="liked_comments", blank=True)
+    # Счётчики ведутся атомарными UPDATE ... SET x = x ± 1 (users/comments.py, users/signals.py)
+    like_count = models.PositiveIntegerField(default=0)
+    reply_count = models.PositiveIntegerField(default=0)
 
     # Ограничение: комментарий должен относиться хотя бы к одному объекту
     # (Можно добавить через clean метод или constraint в Meta, если нужно)
 
-    def like_count(self):
-        return self.likes.count()
+    class Meta:
+        indexes = [
+            # Лента отзывов элемента: только верхний уровень, новые первыми (keyset по created_at, id)
+            models.Index(fields=['game', '-created_at', '-id'], condition=models.Q(parent__isnull=True), name='comment_game_thread'),
+            models.Index(fields=['movie', '-created_at', '-id'], condition=models.Q(parent__isnull=True), name='comment_movie_thread'),
+            models.Index(fields=['book', '-created_at', '-id'], condition=models.Q(parent__isnull=True), name='comment_book_thread'),
+            # Ответы на отзыв по порядку
+            models.Index(fields=['parent', 'created_at', 'id'], name='comment_replies'),
+        ]
 
     def __str__(self):
         # Определяем, к чему относится комментарий для __str__
@@ -655,7 +834,28 @@ class Comment(models.Model):
 
 # --- МОДЕЛИ ПЕРСОНАЛЬНОГО РЕЙТИНГА ПОЛЬЗОВАТЕЛЯ ---
 # --------------------------------------------------------------------------
-class UserMovieRating(models.Model):
+class TrackedRatingMixin(models.Model):
+    """
+    Запоминает оценку в момент загрузки из БД, чтобы сигнал post_save
+    мог посчитать дельту (new - old) без дополнительного запроса.
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rating = instance.__dict__.get('rating')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Оценка до этого сохранения - для журнала активности (сигналы ниже обновляют _loaded_rating)
+        self._previous_rating = getattr(self, '_loaded_rating', None)
+        super().save(*args, **kwargs)
+
+
+class UserMovieRating(TrackedRatingMixin):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="movie_ratings")
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="user_ratings")
     rating = models.PositiveSmallIntegerField(
@@ -673,7 +873,7 @@ class UserMovieRating(models.Model):
         return f"{self.user.username}'s rating for {self.movie.title}: {self.rating}/10"
 
 
-class UserGameRating(models.Model):
+class UserGameRating(TrackedRatingMixin):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="game_ratings")
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name="user_ratings")
     rating = models.PositiveSmallIntegerField(
@@ -691,7 +891,7 @@ class UserGameRating(models.Model):
         return f"{self.user.username}'s rating for {self.game.name}: {self.rating}/10"
 
 
-class UserBookRating(models.Model):
+class UserBookRating(TrackedRatingMixin):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="book_ratings")
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="user_ratings")
     rating = models.PositiveSmallIntegerField(
@@ -706,4 +906,297 @@ class UserBookRating(models.Model):
         ordering = ['-updated_at']
 
     def __str__(self):
-        return f"{self.user.username}'s rating for {self.book.title}: {self.rating}/10"
\ No newline at end of file
+        return f"{self.user.username}'s rating for {self.book.title}: {self.rating}/10"
+
+
+# --- СВОДНОЕ СОСТОЯНИЕ ЭЛЕМЕНТА В БИБЛИОТЕКЕ ПОЛЬЗОВАТЕЛЯ ---
+# --------------------------------------------------------------------------
+class UserItemState(models.Model):
+    """
+    Денормализованная копия избранного, статуса и оценки пользователя для одного элемента.
+    Источник истины - модели Favorite*/статусов/User*Rating; эта таблица синхронизируется
+    сигналами (users/signals.py) и нужна, чтобы библиотека читалась одним запросом по индексу.
+    """
+    CONTENT_TYPE_CHOICES = [
+        ('game', 'Игра'),
+        ('movie', 'Фильм/Сериал'),
+        ('book', 'Книга'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="item_states")
+    content_type = models.CharField(max_length=10, choices=CONTENT_TYPE_CHOICES)
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name="library_states", null=True, blank=True)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="library_states", null=True, blank=True)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="library_states", null=True, blank=True)
+
+    is_favorite = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, blank=True, default='')  # 'played', 'watching', 'read', ...
+    rating = models.PositiveSmallIntegerField(null=True, blank=True)
+    # Последнее добавление в избранное/статус; NULL - элемент только оценён и в библиотеку не входит
+    last_interaction_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'game'], name='unique_user_game_state'),
+            models.UniqueConstraint(fields=['user', 'movie'], name='unique_user_movie_state'),
+            models.UniqueConstraint(fields=['user', 'book'], name='unique_user_book_state'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'content_type', '-last_interaction_at'], name='user_item_state_library'),
+        ]
+        verbose_name = "User Item State"
+        verbose_name_plural = "User Item States"
+
+    def __str__(self):
+        return f"{self.user.username}: {self.content_type} {self.game_id or self.movie_id or self.book_id}"
+
+
+# --- ЖУРНАЛ АКТИВНОСТИ ---
+# --------------------------------------------------------------------------
+class ActivityEvent(models.Model):
+    """
+    Неизменяемая запись о действии пользователя: оценка, избранное, статус, отзыв.
+    Пишется сигналами (users/signals.py); история профиля читается прямо отсюда.
+    """
+    EVENT_RATED = 'rated'
+    EVENT_FAVORITED = 'favorited'
+    EVENT_STATUS = 'status_changed'
+    EVENT_COMMENTED = 'commented'
+    EVENT_TYPE_CHOICES = [
+        (EVENT_RATED, 'Оценка'),
+        (EVENT_FAVORITED, 'Избранное'),
+        (EVENT_STATUS, 'Статус'),
+        (EVENT_COMMENTED, 'Отзыв'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="activity_events")
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPE_CHOICES)
+    content_type = models.CharField(max_length=10, choices=UserItemState.CONTENT_TYPE_CHOICES)
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name="activity_events", null=True, blank=True)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="activity_events", null=True, blank=True)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="activity_events", null=True, blank=True)
+    verb = models.CharField(max_length=150)  # 'Rated 8', 'Started reading', 'Commented on "..."'
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='activity_event_user_recent'),
+        ]
+        verbose_name = "Activity Event"
+        verbose_name_plural = "Activity Events"
+
+    def __str__(self):
+        return f"{self.user.username}: {self.verb} ({self.created_at:%Y-%m-%d})"
+
+
+class ActivityDailyCount(models.Model):
+    """Количество действий пользователя за день - готовые данные для тепловой карты профиля."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="activity_days")
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_user_activity_day'),
+        ]
+        verbose_name = "Activity Daily Count"
+        verbose_name_plural = "Activity Daily Counts"
+
+    def __str__(self):
+        return f"{self.user.username}: {self.day} - {self.count}"
+
+
+# --- ЗАГРУЗКА КАТАЛОГА ---
+# --------------------------------------------------------------------------
+class IngestionRun(models.Model):
+    """
+    Запуск команды загрузки каталога (fetch_games, fetch_movies, fetch_books, populate_tv_shows),
+    дельта-синхронизации (sync_catalog_changes) или заполнения производного поля (backfill).
+    Хранит параметры запуска и уже записанные страницы (offset / page / категория:startIndex),
+    чтобы прерванный запуск можно было продолжить с --resume.
+    """
+    SOURCE_GAMES = 'games'
+    SOURCE_MOVIES = 'movies'
+    SOURCE_BOOKS = 'books'
+    SOURCE_TV_SHOWS = 'tv_shows'
+    SOURCE_GAMES_CHANGES = 'games_changes'
+    SOURCE_MOVIES_CHANGES = 'movies_changes'
+    SOURCE_TV_CHANGES = 'tv_changes'
+    SOURCE_BACKFILL = 'backfill'
+    SOURCE_CHOICES = [
+        (SOURCE_GAMES, 'Игры (IGDB)'),
+        (SOURCE_MOVIES, 'Фильмы (TMDb)'),
+        (SOURCE_BOOKS, 'Книги (Google Books)'),
+        (SOURCE_TV_SHOWS, 'Сериалы (TMDb)'),
+        (SOURCE_GAMES_CHANGES, 'Изменения игр (IGDB updated_at)'),
+        (SOURCE_MOVIES_CHANGES, 'Изменения фильмов (TMDb changes)'),
+        (SOURCE_TV_CHANGES, 'Изменения сериалов (TMDb changes)'),
+        (SOURCE_BACKFILL, 'Заполнение производных полей'),
+    ]
+
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_COMPLETED, 'Завершён'),
+        (STATUS_FAILED, 'Прерван'),
+    ]
+
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    params = models.JSONField(default=dict, blank=True)  # параметры запуска, при --resume берутся отсюда
+    completed_pages = models.JSONField(default=list, blank=True)  # ключи уже записанных страниц
+    items_saved = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['source', '-started_at'], name='ingestion_run_source_recent'),
+        ]
+        verbose_name = "Ingestion Run"
+        verbose_name_plural = "Ingestion Runs"
+
+    def __str__(self):
+        return f"{self.source} #{self.pk}: {self.status}, {len(self.completed_pages)} страниц"
+
+
+# --- ПОХОЖИЕ ЭЛЕМЕНТЫ ---
+# --------------------------------------------------------------------------
+class ItemNeighbor(models.Model):
+    """
+    Похожий элемент каталога из офлайн-индекса (mgb_main/similar_items.py, команда build_similar_items):
+    для каждого элемента - top-K соседей по косинусной близости признаков, rank 0 - самый похожий.
+    item_id / neighbor_id - pk Game, Movie или Book в зависимости от content_type.
+    """
+    content_type = models.CharField(max_length=10, choices=UserItemState.CONTENT_TYPE_CHOICES)
+    item_id = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    neighbor_id = models.PositiveIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Индекс под выборку соседей одного элемента по порядку
+            models.UniqueConstraint(fields=['content_type', 'item_id', 'rank'], name='unique_item_neighbor_rank'),
+        ]
+        verbose_name = "Item Neighbor"
+        verbose_name_plural = "Item Neighbors"
+
+    def __str__(self):
+        return f"{self.content_type} {self.item_id} -> {self.neighbor_id} ({self.score:.3f})"
+
+
+# --- ПЕРСОНАЛЬНЫЕ РЕКОМЕНДАЦИИ ---
+# --------------------------------------------------------------------------
+class UserRecommendation(models.Model):
+    """
+    Рекомендация "Для вас" (mgb_main/recommendations.py, команда build_recommendations):
+    top-N элементов, которых у пользователя ещё нет в библиотеке, rank 0 - лучший.
+    item_id - pk Game, Movie или Book в зависимости от content_type.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="recommendations")
+    content_type = models.CharField(max_length=10, choices=UserItemState.CONTENT_TYPE_CHOICES)
+    rank = models.PositiveSmallIntegerField()
+    item_id = models.PositiveIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Индекс под полку одного пользователя по порядку
+            models.UniqueConstraint(fields=['user', 'content_type', 'rank'], name='unique_user_recommendation_rank'),
+        ]
+        verbose_name = "User Recommendation"
+        verbose_name_plural = "User Recommendations"
+
+    def __str__(self):
+        return f"{self.user_id}: {self.content_type} {self.item_id} ({self.score:.3f})"
+
+
+class UserRecommendationState(models.Model):
+    """
+    Когда у пользователя менялись оценки/статусы/избранное (сигналы users/signals.py) и когда
+    для него последний раз считались рекомендации. changed_at > built_at - рекомендации устарели,
+    build_recommendations --changed пересчитает только таких пользователей.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="recommendation_states")
+    content_type = models.CharField(max_length=10, choices=UserItemState.CONTENT_TYPE_CHOICES)
+    changed_at = models.DateTimeField(null=True, blank=True)
+    built_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'content_type'], name='unique_user_recommendation_state'),
+        ]
+        verbose_name = "User Recommendation State"
+        verbose_name_plural = "User Recommendation States"
+
+    def __str__(self):
+        return f"{self.user_id}: {self.content_type} (изменено {self.changed_at}, посчитано {self.built_at})"
+
+
+class RecommenderModel(models.Model):
+    """
+    Факторы элементов последнего полного пересчёта рекомендаций одного типа контента:
+    item_ids (int32) и factors (float32, элементов x factor_count) - сырые байты массивов NumPy.
+    По ним build_recommendations --changed пересчитывает отдельных пользователей без новой факторизации.
+    """
+    content_type = models.CharField(max_length=10, choices=UserItemState.CONTENT_TYPE_CHOICES, unique=True)
+    factor_count = models.PositiveSmallIntegerField()
+    item_ids = models.BinaryField()
+    factors = models.BinaryField()
+    users_count = models.PositiveIntegerField(default=0)
+    built_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Recommender Model"
+        verbose_name_plural = "Recommender Models"
+
+    def __str__(self):
+        return f"{self.content_type}: {self.factor_count} факторов, {self.users_count} пользователей ({self.built_at:%Y-%m-%d %H:%M})"
+
+
+# --- ФАСЕТЫ КАТАЛОГА ---
+# --------------------------------------------------------------------------
+class CatalogFacetIndex(models.Model):
+    """
+    Фасеты каталога одного типа контента для просмотра с фильтрами (mgb_main/browse.py, команда refresh_browse_facets).
+    item_ids (int32) - pk элементов по позициям; facets - [[фасет, [[значение, подпись, элементов], ...]], ...]
+    (списком: jsonb не сохраняет порядок ключей); bitmaps - по строке на каждое значение в порядке facets:
+    битовая маска позиций (np.packbits), сырые байты.
+    """
+    content_type = models.CharField(max_length=10, choices=UserItemState.CONTENT_TYPE_CHOICES, unique=True)
+    item_ids = models.BinaryField()
+    facets = models.JSONField(default=list)
+    bitmaps = models.BinaryField()
+    built_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Catalog Facet Index"
+        verbose_name_plural = "Catalog Facet Indexes"
+
+    def __str__(self):
+        return f"{self.content_type}: {len(self.item_ids) // 4} элементов ({self.built_at:%Y-%m-%d %H:%M})"
+
+
+# --- КВОТЫ ВНЕШНИХ API ---
+# --------------------------------------------------------------------------
+class ApiQuotaUsage(models.Model):
+    """
+    Израсходованные за сутки единицы дневной квоты внешнего API (DailyQuota в mgb_main/api_client.py).
+    Списание - один условный UPDATE used = used + n, поэтому процессы загрузки не перерасходуют квоту.
+    """
+    name = models.CharField(max_length=50)
+    day = models.DateField()  # сутки в часовом поясе провайдера
+    used = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('name', 'day')
+        verbose_name = "API Quota Usage"
+        verbose_name_plural = "API Quota Usage"
+
+    def __str__(self):
+        return f"{self.name} {self.day}: {self.used}"
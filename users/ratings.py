@@ -0,0 +1,75 @@
+# users/ratings.py
+from django.db.models import Count, DecimalField, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import Game, Movie, Book, UserGameRating, UserMovieRating, UserBookRating
+
+# Конфигурация MGB рейтинга по типам контента: модель оценок -> модель контента и имя FK
+MGB_RATING_CONFIG = {
+    'games': {'content_model': Game, 'rating_model': UserGameRating, 'field': 'game'},
+    'movies': {'content_model': Movie, 'rating_model': UserMovieRating, 'field': 'movie'},
+    'books': {'content_model': Book, 'rating_model': UserBookRating, 'field': 'book'},
+}
+
+
+def get_mgb_rating_config(rating_model):
+    for config in MGB_RATING_CONFIG.values():
+        if config['rating_model'] is rating_model:
+            return config
+    return None
+
+
+def mgb_average_expression(rating_sum, rating_count):
+    """
+    sum / count, округлённое до одного знака (как round(avg, 1) раньше).
+    Округление через numeric(4, 1); при count = 0 получается NULL.
+    """
+    return Cast(
+        Cast(rating_sum, FloatField()) / NullIf(rating_count, Value(0)),
+        DecimalField(max_digits=4, decimal_places=1),
+    )
+
+
+def apply_mgb_rating_delta(content_model, pk, sum_delta, count_delta):
+    """
+    Атомарно сдвигает счётчики одним UPDATE без чтения оценок:
+    новая оценка (+rating, +1), изменение (new - old, 0), удаление (-rating, -1).
+    """
+    if not sum_delta and not count_delta:
+        return 0
+    new_sum = F('mgb_rating_sum') + sum_delta
+    new_count = F('mgb_rating_count') + count_delta
+    return content_model.objects.filter(pk=pk).update(
+        mgb_rating_sum=new_sum,
+        mgb_rating_count=new_count,
+        mgb_average_rating=mgb_average_expression(new_sum, new_count),
+    )
+
+
+def recount_mgb_ratings(content_model, rating_model, field, pks=None, only_drifted=True):
+    """
+    Полный пересчёт счётчиков по таблице оценок (сверка). Работает пачкой: один UPDATE
+    с подзапросами. При only_drifted обновляет только строки, где счётчики разошлись.
+    Принимает модели параметрами, чтобы работать и с историческими моделями в миграциях.
+    Возвращает количество исправленных строк.
+    """
+    stats = rating_model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+    real_sum = Coalesce(
+        Subquery(stats.annotate(total=Sum('rating')).values('total'), output_field=IntegerField()), Value(0)
+    )
+    real_count = Coalesce(
+        Subquery(stats.annotate(total=Count('pk')).values('total'), output_field=IntegerField()), Value(0)
+    )
+
+    queryset = content_model.objects.all() if pks is None else content_model.objects.filter(pk__in=pks)
+    if only_drifted:
+        drifted = queryset.annotate(real_sum=real_sum, real_count=real_count).exclude(
+            mgb_rating_sum=F('real_sum'), mgb_rating_count=F('real_count')
+        )
+        queryset = content_model.objects.filter(pk__in=drifted.values('pk'))
+
+    return queryset.update(
+        mgb_rating_sum=real_sum,
+        mgb_rating_count=real_count,
+        mgb_average_rating=mgb_average_expression(real_sum, real_count),
+    )
@@ -1,32 +1,127 @@
 # users/signals.py
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import UserGameRating, UserMovieRating, UserBookRating
+from .models import User, Game, Movie, Book, Comment, UserGameRating, UserMovieRating, UserBookRating
+from .ratings import get_mgb_rating_config, apply_mgb_rating_delta, recount_mgb_ratings
+from .library_state import LIBRARY_STATE_CONFIG, LIBRARY_STATE_SOURCES, mark_recommendations_stale, sync_user_item_state
+from .activity import ACTIVITY_SOURCES, record_activity_event
+from .comments import apply_reply_count_delta
+from mgb_main.search import get_search_config_for_model, refresh_search_vectors
 
 
 @receiver(post_save, sender=UserGameRating)
-@receiver(post_delete, sender=UserGameRating)
-def update_game_mgb_rating_on_change(sender, instance, **kwargs):
+@receiver(post_save, sender=UserMovieRating)
+@receiver(post_save, sender=UserBookRating)
+def update_mgb_rating_on_save(sender, instance, created, **kwargs):
     """
-    Вызывается после сохранения или удаления UserGameRating.
-    Обновляет средний рейтинг связанной игры.
+    Сдвигает сумму/количество оценок у связанной игры, фильма или книги одним UPDATE.
+    Новая оценка: (+rating, +1); изменённая: (rating - старая, 0).
     """
-    # instance.game ссылается на объект Game, связанный с измененным/удаленным рейтингом
-    if instance.game:
-        instance.game.update_mgb_rating()
+    config = get_mgb_rating_config(sender)
+    content_pk = getattr(instance, f"{config['field']}_id")
+    if content_pk is None:
+        return
 
+    if created:
+        apply_mgb_rating_delta(config['content_model'], content_pk, instance.rating, 1)
+    elif hasattr(instance, '_loaded_rating'):
+        apply_mgb_rating_delta(config['content_model'], content_pk, instance.rating - instance._loaded_rating, 0)
+    else:
+        # Объект сохранён без загрузки из БД - старая оценка неизвестна, пересчитываем этот элемент целиком
+        recount_mgb_ratings(config['content_model'], sender, config['field'], pks=[content_pk], only_drifted=False)
+    instance._loaded_rating = instance.rating
 
-@receiver(post_save, sender=UserMovieRating)
+
+@receiver(post_delete, sender=UserGameRating)
 @receiver(post_delete, sender=UserMovieRating)
-def update_movie_mgb_rating_on_change(sender, instance, **kwargs):
-    """Обновляет средний рейтинг связанного фильма."""
-    if instance.movie:
-        instance.movie.update_mgb_rating()
+@receiver(post_delete, sender=UserBookRating)
+def update_mgb_rating_on_delete(sender, instance, **kwargs):
+    """Убирает удалённую оценку из суммы и количества: (-rating, -1)."""
+    config = get_mgb_rating_config(sender)
+    content_pk = getattr(instance, f"{config['field']}_id")
+    if content_pk is None:
+        return
+    rating = getattr(instance, '_loaded_rating', instance.rating)
+    apply_mgb_rating_delta(config['content_model'], content_pk, -rating, -1)
 
 
-@receiver(post_save, sender=UserBookRating)
-@receiver(post_delete, sender=UserBookRating)
-def update_book_mgb_rating_on_change(sender, instance, **kwargs):
-    """Обновляет средний рейтинг связанной книги."""
-    if instance.book:
-        instance.book.update_mgb_rating()
\ No newline at end of file
+# СВОДНОЕ СОСТОЯНИЕ БИБЛИОТЕКИ (UserItemState)
+# --------------------------------------------------------------------------
+def sync_user_item_state_on_change(sender, instance, **kwargs):
+    """
+    Любое изменение избранного, статуса или оценки пересчитывает строку UserItemState
+    и помечает рекомендации пользователя устаревшими.
+    """
+    content_type = LIBRARY_STATE_SOURCES.get(sender)
+    if content_type is None:
+        return
+    # Каскадное удаление пользователя: его строки состояния удаляются вместе с ним,
+    # а новая строка со ссылкой на удаляемого пользователя сорвала бы COMMIT
+    origin = kwargs.get('origin')
+    if isinstance(origin, User) or getattr(origin, 'model', None) is User:
+        return
+    item_id = getattr(instance, f"{LIBRARY_STATE_CONFIG[content_type]['field']}_id")
+    if item_id is None:
+        return
+    sync_user_item_state(content_type, instance.user_id, item_id)
+    mark_recommendations_stale(content_type, instance.user_id)
+
+
+# Подключаем явно к каждой модели-источнику: receiver без sender отключил бы fast-delete у всех моделей
+for _source_model in LIBRARY_STATE_SOURCES:
+    post_save.connect(sync_user_item_state_on_change, sender=_source_model)
+    post_delete.connect(sync_user_item_state_on_change, sender=_source_model)
+
+
+# ЖУРНАЛ АКТИВНОСТИ (ActivityEvent)
+# --------------------------------------------------------------------------
+def record_activity_on_save(sender, instance, created, **kwargs):
+    """Новая оценка/избранное/статус/отзыв (или изменённая оценка) -> событие и +1 к счётчику дня."""
+    record_activity_event(sender, instance, created)
+
+
+for _source_model in [*ACTIVITY_SOURCES, Comment]:
+    post_save.connect(record_activity_on_save, sender=_source_model)
+
+
+# СЧЁТЧИК ОТВЕТОВ (Comment.reply_count)
+# --------------------------------------------------------------------------
+@receiver(post_save, sender=Comment)
+def increment_reply_count_on_save(sender, instance, created, **kwargs):
+    if created and instance.parent_id:
+        apply_reply_count_delta(instance.parent_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_reply_count_on_delete(sender, instance, **kwargs):
+    # Если родитель удаляется вместе с ответом (каскад), UPDATE просто не найдёт строку
+    if instance.parent_id:
+        apply_reply_count_delta(instance.parent_id, -1)
+
+
+# ПОИСКОВЫЕ ВЕКТОРЫ (search_vector)
+# --------------------------------------------------------------------------
+@receiver(post_save, sender=Game)
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=Book)
+def refresh_search_vector_on_save(sender, instance, update_fields=None, **kwargs):
+    """Пересчитывает search_vector, если изменились поля, из которых он строится."""
+    config = get_search_config_for_model(sender)
+    if config is None:
+        return
+    if update_fields is not None and not (set(update_fields) & config['source_fields']):
+        return  # Например, save(update_fields=['mgb_average_rating', ...]) - вектор не меняется
+    refresh_search_vectors(sender, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+def refresh_movie_search_vector_on_genres_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Жанры фильма входят в search_vector, поэтому пересчитываем его при изменении связей."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance - это Genre, pk_set - фильмы (при post_clear pk_set = None)
+        if pk_set:
+            refresh_search_vectors(Movie, pk_set)
+    else:
+        refresh_search_vectors(Movie, [instance.pk])
@@ -4,6 +4,7 @@ from django.urls import reverse, NoReverseMatch
 from django.utils.safestring import mark_safe
 from django.templatetags.static import static
 from users.models import Book, UserBookRating
+from users.library_state import get_item_library_state
 
 register = template.Library()
 
@@ -67,66 +68,31 @@ def book_actions(context, book, size='large', show_learn_more=True, show_rating=
         # --- КОНЕЦ ЗАПОЛНЕНИЯ ДАННЫХ ДЛЯ МОДАЛЬНОГО ОКНА ---
 
         if is_authenticated:
-            is_favorite = user.is_item_favorite(book)
-
-            if user.is_read(book): current_status_slug = 'read'
-            elif user.is_reading(book): current_status_slug = 'reading'
-            elif user.is_book_dropped(book): current_status_slug = 'dropped'
-            else: current_status_slug = 'none'
+            preloaded = get_item_library_state(context, 'book', book)
+            if preloaded is not None:
+                # Состояние уже загружено пачкой для всей страницы (users/library_state.py)
+                is_favorite = preloaded['is_favorite']
+                statuses_state = dict(preloaded['statuses'])
+                user_rating = preloaded['rating'] if show_rating else None
+            else:
+                is_favorite = user.is_item_favorite(book)
+                statuses_state = {
+                    'read': user.is_read(book),
+                    'reading': user.is_reading(book),
+                    'dropped': user.is_book_dropped(book),
+                }
+                if show_rating:
+                    # Используем _id для ForeignKey полей для прямого запроса по PK
+                    user_rating = UserBookRating.objects.filter(
+                        user_id=user.pk, book_id=book.pk
+                    ).values_list('rating', flat=True).first()
+
+            current_status_slug = next((slug for slug, selected in statuses_state.items() if selected), 'none')
 
             current_status_icon = book_status_map.get(current_status_slug, {}).get('icon', BOOK_ICON_PATHS.get('status_default'))
             if size == 'small' and current_status_slug == 'none':
                 current_status_icon = BOOK_ICON_PATHS.get('status_small_default')
 
-            statuses_state = {
-                'read': user.is_read(book),
-                'reading': user.is_reading(book),
-                'dropped': user.is_book_dropped(book),
-            }
-
-            if show_rating:
-                user_pk_val = user.pk if user else None
-                book_pk_val = book.pk if book else None
-                print(f"Querying UserBookRating with user_pk={user_pk_val}, book_pk={book_pk_val}")
-
-                if user_pk_val is not None and book_pk_val is not None:
-                    try:
-                        # Используем _id для ForeignKey полей для прямого запроса по PK
-                        rating_obj = UserBookRating.objects.get(user_id=user_pk_val, book_id=book_pk_val)
-                        user_rating = rating_obj.rating
-                        print(f"SUCCESS (by _id fields): Found rating: {user_rating}")
-                    except UserBookRating.DoesNotExist:
-                        user_rating = None
-                        print(f"INFO (by _id fields): UserBookRating.DoesNotExist.")
-                    # ... остальные except ...
-                else:
-                    user_rating = None
-                    print(f"INFO (by _id fields): user_pk or book_pk is None.")
-                if user and user.is_authenticated:
-                    rating_exists_by_id = UserBookRating.objects.filter(user_id=user.pk, book_id=book.pk).exists()
-
-                    if rating_exists_by_id:
-                        try:
-                            rating_obj_by_id = UserBookRating.objects.get(user_id=user.pk, book_id=book.pk)
-                            user_rating = rating_obj_by_id.rating
-
-                        except UserBookRating.DoesNotExist:
-
-                            user_rating = None
-                        except UserBookRating.MultipleObjectsReturned:
-                            # Попробуем взять первый, но это указывает на проблему с данными
-                            rating_obj_by_id = UserBookRating.objects.filter(user_id=user.pk, book_id={book.pk}).first()
-                            if rating_obj_by_id:
-                                user_rating = rating_obj_by_id.rating
-                            else:
-                                user_rating = None
-                        except Exception as e_get_id:
-                            user_rating = None
-                    else:
-                        user_rating = None
-                else:
-                    user_rating = None
-
             try:
                 # Используем google_id для книг в URL
                 urls['favorite'] = reverse('users:favorite_toggle', args=['book', book.google_id])
@@ -156,7 +122,6 @@ def book_actions(context, book, size='large', show_learn_more=True, show_rating=
                 except NoReverseMatch:
                     urls['learn_more'] = '#'
 
-    print(f"FINAL user_rating being passed to template for '{book.title if book else 'N/A'}': {user_rating}\n")
     current_status_display_name = book_status_map.get(current_status_slug, {}).get('display', 'Status')
     if size == 'small' and current_status_slug == 'none':
         current_status_display_name = ''
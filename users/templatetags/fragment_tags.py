@@ -0,0 +1,30 @@
+# users/templatetags/fragment_tags.py
+import hashlib
+
+from django import template
+
+register = template.Library()
+
+# Служебные атрибуты объекта, которые не влияют на разметку карточки
+IGNORED_ATTRS = {'_state', '_prefetched_objects_cache', '_card_version'}
+
+
+@register.filter
+def card_version(obj):
+    """
+    Хэш содержимого карточки для ключа {% cache %}: все поля объекта плюс
+    поля отображения (platform_icons, full_poster_path, обрезанное описание...)
+    и предзагруженные жанры. Изменился объект - изменился ключ, старый фрагмент не используется.
+    """
+    version = getattr(obj, '_card_version', None)
+    if version is not None:
+        return version
+
+    parts = [repr(item) for item in sorted(vars(obj).items()) if item[0] not in IGNORED_ATTRS]
+    prefetched = getattr(obj, '_prefetched_objects_cache', {})
+    for name in sorted(prefetched):
+        parts.append(f"{name}={[related.pk for related in prefetched[name]]}")
+
+    version = hashlib.md5('|'.join(parts).encode()).hexdigest()
+    obj._card_version = version
+    return version
@@ -4,6 +4,7 @@ from django.urls import reverse, NoReverseMatch
 from django.utils.safestring import mark_safe
 from django.templatetags.static import static
 from users.models import Game, UserGameRating # Убедитесь, что все нужные модели импортированы
+from users.library_state import get_item_library_state
 
 register = template.Library()
 
@@ -68,30 +69,32 @@ def game_actions(context, game, size='large', show_learn_more=True, show_rating=
         # --- КОНЕЦ ЗАПОЛНЕНИЯ ДАННЫХ ДЛЯ МОДАЛЬНОГО ОКНА ---
 
         if is_authenticated:
-            is_favorite = user.is_item_favorite(game)
-
-            if user.is_played(game): current_status_slug = 'played'
-            elif user.is_playing(game): current_status_slug = 'playing'
-            elif user.is_dropped(game): current_status_slug = 'dropped'
-            else: current_status_slug = 'none'
+            preloaded = get_item_library_state(context, 'game', game)
+            if preloaded is not None:
+                # Состояние уже загружено пачкой для всей страницы (users/library_state.py)
+                is_favorite = preloaded['is_favorite']
+                statuses_state = dict(preloaded['statuses'])
+                user_rating = preloaded['rating'] if show_rating else None
+            else:
+                is_favorite = user.is_item_favorite(game)
+                statuses_state = {
+                    'played': user.is_played(game),
+                    'playing': user.is_playing(game),
+                    'dropped': user.is_dropped(game),
+                }
+                if show_rating:
+                    try:
+                        rating_obj = UserGameRating.objects.get(user=user, game=game)
+                        user_rating = rating_obj.rating
+                    except UserGameRating.DoesNotExist:
+                        user_rating = None
+
+            current_status_slug = next((slug for slug, selected in statuses_state.items() if selected), 'none')
 
             current_status_icon = game_status_map.get(current_status_slug, {}).get('icon', ICON_PATHS.get('gamepad_default'))
             if size == 'small' and current_status_slug == 'none': # Для маленьких кнопок без статуса
                 current_status_icon = ICON_PATHS.get('gamepad_small_default')
 
-            statuses_state = {
-                'played': user.is_played(game),
-                'playing': user.is_playing(game),
-                'dropped': user.is_dropped(game),
-            }
-
-            if show_rating:
-                try:
-                    rating_obj = UserGameRating.objects.get(user=user, game=game)
-                    user_rating = rating_obj.rating
-                except UserGameRating.DoesNotExist:
-                    user_rating = None
-            
             try:
                 urls['favorite'] = reverse('users:favorite_toggle', args=['game', game.id])
                 for slug, data in game_status_map.items():
@@ -4,6 +4,8 @@ from django.urls import reverse, NoReverseMatch
 from django.utils.safestring import mark_safe
 from django.templatetags.static import static
 from users.models import Movie, UserMovieRating
+from users.library_state import get_item_library_state
+from mgb_main.utils import tmdb_image_url
 
 register = template.Library()
 
@@ -59,13 +61,12 @@ def movie_actions(context, movie, size='large', show_learn_more=True, show_ratin
         # --- ЗАПОЛНЯЕМ ДАННЫЕ ДЛЯ МОДАЛЬНОГО ОКНА ---
         item_title_for_modal = movie.title
 
-        TMDB_IMAGE_BASE_URL = "https://image.tmdb.org/t/p/"
         POSTER_SIZE_FOR_MODAL = "w342"
 
         if movie.custom_header_photo:
             item_image_url_for_modal = movie.custom_header_photo
         elif movie.poster_path:
-            item_image_url_for_modal = f"{TMDB_IMAGE_BASE_URL}{POSTER_SIZE_FOR_MODAL}{movie.poster_path}"
+            item_image_url_for_modal = tmdb_image_url(movie.poster_path, POSTER_SIZE_FOR_MODAL)
 
         # Можно добавить URL для заглушки, если совсем нет изображения
         # else:
@@ -73,30 +74,32 @@ def movie_actions(context, movie, size='large', show_learn_more=True, show_ratin
         # --- КОНЕЦ ЗАПОЛНЕНИЯ ДАННЫХ ДЛЯ МОДАЛЬНОГО ОКНА ---
 
         if is_authenticated:
-            is_favorite = user.is_item_favorite(movie)
-
-            if user.is_watched(movie): current_status_slug = 'watched'
-            elif user.is_watching(movie): current_status_slug = 'watching'
-            elif user.is_movie_dropped(movie): current_status_slug = 'dropped'
-            else: current_status_slug = 'none'
+            preloaded = get_item_library_state(context, 'movie', movie)
+            if preloaded is not None:
+                # Состояние уже загружено пачкой для всей страницы (users/library_state.py)
+                is_favorite = preloaded['is_favorite']
+                statuses_state = dict(preloaded['statuses'])
+                user_rating = preloaded['rating'] if show_rating else None
+            else:
+                is_favorite = user.is_item_favorite(movie)
+                statuses_state = {
+                    'watched': user.is_watched(movie),
+                    'watching': user.is_watching(movie),
+                    'dropped': user.is_movie_dropped(movie),
+                }
+                if show_rating:
+                    try:
+                        rating_obj = UserMovieRating.objects.get(user=user, movie=movie)
+                        user_rating = rating_obj.rating
+                    except UserMovieRating.DoesNotExist:
+                        user_rating = None
+
+            current_status_slug = next((slug for slug, selected in statuses_state.items() if selected), 'none')
 
             current_status_icon = status_map.get(current_status_slug, {}).get('icon', MOVIE_ICON_PATHS.get('status_default'))
             if size == 'small' and current_status_slug == 'none':
                 current_status_icon = MOVIE_ICON_PATHS.get('status_small_default')
 
-            statuses_state = {
-                'watched': user.is_watched(movie),
-                'watching': user.is_watching(movie),
-                'dropped': user.is_movie_dropped(movie),
-            }
-            
-            if show_rating:
-                try:
-                    rating_obj = UserMovieRating.objects.get(user=user, movie=movie)
-                    user_rating = rating_obj.rating
-                except UserMovieRating.DoesNotExist:
-                    user_rating = None
-            
             try:
                 urls['favorite'] = reverse('users:favorite_toggle', args=['movie', movie.tmdb_id])
                 for slug, data in status_map.items():
@@ -1,3 +1,27 @@
+# users/tests.py
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from mgb_main.query_budget import QueryBudgetTestMixin
+from mgb_main.tests import populate_test_catalog
+
+
+class ProfileQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Профиль и история пользователя с заполненной библиотекой укладываются в @query_budget."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = populate_test_catalog()
+
+    def test_logged_in(self):
+        self.client.force_login(self.user)
+        for path in (reverse('users:profile'), reverse('users:profile_history')):
+            with self.subTest(path=path):
+                response = self.assertWithinQueryBudget(path)
+                self.assertEqual(response.status_code, 200)
+
+    def test_anonymous_redirects_to_login(self):
+        for path in (reverse('users:profile'), reverse('users:profile_history')):
+            with self.subTest(path=path):
+                response = self.assertWithinQueryBudget(path)
+                self.assertEqual(response.status_code, 302)
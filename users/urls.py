@@ -11,6 +11,9 @@ urlpatterns = [
     path('add_reply/<int:comment_id>/', views.add_reply, name='add_reply'),
     # Для лайка нужен только ID комментария
     path('like_comment/<int:comment_id>/', views.like_comment, name='like_comment'),
+    # Ленты отзывов и ответов постранично (keyset, ?cursor=)
+    path('comments/<str:content_type>/<int:object_id>/', views.comment_thread, name='comment_thread'),
+    path('comments/<int:comment_id>/replies/', views.comment_replies, name='comment_replies'),
 
     # --- Аутентификация и Профиль ---
     path('login/', views.login, name='login'),
@@ -27,6 +30,7 @@ urlpatterns = [
     path('profile/favorites/games/', views.favorite_games_list, name='favorite_games_list'),
     path('profile/favorites/movies/', views.favorite_movies_list, name='favorite_movies_list'),
     path('profile/favorites/books/', views.favorite_books_list, name='favorite_books_list'),
+    path('profile/favorites/<str:content_type_slug>/page/', views.favorite_items_page, name='favorite_items_page'),
     # -------------------------------------------------------
 
     # --- Избранное (Универсальный URL) ---
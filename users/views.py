@@ -5,12 +5,10 @@ import random
 import string
 import calendar
 
-from mgb_main.utils import get_platform_icon_path
 from django.utils import timezone
 from datetime import timedelta, datetime, date
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.http import require_POST
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.http import HttpResponseRedirect, JsonResponse, Http404
 from django.urls import reverse
 from django.conf import settings
@@ -22,12 +20,13 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import update_session_auth_hash
 from django.apps import apps
 from django.db.models import (
-    Q, F, OuterRef, Subquery, Min, Max, Count,
-    Exists, CharField, Value, Case, When,
-    IntegerField, DateField, DateTimeField
+    Q, F, OuterRef, Subquery, Min, Max,
+    CharField, Value, Case, When,
+    IntegerField
 )
 from django.template.loader import render_to_string
-from django.db.models.functions import Greatest, Coalesce, TruncDate
+from django.db.models.functions import Coalesce
+from mgb_main.query_budget import query_budget
 
 # Импортируем нужные формы и модели
 from users.forms import (
@@ -41,9 +40,17 @@ from .models import (
     PlayedGame, PlayingGame, DroppedGame,
     WatchedMovie, WatchingMovie, DroppedMovie,
     ReadBook, ReadingBook, DroppedBook,
-    Comment,
+    Comment, ActivityEvent,
     UserGameRating, UserMovieRating, UserBookRating
 )
+from .activity import get_activity_heatmap, get_activity_history_page, get_latest_activity
+from .comments import (
+    COMMENT_CONTENT_TYPES, get_comment_replies, get_comment_thread, liked_by_user_expression,
+    serialize_comment, toggle_comment_like,
+)
+from .library_state import (
+    get_user_library_state, get_library_queryset, get_library_counts, get_library_tiers, paginate_library,
+)
 
 
 from dotenv import load_dotenv
@@ -52,6 +59,7 @@ load_dotenv()
 
 
 # --- АУТЕНТИФИКАЦИЯ И ПРОФИЛЬ ---
+@query_budget(7)
 def login(request):
     # Остается без изменений
     if request.user.is_authenticated:
@@ -84,6 +92,7 @@ def login(request):
     return render(request, 'login.html', context)  # Укажи правильный путь к шаблону
 
 
+@query_budget(8)
 def register(request):
     # Остается без изменений
     if request.user.is_authenticated:
@@ -105,6 +114,7 @@ def register(request):
     return render(request, 'register.html', context)  # Укажи правильный путь
 
 
+@query_budget(5)
 def logout(request):
     # Остается без изменений
     auth.logout(request)
@@ -115,74 +125,20 @@ def get_user_activity_heatmap_data(user, year):
     """
     Собирает данные об активности пользователя для тепловой карты за указанный год.
     Возвращает словарь: { 'YYYY-MM-DD': count, ... }
+    Читает готовые дневные счётчики (ActivityDailyCount), которые ведут сигналы журнала активности.
     """
-    activity_data = {}
-    start_date = date(year, 1, 1)
-    end_date = date(year, 12, 31)
-
-    # 1. Оценки (User...Rating модели)
-    game_ratings_dates = UserGameRating.objects.filter(
-        user=user, updated_at__year=year
-    ).annotate(
-        activity_date=TruncDate('updated_at', output_field=DateField())
-    ).values('activity_date').annotate(count=Count('id')).values('activity_date', 'count')
-
-    movie_ratings_dates = UserMovieRating.objects.filter(
-        user=user, updated_at__year=year
-    ).annotate(
-        activity_date=TruncDate('updated_at', output_field=DateField())
-    ).values('activity_date').annotate(count=Count('id')).values('activity_date', 'count')
-
-    book_ratings_dates = UserBookRating.objects.filter(
-        user=user, updated_at__year=year
-    ).annotate(
-        activity_date=TruncDate('updated_at', output_field=DateField())
-    ).values('activity_date').annotate(count=Count('id')).values('activity_date', 'count')
-
-    # 2. Отзывы (Comment модель)
-    review_dates = user.comments.filter(
-        created_at__year=year
-    ).annotate(
-        activity_date=TruncDate('created_at', output_field=DateField())
-    ).values('activity_date').annotate(count=Count('id')).values('activity_date', 'count')
-
-    # 3. Добавление в избранное
-    fav_game_dates = FavoriteGame.objects.filter(
-        user=user, added_at__year=year
-    ).annotate(
-        activity_date=TruncDate('added_at', output_field=DateField())
-    ).values('activity_date').annotate(count=Count('id')).values('activity_date', 'count')
-
-    fav_movie_dates = FavoriteMovie.objects.filter(
-        user=user, added_at__year=year
-    ).annotate(
-        activity_date=TruncDate('added_at', output_field=DateField())
-    ).values('activity_date').annotate(count=Count('id')).values('activity_date', 'count')
-
-    fav_book_dates = FavoriteBook.objects.filter(
-        user=user, added_at__year=year
-    ).annotate(
-        activity_date=TruncDate('added_at', output_field=DateField())
-    ).values('activity_date').annotate(count=Count('id')).values('activity_date', 'count')
-
-    all_activities_by_date = {}
-
-    def aggregate_dates(queryset):
-        for item in queryset:
-            day_str = item['activity_date'].isoformat()
-            all_activities_by_date[day_str] = all_activities_by_date.get(day_str, 0) + item['count']
-
-    aggregate_dates(game_ratings_dates)
-    aggregate_dates(movie_ratings_dates)
-    aggregate_dates(book_ratings_dates)
-    aggregate_dates(review_dates)
-    aggregate_dates(fav_game_dates)
-    aggregate_dates(fav_movie_dates)
-    aggregate_dates(fav_book_dates)
-
-    return all_activities_by_date
+    return get_activity_heatmap(user, year)
+
 
+def preload_reviews_library_state(request, reviews):
+    """Предзагружает состояние библиотеки для элементов, к которым относятся отзывы (для *_actions тегов)."""
+    library_state = get_user_library_state(request)
+    library_state.preload('game', [review.game for review in reviews])
+    library_state.preload('movie', [review.movie for review in reviews])
+    library_state.preload('book', [review.book for review in reviews])
 
+
+@query_budget(30)
 @login_required
 def profile(request):
     user = request.user
@@ -248,6 +204,7 @@ def profile(request):
         review_search_param = request.GET.get('review_search', '')
 
         reviews_qs = user.comments.select_related('movie', 'game', 'book').annotate(
+            liked_by_user=liked_by_user_expression(request.user),
             sortable_item_title=Coalesce(
                 'movie__title', 'game__name', 'book__title', Value(''), output_field=CharField()
             ),
@@ -273,13 +230,15 @@ def profile(request):
         if review_sort_param == 'title': reviews_qs = reviews_qs.order_by('sortable_item_title')
         elif review_sort_param == 'rating': reviews_qs = reviews_qs.order_by(F('rating').desc(nulls_last=True))
         else: reviews_qs = reviews_qs.order_by('-created_at')
-        html_reviews = render_to_string('partials/review_list_items.html', {'reviews': reviews_qs, 'user': request.user})
+        preload_reviews_library_state(request, reviews_qs)
+        html_reviews = render_to_string('partials/review_list_items.html', {'reviews': reviews_qs, 'user': request.user}, request=request)
         return JsonResponse({'html_reviews': html_reviews})
 
     initial_review_filter = request.GET.get('review_filter', 'all')
     initial_review_sort = request.GET.get('review_sort', 'date_added')
     initial_review_search = request.GET.get('review_search', '')
     user_reviews_initial = user.comments.select_related('movie', 'game', 'book').annotate(
+        liked_by_user=liked_by_user_expression(request.user),
         sortable_item_title=Coalesce('movie__title', 'game__name', 'book__title', Value(''), output_field=CharField()),
         item_user_rating=Case(
             When(movie_id__isnull=False, then=Subquery(user_movie_rating_subquery, output_field=IntegerField(null=True))),
@@ -301,6 +260,7 @@ def profile(request):
     if initial_review_sort == 'title': user_reviews_initial = user_reviews_initial.order_by('sortable_item_title')
     elif initial_review_sort == 'rating': user_reviews_initial = user_reviews_initial.order_by(F('rating').desc(nulls_last=True))
     else: user_reviews_initial = user_reviews_initial.order_by('-created_at')
+    preload_reviews_library_state(request, user_reviews_initial)
 
     all_user_reviews_for_stats = user.comments.all()
     total_reviews_count_stat = all_user_reviews_for_stats.count()
@@ -364,12 +324,7 @@ def profile(request):
     for fb in fav_books_qs:
         book_obj = fb.book
         authors_list = (book_obj.authors if isinstance(book_obj.authors, list) else [])[:2]
-        release_year_val = None
-        if book_obj.published_date:
-            try:
-                temp_year = str(book_obj.published_date).split('-')[0]
-                if len(temp_year) == 4 and temp_year.isdigit(): release_year_val = temp_year
-            except: pass
+        release_year_val = str(book_obj.published_year) if book_obj.published_year else None
         latest_favorite_items_overview.append({'id': f"book-{book_obj.id}", 'type': 'book', 'added_at': fb.added_at, 'title': book_obj.title, 'image_url': book_obj.thumbnail, 'detail_url': get_item_detail_url('book', book_obj.google_id), 'user_rating': fb.item_user_rating, 'info_line_1': ", ".join(authors_list), 'info_line_2': release_year_val})
 
     latest_favorite_items_overview.sort(key=lambda x: x['added_at'], reverse=True)
@@ -380,69 +335,8 @@ def profile(request):
 
     latest_games, latest_movies, latest_books = get_sorted_user_games(user)[:3], get_sorted_user_movies(user)[:3], get_sorted_user_books(user)[:3] # Сократил до 3 для Library
 
-    latest_activity_item = None
-    all_potential_activities = []
-
-    def add_activity(item_obj, type_str, verb, timestamp, image_attr, title_attr, id_for_url, id_field_name):
-        if item_obj and timestamp:
-            image_url_val = getattr(item_obj, image_attr, None)
-            title_val = getattr(item_obj, title_attr, 'N/A')
-            all_potential_activities.append({
-                'type': type_str, 'activity_verb': verb, 'timestamp': timestamp,
-                'image_url': image_url_val, 'title': title_val,
-                'detail_url': get_item_detail_url(type_str, getattr(item_obj, id_field_name))
-            })
-
-    activity_models_config = [
-        (FavoriteGame, 'game', 'Added to favorites', 'added_at', 'cover_url', 'name', 'id'),
-        (FavoriteMovie, 'movie', 'Added to favorites', 'added_at', 'poster_path', 'title', 'tmdb_id'),
-        (FavoriteBook, 'book', 'Added to favorites', 'added_at', 'thumbnail', 'title', 'google_id'),
-
-        (PlayedGame, 'game', 'Started played', 'added_at', 'cover_url', 'name', 'id'),
-        (WatchedMovie, 'movie', 'Started watched', 'added_at', 'poster_path', 'title', 'tmdb_id'),
-        (ReadBook, 'movie', 'Started readed', 'added_at', 'thumbnail', 'title', 'google_id'),
-
-        (PlayingGame, 'game', 'Started playing', 'added_at', 'cover_url', 'name', 'id'),
-        (WatchingMovie, 'movie', 'Started watching', 'added_at', 'poster_path', 'title', 'tmdb_id'),
-        (ReadingBook, 'movie', 'Started reading', 'added_at', 'thumbnail', 'title', 'google_id'),
-
-        (DroppedGame, 'game', 'Dropped playing', 'added_at', 'cover_url', 'name', 'id'),
-        (DroppedMovie, 'movie', 'Dropped watching', 'added_at', 'poster_path', 'title', 'tmdb_id'),
-        (DroppedBook, 'movie', 'Dropped reading', 'added_at', 'thumbnail', 'title', 'google_id'),
-    ]
-
-    for Model, type_str, verb, time_field, img_attr, title_attr, id_field in activity_models_config:
-        latest_item_rel = Model.objects.filter(user=user).select_related(type_str).order_by(f'-{time_field}').first()
-        if latest_item_rel:
-            item_obj = getattr(latest_item_rel, type_str)
-            add_activity(item_obj, type_str, verb, getattr(latest_item_rel, time_field), img_attr, title_attr, getattr(item_obj, id_field), id_field)
-
-    # Отдельно для отзывов и рейтингов, т.к. структура немного другая
-    latest_review = user.comments.select_related('movie', 'game', 'book').order_by('-created_at').first()
-    if latest_review:
-        item_for_review = latest_review.movie or latest_review.game or latest_review.book
-        if item_for_review:
-            type_name = 'movie' if latest_review.movie else 'game' if latest_review.game else 'book'
-            img_attr = 'poster_path' if type_name == 'movie' else 'cover_url' if type_name == 'game' else 'thumbnail'
-            title_attr = 'title' if type_name in ['movie', 'book'] else 'name'
-            id_field = 'tmdb_id' if type_name == 'movie' else 'id' if type_name == 'game' else 'google_id'
-            add_activity(item_for_review, type_name, 'Reviewed', latest_review.created_at, img_attr, title_attr, getattr(item_for_review, id_field), id_field)
-    
-    # Рейтинги (по одному примеру, остальные аналогично)
-    latest_game_rating = UserGameRating.objects.filter(user=user).select_related('game').order_by('-updated_at').first()
-    if latest_game_rating:
-        add_activity(latest_game_rating.game, 'game', f'Rated {latest_game_rating.rating}/10', latest_game_rating.updated_at, 'cover_url', 'name', latest_game_rating.game.id, 'id')
-    latest_movie_rating = UserMovieRating.objects.filter(user=user).select_related('movie').order_by('-updated_at').first()
-    if latest_movie_rating:
-         add_activity(latest_movie_rating.movie, 'movie', f'Rated {latest_movie_rating.rating}/10', latest_movie_rating.updated_at, 'poster_path', 'title', latest_movie_rating.movie.tmdb_id, 'tmdb_id')
-    latest_book_rating = UserBookRating.objects.filter(user=user).select_related('book').order_by('-updated_at').first()
-    if latest_book_rating:
-         add_activity(latest_book_rating.book, 'book', f'Rated {latest_book_rating.rating}/10', latest_book_rating.updated_at, 'thumbnail', 'title', latest_book_rating.book.google_id, 'google_id')
-
-
-    if all_potential_activities:
-        all_potential_activities.sort(key=lambda x: x['timestamp'] or timezone.make_aware(datetime.min, timezone.utc), reverse=True) # Убедимся, что None обрабатывается
-        latest_activity_item = all_potential_activities[0] if all_potential_activities else None
+    # Последнее действие - одна строка журнала активности вместо запроса к каждой модели-источнику
+    latest_activity_item = get_latest_activity(user)
 
     context = {
         "profile": user, # Передаем инстанс User как 'profile' для шаблона
@@ -474,6 +368,7 @@ def profile(request):
     return render(request, "profile.html", context)
 
 
+@query_budget(8)
 @login_required
 def profile_settings(request):
     password_form = CustomPasswordChangeForm(user=request.user)
@@ -512,172 +407,19 @@ def profile_settings(request):
     return render(request, 'settings.html', context)
 
 
+@query_budget(5)
 @login_required
 def profile_history(request):
     user = request.user
-    all_activities = []
-
-    # 1. Собираем оценки
-    game_ratings = UserGameRating.objects.filter(user=user).select_related('game').order_by('-updated_at')
-    for gr in game_ratings:
-        all_activities.append({
-            'timestamp': gr.updated_at,
-            'type': 'rated',
-            'verb': f'Rated {gr.rating}',
-            'content_object': gr.game,
-            'content_type_str': 'game',
-            'title': gr.game.name,
-            'image_url': gr.game.cover_url, # Или custom_photo
-            'detail_url': reverse('game_detail', args=[gr.game.id]), # Убедись, что game_detail использует id/pk
-        })
-
-    movie_ratings = UserMovieRating.objects.filter(user=user).select_related('movie').order_by('-updated_at')
-    for mr in movie_ratings:
-        all_activities.append({
-            'timestamp': mr.updated_at,
-            'type': 'rated',
-            'verb': f'Rated {mr.rating}',
-            'content_object': mr.movie,
-            'content_type_str': 'movie',
-            'title': mr.movie.title,
-            'image_url': mr.movie.poster_path, # Это относительный путь, нужно будет добавить префикс TMDB
-            'detail_url': reverse('movie_detail', args=[mr.movie.tmdb_id]), # Использует tmdb_id
-        })
-
-    book_ratings = UserBookRating.objects.filter(user=user).select_related('book').order_by('-updated_at')
-    for br in book_ratings:
-        all_activities.append({
-            'timestamp': br.updated_at,
-            'type': 'rated',
-            'verb': f'Rated {br.rating}',
-            'content_object': br.book,
-            'content_type_str': 'book',
-            'title': br.book.title,
-            'image_url': br.book.thumbnail, # Или custom_photo
-            'detail_url': reverse('book_detail', args=[br.book.google_id]), # Использует google_id
-        })
-
-    # 2. Собираем добавление в избранное
-    fav_games = FavoriteGame.objects.filter(user=user).select_related('game').order_by('-added_at')
-    for fg in fav_games:
-        all_activities.append({
-            'timestamp': fg.added_at,
-            'type': 'favorited',
-            'verb': 'Added to favorites',
-            'content_object': fg.game,
-            'content_type_str': 'game',
-            'title': fg.game.name,
-            'image_url': fg.game.cover_url,
-            'detail_url': reverse('game_detail', args=[fg.game.id]),
-        })
-    # Аналогично для FavoriteMovie и FavoriteBook
-    fav_movies = FavoriteMovie.objects.filter(user=user).select_related('movie').order_by('-added_at')
-    for fm in fav_movies:
-        all_activities.append({
-            'timestamp': fm.added_at,
-            'type': 'favorited',
-            'verb': 'Added to favorites',
-            'content_object': fm.movie,
-            'content_type_str': 'movie',
-            'title': fm.movie.title,
-            'image_url': fm.movie.poster_path,
-            'detail_url': reverse('movie_detail', args=[fm.movie.tmdb_id]),
-        })
-    fav_books = FavoriteBook.objects.filter(user=user).select_related('book').order_by('-added_at')
-    for fb in fav_books:
-        all_activities.append({
-            'timestamp': fb.added_at,
-            'type': 'favorited',
-            'verb': 'Added to favorites',
-            'content_object': fb.book,
-            'content_type_str': 'book',
-            'title': fb.book.title,
-            'image_url': fb.book.thumbnail,
-            'detail_url': reverse('book_detail', args=[fb.book.google_id]),
-        })
-
-
-    # 3. Собираем статусы (Played, Watched, Read и т.д.)
-    played_games = PlayedGame.objects.filter(user=user).select_related('game').order_by('-added_at')
-    for pg in played_games:
-        all_activities.append({
-            'timestamp': pg.added_at,
-            'type': 'status_changed',
-            'verb': 'Finished playing', # Или "Marked as Played"
-            'content_object': pg.game,
-            'content_type_str': 'game',
-            'title': pg.game.name,
-            'image_url': pg.game.cover_url,
-            'detail_url': reverse('game_detail', args=[pg.game.id]),
-        })
-
-    reading_books = ReadingBook.objects.filter(user=user).select_related('book').order_by('-added_at')
-    for rb_reading in reading_books:
-        all_activities.append({
-            'timestamp': rb_reading.added_at,
-            'type': 'status_changed',
-            'verb': 'Started reading',
-            'content_object': rb_reading.book,
-            'content_type_str': 'book',
-            'title': rb_reading.book.title,
-            'image_url': rb_reading.book.thumbnail,
-            'detail_url': reverse('book_detail', args=[rb_reading.book.google_id]),
-        })
 
-    # 4. Собираем комментарии/отзывы
-    comments = Comment.objects.filter(user=user).select_related('game', 'movie', 'book').order_by('-created_at')
-    for comment in comments:
-        item = comment.game or comment.movie or comment.book
-        item_title = "Unknown Item"
-        item_image_url = None
-        item_detail_url = "#"
-        item_content_type = "unknown"
-
-        if comment.game:
-            item_title = comment.game.name
-            item_image_url = comment.game.cover_url
-            item_detail_url = reverse('game_detail', args=[comment.game.id])
-            item_content_type = "game"
-        elif comment.movie:
-            item_title = comment.movie.title
-            item_image_url = comment.movie.poster_path
-            item_detail_url = reverse('movie_detail', args=[comment.movie.tmdb_id])
-            item_content_type = "movie"
-        elif comment.book:
-            item_title = comment.book.title
-            item_image_url = comment.book.thumbnail
-            item_detail_url = reverse('book_detail', args=[comment.book.google_id])
-            item_content_type = "book"
-
-        all_activities.append({
-            'timestamp': comment.created_at,
-            'type': 'commented',
-            'verb': f'Commented on "{comment.title}"',
-            'content_object': item,
-            'content_type_str': item_content_type,
-            'title': item_title,
-            'image_url': item_image_url,
-            'detail_url': item_detail_url,
-            'comment_content': comment.content[:150] + '...' if len(comment.content) > 150 else comment.content, # Превью комментария
-        })
-
-    # Сортируем все активности по дате/времени в обратном хронологическом порядке
-    all_activities.sort(key=lambda x: x['timestamp'], reverse=True)
-    total_activities_count = len(all_activities)
-
-    # Пагинация
-    paginator = Paginator(all_activities, 20)
-    page_number = request.GET.get('page')
-    try:
-        page_obj = paginator.page(page_number)
-    except PageNotAnInteger:
-        page_obj = paginator.page(1)
-    except EmptyPage:
-        page_obj = paginator.page(paginator.num_pages)
+    # История читается из журнала ActivityEvent постранично (keyset по времени), без сборки всего в памяти
+    activities, next_cursor = get_activity_history_page(user, request.GET.get('before'))
+    total_activities_count = ActivityEvent.objects.filter(user=user).count()
 
     context = {
         'profile_user': user,
-        'activities_page': page_obj,
+        'activities': activities,
+        'next_cursor': next_cursor,
         'page_title': f"{user.username}'s History",
         'total_activities_count': total_activities_count,
         'TMDB_IMAGE_BASE_URL': "https://image.tmdb.org/t/p/",
@@ -688,6 +430,7 @@ def profile_history(request):
 
 # --- УНИВЕРСАЛЬНОЕ ИЗБРАННОЕ ---
 # -----------------------------------------------------------------------------------------------------------------------------
+@query_budget(18)
 @login_required
 def toggle_favorite_item(request, content_type, object_id):
     """
@@ -739,65 +482,25 @@ def toggle_favorite_item(request, content_type, object_id):
 
 def get_combined_user_movie_ids(user):
     """Возвращает множество ID фильмов, добавленных пользователем в избранное или любой статус."""
-    favorite_ids = set(FavoriteMovie.objects.filter(user=user).values_list('movie_id', flat=True))
-    watched_ids = set(WatchedMovie.objects.filter(user=user).values_list('movie_id', flat=True))
-    watching_ids = set(WatchingMovie.objects.filter(user=user).values_list('movie_id', flat=True))
-    dropped_ids = set(DroppedMovie.objects.filter(user=user).values_list('movie_id', flat=True))
-    return favorite_ids.union(watched_ids, watching_ids, dropped_ids)
+    return set(get_library_queryset(user, 'movie').values_list('pk', flat=True))
 
 
 def get_combined_user_game_ids(user):
     """Возвращает множество ID игр, добавленных пользователем в избранное или любой статус."""
-    favorite_ids = set(FavoriteGame.objects.filter(user=user).values_list('game_id', flat=True))
-    played_ids = set(PlayedGame.objects.filter(user=user).values_list('game_id', flat=True))
-    playing_ids = set(PlayingGame.objects.filter(user=user).values_list('game_id', flat=True))
-    dropped_ids = set(DroppedGame.objects.filter(user=user).values_list('game_id', flat=True))
-    # Объединяем все ID
-    return favorite_ids.union(played_ids, playing_ids, dropped_ids)
+    return set(get_library_queryset(user, 'game').values_list('pk', flat=True))
 
 
 def get_combined_user_book_ids(user):
     """Возвращает множество ID книг, добавленных пользователем в избранное или любой статус."""
-    favorite_ids = set(FavoriteBook.objects.filter(user=user).values_list('book_id', flat=True))
-    read_ids = set(ReadBook.objects.filter(user=user).values_list('book_id', flat=True))
-    reading_ids = set(ReadingBook.objects.filter(user=user).values_list('book_id', flat=True))
-    dropped_ids = set(DroppedBook.objects.filter(user=user).values_list('book_id', flat=True))
-    return favorite_ids.union(read_ids, reading_ids, dropped_ids)
+    return set(get_library_queryset(user, 'book').values_list('pk', flat=True))
 
 
 # --- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ДЛЯ ПОЛУЧЕНИЯ ОТСОРТИРОВАННЫХ СПИСКОВ ---
+# Читают сводную таблицу UserItemState: один JOIN по индексу (user, content_type, last_interaction_at)
+# вместо объединения четырёх таблиц и подзапросов на каждую строку.
 # -----------------------------------------------------------------------------------------------------------------------------
 def get_sorted_user_movies(user):
-    combined_movie_ids = get_combined_user_movie_ids(user)
-    if not combined_movie_ids:
-        return Movie.objects.none()
-
-    latest_fav = FavoriteMovie.objects.filter(movie=OuterRef('pk'), user=user).order_by('-added_at')
-    latest_watched = WatchedMovie.objects.filter(movie=OuterRef('pk'), user=user).order_by('-added_at')
-    latest_watching = WatchingMovie.objects.filter(movie=OuterRef('pk'), user=user).order_by('-added_at')
-    latest_dropped = DroppedMovie.objects.filter(movie=OuterRef('pk'), user=user).order_by('-added_at')
-
-    user_rating_subquery = UserMovieRating.objects.filter(
-        movie=OuterRef('pk'), user=user
-    ).values('rating')[:1]
-
-    return Movie.objects.filter(pk__in=list(combined_movie_ids)).annotate(
-        fav_date=Subquery(latest_fav.values('added_at')[:1]),
-        watched_date=Subquery(latest_watched.values('added_at')[:1]),
-        watching_date=Subquery(latest_watching.values('added_at')[:1]),
-        dropped_date=Subquery(latest_dropped.values('added_at')[:1]),
-        latest_interaction_date=Greatest(
-            F('fav_date'), F('watched_date'), F('watching_date'), F('dropped_date'),
-            output_field=DateTimeField(null=True)
-        ),
-        user_rating=Subquery(user_rating_subquery), # Если есть рейтинг для фильмов
-        is_favorite_for_user=Exists(FavoriteMovie.objects.filter(movie=OuterRef('pk'), user=user)),
-        is_watched_for_user=Exists(WatchedMovie.objects.filter(movie=OuterRef('pk'), user=user)),
-        is_watching_for_user=Exists(WatchingMovie.objects.filter(movie=OuterRef('pk'), user=user)),
-        is_dropped_for_user=Exists(DroppedMovie.objects.filter(movie=OuterRef('pk'), user=user)),
-            ).prefetch_related(
-            'genres'
-    ).order_by(F('latest_interaction_date').desc(nulls_last=True), '-pk')
+    return get_library_queryset(user, 'movie').prefetch_related('genres')
 
 
 def get_sorted_user_games(user):
@@ -805,76 +508,67 @@ def get_sorted_user_games(user):
     Возвращает QuerySet игр пользователя, отсортированный по последней дате взаимодействия,
     с аннотациями для каждого статуса.
     """
-    combined_game_ids = get_combined_user_game_ids(user)
-    if not combined_game_ids:
-        return Game.objects.none()
-
-    
-
-    latest_fav = FavoriteGame.objects.filter(game=OuterRef('pk'), user=user).order_by('-added_at')
-    latest_played = PlayedGame.objects.filter(game=OuterRef('pk'), user=user).order_by('-added_at')
-    latest_playing = PlayingGame.objects.filter(game=OuterRef('pk'), user=user).order_by('-added_at')
-    latest_dropped = DroppedGame.objects.filter(game=OuterRef('pk'), user=user).order_by('-added_at')
-
-    user_rating_subquery = UserGameRating.objects.filter(
-        game=OuterRef('pk'),
-        user=user
-    ).values('rating')[:1]
-
-    return Game.objects.filter(pk__in=list(combined_game_ids)).annotate(
-        fav_date=Subquery(latest_fav.values('added_at')[:1]),
-        played_date=Subquery(latest_played.values('added_at')[:1]),
-        playing_date=Subquery(latest_playing.values('added_at')[:1]),
-        dropped_date=Subquery(latest_dropped.values('added_at')[:1]),
-        latest_interaction_date=Greatest(
-            F('fav_date'), F('played_date'), F('playing_date'), F('dropped_date'),
-            output_field=DateTimeField(null=True)
-        ),
-        user_rating=Subquery(user_rating_subquery),
-        # --- НОВЫЕ АННОТАЦИИ ДЛЯ СТАТУСОВ ---
-        is_favorite_for_user=Exists(FavoriteGame.objects.filter(game=OuterRef('pk'), user=user)),
-        is_played_for_user=Exists(PlayedGame.objects.filter(game=OuterRef('pk'), user=user)),
-        is_playing_for_user=Exists(PlayingGame.objects.filter(game=OuterRef('pk'), user=user)),
-        is_dropped_for_user=Exists(DroppedGame.objects.filter(game=OuterRef('pk'), user=user)),
-    ).order_by(F('latest_interaction_date').desc(nulls_last=True), '-pk')
+    return get_library_queryset(user, 'game')
 
 
 def get_sorted_user_books(user):
-    combined_book_ids = get_combined_user_book_ids(user)
-    if not combined_book_ids:
-        return Book.objects.none()
-
-    latest_fav = FavoriteBook.objects.filter(book=OuterRef('pk'), user=user).order_by('-added_at')
-    latest_read = ReadBook.objects.filter(book=OuterRef('pk'), user=user).order_by('-added_at')
-    latest_reading = ReadingBook.objects.filter(book=OuterRef('pk'), user=user).order_by('-added_at')
-    latest_dropped = DroppedBook.objects.filter(book=OuterRef('pk'), user=user).order_by('-added_at')
-
-    user_rating_subquery = UserBookRating.objects.filter(
-        book=OuterRef('pk'), user=user
-    ).values('rating')[:1]
-
-    return Book.objects.filter(pk__in=list(combined_book_ids)).annotate(
-        fav_date=Subquery(latest_fav.values('added_at')[:1]),
-        read_date=Subquery(latest_read.values('added_at')[:1]),
-        reading_date=Subquery(latest_reading.values('added_at')[:1]),
-        dropped_date=Subquery(latest_dropped.values('added_at')[:1]),
-        latest_interaction_date=Greatest(
-            F('fav_date'), F('read_date'), F('reading_date'), F('dropped_date'),
-            output_field=DateTimeField(null=True)
-        ),
-        user_rating=Subquery(user_rating_subquery), # Если есть рейтинг для книг
-        is_favorite_for_user=Exists(FavoriteBook.objects.filter(book=OuterRef('pk'), user=user)),
-        is_read_for_user=Exists(ReadBook.objects.filter(book=OuterRef('pk'), user=user)),
-        is_reading_for_user=Exists(ReadingBook.objects.filter(book=OuterRef('pk'), user=user)),
-        is_dropped_for_user=Exists(DroppedBook.objects.filter(book=OuterRef('pk'), user=user)),
-    ).order_by(F('latest_interaction_date').desc(nulls_last=True), '-pk')
+    return get_library_queryset(user, 'book')
 
 
 # --- VIEWS ДЛЯ ОТОБРАЖЕНИЯ ОБЪЕДИНЕННЫХ СПИСКОВ ---
 # -----------------------------------------------------------------------------------------------------------------------
-def apply_sorting_to_queryset(queryset, sort_by_param_str, field_map):
+# Настройки страниц библиотеки по типам контента.
+# sections - порядок секций в сетке/списке; chip-класс статуса = '<slug>-chip'.
+LIBRARY_LIST_CONFIG = {
+    'movies': {
+        'content_type': 'movie',
+        'name': 'Movies',
+        'get_queryset': get_sorted_user_movies,
+        'title_field': 'title',
+        'release_field': 'release_date',
+        'card_template': 'partials/movie_card.html',
+        'showcase_template': 'partials/showcase_movie_cell.html',
+        'labels': {'status1': 'Watched', 'status2': 'Watching', 'status3': 'Dropped', 'wishlist': 'Wishlist'},
+        'statuses': {'status1': 'watched', 'status2': 'watching', 'status3': 'dropped'},
+        'sections': ['status1', 'status2', 'status3', 'wishlist'],
+    },
+    'games': {
+        'content_type': 'game',
+        'name': 'Games',
+        'get_queryset': get_sorted_user_games,
+        'title_field': 'name',
+        'release_field': 'release_date',
+        'card_template': 'partials/game_card.html',
+        'showcase_template': 'partials/showcase_game_cell.html',
+        'labels': {'status1': 'Played', 'status2': 'Playing', 'status3': 'Dropped', 'wishlist': 'Favourite'},
+        'statuses': {'status1': 'played', 'status2': 'playing', 'status3': 'dropped'},
+        'sections': ['wishlist', 'status1', 'status2', 'status3'],
+    },
+    'books': {
+        'content_type': 'book',
+        'name': 'Books',
+        'get_queryset': get_sorted_user_books,
+        'title_field': 'title',
+        'release_field': 'published_on',
+        'card_template': 'partials/book_card.html',
+        'showcase_template': 'partials/showcase_book_cell.html',
+        'labels': {'status1': 'Read', 'status2': 'Reading', 'status3': 'Dropped', 'wishlist': 'Wishlist'},
+        'statuses': {'status1': 'read', 'status2': 'reading', 'status3': 'dropped'},
+        'sections': ['status1', 'status2', 'status3', 'wishlist'],
+    },
+}
+
+LIBRARY_VIEW_TEMPLATES = {
+    'view-grid': 'includes/items_list_content_grid.html',
+    'view-list': 'includes/items_list_content_list.html',
+    'view-tierlist': 'includes/items_list_content_tierlist.html',
+}
+TIERLIST_ITEM_TEMPLATE = 'partials/tierlist_item_card.html'
+
+
+def get_library_sort(sort_by_param_str, field_map):
     """
-    Применяет сортировку к QuerySet на основе строки параметра и карты полей.
+    Разбирает параметр сортировки ('date_added_desc', 'title', ...) в (поле, по убыванию ли).
     field_map: {'ключ_сортировки_из_dropdown': 'поле_в_модели'}
     """
     sort_key = sort_by_param_str
@@ -887,517 +581,175 @@ def apply_sorting_to_queryset(queryset, sort_by_param_str, field_map):
         sort_key = sort_by_param_str.replace('_desc', '')
         direction = 'desc'
 
+    if sort_key not in field_map:
+        # Сортировка по умолчанию, если sort_key не найден
+        return field_map.get('date_added', 'latest_interaction_date'), True
+
     # Устанавливаем направление по умолчанию, если оно не задано явно
     if not direction:
-        if sort_key == 'title' or sort_key == 'name': # 'name' для игр
-            direction = 'asc'
-        else:
-            direction = 'desc'
-
-    if sort_key in field_map:
-        actual_sort_field = field_map[sort_key]
-        if direction == 'asc':
-            # Для текстовых полей F() не нужен, для остальных nulls_last/first полезно
-            if actual_sort_field in ['title', 'name']:
-                return queryset.order_by(actual_sort_field)
-            else:
-                return queryset.order_by(F(actual_sort_field).asc(nulls_last=True))
-        elif direction == 'desc':
-            if actual_sort_field in ['title', 'name']:
-                return queryset.order_by(f'-{actual_sort_field}')
-            else:
-                return queryset.order_by(F(actual_sort_field).desc(nulls_last=True))
-
-    # Сортировка по умолчанию, если sort_key не найден (например, 'date_added')
-    default_sort_field = field_map.get('date_added', 'latest_interaction_date') # Фоллбэк, если 'date_added' нет
-    return queryset.order_by(F(default_sort_field).desc(nulls_last=True))
+        direction = 'asc' if sort_key in ('title', 'name') else 'desc'
+    return field_map[sort_key], direction == 'desc'
+
+
+def get_library_status_config(config, library_counts):
+    """Секции сетки/списка со счётчиками из агрегата (а не по длине текущей страницы)."""
+    counts = {'wishlist': library_counts['favorite']}
+    annotations = {'wishlist': 'is_favorite_for_user'}
+    chips = {'wishlist': 'wishlist-chip'}
+    for key, slug in config['statuses'].items():
+        counts[key] = library_counts[slug]
+        annotations[key] = f'is_{slug}_for_user'
+        chips[key] = f'{slug}-chip'
+
+    return [
+        {
+            'key': key, 'label': config['labels'][key], 'annotation_field': annotations[key],
+            'chip_class': chips[key], 'count': counts[key],
+        }
+        for key in config['sections']
+    ]
 
 
-@login_required
-def favorite_movies_list(request):
+def get_library_list_page(request, config, grid_status_config):
+    """
+    Общая часть страницы библиотеки и подгрузки: фильтр по статусу, сортировка и keyset-страница.
+    Возвращает (контекст для шаблона списка, имя шаблона).
+    """
     user = request.user
-    base_queryset = get_sorted_user_movies(user)
-
     status_filter_key = request.GET.get('status_filter', 'all')
-    sort_by_param = request.GET.get('sort_by', 'date_added_desc') 
+    sort_by_param = request.GET.get('sort_by', 'date_added_desc')
     current_view_mode_id = request.GET.get('view_mode', 'view-grid')
-
-    current_content_type_slug = 'movies'
-    content_type_name_display = 'Movies'
-    default_item_card_template = 'partials/movie_card.html'
-    tierlist_item_card_template = 'partials/tierlist_item_card.html'
-    showcase_item_template_path = 'partials/showcase_movie_cell.html'
-
-    # Подготовка данных для тирлиста
-    unrated_items_for_tierlist = []
-    rated_items_by_tier = {i: [] for i in range(1, 11)}
-    for item in base_queryset:
-        rating = getattr(item, 'user_rating', None)
-        if rating is not None and 1 <= rating <= 10:
-            rated_items_by_tier[int(rating)].append(item)
-        else:
-            unrated_items_for_tierlist.append(item)
-
-    # Модели статусов для фильмов
-    status_models_map = {
-        'status1': WatchedMovie, 'status2': WatchingMovie,
-        'status3': DroppedMovie, 'wishlist': FavoriteMovie,
-    }
-    status_model_id_field = 'movie_id'
-
-    # Фильтрация
-    items_processed = base_queryset
-    items_to_render_for_list_detailed = base_queryset
-
-    if current_view_mode_id == 'view-grid' and status_filter_key != 'all' and status_filter_key in status_models_map:
-        StatusModel = status_models_map[status_filter_key]
-        status_item_ids = StatusModel.objects.filter(user=user).values_list(status_model_id_field, flat=True)
-        items_processed = base_queryset.filter(pk__in=list(status_item_ids))
-
-    if current_view_mode_id != 'view-grid':
-        if status_filter_key != 'all' and status_filter_key in status_models_map:
-            StatusModel = status_models_map[status_filter_key]
-            status_item_ids = StatusModel.objects.filter(user=user).values_list(status_model_id_field, flat=True)
-            items_to_render_for_list_detailed = base_queryset.filter(pk__in=list(status_item_ids))
-
-    # Сортировка
-    sort_field_map = {
-        'date_added': 'latest_interaction_date',
-        'rating': 'user_rating',
-        'title': 'title', 
-    }
-    if base_queryset.exists():
-        items_processed = apply_sorting_to_queryset(items_processed, sort_by_param, sort_field_map)
-        items_to_render_for_list_detailed = apply_sorting_to_queryset(items_to_render_for_list_detailed, sort_by_param, sort_field_map)
-
-    # Статистика
-    stats = {
-        'total': base_queryset.count(),
-        'favourite': FavoriteMovie.objects.filter(user=user).count(),
-        'status1_label': 'Watched', 'status1_count': WatchedMovie.objects.filter(user=user).count(),
-        'status2_label': 'Watching', 'status2_count': WatchingMovie.objects.filter(user=user).count(),
-        'status3_label': 'Dropped', 'status3_count': DroppedMovie.objects.filter(user=user).count(),
-        'wishlist_label': 'Wishlist',
-    }
-    stats['wishlist_count'] = stats['favourite']
-
-    grid_status_config = [
-        {'key': 'status1', 'label': stats['status1_label'], 'annotation_field': 'is_watched_for_user', 'chip_class': 'watched-chip'},
-        {'key': 'status2', 'label': stats['status2_label'], 'annotation_field': 'is_watching_for_user', 'chip_class': 'watching-chip'},
-        {'key': 'status3', 'label': stats['status3_label'], 'annotation_field': 'is_dropped_for_user', 'chip_class': 'dropped-chip'},
-        {'key': 'wishlist', 'label': stats['wishlist_label'], 'annotation_field': 'is_favorite_for_user', 'chip_class': 'wishlist-chip'},
-    ]
-    status_labels_map = {key: stats[f"{key_}_label"] for key_, key in [('status1','status1'), ('status2','status2'), ('status3','status3'), ('wishlist','wishlist')]}
-
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        list_template_name = ''
-        context_for_ajax = {
-            'content_type_name': content_type_name_display,
-            'user': request.user,
-            'status_filter_key': status_filter_key,
-            'status_labels': status_labels_map,
-            'grid_status_config': grid_status_config,
-            'content_type_slug': current_content_type_slug,
-        }
-        if current_view_mode_id == 'view-grid':
-            list_template_name = 'includes/items_list_content_grid.html'
-            context_for_ajax['library_items'] = items_processed
-            context_for_ajax['status_filter_from_toolbar'] = status_filter_key
-            context_for_ajax['item_template_name'] = default_item_card_template
-        elif current_view_mode_id == 'view-list':
-            list_template_name = 'includes/items_list_content_list.html'
-            context_for_ajax['library_items'] = items_to_render_for_list_detailed
-        elif current_view_mode_id == 'view-detailed-list':
-            list_template_name = 'includes/items_list_content_detailed.html'
-            context_for_ajax['library_items'] = items_to_render_for_list_detailed
-        elif current_view_mode_id == 'view-tierlist':
-            list_template_name = 'includes/items_list_content_tierlist.html'
-            context_for_ajax.update({
-                'unrated_items': unrated_items_for_tierlist,
-                'rated_items_by_tier': rated_items_by_tier,
-                'tier_item_template_name': tierlist_item_card_template,
-                'tier_rating_values': list(range(10, 0, -1)),
-            })
-        else:
-            list_template_name = 'includes/items_list_content_grid.html'
-            context_for_ajax['library_items'] = items_processed
-            context_for_ajax['status_filter_from_toolbar'] = status_filter_key
-            context_for_ajax['item_template_name'] = default_item_card_template
-
-        html_items = render_to_string(list_template_name, context_for_ajax)
-        return JsonResponse({'html_items': html_items})
-
-    library_items_for_initial_load = items_processed 
-    item_template_name_for_initial_load = default_item_card_template
-    initial_list_template_to_include = 'includes/items_list_content_grid.html'
-
-    if current_view_mode_id == 'view-list':
-        initial_list_template_to_include = 'includes/items_list_content_list.html'
-        library_items_for_initial_load = items_to_render_for_list_detailed
-    elif current_view_mode_id == 'view-detailed-list':
-        initial_list_template_to_include = 'includes/items_list_content_detailed.html'
-        library_items_for_initial_load = items_to_render_for_list_detailed
-    elif current_view_mode_id == 'view-tierlist':
-        initial_list_template_to_include = 'includes/items_list_content_tierlist.html'
-
-    initial_sort_dropdown_value = 'date_added'
-    if sort_by_param.startswith('date_added'): initial_sort_dropdown_value = 'date_added'
-    elif sort_by_param.startswith('rating'): initial_sort_dropdown_value = 'rating'
-    elif sort_by_param.startswith('title'): initial_sort_dropdown_value = 'title'
+    if current_view_mode_id not in LIBRARY_VIEW_TEMPLATES:
+        current_view_mode_id = 'view-grid'
 
     context = {
-        'profile': user,
-        'library_items': library_items_for_initial_load if current_view_mode_id != 'view-tierlist' else None,
-        'item_template_name': item_template_name_for_initial_load if current_view_mode_id != 'view-tierlist' else None,
-
-        'unrated_items': unrated_items_for_tierlist if current_view_mode_id == 'view-tierlist' else None,
-        'rated_items_by_tier': rated_items_by_tier if current_view_mode_id == 'view-tierlist' else None,
-        'tier_item_template_name': tierlist_item_card_template if current_view_mode_id == 'view-tierlist' else None,
-        'tier_rating_values': list(range(10, 0, -1)) if current_view_mode_id == 'view-tierlist' else None,
-
-        'content_type_name': content_type_name_display,
+        'content_type_name': config['name'],
+        'user': user,
         'status_filter_key': status_filter_key,
+        'status_labels': config['labels'],
         'grid_status_config': grid_status_config,
-        'content_type_slug': current_content_type_slug,
-        'sorted_items': base_queryset[:4],
-        'content_type_name_page_title': content_type_name_display,
-        'showcase_item_template': showcase_item_template_path,
-        'stats': stats,
-        'initial_view_id': current_view_mode_id,
-        'initial_filter': status_filter_key,
-        'initial_sort': initial_sort_dropdown_value,
-        'status_labels': status_labels_map,
-        'initial_list_template_to_include': initial_list_template_to_include,
+        'content_type_slug': config['slug'],
+        'view_mode': current_view_mode_id,
     }
-    return render(request, 'users/favorite_list.html', context)
 
+    if current_view_mode_id == 'view-tierlist':
+        # Тирлист показывает всю библиотеку сразу (перетаскивание между уровнями), но строится
+        # одним сгруппированным по оценке запросом
+        rated_items_by_tier, unrated_items = get_library_tiers(user, config['content_type'])
+        context.update({
+            'unrated_items': unrated_items,
+            'rated_items_by_tier': rated_items_by_tier,
+            'tier_item_template_name': TIERLIST_ITEM_TEMPLATE,
+            'tier_rating_values': list(range(10, 0, -1)),
+        })
+        return context, LIBRARY_VIEW_TEMPLATES[current_view_mode_id]
 
-@login_required
-def favorite_games_list(request):
-    user = request.user
-    base_queryset = get_sorted_user_games(user)
-
-    status_filter_key = request.GET.get('status_filter', 'all')
-    sort_by_param = request.GET.get('sort_by', 'date_added_desc')
-    current_view_mode_id = request.GET.get('view_mode', 'view-grid')
-
-    current_content_type_slug = 'games'
-    content_type_name_display = 'Games'
-    default_item_card_template = 'partials/game_card.html'
-    tierlist_item_card_template = 'partials/tierlist_item_card.html'
-    showcase_item_template_path = 'partials/showcase_game_cell.html'
-
-    # Подготовка данных для тирлиста
-    unrated_items_for_tierlist = []
-    rated_items_by_tier = {i: [] for i in range(1, 11)}
-    for item in base_queryset:
-        rating = getattr(item, 'user_rating', None)
-        if rating is not None and 1 <= rating <= 10:
-            rated_items_by_tier[int(rating)].append(item)
-        else:
-            unrated_items_for_tierlist.append(item)
-
-        if item.platforms:
-            game_platforms = json.loads(item.platforms) if isinstance(item.platforms, str) else item.platforms
-        else:
-            game_platforms = []
-
-        item.platform_icons = list(set(get_platform_icon_path(p["name"]) for p in game_platforms if p and "name" in p))
-
-    sorted_rated_tiers_for_template = sorted(
-        [(r_val, r_items) for r_val, r_items in rated_items_by_tier.items()],
-        key=lambda x: x[0],
-        reverse=True
-    )
-
-    # Модели статусов для игр
-    status_models_map = {
-        'status1': PlayedGame, 'status2': PlayingGame,
-        'status3': DroppedGame, 'wishlist': FavoriteGame,
-    }
-    status_model_id_field = 'game_id'
-
-    # Фильтрация
-    items_processed = base_queryset
-    items_to_render_for_list_detailed = base_queryset
-
-    if current_view_mode_id == 'view-grid' and status_filter_key != 'all' and status_filter_key in status_models_map:
-        StatusModel = status_models_map[status_filter_key]
-        status_item_ids = StatusModel.objects.filter(user=user).values_list(status_model_id_field, flat=True)
-        items_processed = base_queryset.filter(pk__in=list(status_item_ids))
-
-    if current_view_mode_id != 'view-grid': 
-        if status_filter_key != 'all' and status_filter_key in status_models_map:
-            StatusModel = status_models_map[status_filter_key]
-            status_item_ids = StatusModel.objects.filter(user=user).values_list(status_model_id_field, flat=True)
-            items_to_render_for_list_detailed = base_queryset.filter(pk__in=list(status_item_ids))
+    queryset = config['get_queryset'](user)
+    status_annotations = {conf['key']: conf['annotation_field'] for conf in grid_status_config}
+    if status_filter_key in status_annotations:
+        queryset = queryset.filter(**{status_annotations[status_filter_key]: True})
 
-    # Сортировка
     sort_field_map = {
         'date_added': 'latest_interaction_date',
         'rating': 'user_rating',
-        'title': 'name',
+        'title': config['title_field'],
+        'name': config['title_field'],
+        'release_date': config['release_field'],
     }
-    if base_queryset.exists():
-        items_processed = apply_sorting_to_queryset(items_processed, sort_by_param, sort_field_map)
-        items_to_render_for_list_detailed = apply_sorting_to_queryset(items_to_render_for_list_detailed, sort_by_param, sort_field_map)
+    sort_field, descending = get_library_sort(sort_by_param, sort_field_map)
+    library_items, next_cursor = paginate_library(queryset, sort_field, descending, request.GET.get('cursor'))
+
+    context.update({
+        'library_items': library_items,
+        'next_cursor': next_cursor,
+        'item_template_name': config['card_template'],
+        'status_filter_from_toolbar': status_filter_key,
+    })
+    return context, LIBRARY_VIEW_TEMPLATES[current_view_mode_id]
+
 
-    # Статистика
+def render_library_list(request, content_type_slug):
+    """Страница библиотеки пользователя (игры, фильмы или книги) и её AJAX-перерисовка."""
+    config = {**LIBRARY_LIST_CONFIG[content_type_slug], 'slug': content_type_slug}
+    user = request.user
+
+    # Статистика (одним агрегатом по UserItemState)
+    library_counts = get_library_counts(user, config['content_type'])
     stats = {
-        'total': base_queryset.count(),
-        'favourite': FavoriteGame.objects.filter(user=user).count(),
-        'status1_label': 'Played', 'status1_count': PlayedGame.objects.filter(user=user).count(),
-        'status2_label': 'Playing', 'status2_count': PlayingGame.objects.filter(user=user).count(),
-        'status3_label': 'Dropped', 'status3_count': DroppedGame.objects.filter(user=user).count(),
-        'wishlist_label': 'Favourite', 
+        'total': library_counts['total'],
+        'favourite': library_counts['favorite'],
+        'wishlist_label': config['labels']['wishlist'],
+        'wishlist_count': library_counts['favorite'],
     }
-    stats['wishlist_count'] = stats['favourite']
+    for key, slug in config['statuses'].items():
+        stats[f'{key}_label'] = config['labels'][key]
+        stats[f'{key}_count'] = library_counts[slug]
 
-    grid_status_config = [
-        {'key': 'wishlist', 'label': stats['wishlist_label'], 'annotation_field': 'is_favorite_for_user', 'chip_class': 'wishlist-chip'},
-        {'key': 'status1', 'label': stats['status1_label'], 'annotation_field': 'is_played_for_user', 'chip_class': 'played-chip'},
-        {'key': 'status2', 'label': stats['status2_label'], 'annotation_field': 'is_playing_for_user', 'chip_class': 'playing-chip'},
-        {'key': 'status3', 'label': stats['status3_label'], 'annotation_field': 'is_dropped_for_user', 'chip_class': 'dropped-chip'},
-    ]
-    status_labels_map = {key: stats[f"{key_}_label"] for key_, key in [('status1','status1'), ('status2','status2'), ('status3','status3'), ('wishlist','wishlist')]}
+    grid_status_config = get_library_status_config(config, library_counts)
+    list_context, list_template_name = get_library_list_page(request, config, grid_status_config)
 
-    # AJAX и полная загрузка (аналогично movies, с заменой имен шаблонов и контекста)
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        list_template_name = ''
-        context_for_ajax = {
-            'content_type_name': content_type_name_display, # 'Games'
-            'user': request.user,
-            'status_filter_key': status_filter_key,
-            'status_labels': status_labels_map,
-            'grid_status_config': grid_status_config,
-            'content_type_slug': current_content_type_slug, # 'games'
-        }
-        if current_view_mode_id == 'view-grid':
-            list_template_name = 'includes/items_list_content_grid.html'
-            context_for_ajax['library_items'] = items_processed
-            context_for_ajax['status_filter_from_toolbar'] = status_filter_key
-            context_for_ajax['item_template_name'] = default_item_card_template 
-        elif current_view_mode_id == 'view-list':
-            list_template_name = 'includes/items_list_content_list.html'
-            context_for_ajax['library_items'] = items_to_render_for_list_detailed
-        elif current_view_mode_id == 'view-tierlist':
-            list_template_name = 'includes/items_list_content_tierlist.html'
-            context_for_ajax.update({
-                'unrated_items': unrated_items_for_tierlist,
-                'rated_items_by_tier': rated_items_by_tier,
-                'tier_item_template_name': tierlist_item_card_template,
-                'tier_rating_values': list(range(10, 0, -1)),
-            })
-        else:
-            list_template_name = 'includes/items_list_content_grid.html'
-            context_for_ajax['library_items'] = items_processed
-            context_for_ajax['status_filter_from_toolbar'] = status_filter_key
-            context_for_ajax['item_template_name'] = default_item_card_template
-
-        html_items = render_to_string(list_template_name, context_for_ajax)
+        html_items = render_to_string(list_template_name, list_context, request=request)
         return JsonResponse({'html_items': html_items})
 
-    library_items_for_initial_load = items_processed
-    item_template_name_for_initial_load = default_item_card_template
-    initial_list_template_to_include = 'includes/items_list_content_grid.html'
-
-    if current_view_mode_id == 'view-list':
-        initial_list_template_to_include = 'includes/items_list_content_list.html'
-        library_items_for_initial_load = items_to_render_for_list_detailed
-    elif current_view_mode_id == 'view-detailed-list':
-        initial_list_template_to_include = 'includes/items_list_content_detailed.html'
-        library_items_for_initial_load = items_to_render_for_list_detailed
-    elif current_view_mode_id == 'view-tierlist':
-        initial_list_template_to_include = 'includes/items_list_content_tierlist.html'
-
+    sort_by_param = request.GET.get('sort_by', 'date_added_desc')
     initial_sort_dropdown_value = 'date_added'
     if sort_by_param.startswith('date_added'): initial_sort_dropdown_value = 'date_added'
     elif sort_by_param.startswith('rating'): initial_sort_dropdown_value = 'rating'
     elif sort_by_param.startswith('title') or sort_by_param.startswith('name'): initial_sort_dropdown_value = 'title'
 
     context = {
+        **list_context,
         'profile': user,
-        'sorted_rated_tiers': sorted_rated_tiers_for_template,
-        'library_items': library_items_for_initial_load if current_view_mode_id != 'view-tierlist' else None,
-        'item_template_name': item_template_name_for_initial_load if current_view_mode_id != 'view-tierlist' else None,
-        'unrated_items': unrated_items_for_tierlist if current_view_mode_id == 'view-tierlist' else None,
-        'tier_rating_values': list(range(10, 0, -1)) if current_view_mode_id == 'view-tierlist' else None,
-        'rated_items_by_tier': rated_items_by_tier,
-        'tier_item_template_name': tierlist_item_card_template if current_view_mode_id == 'view-tierlist' else None,
-        'content_type_name': content_type_name_display,
-        'status_filter_key': status_filter_key,
-        'grid_status_config': grid_status_config,
-        'content_type_slug': current_content_type_slug,
-        'sorted_items': base_queryset[:4],
-        'content_type_name_page_title': content_type_name_display,
-        'showcase_item_template': showcase_item_template_path,
+        'sorted_items': config['get_queryset'](user)[:4],
+        'content_type_name_page_title': config['name'],
+        'showcase_item_template': config['showcase_template'],
         'stats': stats,
-        'initial_view_id': current_view_mode_id,
-        'initial_filter': status_filter_key,
+        'initial_view_id': list_context['view_mode'],
+        'initial_filter': list_context['status_filter_key'],
         'initial_sort': initial_sort_dropdown_value,
-        'status_labels': status_labels_map,
-        'initial_list_template_to_include': initial_list_template_to_include,
+        'initial_list_template_to_include': list_template_name,
     }
     return render(request, 'users/favorite_list.html', context)
 
 
+@query_budget(8)
 @login_required
-def favorite_books_list(request):
-    user = request.user
-    base_queryset = get_sorted_user_books(user)
-
-    status_filter_key = request.GET.get('status_filter', 'all')
-    sort_by_param = request.GET.get('sort_by', 'date_added_desc')
-    current_view_mode_id = request.GET.get('view_mode', 'view-grid')
-
-    current_content_type_slug = 'books'
-    content_type_name_display = 'Books'
-    default_item_card_template = 'partials/book_card.html'
-    tierlist_item_card_template = 'partials/tierlist_item_card.html'
-    showcase_item_template_path = 'partials/showcase_book_cell.html'
-
-    # Подготовка данных для тирлиста
-    unrated_items_for_tierlist = []
-    rated_items_by_tier = {i: [] for i in range(1, 11)}
-    for item in base_queryset:
-        rating = getattr(item, 'user_rating', None)
-        if rating is not None and 1 <= rating <= 10:
-            rated_items_by_tier[int(rating)].append(item)
-        else:
-            unrated_items_for_tierlist.append(item)
-
-    # Модели статусов для книг
-    status_models_map = {
-        'status1': ReadBook, 'status2': ReadingBook,
-        'status3': DroppedBook, 'wishlist': FavoriteBook,
-    }
-    status_model_id_field = 'book_id'
-
-    # Фильтрация
-    items_processed = base_queryset
-    items_to_render_for_list_detailed = base_queryset
-
-    if current_view_mode_id == 'view-grid' and status_filter_key != 'all' and status_filter_key in status_models_map:
-        StatusModel = status_models_map[status_filter_key]
-        status_item_ids = StatusModel.objects.filter(user=user).values_list(status_model_id_field, flat=True)
-        items_processed = base_queryset.filter(pk__in=list(status_item_ids))
-
-    if current_view_mode_id != 'view-grid':
-        if status_filter_key != 'all' and status_filter_key in status_models_map:
-            StatusModel = status_models_map[status_filter_key]
-            status_item_ids = StatusModel.objects.filter(user=user).values_list(status_model_id_field, flat=True)
-            items_to_render_for_list_detailed = base_queryset.filter(pk__in=list(status_item_ids))
-
-    # Сортировка
-    sort_field_map = {
-        'date_added': 'latest_interaction_date',
-        'rating': 'user_rating',
-        'title': 'title',
-    }
-    if base_queryset.exists():
-        items_processed = apply_sorting_to_queryset(items_processed, sort_by_param, sort_field_map)
-        items_to_render_for_list_detailed = apply_sorting_to_queryset(items_to_render_for_list_detailed, sort_by_param, sort_field_map)
+def favorite_movies_list(request):
+    return render_library_list(request, 'movies')
 
-    # Статистика
-    stats = {
-        'total': base_queryset.count(),
-        'favourite': FavoriteBook.objects.filter(user=user).count(),
-        'status1_label': 'Read', 'status1_count': ReadBook.objects.filter(user=user).count(),
-        'status2_label': 'Reading', 'status2_count': ReadingBook.objects.filter(user=user).count(),
-        'status3_label': 'Dropped', 'status3_count': DroppedBook.objects.filter(user=user).count(),
-        'wishlist_label': 'Wishlist',
-    }
-    stats['wishlist_count'] = stats['favourite']
 
-    grid_status_config = [
-        {'key': 'status1', 'label': stats['status1_label'], 'annotation_field': 'is_read_for_user', 'chip_class': 'read-chip'},
-        {'key': 'status2', 'label': stats['status2_label'], 'annotation_field': 'is_reading_for_user', 'chip_class': 'reading-chip'},
-        {'key': 'status3', 'label': stats['status3_label'], 'annotation_field': 'is_dropped_for_user', 'chip_class': 'dropped-chip'},
-        {'key': 'wishlist', 'label': stats['wishlist_label'], 'annotation_field': 'is_favorite_for_user', 'chip_class': 'wishlist-chip'},
-    ]
-    status_labels_map = {key: stats[f"{key_}_label"] for key_, key in [('status1','status1'), ('status2','status2'), ('status3','status3'), ('wishlist','wishlist')]}
+@query_budget(8)
+@login_required
+def favorite_games_list(request):
+    return render_library_list(request, 'games')
 
-    # AJAX и полная загрузка (аналогично)
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        list_template_name = ''
-        context_for_ajax = {
-            'content_type_name': content_type_name_display, # 'Books'
-            'user': request.user,
-            'status_filter_key': status_filter_key,
-            'status_labels': status_labels_map,
-            'grid_status_config': grid_status_config,
-            'content_type_slug': current_content_type_slug, # 'books'
-        }
-        if current_view_mode_id == 'view-grid':
-            list_template_name = 'includes/items_list_content_grid.html'
-            context_for_ajax['library_items'] = items_processed
-            context_for_ajax['status_filter_from_toolbar'] = status_filter_key
-            context_for_ajax['item_template_name'] = default_item_card_template
-        elif current_view_mode_id == 'view-list':
-            list_template_name = 'includes/items_list_content_list.html'
-            context_for_ajax['library_items'] = items_to_render_for_list_detailed
-        elif current_view_mode_id == 'view-detailed-list':
-            list_template_name = 'includes/items_list_content_detailed.html'
-            context_for_ajax['library_items'] = items_to_render_for_list_detailed
-        elif current_view_mode_id == 'view-tierlist':
-            list_template_name = 'includes/items_list_content_tierlist.html'
-            context_for_ajax.update({
-                'unrated_items': unrated_items_for_tierlist,
-                'rated_items_by_tier': rated_items_by_tier,
-                'tier_item_template_name': tierlist_item_card_template,
-                'tier_rating_values': list(range(10, 0, -1)),
-            })
-        else:
-            list_template_name = 'includes/items_list_content_grid.html'
-            context_for_ajax['library_items'] = items_processed
-            context_for_ajax['status_filter_from_toolbar'] = status_filter_key
-            context_for_ajax['item_template_name'] = default_item_card_template
 
-        html_items = render_to_string(list_template_name, context_for_ajax)
-        return JsonResponse({'html_items': html_items})
+@query_budget(8)
+@login_required
+def favorite_books_list(request):
+    return render_library_list(request, 'books')
 
-    library_items_for_initial_load = items_processed
-    item_template_name_for_initial_load = default_item_card_template
-    initial_list_template_to_include = 'includes/items_list_content_grid.html'
 
-    if current_view_mode_id == 'view-list':
-        initial_list_template_to_include = 'includes/items_list_content_list.html'
-        library_items_for_initial_load = items_to_render_for_list_detailed
-    elif current_view_mode_id == 'view-detailed-list':
-        initial_list_template_to_include = 'includes/items_list_content_detailed.html'
-        library_items_for_initial_load = items_to_render_for_list_detailed
-    elif current_view_mode_id == 'view-tierlist':
-        initial_list_template_to_include = 'includes/items_list_content_tierlist.html'
+@query_budget(5)
+@login_required
+def favorite_items_page(request, content_type_slug):
+    """
+    Бесконечная прокрутка: следующая keyset-страница библиотеки по курсору.
+    Возвращает HTML элементов (в тех же секциях) и курсор следующей страницы.
+    """
+    if content_type_slug not in LIBRARY_LIST_CONFIG:
+        raise Http404
+    config = {**LIBRARY_LIST_CONFIG[content_type_slug], 'slug': content_type_slug}
 
-    initial_sort_dropdown_value = 'date_added'
-    if sort_by_param.startswith('date_added'): initial_sort_dropdown_value = 'date_added'
-    elif sort_by_param.startswith('rating'): initial_sort_dropdown_value = 'rating'
-    elif sort_by_param.startswith('title'): initial_sort_dropdown_value = 'title'
+    library_counts = get_library_counts(request.user, config['content_type'])
+    grid_status_config = get_library_status_config(config, library_counts)
+    list_context, list_template_name = get_library_list_page(request, config, grid_status_config)
+    if list_context['view_mode'] == 'view-tierlist':
+        return JsonResponse({'html_items': '', 'next_cursor': None})
 
-    context = {
-        'profile': user,
-        'library_items': library_items_for_initial_load if current_view_mode_id != 'view-tierlist' else None,
-        'item_template_name': item_template_name_for_initial_load if current_view_mode_id != 'view-tierlist' else None,
-        'unrated_items': unrated_items_for_tierlist if current_view_mode_id == 'view-tierlist' else None,
-        'rated_items_by_tier': rated_items_by_tier if current_view_mode_id == 'view-tierlist' else None,
-        'tier_rating_values': list(range(10, 0, -1)) if current_view_mode_id == 'view-tierlist' else None,
-
-        'tier_item_template_name': tierlist_item_card_template if current_view_mode_id == 'view-tierlist' else None,
-        'content_type_name': content_type_name_display,
-        'status_filter_key': status_filter_key,
-        'grid_status_config': grid_status_config,
-        'content_type_slug': current_content_type_slug,
-        'sorted_items': base_queryset[:4],
-        'content_type_name_page_title': content_type_name_display,
-        'showcase_item_template': showcase_item_template_path,
-        'stats': stats,
-        'initial_view_id': current_view_mode_id,
-        'initial_filter': status_filter_key,
-        'initial_sort': initial_sort_dropdown_value,
-        'status_labels': status_labels_map,
-        'initial_list_template_to_include': initial_list_template_to_include,
-    }
-    return render(request, 'users/favorite_list.html', context)
+    html_items = render_to_string(list_template_name, list_context, request=request)
+    return JsonResponse({'html_items': html_items, 'next_cursor': list_context['next_cursor']})
 
 
 def generate_verification_code(length=6):
@@ -1405,6 +757,7 @@ def generate_verification_code(length=6):
     return "".join(random.choice(string.digits) for i in range(length))
 
 
+@query_budget(5)
 @login_required
 @require_POST
 def send_email_verification(request):
@@ -1450,6 +803,7 @@ def send_email_verification(request):
         return JsonResponse({'status': 'error', 'message': 'Could not send verification email. Please try again later.'}, status=500)
 
 
+@query_budget(6)
 @login_required
 @require_POST
 def verify_and_change_email(request):
@@ -1495,6 +849,7 @@ def verify_and_change_email(request):
         return JsonResponse({'status': 'error', 'message': 'Invalid verification code.'}, status=400)
 
 
+@query_budget(20)
 @login_required
 @require_POST # Эта view должна принимать только POST запросы
 def update_item_rating(request, content_type_slug, item_pk_str): # item_pk_str потому что ID книги может быть строкой
@@ -1555,10 +910,7 @@ def update_item_rating(request, content_type_slug, item_pk_str): # item_pk_str 
                 )
                 current_rating_value = rating_obj.rating
                 action_message = f'Rating {"set" if created else "updated"} to {current_rating_value}.'
-
-                # Обновим MGB рейтинг для самого объекта Game/Movie/Book
-                if hasattr(item, 'update_mgb_rating'):
-                    item.update_mgb_rating()
+                # MGB рейтинг самого объекта обновляется сигналом post_save (users/signals.py)
 
             else:
                 return JsonResponse({'status': 'error', 'message': 'Rating must be between 1 and 10.'}, status=400)
@@ -1572,9 +924,6 @@ def update_item_rating(request, content_type_slug, item_pk_str): # item_pk_str 
         action_message = 'Rating removed.' if deleted_count > 0 else 'No rating to remove.'
         current_rating_value = None
 
-        if hasattr(item, 'update_mgb_rating'):
-            item.update_mgb_rating()
-
     return JsonResponse({
         'status': 'success',
         'message': action_message,
@@ -1586,6 +935,7 @@ def update_item_rating(request, content_type_slug, item_pk_str): # item_pk_str 
 
 # --- СТАТУСЫ ИГР ---
 # --------------------------------------------------------------------------------------------------------------------------------------------
+@query_budget(24)
 @login_required
 def played_add(request, game_id):
     # Используем стандартный pk/id для поиска Game в БД
@@ -1606,6 +956,7 @@ def played_add(request, game_id):
     return JsonResponse({"is_played": is_played})
 
 
+@query_budget(24)
 @login_required
 def playing_add(request, game_id):
     game = get_object_or_404(Game, pk=game_id)
@@ -1625,6 +976,7 @@ def playing_add(request, game_id):
     return JsonResponse({"is_playing": is_playing})
 
 
+@query_budget(24)
 @login_required
 def dropped_add(request, game_id):
     game = get_object_or_404(Game, pk=game_id)
@@ -1645,6 +997,7 @@ def dropped_add(request, game_id):
 
 
 # --- СТАТУСЫ ФИЛЬМОВ ---
+@query_budget(24)
 @login_required
 def watched_add(request, movie_id): # Используем movie_id (tmdb_id)
     movie = get_object_or_404(Movie, tmdb_id=movie_id)
@@ -1662,6 +1015,7 @@ def watched_add(request, movie_id): # Используем movie_id (tmdb_id)
     return JsonResponse({"is_watched": is_watched}) # Возвращаем правильный ключ
 
 
+@query_budget(24)
 @login_required
 def watching_add(request, movie_id):
     movie = get_object_or_404(Movie, tmdb_id=movie_id)
@@ -1677,6 +1031,7 @@ def watching_add(request, movie_id):
     return JsonResponse({"is_watching": is_watching})
 
 
+@query_budget(24)
 @login_required
 def movie_dropped_add(request, movie_id): # Назвали movie_dropped_add
     movie = get_object_or_404(Movie, tmdb_id=movie_id)
@@ -1693,6 +1048,7 @@ def movie_dropped_add(request, movie_id): # Назвали movie_dropped_add
 
 
 # --- СТАТУСЫ КНИГ ---
+@query_budget(24)
 @login_required
 def read_add(request, book_id): # Используем book_id (google_id)
     book = get_object_or_404(Book, google_id=book_id)
@@ -1708,6 +1064,7 @@ def read_add(request, book_id): # Используем book_id (google_id)
     return JsonResponse({"is_read": is_read})
 
 
+@query_budget(24)
 @login_required
 def reading_add(request, book_id):
     book = get_object_or_404(Book, google_id=book_id)
@@ -1723,6 +1080,7 @@ def reading_add(request, book_id):
     return JsonResponse({"is_reading": is_reading})
 
 
+@query_budget(24)
 @login_required
 def book_dropped_add(request, book_id): # Назвали book_dropped_add
     book = get_object_or_404(Book, google_id=book_id)
@@ -1742,6 +1100,7 @@ def book_dropped_add(request, book_id): # Назвали book_dropped_add
 # (Сейчас работают только с Game и Movie)
 
 
+@query_budget(8)
 @login_required  # Добавил декоратор, т.к. комментировать могут только авторизованные
 def add_comment(request, content_type, object_id):
     if request.method == "POST":
@@ -1778,27 +1137,17 @@ def add_comment(request, content_type, object_id):
 
         comment.save()
 
-        # Возвращаем данные о созданном комментарии
+        # Возвращаем данные о созданном комментарии и готовую карточку для ленты
         return JsonResponse({
             "success": True,
-            "comment": {
-                "id": comment.id,
-                "title": comment.title,
-                "content": comment.content,
-                "created_at": comment.created_at.strftime("%Y-%m-%d %H:%M:%S"), # Формат можно настроить
-                "user": {
-                    "username": user.username,
-                    "avatar_url": user.avatar.url if user.avatar else None, # Переименовал в avatar_url
-                },
-                "like_count": 0, # Новый коммент - 0 лайков
-                "liked": False, # Текущий юзер его еще не лайкнул
-                "reply_count": 0, # Новый коммент - 0 ответов
-            }
+            "comment": serialize_comment(comment),
+            "html": render_to_string('partials/comment_item.html', {'comment': comment}, request=request),
         }, status=201) # Статус 201 Created
 
     return JsonResponse({"success": False, "error": "Method not allowed"}, status=405)
 
 
+@query_budget(10)
 @login_required  # Добавил декоратор
 def add_reply(request, comment_id):
     if request.method == "POST":
@@ -1827,42 +1176,23 @@ def add_reply(request, comment_id):
             book=parent_comment.book   # Копируем связь
             )
 
+        # reply_count родителя увеличивает сигнал post_save
         return JsonResponse({
             "success": True,
-            "reply": {
-                "id": reply.id,
-                "title": reply.title,
-                "content": reply.content,
-                "created_at": reply.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                "user": {
-                    "username": user.username,
-                    "avatar_url": user.avatar.url if user.avatar else None,
-                },
-                "like_count": 0,
-                "liked": False,
-                "parent_id": parent_comment.id # Добавил ID родителя
-            }
+            "reply": serialize_comment(reply),
+            "html": render_to_string('partials/comment_item.html', {'comment': reply, 'is_reply': True}, request=request),
         }, status=201)
 
     return JsonResponse({"success": False, "error": "Method not allowed"}, status=405)
 
 
+@query_budget(12)
 @login_required
 def like_comment(request, comment_id):
     if request.method == "POST": # Лайк - это изменение данных, лучше POST
-        comment = get_object_or_404(Comment, id=comment_id)
-        user = request.user
-
-        if user in comment.likes.all():
-            # Если лайк уже есть - убираем
-            comment.likes.remove(user)
-            liked = False
-        else:
-            # Если лайка нет - добавляем
-            comment.likes.add(user)
-            liked = True
-
-        like_count = comment.likes.count() # Получаем актуальное количество
+        get_object_or_404(Comment.objects.only('pk'), id=comment_id)
+        # Лайк ставится или снимается по индексу (comment, user), счётчик - атомарным UPDATE
+        liked, like_count = toggle_comment_like(comment_id, request.user)
 
         return JsonResponse({
             "success": True,
@@ -1874,8 +1204,34 @@ def like_comment(request, comment_id):
     return JsonResponse({"success": False, "error": "Method not allowed, use POST"}, status=405)
 
 
+def comment_page_response(request, comments, next_cursor, is_reply=False):
+    return JsonResponse({
+        "success": True,
+        "comments": [serialize_comment(comment) for comment in comments],
+        "html": render_to_string('partials/comment_list_items.html', {'comments': comments, 'is_reply': is_reply}, request=request),
+        "next_cursor": next_cursor,
+    })
+
+
+@query_budget(4)
+def comment_thread(request, content_type, object_id):
+    """Страница отзывов верхнего уровня к элементу, новые первыми; следующая - по ?cursor= из ответа."""
+    if content_type not in COMMENT_CONTENT_TYPES:
+        return JsonResponse({"success": False, "error": "Invalid content type for comment"}, status=400)
+    comments, next_cursor = get_comment_thread(content_type, object_id, request.user, request.GET.get('cursor'))
+    return comment_page_response(request, comments, next_cursor)
+
+
+@query_budget(4)
+def comment_replies(request, comment_id):
+    """Ответы на отзыв по порядку - подгружаются, когда пользователь раскрывает ветку."""
+    replies, next_cursor = get_comment_replies(comment_id, request.user, request.GET.get('cursor'))
+    return comment_page_response(request, replies, next_cursor, is_reply=True)
+
+
 # РЕЙТИНГ ПОЛЬЗОВАТЕЛЕЙ MGB
 # -------------------------------------------------------------------------------------------------------
+@query_budget(18)
 @login_required
 @require_POST  # Принимаем только POST запросы
 def set_user_rating(request, content_type, item_pk):